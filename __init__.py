@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from . import tools
 from . import models
 from . import controllers
 from . import wizards
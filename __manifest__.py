@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Transport Interurbain',
-    'version': '17.0.1.0.1',
+    'version': '17.0.1.0.4',
     'category': 'Transportation',
     'summary': 'Gestion des transports interurbains - Côte d\'Ivoire',
     'description': """
@@ -45,12 +45,16 @@ Module complet de gestion des transports interurbains avec les fonctionnalités
     'depends': [
         'base',
         'mail',
+        'bus',
         'portal',
         'contacts',
         'web',
         'web_responsive',
         'website',
     ],
+    'external_dependencies': {
+        'python': ['cryptography'],
+    },
     'post_init_hook': 'post_init_hook',
     'uninstall_hook': 'uninstall_hook',
     'data': [
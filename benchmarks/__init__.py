@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+Banc de mesure de performance - Transport Interurbain
+
+Ce paquet n'est pas chargé par Odoo : il est exécuté à la demande
+(voir benchmarks/README.md) pour générer un réseau national synthétique
+puis rejouer des scénarios chronométrés.
+"""
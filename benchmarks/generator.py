@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Générateur d'un réseau national synthétique (données reproductibles).
+
+Les données de référence (compagnies, bus, itinéraires, programmes, voyages)
+passent par l'ORM afin d'exercer le code réel ; les passagers et les
+réservations, qui se comptent en millions, sont insérés par lots en SQL.
+La même graine produit toujours le même jeu de données.
+"""
+
+import logging
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
+from odoo import fields
+
+from ..tools.phone import normalize_phone
+
+_logger = logging.getLogger(__name__)
+
+# Tailles de réseau prédéfinies
+SCALES = {
+    'small': {
+        'companies': 3, 'routes': 8, 'routes_per_company': 4,
+        'departures': 2, 'days': 30, 'passengers': 500,
+    },
+    'medium': {
+        'companies': 8, 'routes': 30, 'routes_per_company': 8,
+        'departures': 4, 'days': 180, 'passengers': 20000,
+    },
+    'large': {
+        'companies': 20, 'routes': 60, 'routes_per_company': 15,
+        'departures': 6, 'days': 365, 'passengers': 200000,
+    },
+}
+
+BUS_CAPACITY = 50
+DEPARTURE_HOURS = (5.5, 7.0, 9.0, 11.5, 14.0, 16.5, 19.0, 21.5)
+INSERT_BATCH_SIZE = 10000
+
+# Remplissage et états des réservations (poids relatifs)
+OCCUPANCY_RANGE = (0.35, 0.95)
+PAST_STATES = (('completed', 80), ('cancelled', 8), ('expired', 10), ('refunded', 2))
+FUTURE_STATES = (('confirmed', 65), ('reserved', 20), ('cancelled', 8), ('expired', 7))
+# Part des réservations sur le trajet complet (le reste sur un segment)
+FULL_ROUTE_SHARE = 0.65
+TICKET_TYPES = (('adult', 85), ('child', 10), ('vip', 5))
+RATING_SHARE = 0.3
+
+BENCH_PREFIX = 'BENCH'
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights)[0]
+
+
+class NetworkGenerator:
+    """Construire un réseau synthétique pour les mesures de performance"""
+
+    def __init__(self, env, scale='small', seed=42):
+        self.env = env(context=dict(env.context, tracking_disable=True, mail_notrack=True,
+                                    mail_create_nolog=True, transport_bulk_mode=True))
+        self.scale = scale
+        self.params = SCALES[scale]
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.today = fields.Date.context_today(self.env['transport.trip'])
+
+    def generate(self, commit=True):
+        """Générer toutes les données et retourner le nombre d'enregistrements par modèle"""
+        if self.env['transport.company'].search_count([('code', '=like', BENCH_PREFIX + '%')]):
+            raise ValueError("Un jeu de données de benchmark existe déjà dans cette base")
+        steps = [
+            ('routes', self._create_routes),
+            ('companies', self._create_companies),
+            ('schedules', self._create_schedules),
+            ('trips', self._generate_trips),
+            ('passengers', self._create_passengers),
+            ('bookings', self._create_bookings),
+            ('counters', self._refresh_counters),
+        ]
+        for name, step in steps:
+            started = time.monotonic()
+            step()
+            self.env.flush_all()
+            if commit:
+                self.env.cr.commit()
+            _logger.info("Benchmark: étape %s terminée en %.1fs", name, time.monotonic() - started)
+        return self.dataset_summary(self.env)
+
+    @staticmethod
+    def dataset_summary(env):
+        """Nombre d'enregistrements des principaux modèles"""
+        return {
+            model: env[model].sudo().search_count([])
+            for model in ('transport.company', 'transport.city', 'transport.route',
+                          'transport.bus', 'transport.trip.schedule', 'transport.trip',
+                          'transport.passenger', 'transport.booking')
+        }
+
+    # ---------- Réseau ----------
+
+    def _create_routes(self):
+        """Itinéraires entre les villes existantes, avec 0 à 3 arrêts intermédiaires"""
+        cities = self.env['transport.city'].search([], order='id')
+        if len(cities) < 5:
+            raise ValueError("Au moins 5 villes sont nécessaires (données transport_data.xml)")
+        vals_list = []
+        for i in range(self.params['routes']):
+            departure, arrival, *stops = self.rng.sample(cities.ids, 2 + self.rng.randint(0, 3))
+            distance = self.rng.randint(100, 700)
+            duration = round(distance / 60, 1)
+            price = int(distance * 12 / 500) * 500 or 1000
+            vals_list.append({
+                'name': '%s %03d' % (BENCH_PREFIX, i),
+                'code': '%s-R%03d' % (BENCH_PREFIX, i),
+                'departure_city_id': departure,
+                'arrival_city_id': arrival,
+                'distance_km': distance,
+                'estimated_duration': duration,
+                'base_price': price,
+                'state': 'active',
+                'stop_ids': [(0, 0, {
+                    'city_id': city_id,
+                    'sequence': (seq + 1) * 10,
+                    'distance_from_start': distance * (seq + 1) / (len(stops) + 1),
+                    'duration_from_start': duration * (seq + 1) / (len(stops) + 1),
+                    'price_from_start': int(price * (seq + 1) / (len(stops) + 1)),
+                    'price_to_end': int(price * (len(stops) - seq) / (len(stops) + 1)),
+                }) for seq, city_id in enumerate(stops)],
+            })
+        self.routes = self.env['transport.route'].create(vals_list)
+
+    def _create_companies(self):
+        """Compagnies, avec un bus par créneau horaire et par itinéraire desservi"""
+        Company = self.env['transport.company']
+        Bus = self.env['transport.bus']
+        self.companies = Company.create([{
+            'name': '%s Transport %02d' % (BENCH_PREFIX, i),
+            'code': '%s%02d' % (BENCH_PREFIX, i),
+            'state': 'active',
+        } for i in range(self.params['companies'])])
+        buses_per_company = self.params['routes_per_company'] * self.params['departures']
+        Bus.create([{
+            'name': '%s-%02d-%03d' % (BENCH_PREFIX, c, b),
+            'code': '%s-%02d-%03d' % (BENCH_PREFIX, c, b),
+            'transport_company_id': company.id,
+            'seat_capacity': BUS_CAPACITY,
+            'state': 'available',
+        } for c, company in enumerate(self.companies) for b in range(buses_per_company)])
+
+    def _create_schedules(self):
+        """Un programme quotidien par compagnie et itinéraire desservi"""
+        vals_list = []
+        hours = DEPARTURE_HOURS[:self.params['departures']]
+        for c, company in enumerate(self.companies):
+            buses = company.bus_ids.sorted('id')
+            routes = self.rng.sample(list(self.routes), min(self.params['routes_per_company'], len(self.routes)))
+            for r, route in enumerate(routes):
+                vals_list.append({
+                    'name': '%s %s' % (company.code, route.code),
+                    'code': '%s-P%02d-%03d' % (BENCH_PREFIX, c, r),
+                    'transport_company_id': company.id,
+                    'route_id': route.id,
+                    'meeting_point': 'Gare routière',
+                    'default_price': route.base_price,
+                    'date_start': self.today - timedelta(days=self.params['days'] // 2),
+                    'schedule_type': 'daily',
+                    'state': 'active',
+                    'line_ids': [(0, 0, {
+                        'departure_hour': hour,
+                        'bus_id': buses[r * len(hours) + h].id,
+                    }) for h, hour in enumerate(hours)],
+                })
+        self.schedules = self.env['transport.trip.schedule'].create(vals_list)
+
+    def _generate_trips(self):
+        """Voyages sur toute la période (moitié passée, moitié à venir)"""
+        date_from = self.today - timedelta(days=self.params['days'] // 2)
+        date_to = date_from + timedelta(days=self.params['days'] - 1)
+        for schedule in self.schedules:
+            schedule.generate_trips(date_from, date_to)
+        self.env.flush_all()
+        self.env.cr.execute("""
+            UPDATE transport_trip
+               SET state = 'arrived'
+             WHERE departure_datetime < (now() at time zone 'UTC')
+               AND transport_company_id IN %s
+        """, (tuple(self.companies.ids),))
+        self.env['transport.trip'].invalidate_model(['state'])
+
+    # ---------- Passagers et réservations (SQL) ----------
+
+    def _create_passengers(self):
+        """Clients : un partenaire et un profil passager chacun"""
+        count = self.params['passengers']
+        partners = self.env['res.partner']
+        for start in range(0, count, 1000):
+            partners |= partners.create([{
+                'name': 'Client %s %06d' % (BENCH_PREFIX, i),
+                'phone': '+225 07%08d' % i,
+            } for i in range(start, min(start + 1000, count))])
+        self.partner_ids = partners.ids
+        uid = self.env.uid
+        rows = [(
+            'Client %s %06d' % (BENCH_PREFIX, i), '+225 07%08d' % i, normalize_phone('+225 07%08d' % i),
+            partner_id, str(uuid.UUID(int=self.rng.getrandbits(128))), True, uid, uid,
+        ) for i, partner_id in enumerate(self.partner_ids)]
+        cr = self.env.cr
+        self.passenger_ids = []
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            result = execute_values(cr, """
+                INSERT INTO transport_passenger (
+                    name, phone, phone_key, partner_id, unique_token, active,
+                    create_uid, write_uid, create_date, write_date
+                )
+                VALUES %s
+             RETURNING id
+            """, rows[start:start + INSERT_BATCH_SIZE],
+                template="(%s, %s, %s, %s, %s, %s, %s, %s, now() at time zone 'UTC', now() at time zone 'UTC')",
+                fetch=True)
+            self.passenger_ids += [row[0] for row in result]
+
+    def _create_bookings(self):
+        """Réservations sur chaque voyage, avec un mélange réaliste de segments et d'états"""
+        cr = self.env.cr
+        cr.execute("""
+            SELECT t.id, t.route_id, t.bus_id, t.transport_company_id, t.departure_datetime,
+                   t.price, t.state
+              FROM transport_trip t
+             WHERE t.transport_company_id IN %s
+          ORDER BY t.id
+        """, (tuple(self.companies.ids),))
+        trips = cr.fetchall()
+        stops_by_route = {
+            route.id: [route.departure_city_id.id]
+            + route.stop_ids.sorted('sequence').city_id.ids
+            + [route.arrival_city_id.id]
+            for route in self.routes
+        }
+        now = fields.Datetime.now()
+        uid = self.env.uid
+        passengers = list(zip(self.passenger_ids, self.partner_ids))
+        rows = []
+        sequence = 0
+        for trip_id, route_id, bus_id, company_id, departure, price, trip_state in trips:
+            stops = stops_by_route[route_id]
+            is_past = trip_state == 'arrived'
+            seats = int(BUS_CAPACITY * self.rng.uniform(*OCCUPANCY_RANGE))
+            for __ in range(seats):
+                sequence += 1
+                passenger_id, partner_id = self.rng.choice(passengers)
+                phone = '+225 07%08d' % passenger_id
+                if len(stops) > 2 and self.rng.random() > FULL_ROUTE_SHARE:
+                    boarding, alighting = sorted(self.rng.sample(range(len(stops)), 2))
+                else:
+                    boarding, alighting = 0, len(stops) - 1
+                state = _weighted(self.rng, PAST_STATES if is_past else FUTURE_STATES)
+                ticket_type = _weighted(self.rng, TICKET_TYPES)
+                ticket_price = float(price) * (alighting - boarding) / (len(stops) - 1)
+                paid = ticket_price if state in ('confirmed', 'completed', 'refunded') else 0.0
+                booked_at = departure - timedelta(hours=self.rng.randint(1, 24 * 14))
+                rows.append((
+                    '%s/%08d' % (BENCH_PREFIX, sequence), trip_id, partner_id, passenger_id,
+                    'Client %s' % passenger_id, phone, normalize_phone(phone),
+                    stops[boarding], stops[alighting], ticket_price, ticket_type,
+                    ticket_price, paid, ticket_price - paid,
+                    'purchase' if paid else 'reservation',
+                    booked_at + timedelta(hours=24) if state in ('reserved', 'expired') else None,
+                    state, booked_at.date(), str(uuid.UUID(int=self.rng.getrandbits(128))),
+                    company_id, route_id, bus_id, departure,
+                    self.rng.randint(1, 5) if state == 'completed' and self.rng.random() < RATING_SHARE else None,
+                    uid, min(booked_at, now), uid, min(booked_at, now),
+                ))
+                if len(rows) >= INSERT_BATCH_SIZE:
+                    self._insert_bookings(rows)
+                    rows = []
+        if rows:
+            self._insert_bookings(rows)
+
+    def _insert_bookings(self, rows):
+        execute_values(self.env.cr, """
+            INSERT INTO transport_booking (
+                name, trip_id, partner_id, passenger_id, passenger_name, passenger_phone,
+                passenger_phone_key, boarding_stop_id, alighting_stop_id, ticket_price, ticket_type,
+                total_amount, amount_paid, amount_due, booking_type, reservation_deadline,
+                state, booking_date, ticket_token,
+                transport_company_id, route_id, bus_id, departure_datetime, rating,
+                create_uid, create_date, write_uid, write_date
+            )
+            VALUES %s
+        """, rows, page_size=1000)
+
+    def _refresh_counters(self):
+        """Recalculer en SQL les champs stockés alimentés par les réservations"""
+        cr = self.env.cr
+        trips = self.env['transport.trip'].search([('transport_company_id', 'in', self.companies.ids)])
+        trips._sql_refresh_seat_counters()
+        cr.execute("""
+            UPDATE transport_passenger p
+               SET booking_count = s.booking_count,
+                   total_spent = s.total_spent,
+                   last_trip_date = s.last_trip_date
+              FROM (
+                    SELECT passenger_id,
+                           COUNT(*) AS booking_count,
+                           SUM(total_amount) AS total_spent,
+                           MAX(departure_datetime) AS last_trip_date
+                      FROM transport_booking
+                     WHERE passenger_id IN %s AND state IN ('confirmed', 'completed')
+                  GROUP BY passenger_id
+                   ) s
+             WHERE p.id = s.passenger_id
+        """, (tuple(self.passenger_ids),))
+        cr.execute("""
+            UPDATE transport_company c
+               SET rating = s.rating, rating_count = s.rating_count
+              FROM (
+                    SELECT transport_company_id, AVG(rating) AS rating, COUNT(*) AS rating_count
+                      FROM transport_booking
+                     WHERE transport_company_id IN %s AND rating > 0
+                  GROUP BY transport_company_id
+                   ) s
+             WHERE c.id = s.transport_company_id
+        """, (tuple(self.companies.ids),))
+        self.env.invalidate_all()
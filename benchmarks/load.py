@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Test de charge HTTP du parcours complet d'un usager.
+
+Chaque utilisateur virtuel enchaîne en boucle :
+inscription → recherche → réservation → paiement Wave → attente du
+webhook (réservation confirmée) → récupération du billet → scan par un
+agent. Les appels passent par l'API mobile d'un serveur Odoo réel, dont
+l'URL de l'API Wave pointe vers ``benchmarks/wave_simulator.py``.
+
+Le débit global est plafonné à ``--rps`` requêtes par seconde (le
+nombre d'utilisateurs virtuels ``--users`` doit suffire à l'atteindre).
+Le rapport donne le débit obtenu, le taux d'erreur et les latences par
+étape. Seule la bibliothèque standard est utilisée::
+
+    python benchmarks/load.py --base-url http://127.0.0.1:8069 \\
+        --from-city 1 --to-city 2 --agent-login agent@example.com --agent-password agent \\
+        --rps 20 --users 40 --duration 120 --output load.json
+
+Chaque utilisateur virtuel envoie un ``X-Forwarded-For`` distinct pour ne
+pas être bloqué par la limitation de débit par adresse IP de l'API.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+
+API_PREFIX = '/api/v1/transport'
+STEPS = ('agent_login', 'register', 'search', 'no_trip', 'book', 'pay', 'webhook', 'ticket', 'scan', 'unexpected')
+
+
+def percentile(values, pct):
+    """Percentile au rang le plus proche (valeurs non triées acceptées)"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class StepFailed(Exception):
+    """Étape du parcours en échec (réponse en erreur ou inattendue)"""
+
+    def __init__(self, step, message):
+        super().__init__('%s: %s' % (step, message))
+        self.step = step
+
+
+class Pacer:
+    """Plafonner le débit global de requêtes (créneaux régulièrement espacés)"""
+
+    def __init__(self, rps):
+        self.interval = 1.0 / rps if rps else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class LoadStats:
+    """Latences et erreurs par étape"""
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = defaultdict(list)
+        self.requests = 0
+        self.journeys = 0
+        self.completed = 0
+
+    def record(self, step, duration, error=None):
+        if error is None:
+            self.durations[step].append(duration * 1000.0)
+            return
+        self.errors[step] += 1
+        if len(self.error_samples[step]) < 5:
+            self.error_samples[step].append(str(error))
+
+    def report(self, elapsed, args):
+        steps = {}
+        for step in STEPS:
+            durations = self.durations.get(step, [])
+            total = len(durations) + self.errors.get(step, 0)
+            if not total:
+                continue
+            steps[step] = {
+                'calls': total,
+                'errors': self.errors.get(step, 0),
+                'error_rate': round(self.errors.get(step, 0) / total, 4),
+                'p50_ms': round(percentile(durations, 50), 1),
+                'p95_ms': round(percentile(durations, 95), 1),
+                'max_ms': round(max(durations, default=0), 1),
+                'first_errors': self.error_samples.get(step, []),
+            }
+        return {
+            'meta': {
+                'base_url': args.base_url,
+                'target_rps': args.rps,
+                'users': args.users,
+                'duration_s': args.duration,
+                'date': date.today().isoformat(),
+            },
+            'elapsed_s': round(elapsed, 1),
+            'requests': self.requests,
+            'throughput_rps': round(self.requests / elapsed, 2) if elapsed else 0,
+            'journeys_started': self.journeys,
+            'journeys_completed': self.completed,
+            'journeys_per_min': round(self.completed * 60.0 / elapsed, 1) if elapsed else 0,
+            'journey_error_rate': round(1 - self.completed / self.journeys, 4) if self.journeys else 0,
+            'steps': steps,
+        }
+
+
+class LoadTest:
+    """Utilisateurs virtuels exécutant le parcours usager contre un serveur Odoo"""
+
+    def __init__(self, args):
+        self.args = args
+        self.base_url = args.base_url.rstrip('/')
+        self.pacer = Pacer(args.rps)
+        self.stats = LoadStats()
+        self.rng = random.Random(args.seed)
+        self.agent_token = None
+        self.deadline = None
+
+    # ---------- HTTP ----------
+
+    def _post_json(self, path, params, token=None, client_ip=None, method='POST'):
+        body = json.dumps({'jsonrpc': '2.0', 'method': 'call', 'params': params or {}}).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = 'Bearer %s' % token
+        if client_ip:
+            headers['X-Forwarded-For'] = client_ip
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        with urllib.request.urlopen(req, timeout=self.args.timeout) as response:
+            return json.loads(response.read())
+
+    async def call(self, step, path, params=None, token=None, client_ip=None, method='POST'):
+        """Appeler un endpoint JSON de l'API mobile et renvoyer ``data``"""
+        await self.pacer.wait()
+        self.stats.requests += 1
+        started = time.monotonic()
+        try:
+            result = await asyncio.to_thread(self._post_json, path, params, token, client_ip, method)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            self.stats.record(step, time.monotonic() - started, error=e)
+            raise StepFailed(step, e)
+        duration = time.monotonic() - started
+        if result.get('error'):
+            error = result['error'].get('data', {}).get('message') or result['error'].get('message')
+            self.stats.record(step, duration, error=error)
+            raise StepFailed(step, error)
+        payload = result.get('result') or {}
+        if not payload.get('success'):
+            self.stats.record(step, duration, error=payload.get('message'))
+            raise StepFailed(step, payload.get('message'))
+        self.stats.record(step, duration)
+        return payload.get('data') or {}
+
+    # ---------- Parcours ----------
+
+    async def login_agent(self):
+        data = await self.call('agent_login', API_PREFIX + '/agent/auth/login', {
+            'login': self.args.agent_login,
+            'password': self.args.agent_password,
+        })
+        self.agent_token = data['token']
+
+    async def journey(self, user_index):
+        """Un parcours complet ; lève StepFailed à la première étape en erreur"""
+        client_ip = '10.%d.%d.%d' % (user_index // 65536 % 256, user_index // 256 % 256, user_index % 256)
+        phone = '+22507%08d' % self.rng.randrange(10 ** 8)
+
+        data = await self.call('register', API_PREFIX + '/usager/auth/register', {
+            'name': 'Charge %s' % phone[-6:],
+            'phone': phone,
+            'pin_code': '%04d' % self.rng.randrange(10000),
+        }, client_ip=client_ip)
+        token = data['token']
+
+        search = {
+            'departure_city_id': self.args.from_city,
+            'arrival_city_id': self.args.to_city,
+            'departure_date': self.args.date,
+        }
+        if self.args.company_id:
+            search['company_id'] = self.args.company_id
+        data = await self.call('search', API_PREFIX + '/usager/trips/search', search, client_ip=client_ip)
+        trips = [t for t in data.get('trips', []) if t.get('available_seats', 1) > 0]
+        if not trips:
+            self.stats.record('no_trip', 0, error='Aucun voyage disponible')
+            raise StepFailed('no_trip', 'Aucun voyage disponible')
+        trip = self.rng.choice(trips)
+
+        data = await self.call('book', API_PREFIX + '/usager/bookings', {
+            'trip_id': trip['id'],
+            'booking_type': 'reservation',
+        }, token=token, client_ip=client_ip)
+        booking_id = data['booking']['id']
+
+        await self.call('pay', API_PREFIX + '/usager/bookings/%d/pay' % booking_id, {
+            'payment_method': 'wave',
+        }, token=token, client_ip=client_ip)
+
+        # Attendre que le webhook du simulateur confirme la réservation
+        started = time.monotonic()
+        while True:
+            data = await self.call('webhook', API_PREFIX + '/usager/bookings/%d' % booking_id,
+                                   token=token, client_ip=client_ip, method='GET')
+            if data.get('booking', {}).get('state') == 'confirmed':
+                break
+            if time.monotonic() - started > self.args.webhook_timeout:
+                self.stats.record('webhook', 0, error='Réservation non confirmée après %ss' % self.args.webhook_timeout)
+                raise StepFailed('webhook', 'timeout')
+            await asyncio.sleep(self.args.poll_interval)
+
+        data = await self.call('ticket', API_PREFIX + '/usager/bookings/%d/ticket' % booking_id,
+                               token=token, client_ip=client_ip, method='GET')
+        qr_data = data['ticket']['ticket_qr_data']
+
+        await self.call('scan', API_PREFIX + '/agent/scan/ticket', {'qr_data': qr_data},
+                        token=self.agent_token, client_ip=client_ip)
+
+    async def virtual_user(self, user_index):
+        while time.monotonic() < self.deadline:
+            self.stats.journeys += 1
+            try:
+                await self.journey(user_index)
+                self.stats.completed += 1
+            except StepFailed:
+                pass
+            except (KeyError, TypeError) as e:
+                self.stats.record('unexpected', 0, error=e)
+
+    async def run(self):
+        await self.login_agent()
+        started = time.monotonic()
+        self.deadline = started + self.args.duration
+        users = []
+        for index in range(self.args.users):
+            users.append(asyncio.create_task(self.virtual_user(index)))
+            # Montée en charge progressive
+            await asyncio.sleep(self.args.ramp_up / max(self.args.users, 1))
+        await asyncio.gather(*users)
+        return self.stats.report(time.monotonic() - started, self.args)
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='transport-load', description="Test de charge du parcours usager")
+    parser.add_argument('--base-url', default='http://127.0.0.1:8069', help="URL du serveur Odoo")
+    parser.add_argument('--from-city', type=int, required=True, help="ID de la ville de départ")
+    parser.add_argument('--to-city', type=int, required=True, help="ID de la ville d'arrivée")
+    parser.add_argument('--date', default=(date.today() + timedelta(days=1)).isoformat(),
+                        help="Date de départ YYYY-MM-DD (demain par défaut)")
+    parser.add_argument('--company-id', type=int, help="Limiter la recherche à la compagnie de l'agent")
+    parser.add_argument('--agent-login', required=True)
+    parser.add_argument('--agent-password', required=True)
+    parser.add_argument('--rps', type=float, default=10, help="Débit cible en requêtes par seconde (0 = illimité)")
+    parser.add_argument('--users', type=int, default=20, help="Nombre d'utilisateurs virtuels")
+    parser.add_argument('--duration', type=float, default=60, help="Durée du test en secondes")
+    parser.add_argument('--ramp-up', type=float, default=10, help="Durée de montée en charge en secondes")
+    parser.add_argument('--timeout', type=float, default=30, help="Timeout HTTP en secondes")
+    parser.add_argument('--webhook-timeout', type=float, default=15,
+                        help="Attente maximale de la confirmation après paiement")
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Fichier JSON du rapport (sortie standard sinon)")
+    return parser
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    report = asyncio.run(LoadTest(args).run())
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+    return report
+
+
+if __name__ == '__main__':
+    main()
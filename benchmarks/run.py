@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Point d'entrée du banc de mesure.
+
+Depuis un shell Odoo::
+
+    from odoo.addons.transport_interurbain.benchmarks import run
+    run.main(env, ['generate', '--scale', 'small'])
+    run.main(env, ['run', '--output', 'bench.json'])
+
+En ligne de commande (initialise Odoo à partir du fichier de configuration)::
+
+    python benchmarks/run.py -c odoo.conf -d bench generate --scale medium
+    python benchmarks/run.py -c odoo.conf -d bench run --output bench.json
+    python benchmarks/run.py compare avant.json apres.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+MODULE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=MODULE_DIR, stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='transport-benchmark')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    generate = sub.add_parser('generate', help="Générer le réseau synthétique")
+    generate.add_argument('--scale', default='small', choices=['small', 'medium', 'large'])
+    generate.add_argument('--seed', type=int, default=42)
+
+    run = sub.add_parser('run', help="Exécuter les scénarios")
+    run.add_argument('--scenario', action='append', dest='scenarios',
+                     help="Scénario à exécuter (répétable, tous par défaut)")
+    run.add_argument('--iterations', type=int, default=30)
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--output', help="Fichier JSON de résultats (sortie standard sinon)")
+
+    compare = sub.add_parser('compare', help="Comparer deux fichiers de résultats")
+    compare.add_argument('before')
+    compare.add_argument('after')
+    return parser
+
+
+def main(env, argv):
+    """Exécuter une commande du banc de mesure avec l'environnement donné"""
+    from odoo.addons.transport_interurbain.benchmarks.generator import NetworkGenerator
+    from odoo.addons.transport_interurbain.benchmarks.scenarios import ScenarioRunner
+
+    args = _parser().parse_args(argv)
+    if args.command == 'compare':
+        return compare(args.before, args.after)
+    if args.command == 'generate':
+        summary = NetworkGenerator(env, scale=args.scale, seed=args.seed).generate()
+        print(json.dumps(summary, indent=2))
+        return summary
+
+    results = {
+        'meta': {
+            'commit': _git_commit(),
+            'database': env.cr.dbname,
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+            'iterations': args.iterations,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'dataset': NetworkGenerator.dataset_summary(env),
+        },
+        'scenarios': ScenarioRunner(env, iterations=args.iterations, seed=args.seed).run(args.scenarios),
+    }
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return results
+
+
+def compare(before_path, after_path):
+    """Afficher l'évolution p50/p95 et requêtes entre deux exécutions"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print("%-26s %10s %10s %8s %10s %10s %8s" % (
+        'scénario', 'p50 avant', 'p50 après', 'Δ%', 'req. avant', 'req. après', 'Δ req.'))
+    rows = {}
+    for name in sorted(set(before['scenarios']) & set(after['scenarios'])):
+        b, a = before['scenarios'][name], after['scenarios'][name]
+        delta = (a['p50_ms'] - b['p50_ms']) * 100 / b['p50_ms'] if b['p50_ms'] else 0
+        rows[name] = {'p50_delta_pct': round(delta, 1), 'queries_delta': a['queries_p50'] - b['queries_p50']}
+        print("%-26s %10.1f %10.1f %+7.1f%% %10d %10d %+8d" % (
+            name, b['p50_ms'], a['p50_ms'], delta, b['queries_p50'], a['queries_p50'],
+            a['queries_p50'] - b['queries_p50']))
+    return rows
+
+
+def _cli(argv):
+    """Initialiser Odoo (-c/-d) puis exécuter la commande"""
+    if argv and argv[0] == 'compare':
+        return compare(*argv[1:3])
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('-c', '--config')
+    options.add_argument('-d', '--database', required=True)
+    known, rest = options.parse_known_args(argv)
+
+    import odoo
+    from odoo import api, SUPERUSER_ID
+
+    odoo_args = ['-d', known.database] + (['-c', known.config] if known.config else [])
+    odoo.tools.config.parse_config(odoo_args)
+    registry = odoo.modules.registry.Registry(known.database)
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        main(env, rest)
+
+
+if __name__ == '__main__':
+    _cli(sys.argv[1:])
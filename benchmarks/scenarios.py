@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Scénarios chronométrés rejoués sur un jeu de données généré.
+
+Les endpoints de l'API mobile sont appelés directement (requête simulée
+par MockRequest) afin de mesurer le code réel des contrôleurs. Chaque
+itération est exécutée dans un savepoint annulé ensuite, et l'ensemble
+de la campagne est annulé à la fin : la base reste identique d'une
+exécution à l'autre, ce qui rend les résultats comparables entre commits.
+"""
+
+import logging
+import random
+import time
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+from odoo import fields
+from odoo.addons.website.tools import MockRequest
+
+from ..controllers.mobile_api_agent import TransportAgentMobileAPI
+from ..controllers.mobile_api_usager import TransportUsagerMobileAPI
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_ITERATIONS = 30
+
+
+def percentile(values, pct):
+    """Percentile au rang le plus proche (valeurs non triées acceptées)"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class ScenarioRunner:
+    """Exécuter les scénarios et agréger latences et nombres de requêtes"""
+
+    def __init__(self, env, iterations=DEFAULT_ITERATIONS, seed=42):
+        self.env = env
+        self.iterations = iterations
+        self.rng = random.Random(seed)
+        self.usager_api = TransportUsagerMobileAPI()
+        self.agent_api = TransportAgentMobileAPI()
+
+    @property
+    def scenarios(self):
+        return {
+            'search_trips': self._scenario_search_trips,
+            'trip_detail': self._scenario_trip_detail,
+            'create_booking': self._scenario_create_booking,
+            'scan_boarding_burst': self._scenario_scan_boarding_burst,
+            'generate_trips': self._scenario_generate_trips,
+            'cron_expire_reservations': self._scenario_cron_expire,
+            'dashboard_load': self._scenario_dashboard,
+        }
+
+    def run(self, names=None):
+        """Exécuter les scénarios demandés (tous par défaut)"""
+        results = {}
+        try:
+            self._prepare()
+            for name in names or list(self.scenarios):
+                _logger.info("Benchmark: scénario %s", name)
+                calls = self.scenarios[name]()
+                results[name] = self._measure(calls)
+        finally:
+            self.env.cr.rollback()
+            self.env.invalidate_all()
+        return results
+
+    # ---------- Mesure ----------
+
+    def _measure(self, calls):
+        """Chronométrer les appels ; un élément peut être un couple (préparation, appel)"""
+        cr = self.env.cr
+        durations, queries, errors = [], [], []
+        for call in calls:
+            savepoint = cr.savepoint(flush=False)
+            if isinstance(call, tuple):
+                setup, call = call
+                setup()
+            self.env.flush_all()
+            start_count = cr.sql_log_count
+            started = time.perf_counter()
+            try:
+                result = call()
+                self.env.flush_all()
+                if isinstance(result, dict) and result.get('success') is False:
+                    errors.append(result.get('message'))
+            except Exception as e:  # noqa: BLE001 - l'erreur est reportée dans le résultat
+                errors.append(repr(e))
+            durations.append((time.perf_counter() - started) * 1000)
+            queries.append(cr.sql_log_count - start_count)
+            savepoint.close(rollback=True)
+            self.env.invalidate_all()
+        return {
+            'iterations': len(durations),
+            'p50_ms': round(percentile(durations, 50), 2),
+            'p95_ms': round(percentile(durations, 95), 2),
+            'max_ms': round(max(durations, default=0), 2),
+            'mean_ms': round(sum(durations) / len(durations), 2) if durations else 0,
+            'queries_p50': percentile(queries, 50),
+            'queries_p95': percentile(queries, 95),
+            'errors': len(errors),
+            'first_error': errors[0] if errors else None,
+        }
+
+    def _call(self, endpoint, payload=None, token=None, **kwargs):
+        """Appeler un endpoint JSON avec une requête simulée"""
+        with MockRequest(self.env) as mock_request:
+            mock_request.params = payload or {}
+            mock_request.httprequest.method = 'POST'
+            mock_request.httprequest.headers = {'Authorization': 'Bearer %s' % token} if token else {}
+            mock_request.future_response = SimpleNamespace(headers={})
+            return endpoint(**kwargs)
+
+    # ---------- Préparation ----------
+
+    def _prepare(self):
+        """Jetons d'authentification et droits nécessaires (annulés en fin de campagne)"""
+        env = self.env
+        expiry = fields.Datetime.now() + timedelta(days=1)
+        self.scheduled_trips = env['transport.trip'].search(
+            [('state', '=', 'scheduled'), ('available_seats', '>', 0)], order='id')
+        if not self.scheduled_trips:
+            raise ValueError("Aucun voyage programmé : générez d'abord les données")
+        self.passengers = env['transport.passenger'].search([], limit=self.iterations, order='id')
+        self.passenger_tokens = []
+        for passenger in self.passengers:
+            token = uuid.uuid4().hex
+            passenger.write({'mobile_token': token, 'mobile_token_expiry': expiry})
+            self.passenger_tokens.append(token)
+        company = self.scheduled_trips[0].transport_company_id
+        self.agent = env['res.users'].with_context(no_reset_password=True).create({
+            'name': 'Agent benchmark',
+            'login': 'bench.agent.%s' % uuid.uuid4().hex[:8],
+            'groups_id': [(4, env.ref('transport_interurbain.group_transport_agent').id)],
+            'transport_company_ids': [(4, company.id)],
+            'transport_agent_token': uuid.uuid4().hex,
+            'transport_agent_token_expiry': expiry,
+        })
+        self.agent_company = company
+        admin = env.ref('base.user_admin')
+        admin.write({'groups_id': [(4, env.ref('transport_interurbain.group_transport_admin').id)]})
+        self.admin_env = env(user=admin)
+
+    def _sample_trips(self):
+        trips = self.scheduled_trips
+        return [trips[self.rng.randrange(len(trips))] for __ in range(self.iterations)]
+
+    # ---------- Scénarios ----------
+
+    def _scenario_search_trips(self):
+        return [
+            (lambda trip=trip: self._call(self.usager_api.search_trips, {
+                'departure_city_id': trip.route_id.departure_city_id.id,
+                'arrival_city_id': trip.route_id.arrival_city_id.id,
+                'departure_date': fields.Date.to_string(trip.departure_date),
+                'passengers': 1,
+            }))
+            for trip in self._sample_trips()
+        ]
+
+    def _scenario_trip_detail(self):
+        return [
+            (lambda trip=trip: self._call(self.usager_api.get_trip_detail, trip_id=trip.id))
+            for trip in self._sample_trips()
+        ]
+
+    def _scenario_create_booking(self):
+        return [
+            (lambda trip=trip, token=token: self._call(
+                self.usager_api.create_booking, {'trip_id': trip.id}, token=token))
+            for trip, token in zip(self._sample_trips(), self.passenger_tokens)
+        ]
+
+    def _scenario_scan_boarding_burst(self):
+        bookings = self.env['transport.booking'].search([
+            ('transport_company_id', '=', self.agent_company.id),
+            ('state', '=', 'confirmed'),
+        ], limit=self.iterations, order='trip_id, id')
+        token = self.agent.transport_agent_token
+
+        def scan_and_board(booking):
+            self._call(self.agent_api.scan_ticket_qr, {
+                'qr_data': 'TICKET:%s|TOKEN:%s|TRIP:%s' % (
+                    booking.name, booking.ticket_token, booking.trip_id.name),
+            }, token=token)
+            return self._call(self.agent_api.board_passenger, token=token, booking_id=booking.id)
+
+        return [(lambda booking=booking: scan_and_board(booking)) for booking in bookings]
+
+    def _scenario_generate_trips(self):
+        schedules = self.env['transport.trip.schedule'].search([('state', '=', 'active')], order='id')
+        last_date = max(self.scheduled_trips.mapped('departure_date'))
+        date_from = last_date + timedelta(days=1)
+        date_to = date_from + timedelta(days=6)
+        return [
+            (lambda schedule=schedule: schedule.generate_trips(date_from, date_to))
+            for schedule in schedules[:self.iterations]
+        ]
+
+    def _scenario_cron_expire(self):
+        Booking = self.env['transport.booking'].with_context(transport_no_commit=True)
+
+        def setup():
+            self.env.cr.execute("""
+                UPDATE transport_booking
+                   SET reservation_deadline = (now() at time zone 'UTC') - interval '1 hour'
+                 WHERE id IN (SELECT id FROM transport_booking
+                               WHERE state = 'reserved' AND booking_type = 'reservation'
+                            ORDER BY id LIMIT 5000)
+            """)
+            self.env.invalidate_all()
+
+        return [(setup, Booking.cron_expire_reservations) for __ in range(min(self.iterations, 5))]
+
+    def _scenario_dashboard(self):
+        Dashboard = self.admin_env['transport.dashboard']
+        return [
+            (lambda: Dashboard.get_admin_dashboard_data(force=True))
+            for __ in range(self.iterations)
+        ]
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Simulateur local de l'API Wave pour les tests de charge.
+
+Reproduit le strict nécessaire du parcours de paiement :
+
+- ``POST <base>/checkout/sessions`` crée une session de paiement et
+  renvoie ``id`` et ``wave_launch_url`` ;
+- ``GET <base>/checkout/sessions/<id>`` renvoie l'état d'une session ;
+- après un délai, le simulateur rappelle ``webhook_url`` (la route
+  ``/transport/payment/webhook/<id>`` du module) avec un évènement
+  ``checkout.session.completed`` ou ``checkout.session.failed``, signé
+  avec ``--signing-secret`` (clé API Wave de la compagnie) ;
+- ``GET /stats`` renvoie les compteurs du simulateur.
+
+Latence, taux d'erreur de l'API et taux d'échec des paiements sont
+configurables. Le script n'utilise que la bibliothèque standard et ne
+dépend pas d'Odoo::
+
+    python benchmarks/wave_simulator.py --port 8765 --latency-ms 150 --failure-rate 0.02
+
+Puis, dans Odoo, régler l'URL de l'API Wave (Paramètres > Transport
+Interurbain) sur ``http://127.0.0.1:8765/v1``.
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_logger = logging.getLogger('wave_simulator')
+
+SESSION_PATH = re.compile(r'^(?:/v1)?/checkout/sessions/?$')
+SESSION_DETAIL_PATH = re.compile(r'^(?:/v1)?/checkout/sessions/(?P<id>[\w-]+)/?$')
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def sign_payload(secret, body):
+    """Signature HMAC-SHA256 du corps brut, vérifiée par le contrôleur de paiement"""
+    return hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+class WaveSimulator:
+    """État et comportement du faux service Wave"""
+
+    def __init__(self, latency_ms=100, jitter_ms=50, failure_rate=0.0,
+                 payment_failure_rate=0.0, webhook_delay_ms=500,
+                 webhook_timeout=10, signing_secret=None, public_url=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.payment_failure_rate = payment_failure_rate
+        self.webhook_delay_ms = webhook_delay_ms
+        self.webhook_timeout = webhook_timeout
+        self.signing_secret = signing_secret
+        self.public_url = public_url
+        self.rng = random.Random(seed)
+        self.sessions = {}
+        self.stats = {
+            'sessions_created': 0,
+            'api_errors': 0,
+            'webhooks_sent': 0,
+            'webhooks_failed': 0,
+            'payments_completed': 0,
+            'payments_failed': 0,
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _random(self):
+        with self._lock:
+            return self.rng.random()
+
+    def wait_latency(self):
+        """Simuler le temps de réponse de l'API"""
+        with self._lock:
+            delay = self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def create_session(self, payload, base_url):
+        """Créer une session de paiement ; renvoie (statut HTTP, corps)"""
+        self.wait_latency()
+        if self._random() < self.failure_rate:
+            self._count('api_errors')
+            return 503, {'code': 'service-unavailable', 'message': 'Simulated Wave outage'}
+        if not payload.get('amount') or not payload.get('currency'):
+            return 400, {'code': 'request-validation-error', 'message': 'amount and currency are required'}
+
+        session_id = 'cos-%s' % uuid.uuid4().hex[:20]
+        session = {
+            'id': session_id,
+            'amount': payload['amount'],
+            'currency': payload['currency'],
+            'client_reference': payload.get('client_reference'),
+            'checkout_status': 'open',
+            'payment_status': 'processing',
+            'success_url': payload.get('success_url'),
+            'error_url': payload.get('error_url'),
+            'wave_launch_url': '%s/c/%s' % (self.public_url or base_url, session_id),
+            'when_created': _utcnow(),
+        }
+        with self._lock:
+            self.sessions[session_id] = session
+            self.stats['sessions_created'] += 1
+
+        webhook_url = payload.get('webhook_url')
+        if webhook_url:
+            timer = threading.Timer(
+                self.webhook_delay_ms / 1000.0, self._complete_session, args=(session_id, webhook_url))
+            timer.daemon = True
+            timer.start()
+        return 200, dict(session)
+
+    def get_session(self, session_id):
+        """Lire une session ; renvoie (statut HTTP, corps)"""
+        self.wait_latency()
+        with self._lock:
+            session = self.sessions.get(session_id)
+        if not session:
+            return 404, {'code': 'not-found', 'message': 'Checkout session not found'}
+        return 200, dict(session)
+
+    def _complete_session(self, session_id, webhook_url):
+        """Terminer le paiement puis notifier Odoo par webhook"""
+        failed = self._random() < self.payment_failure_rate
+        with self._lock:
+            session = self.sessions[session_id]
+            session['checkout_status'] = 'complete' if not failed else 'expired'
+            session['payment_status'] = 'succeeded' if not failed else 'cancelled'
+            session['when_completed'] = _utcnow()
+            if not failed:
+                session['transaction_id'] = 'T_%s' % uuid.uuid4().hex[:16].upper()
+            self.stats['payments_failed' if failed else 'payments_completed'] += 1
+            data = {key: value for key, value in session.items() if key != 'error_url'}
+        if failed:
+            data['error_message'] = 'Simulated payment failure'
+        event = {
+            'id': 'EV_%s' % uuid.uuid4().hex[:20].upper(),
+            'type': 'checkout.session.failed' if failed else 'checkout.session.completed',
+            'data': data,
+        }
+        self.send_webhook(webhook_url, event)
+
+    def send_webhook(self, webhook_url, event):
+        """Appeler la route webhook du module (corps JSON brut, comme Wave)"""
+        body = json.dumps(event).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.signing_secret:
+            headers['Wave-Signature'] = sign_payload(self.signing_secret, body)
+        req = urllib.request.Request(webhook_url, data=body, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(req, timeout=self.webhook_timeout) as response:
+                response.read()
+            self._count('webhooks_sent')
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            self._count('webhooks_failed')
+            _logger.warning("Webhook %s en échec: %s", webhook_url, e)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, open_sessions=sum(
+                1 for s in self.sessions.values() if s['checkout_status'] == 'open'))
+
+
+class WaveRequestHandler(BaseHTTPRequestHandler):
+    """Routage HTTP minimal vers le simulateur"""
+
+    server_version = 'WaveSimulator/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def simulator(self):
+        return self.server.simulator
+
+    def log_message(self, format, *args):
+        _logger.debug(format, *args)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _base_url(self):
+        return 'http://%s' % (self.headers.get('Host') or '%s:%s' % self.server.server_address[:2])
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send_json(400, {'code': 'invalid-json', 'message': 'Malformed JSON body'})
+        if not SESSION_PATH.match(path):
+            return self._send_json(404, {'code': 'not-found', 'message': path})
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self._send_json(401, {'code': 'missing-auth-header', 'message': 'Bearer token required'})
+        status, body = self.simulator.create_session(payload, self._base_url())
+        self._send_json(status, body)
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/stats':
+            return self._send_json(200, self.simulator.snapshot())
+        match = SESSION_DETAIL_PATH.match(path)
+        if not match:
+            return self._send_json(404, {'code': 'not-found', 'message': path})
+        status, body = self.simulator.get_session(match.group('id'))
+        self._send_json(status, body)
+
+
+def make_server(simulator, host='127.0.0.1', port=8765):
+    """Serveur HTTP du simulateur (port 0 : port libre choisi par le système)"""
+    server = ThreadingHTTPServer((host, port), WaveRequestHandler)
+    server.daemon_threads = True
+    server.simulator = simulator
+    return server
+
+
+def serve(simulator, host='127.0.0.1', port=8765):
+    """Démarrer le serveur HTTP (bloquant)"""
+    server = make_server(simulator, host, port)
+    _logger.info("Simulateur Wave sur http://%s:%s/v1", host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        _logger.info("Statistiques: %s", json.dumps(simulator.snapshot()))
+    return server
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='wave-simulator', description="Simulateur local de l'API Wave")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=100,
+                        help="Latence moyenne de l'API en millisecondes")
+    parser.add_argument('--jitter-ms', type=float, default=50,
+                        help="Variation aléatoire de la latence (+/-)")
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help="Proportion de créations de session en erreur 503 (0-1)")
+    parser.add_argument('--payment-failure-rate', type=float, default=0.0,
+                        help="Proportion de paiements refusés (webhook checkout.session.failed)")
+    parser.add_argument('--webhook-delay-ms', type=float, default=500,
+                        help="Délai entre la création de la session et le webhook")
+    parser.add_argument('--signing-secret',
+                        help="Clé API Wave de la compagnie, pour signer les webhooks (en-tête Wave-Signature, exigé par Odoo)")
+    parser.add_argument('--public-url',
+                        help="Préfixe des wave_launch_url renvoyées (adresse du simulateur par défaut)")
+    parser.add_argument('--seed', type=int, default=None)
+    return parser
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    simulator = WaveSimulator(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        payment_failure_rate=args.payment_failure_rate,
+        webhook_delay_ms=args.webhook_delay_ms,
+        signing_secret=args.signing_secret,
+        public_url=args.public_url,
+        seed=args.seed,
+    )
+    serve(simulator, args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,3 +7,5 @@ from . import api_utils
 from . import mobile_api_usager
 from . import mobile_api_agent
 from . import ticket_share
+from . import metrics
+from . import manifest
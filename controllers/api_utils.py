@@ -12,6 +12,7 @@ import logging
 import hashlib
 import secrets
 import functools
+import threading
 import time
 from datetime import datetime, timedelta
 
@@ -19,7 +20,12 @@ from odoo import _, fields
 from odoo.http import request, Response
 import json
 
+from ..tools.metrics import metrics
+from ..tools.phone import normalize_phone
+
 _logger = logging.getLogger(__name__)
+# Journal dédié aux mesures de performance (une ligne JSON par appel)
+_perf_logger = logging.getLogger(__name__ + '.perf')
 
 # ==================== CONFIGURATION ====================
 
@@ -28,6 +34,8 @@ TOKEN_EXPIRY_HOURS = 24 * 30  # 30 jours
 MAX_LOGIN_ATTEMPTS = 5
 RATE_LIMIT_WINDOW = 60  # secondes
 RATE_LIMIT_MAX_REQUESTS = 100
+# Bornes (ms) des histogrammes de latence par route
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
 
 
 # ==================== CODES D'ERREUR ====================
@@ -133,6 +141,65 @@ class RateLimiter:
 rate_limiter = RateLimiter()
 
 
+# ==================== MESURES DE PERFORMANCE ====================
+
+class APIMetrics:
+    """Histogrammes en mémoire (par processus) des appels API par route"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, duration_ms, query_count, query_time_ms, size, status):
+        """Enregistrer la mesure d'un appel"""
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'count': 0,
+                    'errors': 0,
+                    'duration_sum': 0.0,
+                    'duration_max': 0.0,
+                    'query_count_sum': 0,
+                    'query_time_sum': 0.0,
+                    'size_sum': 0,
+                    'buckets': [0] * (len(self.buckets) + 1),
+                    'status': {},
+                }
+            stats['count'] += 1
+            if status != 'ok':
+                stats['errors'] += 1
+            stats['duration_sum'] += duration_ms
+            stats['duration_max'] = max(stats['duration_max'], duration_ms)
+            stats['query_count_sum'] += query_count
+            stats['query_time_sum'] += query_time_ms
+            stats['size_sum'] += size
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if duration_ms <= bound:
+                    index = i
+                    break
+            stats['buckets'][index] += 1
+            stats['status'][status] = stats['status'].get(status, 0) + 1
+
+    def snapshot(self):
+        """Copie des statistiques courantes, indexée par route"""
+        with self._lock:
+            return {
+                route: dict(stats, buckets=list(stats['buckets']), status=dict(stats['status']))
+                for route, stats in self._routes.items()
+            }
+
+    def reset(self):
+        """Vider les statistiques"""
+        with self._lock:
+            self._routes.clear()
+
+
+api_metrics = APIMetrics()
+
+
 # ==================== VALIDATION ====================
 
 class InputValidator:
@@ -140,16 +207,15 @@ class InputValidator:
     
     @staticmethod
     def validate_phone(phone):
-        """Valider un numéro de téléphone"""
-        import re
+        """Valider un numéro de téléphone et le retourner au format E.164"""
         if not phone:
             return False, "Le numéro de téléphone est requis"
         
-        cleaned = re.sub(r'[\s\-\.]', '', phone)
-        if not re.match(r'^\+?[\d]{8,15}$', cleaned):
+        normalized = normalize_phone(phone)
+        if not normalized:
             return False, "Format de téléphone invalide"
         
-        return True, cleaned
+        return True, normalized
     
     @staticmethod
     def validate_email(email):
@@ -333,6 +399,96 @@ def api_exception_handler(func):
     return wrapper
 
 
+# Statut HTTP des erreurs API sur les routes type='http' (les routes JSON-RPC répondent toujours 200)
+HTTP_STATUS_BY_CODE = {
+    APIErrorCodes.TOKEN_EXPIRED: 401,
+    APIErrorCodes.TOKEN_INVALID: 401,
+    APIErrorCodes.UNAUTHORIZED: 403,
+    APIErrorCodes.RESOURCE_NOT_FOUND: 404,
+    APIErrorCodes.RATE_LIMIT_EXCEEDED: 429,
+    APIErrorCodes.SERVER_ERROR: 500,
+}
+
+
+def http_json_response(func):
+    """Décorateur pour les routes type='http' : renvoyer les réponses API (dict) en JSON
+
+    Permet de réutiliser ``require_agent_auth`` et ``api_exception_handler``
+    sur une route qui diffuse un fichier ; à placer sous ``api_instrumented``.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        result = func(self, *args, **kwargs)
+        if isinstance(result, dict):
+            status = 200 if result.get('success') else HTTP_STATUS_BY_CODE.get(result.get('code'), 400)
+            return request.make_json_response(result, status=status)
+        return result
+
+    return wrapper
+
+
+def _sql_counters():
+    """Compteurs SQL du thread courant (nombre de requêtes, temps en secondes)"""
+    thread = threading.current_thread()
+    return getattr(thread, 'query_count', 0), getattr(thread, 'query_time', 0.0)
+
+
+def _response_status_and_size(result):
+    """Statut applicatif et taille (octets) d'une réponse d'endpoint"""
+    if isinstance(result, dict):
+        status = 'ok' if result.get('success', True) else str(result.get('code', 'error'))
+        return status, len(json.dumps(result, default=str))
+    if isinstance(result, Response):
+        status = 'ok' if result.status_code < 400 else str(result.status_code)
+        return status, result.content_length or 0
+    return 'ok', 0
+
+
+def api_instrumented(func):
+    """Décorateur mesurant durée, requêtes SQL, taille et statut d'un appel API
+
+    À placer au-dessus de ``api_exception_handler`` afin de mesurer aussi les
+    réponses d'erreur. Alimente ``api_metrics``, journalise une ligne JSON via
+    ``log_api_call`` et ajoute l'en-tête ``Server-Timing`` à la réponse.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        route = '%s.%s' % (getattr(self, '_api_scope', type(self).__name__), func.__name__)
+        start_count, start_time = _sql_counters()
+        started = time.perf_counter()
+        result = func(self, *args, **kwargs)
+        duration_ms = (time.perf_counter() - started) * 1000
+        query_count, query_time = _sql_counters()
+        query_count -= start_count
+        query_time_ms = (query_time - start_time) * 1000
+        status, size = _response_status_and_size(result)
+
+        api_metrics.record(route, duration_ms, query_count, query_time_ms, size, status)
+        metrics.observe('transport_api_request_duration_seconds', duration_ms / 1000, route=route)
+        metrics.inc('transport_api_requests_total', route=route, status=status)
+        metrics.inc('transport_api_sql_queries_total', query_count, route=route)
+        log_api_call(
+            route, request.httprequest.method, status,
+            duration=duration_ms,
+            details={
+                'path': request.httprequest.path,
+                'sql_count': query_count,
+                'sql_ms': round(query_time_ms, 2),
+                'size': size,
+            },
+        )
+        server_timing = 'app;dur=%.1f, sql;dur=%.1f;desc="%d queries"' % (
+            duration_ms, query_time_ms, query_count,
+        )
+        if isinstance(result, Response):
+            result.headers['Server-Timing'] = server_timing
+        else:
+            request.future_response.headers['Server-Timing'] = server_timing
+        return result
+
+    return wrapper
+
+
 def rate_limit(max_requests=RATE_LIMIT_MAX_REQUESTS, window=RATE_LIMIT_WINDOW):
     """Décorateur pour limiter le nombre de requêtes"""
     def decorator(func):
@@ -342,6 +498,7 @@ def rate_limit(max_requests=RATE_LIMIT_MAX_REQUESTS, window=RATE_LIMIT_WINDOW):
             key = f"{func.__name__}:{client_ip}"
             
             if not rate_limiter.is_allowed(key, max_requests, window):
+                metrics.inc('transport_rate_limit_rejections_total', route=func.__name__)
                 retry_after = rate_limiter.get_retry_after(key, window)
                 return api_error(
                     message=f"Trop de requêtes. Réessayez dans {retry_after} secondes.",
@@ -388,9 +545,16 @@ def format_date(d, format='%d/%m/%Y'):
 
 
 def log_api_call(endpoint, method, status, duration=None, details=None):
-    """Logger un appel API"""
-    _logger.info(
-        f"API Call: {method} {endpoint} - Status: {status}" +
-        (f" - Duration: {duration}ms" if duration else "") +
-        (f" - {details}" if details else "")
-    )
+    """Logger un appel API (une ligne JSON structurée)"""
+    entry = {
+        'endpoint': endpoint,
+        'method': method,
+        'status': status,
+    }
+    if duration is not None:
+        entry['duration_ms'] = round(duration, 2)
+    if isinstance(details, dict):
+        entry.update(details)
+    elif details:
+        entry['details'] = details
+    _perf_logger.info(json.dumps(entry, default=str))
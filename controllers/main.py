@@ -299,10 +299,6 @@ class TransportController(http.Controller):
         Booking = request.env['transport.booking'].sudo()
         partner = request.env.user.partner_id
         
-        # Récupérer toutes les réservations
-        all_bookings = Booking.search([('partner_id', '=', partner.id)])
-        completed_bookings = all_bookings.filtered(lambda b: b.state == 'completed')
-        
         # Prochain voyage
         next_booking = Booking.search([
             ('partner_id', '=', partner.id),
@@ -315,37 +311,14 @@ class TransportController(http.Controller):
             ('partner_id', '=', partner.id),
         ], order='create_date desc', limit=5)
         
-        # Calculer statistiques
-        total_km = sum(b.route_id.distance_km for b in completed_bookings if b.route_id)
-        total_spent = sum(b.total_amount for b in all_bookings.filtered(lambda b: b.state in ['confirmed', 'completed']))
-        
-        # Compagnie préférée
-        company_counts = {}
-        for b in completed_bookings:
-            if b.transport_company_id:
-                company_counts[b.transport_company_id.name] = company_counts.get(b.transport_company_id.name, 0) + 1
-        favorite_company = max(company_counts, key=company_counts.get) if company_counts else 'N/A'
-        
-        # Itinéraires fréquents
-        route_counts = {}
-        for b in completed_bookings:
-            if b.route_id:
-                route_name = b.route_id.name
-                route_counts[route_name] = route_counts.get(route_name, 0) + 1
-        frequent_routes = [{'name': k, 'count': v} for k, v in sorted(route_counts.items(), key=lambda x: -x[1])]
-        
-        stats = {
-            'total_trips': len(completed_bookings),
-            'total_km': total_km,
-            'total_spent': total_spent,
-            'favorite_company': favorite_company,
-        }
+        # Statistiques : requêtes groupées, indépendantes de la taille de l'historique
+        stats = request.env['transport.partner.stats']._get_partner_stats(partner.id)
         
         return request.render('transport_interurbain.portal_user_dashboard', {
             'stats': stats,
             'next_booking': next_booking,
             'recent_bookings': recent_bookings,
-            'frequent_routes': frequent_routes,
+            'frequent_routes': stats['frequent_routes'],
         })
 
     # ============================================
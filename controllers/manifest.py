@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from odoo import fields, http
+from odoo.http import request
+import logging
+
+from ..tools import manifest
+
+_logger = logging.getLogger(__name__)
+
+
+def manifest_response(trips, fmt, tz=None, bookings=None):
+    """
+    Réponse HTTP diffusant les manifestes des voyages ``trips`` (csv ou pdf),
+    horaires affichés dans le fuseau ``tz`` (celui de l'utilisateur par défaut).
+    ``bookings`` limite les passagers listés aux réservations lisibles par
+    l'utilisateur (toutes les réservations des voyages si None).
+
+    Le document est produit pendant l'envoi, avec un curseur dédié : la
+    requête unique est lue par paquets et chaque voyage est écrit dès qu'il
+    est complet.
+    """
+    mimetype, extension, writer = manifest.FORMATS[fmt]
+    registry = request.env.registry
+    trip_ids = trips.ids
+    booking_ids = bookings.ids if bookings is not None else None
+    tz = tz or request.env.user.tz or 'UTC'
+    day = trips[:1].departure_date or fields.Date.context_today(trips)
+    filename = 'Manifestes-%s.%s' % (day, extension)
+
+    def generate():
+        with registry.cursor() as cr:
+            yield from writer(manifest.iter_manifests(cr, trip_ids, booking_ids), tz)
+
+    return request.make_response(generate(), headers=[
+        ('Content-Type', mimetype),
+        ('Content-Disposition', 'attachment; filename="%s"' % filename),
+        ('Cache-Control', 'no-store'),
+    ])
+
+
+class TransportManifestController(http.Controller):
+    """Téléchargement des manifestes depuis le back-office"""
+
+    @http.route('/transport/manifests', type='http', auth='user')
+    def download_manifests(self, trip_ids='', format='pdf', **kw):
+        """Manifestes (PDF ou CSV) des voyages sélectionnés"""
+        if format not in manifest.FORMATS:
+            return request.not_found()
+        ids = [int(trip_id) for trip_id in trip_ids.split(',') if trip_id.strip().isdigit()]
+        trips = request.env['transport.trip'].browse(ids).exists()
+        if not trips:
+            return request.not_found()
+        trips.check_access_rights('read')
+        trips.check_access_rule('read')
+        # Le manifeste est lu en SQL : n'y lister que les réservations autorisées par les règles d'accès
+        bookings = request.env['transport.booking'].search([
+            ('trip_id', 'in', trips.ids),
+            ('state', 'in', manifest.MANIFEST_STATES),
+        ])
+        return manifest_response(trips.sorted('departure_datetime'), format, bookings=bookings)
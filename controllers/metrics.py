@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import hmac
+import logging
+
+from odoo import http
+from odoo.http import request, Response
+
+from ..tools.metrics import metrics
+
+_logger = logging.getLogger(__name__)
+
+METRICS_TOKEN_PARAM = 'transport_interurbain.metrics_token'
+
+
+class TransportMetricsController(http.Controller):
+    """Exposition des métriques d'exploitation au format Prometheus"""
+
+    @http.route('/api/v1/transport/metrics', type='http', auth='none',
+                methods=['GET'], csrf=False, save_session=False)
+    def prometheus_metrics(self, **kw):
+        """
+        Métriques agrégées de tous les workers (format texte Prometheus).
+
+        Exige l'en-tête ``Authorization: Bearer <token>`` correspondant au
+        paramètre système ``transport_interurbain.metrics_token``. Sans jeton
+        configuré, le point d'accès n'existe pas (404) : derrière un proxy
+        local, l'adresse de l'appelant ne permet pas de distinguer une
+        collecte locale d'une requête publique.
+        """
+        expected = request.db and request.env['ir.config_parameter'].sudo().get_param(METRICS_TOKEN_PARAM)
+        if not expected:
+            return request.not_found()
+        if not self._is_authorized(expected):
+            return Response("Forbidden\n", status=403, content_type='text/plain')
+        return Response(
+            metrics.render(),
+            status=200,
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
+
+    def _is_authorized(self, expected):
+        token = request.httprequest.headers.get('Authorization', '').replace('Bearer ', '')
+        return hmac.compare_digest(token.encode(), expected.encode())
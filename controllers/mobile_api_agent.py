@@ -21,14 +21,22 @@ Endpoints:
 - POST /api/v1/transport/agent/scan/ticket - Scanner QR ticket
 - POST /api/v1/transport/agent/boarding/<booking_id> - Embarquer un passager
 - GET /api/v1/transport/agent/trips/<id>/stats - Statistiques embarquement
+- GET /api/v1/transport/agent/trips/<id>/events - Avancement en temps réel (long polling)
+- GET /api/v1/transport/agent/manifests - Manifestes des départs du jour (CSV ou PDF)
+- GET /api/v1/transport/agent/qr-keys - Clés de vérification des QR codes (mode hors ligne)
 """
 
 import logging
+from collections import defaultdict
 from datetime import datetime, timedelta
 
 from odoo import http, _, fields
 from odoo.http import request
 
+from ..tools import ticket_qr
+from ..tools.manifest import FORMATS as MANIFEST_FORMATS
+from ..tools.metrics import metrics
+from .manifest import manifest_response
 from .api_utils import (
     APIErrorCodes,
     api_response, api_error, api_validation_error,
@@ -36,6 +44,8 @@ from .api_utils import (
     generate_api_token,
     require_agent_auth,
     api_exception_handler,
+    api_instrumented,
+    http_json_response,
     rate_limit,
     get_client_ip,
     format_currency,
@@ -46,14 +56,21 @@ from .api_utils import (
 
 _logger = logging.getLogger(__name__)
 
+# Intervalle (secondes) conseillé à l'application entre deux lectures des évènements d'un voyage
+EVENTS_POLL_INTERVAL = 5
+
 
 class TransportAgentMobileAPI(http.Controller):
     """Contrôleur API REST pour l'application mobile des agents d'embarquement"""
 
+    # Préfixe des routes dans les mesures de performance
+    _api_scope = 'agent'
+
     # ==================== AUTHENTIFICATION ====================
 
     @http.route('/api/v1/transport/agent/auth/login', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @rate_limit(max_requests=20, window=60)
     def login(self, **kw):
@@ -64,7 +81,7 @@ class TransportAgentMobileAPI(http.Controller):
             - login: Email ou identifiant (requis)
             - password: Mot de passe (requis)
         """
-        data = request.jsonrequest
+        data = request.params
         
         login = data.get('login', '').strip()
         password = data.get('password', '')
@@ -123,6 +140,7 @@ class TransportAgentMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/agent/auth/logout', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_agent_auth
     def logout(self, agent_user=None, **kw):
@@ -135,6 +153,7 @@ class TransportAgentMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/agent/profile', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_agent_auth
     def get_profile(self, agent_user=None, **kw):
@@ -147,6 +166,7 @@ class TransportAgentMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/agent/trips', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_agent_auth
     def get_assigned_trips(self, agent_user=None, **kw):
@@ -185,10 +205,11 @@ class TransportAgentMobileAPI(http.Controller):
         ]
         
         trips = Trip.search(domain, order='departure_datetime')
+        trip_stats = self._get_trips_boarding_stats(trips)
         
         return api_response(
             data={
-                'trips': [self._format_trip_for_agent(t) for t in trips],
+                'trips': [self._format_trip_for_agent(t, trip_stats.get(t.id)) for t in trips],
                 'date': str(trip_date),
                 'company': {
                     'id': company.id,
@@ -199,6 +220,7 @@ class TransportAgentMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/agent/trips/<int:trip_id>/passengers', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_agent_auth
     def get_trip_passengers(self, trip_id, agent_user=None, **kw):
@@ -226,26 +248,36 @@ class TransportAgentMobileAPI(http.Controller):
                 code=APIErrorCodes.UNAUTHORIZED
             )
         
-        # Récupérer toutes les réservations confirmées
-        bookings = Booking.search([
-            ('trip_id', '=', trip.id),
-            ('state', 'in', ['confirmed', 'checked_in']),
-        ], order='passenger_name')
+        # Récupérer toutes les réservations confirmées (session en mémoire pendant l'embarquement)
+        session = request.env['transport.boarding']._get_session(trip.id)
+        if session:
+            rows = sorted(
+                (row for row in session.rows.values() if row['state'] in ['confirmed', 'checked_in']),
+                key=lambda row: row['passenger_name'] or '',
+            )
+        else:
+            rows = Booking.search([
+                ('trip_id', '=', trip.id),
+                ('state', 'in', ['confirmed', 'checked_in']),
+            ], order='passenger_name')._get_boarding_rows()
+        
+        summary = {
+            'total_confirmed': len(rows),
+            'checked_in': sum(1 for row in rows if row['state'] == 'checked_in'),
+            'pending': sum(1 for row in rows if row['state'] == 'confirmed'),
+        }
         
         return api_response(
             data={
-                'trip': self._format_trip_for_agent(trip),
-                'passengers': [self._format_booking_for_agent(b) for b in bookings],
-                'summary': {
-                    'total_confirmed': len(bookings),
-                    'checked_in': len(bookings.filtered(lambda b: b.state == 'checked_in')),
-                    'pending': len(bookings.filtered(lambda b: b.state == 'confirmed')),
-                },
+                'trip': self._format_trip_for_agent(trip, summary),
+                'passengers': [self._format_boarding_row(row) for row in rows],
+                'summary': summary,
             }
         )
 
     @http.route('/api/v1/transport/agent/trips/<int:trip_id>/stats', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_agent_auth
     def get_trip_stats(self, trip_id, agent_user=None, **kw):
@@ -268,26 +300,40 @@ class TransportAgentMobileAPI(http.Controller):
                 code=APIErrorCodes.UNAUTHORIZED
             )
         
-        all_bookings = Booking.search([('trip_id', '=', trip.id)])
+        # Comptage groupé par état et type de billet (une seule requête)
+        groups = Booking.read_group(
+            [('trip_id', '=', trip.id)],
+            ['total_amount:sum'],
+            ['state', 'ticket_type'],
+            lazy=False,
+        )
+        by_state = {}
+        by_type = {}
+        revenue = 0
+        for group in groups:
+            by_state[group['state']] = by_state.get(group['state'], 0) + group['__count']
+            if group['state'] in ('confirmed', 'checked_in'):
+                by_type[group['ticket_type']] = by_type.get(group['ticket_type'], 0) + group['__count']
+                revenue += group['total_amount'] or 0
         
         stats = {
             'total_seats': trip.total_seats,
             'available_seats': trip.available_seats,
             'bookings': {
-                'total': len(all_bookings),
-                'confirmed': len(all_bookings.filtered(lambda b: b.state == 'confirmed')),
-                'checked_in': len(all_bookings.filtered(lambda b: b.state == 'checked_in')),
-                'cancelled': len(all_bookings.filtered(lambda b: b.state == 'cancelled')),
-                'expired': len(all_bookings.filtered(lambda b: b.state == 'expired')),
+                'total': sum(by_state.values()),
+                'confirmed': by_state.get('confirmed', 0),
+                'checked_in': by_state.get('checked_in', 0),
+                'cancelled': by_state.get('cancelled', 0),
+                'expired': by_state.get('expired', 0),
             },
             'revenue': {
-                'total': sum(all_bookings.filtered(lambda b: b.state in ['confirmed', 'checked_in']).mapped('total_amount')),
+                'total': revenue,
                 'currency': 'FCFA',
             },
             'ticket_types': {
-                'adult': len(all_bookings.filtered(lambda b: b.ticket_type == 'adult' and b.state in ['confirmed', 'checked_in'])),
-                'child': len(all_bookings.filtered(lambda b: b.ticket_type == 'child' and b.state in ['confirmed', 'checked_in'])),
-                'vip': len(all_bookings.filtered(lambda b: b.ticket_type == 'vip' and b.state in ['confirmed', 'checked_in'])),
+                'adult': by_type.get('adult', 0),
+                'child': by_type.get('child', 0),
+                'vip': by_type.get('vip', 0),
             },
         }
         
@@ -300,10 +346,132 @@ class TransportAgentMobileAPI(http.Controller):
         
         return api_response(data={'stats': stats})
 
+    @http.route('/api/v1/transport/agent/trips/<int:trip_id>/events', type='json', auth='none',
+                methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
+    @api_exception_handler
+    @require_agent_auth
+    def get_trip_events(self, trip_id, agent_user=None, **kw):
+        """
+        Avancement d'un voyage en temps réel (remplace la scrutation de /stats)
+        
+        Paramètres:
+            - cursor: curseur renvoyé par l'appel précédent (absent : état initial)
+        
+        Retourne les deltas publiés depuis ``cursor`` (compteurs du voyage et
+        places modifiées) et le curseur suivant. Si le curseur est trop ancien,
+        ``reset`` vaut true et l'état complet est renvoyé dans ``progress``.
+        La réponse est immédiate (pas d'attente dans un worker) : l'application
+        rappelle après ``retry_after`` secondes.
+        """
+        data = request.params
+        trip = request.env['transport.trip'].sudo().browse(trip_id)
+        
+        if not trip.exists():
+            return api_error(
+                message="Voyage non trouvé",
+                code=APIErrorCodes.RESOURCE_NOT_FOUND
+            )
+        
+        company = self._get_agent_company(agent_user)
+        if company and trip.transport_company_id.id != company.id:
+            return api_error(
+                message="Vous n'avez pas accès à ce voyage",
+                code=APIErrorCodes.UNAUTHORIZED
+            )
+        
+        cursor = data.get('cursor')
+        if cursor is not None and not str(cursor).isdigit():
+            return api_error(
+                message="Curseur invalide",
+                code=APIErrorCodes.INVALID_FORMAT
+            )
+        
+        Realtime = request.env['transport.realtime']
+        first_id, last_id = Realtime._get_bus_bounds()
+        if cursor is None or int(cursor) < first_id - 1:
+            # Premier appel ou évènements purgés : état complet
+            return api_response(data={
+                'cursor': last_id,
+                'reset': cursor is not None,
+                'progress': Realtime._get_trip_progress([trip.id]).get(trip.id),
+                'events': [],
+                'retry_after': EVENTS_POLL_INTERVAL,
+            })
+        
+        events, cursor = Realtime._fetch_trip_events(trip.id, int(cursor))
+        return api_response(data={
+            'cursor': cursor,
+            'reset': False,
+            'events': events,
+            'retry_after': EVENTS_POLL_INTERVAL,
+        })
+
     # ==================== SCAN QR CODE ====================
 
+    @http.route('/api/v1/transport/agent/manifests', type='http', auth='none',
+                methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
+    @http_json_response
+    @api_exception_handler
+    @require_agent_auth
+    def download_manifests(self, agent_user=None, **kw):
+        """
+        Télécharger les manifestes des départs d'une journée
+
+        Paramètres (query string):
+        - date: AAAA-MM-JJ (aujourd'hui par défaut)
+        - city_id: gare de départ (toutes par défaut)
+        - format: pdf (défaut) ou csv
+
+        Le fichier est diffusé au fil de la génération ; les erreurs sont
+        renvoyées en JSON.
+        """
+        company = self._get_agent_company(agent_user)
+        if not company:
+            return api_error(
+                message="Aucune compagnie de transport associée à votre compte",
+                code=APIErrorCodes.VALIDATION_ERROR
+            )
+
+        fmt = kw.get('format') or 'pdf'
+        if fmt not in MANIFEST_FORMATS:
+            return api_error(
+                message="Format de manifeste inconnu",
+                code=APIErrorCodes.INVALID_FORMAT,
+                details={'formats': sorted(MANIFEST_FORMATS)},
+            )
+
+        trip_date = fields.Date.today()
+        if kw.get('date'):
+            valid, trip_date = InputValidator.validate_date(kw['date'])
+            if not valid:
+                return api_error(
+                    message="Date invalide (format attendu: AAAA-MM-JJ)",
+                    code=APIErrorCodes.INVALID_FORMAT
+                )
+
+        city_id = kw.get('city_id')
+        if city_id and not str(city_id).isdigit():
+            return api_error(
+                message="Gare invalide",
+                code=APIErrorCodes.INVALID_FORMAT
+            )
+
+        trips = request.env['transport.trip'].sudo()._get_manifest_trips(
+            trip_date, city_id=int(city_id) if city_id else None, company_id=company.id,
+        )
+        if not trips:
+            return api_error(
+                message="Aucun voyage pour cette date",
+                code=APIErrorCodes.RESOURCE_NOT_FOUND,
+                http_status=404
+            )
+        return manifest_response(trips, fmt, tz=agent_user.tz)
+
     @http.route('/api/v1/transport/agent/scan/passenger', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_agent_auth
     def scan_passenger_qr(self, agent_user=None, **kw):
@@ -311,15 +479,18 @@ class TransportAgentMobileAPI(http.Controller):
         Scanner le QR Code unique d'un passager
         
         Body:
-            - qr_data: Données du QR code (format: PASSENGER:<token>)
+            - qr_data: Données du QR code (format signé Ed25519 P2.… ou ancien format
+              PASSENGER:<token>) ; les QR HMAC P1.… sont refusés (motif ``obsolete``)
             - trip_id: ID du voyage actuel (requis)
         
         Retourne:
             - Les informations du passager
             - Tous ses tickets pour le voyage spécifié
             - Le statut de paiement de chaque ticket
+        
+        Pendant l'embarquement, la réponse est servie par la session en mémoire du voyage.
         """
-        data = request.jsonrequest
+        data = request.params
         
         qr_data = data.get('qr_data', '').strip()
         trip_id = data.get('trip_id')
@@ -336,27 +507,55 @@ class TransportAgentMobileAPI(http.Controller):
                 code=APIErrorCodes.VALIDATION_ERROR
             )
         
-        # Parser le QR code
-        if not qr_data.startswith('PASSENGER:'):
+        # Parser le QR code : format signé vérifié sans requête, sinon ancien format
+        passenger_id = passenger_token = token_tag = None
+        if ticket_qr.is_signed(qr_data, ticket_qr.PASSENGER_VERSION) or ticket_qr.is_obsolete(qr_data):
+            try:
+                passenger_id, token_tag = ticket_qr.verify_passenger(
+                    qr_data, request.env['transport.qr.key'].sudo()._get_verification_keys())
+            except ticket_qr.QRError as e:
+                return self._qr_rejected('passenger', e)
+        elif qr_data.startswith('PASSENGER:'):
+            passenger_token = qr_data.replace('PASSENGER:', '')
+        else:
+            metrics.inc('transport_scans_total', scan='passenger', outcome='invalid')
             return api_error(
                 message="Format de QR code invalide. Utilisez le QR code unique du passager.",
                 code=APIErrorCodes.VALIDATION_ERROR
             )
         
-        passenger_token = qr_data.replace('PASSENGER:', '')
+        session = request.env['transport.boarding']._get_session(int(trip_id))
+        rows = session.find_passenger(passenger_id, passenger_token) if session else []
+        if rows:
+            # Un QR signé n'est valable qu'avec le token courant du passager (révocation)
+            if token_tag:
+                try:
+                    ticket_qr.check_token_tag(token_tag, rows[0]['passenger']['token'])
+                except ticket_qr.QRError as e:
+                    return self._qr_rejected('passenger', e)
+            return self._passenger_scan_response(rows[0]['passenger'], rows)
         
         Passenger = request.env['transport.passenger'].sudo()
         Booking = request.env['transport.booking'].sudo()
         Trip = request.env['transport.trip'].sudo()
         
         # Rechercher le passager
-        passenger = Passenger.search([('unique_token', '=', passenger_token)], limit=1)
+        if passenger_id:
+            passenger = Passenger.browse(passenger_id).exists()
+        else:
+            passenger = Passenger.search([('unique_token', '=', passenger_token)], limit=1)
         
         if not passenger:
+            metrics.inc('transport_scans_total', scan='passenger', outcome='not_found')
             return api_error(
                 message="Passager non trouvé. QR code invalide.",
                 code=APIErrorCodes.PASSENGER_NOT_FOUND
             )
+        if token_tag:
+            try:
+                ticket_qr.check_token_tag(token_tag, passenger.unique_token)
+            except ticket_qr.QRError as e:
+                return self._qr_rejected('passenger', e)
         
         # Vérifier le voyage
         trip = Trip.browse(int(trip_id))
@@ -371,14 +570,18 @@ class TransportAgentMobileAPI(http.Controller):
             ('passenger_id', '=', passenger.id),
             ('trip_id', '=', trip.id),
         ])
-        
-        if not bookings:
+        return self._passenger_scan_response(passenger._get_boarding_info(), bookings._get_boarding_rows())
+
+    def _passenger_scan_response(self, passenger, rows):
+        """Réponse du scan d'un passager à partir des lignes de ses réservations sur le voyage"""
+        if not rows:
+            metrics.inc('transport_scans_total', scan='passenger', outcome='no_booking')
             return api_response(
                 data={
                     'passenger': {
-                        'name': passenger.name,
-                        'phone': passenger.phone,
-                        'loyalty_level': passenger.loyalty_level,
+                        'name': passenger['name'],
+                        'phone': passenger['phone'],
+                        'loyalty_level': passenger['loyalty_level'],
                     },
                     'has_valid_ticket': False,
                     'bookings': [],
@@ -387,49 +590,55 @@ class TransportAgentMobileAPI(http.Controller):
             )
         
         # Analyser les réservations
-        valid_bookings = bookings.filtered(lambda b: b.state in ['confirmed', 'checked_in'])
+        state_labels = self._booking_state_labels()
+        valid_rows = [row for row in rows if row['state'] in ['confirmed', 'checked_in']]
         
         response_data = {
             'passenger': {
-                'id': passenger.id,
-                'name': passenger.name,
-                'phone': passenger.phone,
-                'email': passenger.email,
-                'loyalty_level': passenger.loyalty_level,
-                'loyalty_points': passenger.loyalty_points,
+                'id': passenger['id'],
+                'name': passenger['name'],
+                'phone': passenger['phone'],
+                'email': passenger['email'],
+                'loyalty_level': passenger['loyalty_level'],
+                'loyalty_points': passenger['loyalty_points'],
             },
-            'has_valid_ticket': len(valid_bookings) > 0,
+            'has_valid_ticket': len(valid_rows) > 0,
             'bookings': [{
-                'id': b.id,
-                'reference': b.name,
-                'state': b.state,
-                'state_label': dict(b._fields['state'].selection).get(b.state),
-                'is_paid': b.state in ['confirmed', 'checked_in'],
-                'is_boarded': b.state == 'checked_in',
-                'seat': b.seat_number or "Non assigné",
-                'ticket_type': b.ticket_type,
-                'total_amount': b.total_amount,
-                'amount_paid': b.amount_paid,
-                'amount_due': b.amount_due,
-                'can_board': b.state == 'confirmed',
-            } for b in bookings],
+                'id': row['id'],
+                'reference': row['reference'],
+                'state': row['state'],
+                'state_label': state_labels.get(row['state']),
+                'is_paid': row['state'] in ['confirmed', 'checked_in'],
+                'is_boarded': row['state'] == 'checked_in',
+                'seat': row['seat'] or "Non assigné",
+                'ticket_type': row['ticket_type'],
+                'total_amount': row['total_amount'],
+                'amount_paid': row['amount_paid'],
+                'amount_due': row['amount_due'],
+                'can_board': row['state'] == 'confirmed',
+            } for row in rows],
         }
         
         # Déterminer le message approprié
-        if not valid_bookings:
+        if not valid_rows:
+            outcome = 'unpaid'
             response_data['message'] = "⚠️ ATTENTION: Ce passager n'a pas de ticket payé pour ce voyage!"
             response_data['alert_type'] = 'danger'
-        elif all(b.state == 'checked_in' for b in valid_bookings):
+        elif all(row['state'] == 'checked_in' for row in valid_rows):
+            outcome = 'already_boarded'
             response_data['message'] = "✓ Passager déjà embarqué"
             response_data['alert_type'] = 'info'
         else:
+            outcome = 'valid'
             response_data['message'] = "✓ Passager avec ticket valide - Prêt pour l'embarquement"
             response_data['alert_type'] = 'success'
+        metrics.inc('transport_scans_total', scan='passenger', outcome=outcome)
         
         return api_response(data=response_data)
 
     @http.route('/api/v1/transport/agent/scan/ticket', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_agent_auth
     def scan_ticket_qr(self, agent_user=None, **kw):
@@ -437,14 +646,20 @@ class TransportAgentMobileAPI(http.Controller):
         Scanner le QR Code d'un ticket spécifique
         
         Body:
-            - qr_data: Données du QR code (format: TICKET:<ref>|TOKEN:<token>|TRIP:<trip_ref>)
+            - qr_data: Données du QR code (format signé Ed25519 T2.… ou ancien format
+              TICKET:<ref>|TOKEN:<token>|TRIP:<trip_ref>) ; les QR HMAC T1.… sont
+              refusés (motif ``obsolete``)
+            - trip_id: ID du voyage en cours d'embarquement (optionnel, refuse
+              les tickets d'un autre voyage)
         
         Retourne:
             - Les informations du ticket
             - Le statut de paiement
             - La possibilité d'embarquer
+        
+        Pendant l'embarquement, la réponse est servie par la session en mémoire du voyage.
         """
-        data = request.jsonrequest
+        data = request.params
         
         qr_data = data.get('qr_data', '').strip()
         
@@ -454,104 +669,187 @@ class TransportAgentMobileAPI(http.Controller):
                 code=APIErrorCodes.VALIDATION_ERROR
             )
         
-        # Parser le QR code du ticket
-        if not qr_data.startswith('TICKET:'):
+        trip_id = data.get('trip_id')
+        if trip_id and not str(trip_id).isdigit():
             return api_error(
-                message="Format de QR code invalide. Utilisez le QR code du ticket.",
-                code=APIErrorCodes.VALIDATION_ERROR
+                message="ID du voyage invalide",
+                code=APIErrorCodes.INVALID_FORMAT
             )
+        trip_id = int(trip_id) if trip_id else None
         
-        try:
+        Boarding = request.env['transport.boarding']
+        Booking = request.env['transport.booking'].sudo()
+        row = trip = session = None
+        
+        # Format signé : signature, validité et voyage vérifiés sans requête
+        if ticket_qr.is_signed(qr_data, ticket_qr.TICKET_VERSION) or ticket_qr.is_obsolete(qr_data):
+            try:
+                claims = ticket_qr.verify_ticket(
+                    qr_data, request.env['transport.qr.key'].sudo()._get_verification_keys(),
+                    trip_id=trip_id,
+                )
+            except ticket_qr.QRError as e:
+                return self._qr_rejected('ticket', e)
+            session = Boarding._get_session(claims['trip_id'])
+            if session:
+                row = session.get(claims['booking_id'])
+            else:
+                booking = Booking.browse(claims['booking_id']).exists()
+                row = booking._get_boarding_rows()[0] if booking else None
+                trip = booking.trip_id
+            if row and (row['trip_id'] != claims['trip_id']
+                        or (claims['company_id'] and row['company_id'] != claims['company_id'])):
+                row = None
+        elif qr_data.startswith('TICKET:'):
             parts = qr_data.split('|')
             ticket_ref = parts[0].replace('TICKET:', '')
             ticket_token = parts[1].replace('TOKEN:', '') if len(parts) > 1 else None
-        except Exception:
+            
+            session = Boarding._get_session(trip_id) if trip_id else None
+            if session:
+                row = session.find_ticket(ticket_ref, ticket_token)
+            if not row:
+                # Rechercher la réservation
+                domain = [('name', '=', ticket_ref)]
+                if ticket_token:
+                    domain.append(('ticket_token', '=', ticket_token))
+                booking = Booking.search(domain, limit=1)
+                if booking and trip_id and booking.trip_id.id != trip_id:
+                    return self._qr_rejected('ticket', ticket_qr.QRError('wrong_trip'))
+                row = booking._get_boarding_rows()[0] if booking else None
+                trip, session = booking.trip_id, None
+        else:
+            metrics.inc('transport_scans_total', scan='ticket', outcome='invalid')
             return api_error(
-                message="Format de QR code invalide",
+                message="Format de QR code invalide. Utilisez le QR code du ticket.",
                 code=APIErrorCodes.VALIDATION_ERROR
             )
         
-        Booking = request.env['transport.booking'].sudo()
-        
-        # Rechercher la réservation
-        domain = [('name', '=', ticket_ref)]
-        if ticket_token:
-            domain.append(('ticket_token', '=', ticket_token))
-        
-        booking = Booking.search(domain, limit=1)
-        
-        if not booking:
+        if not row:
+            metrics.inc('transport_scans_total', scan='ticket', outcome='not_found')
             return api_error(
                 message="Ticket non trouvé. QR code invalide ou expiré.",
                 code=APIErrorCodes.BOOKING_NOT_FOUND
             )
         
         # Vérifier la compagnie
-        company = self._get_agent_company(agent_user)
-        if company and booking.transport_company_id.id != company.id:
+        company_id = self._get_agent_company_id(agent_user, session)
+        if company_id and row['company_id'] != company_id:
+            metrics.inc('transport_scans_total', scan='ticket', outcome='wrong_company')
             return api_error(
                 message="Ce ticket appartient à une autre compagnie",
                 code=APIErrorCodes.UNAUTHORIZED
             )
         
+        trip_info = session.trip if session else trip._get_boarding_info()
+        state_label = self._booking_state_labels().get(row['state'])
+        
         # Construire la réponse
         response_data = {
             'ticket': {
-                'id': booking.id,
-                'reference': booking.name,
-                'state': booking.state,
-                'state_label': dict(booking._fields['state'].selection).get(booking.state),
+                'id': row['id'],
+                'reference': row['reference'],
+                'state': row['state'],
+                'state_label': state_label,
             },
             'passenger': {
-                'name': booking.passenger_name,
-                'phone': booking.passenger_phone,
+                'name': row['passenger_name'],
+                'phone': row['passenger_phone'],
             },
             'trip': {
-                'id': booking.trip_id.id,
-                'reference': booking.trip_id.name,
-                'route': f"{booking.trip_id.route_id.departure_city_id.name} → {booking.trip_id.route_id.arrival_city_id.name}",
-                'departure': format_datetime(booking.trip_id.departure_datetime),
+                'id': trip_info['id'],
+                'reference': trip_info['reference'],
+                'route': trip_info['route'],
+                'departure': format_datetime(trip_info['departure']),
             },
-            'seat': booking.seat_number or "Non assigné",
-            'ticket_type': booking.ticket_type,
+            'seat': row['seat'] or "Non assigné",
+            'ticket_type': row['ticket_type'],
             'payment': {
-                'total_amount': booking.total_amount,
-                'amount_paid': booking.amount_paid,
-                'amount_due': booking.amount_due,
-                'is_paid': booking.amount_due <= 0,
+                'total_amount': row['total_amount'],
+                'amount_paid': row['amount_paid'],
+                'amount_due': row['amount_due'],
+                'is_paid': row['amount_due'] <= 0,
             },
             'boarding': {
-                'is_boarded': booking.state == 'checked_in',
-                'can_board': booking.state == 'confirmed',
+                'is_boarded': row['state'] == 'checked_in',
+                'can_board': row['state'] == 'confirmed',
             },
         }
         
         # Déterminer le message et l'alerte
-        if booking.state == 'checked_in':
+        outcome = row['state']
+        if row['state'] == 'checked_in':
+            outcome = 'already_boarded'
             response_data['message'] = "✓ Passager déjà embarqué"
             response_data['alert_type'] = 'info'
-        elif booking.state == 'confirmed':
+        elif row['state'] == 'confirmed':
+            outcome = 'valid'
             response_data['message'] = "✓ Ticket valide - Prêt pour l'embarquement"
             response_data['alert_type'] = 'success'
-        elif booking.state in ['draft', 'reserved']:
+        elif row['state'] in ['draft', 'reserved']:
+            outcome = 'unpaid'
             response_data['message'] = "⚠️ ATTENTION: Ticket non payé!"
             response_data['alert_type'] = 'danger'
-        elif booking.state == 'cancelled':
+        elif row['state'] == 'cancelled':
             response_data['message'] = "❌ Ticket annulé"
             response_data['alert_type'] = 'danger'
-        elif booking.state == 'expired':
+        elif row['state'] == 'expired':
             response_data['message'] = "❌ Ticket expiré"
             response_data['alert_type'] = 'danger'
         else:
-            response_data['message'] = f"État du ticket: {response_data['ticket']['state_label']}"
+            response_data['message'] = f"État du ticket: {state_label}"
             response_data['alert_type'] = 'warning'
+        metrics.inc('transport_scans_total', scan='ticket', outcome=outcome)
         
         return api_response(data=response_data)
 
+    def _qr_rejected(self, scan, error):
+        """Réponse d'erreur pour un QR code signé refusé"""
+        metrics.inc('transport_scans_total', scan=scan, outcome=error.reason)
+        return api_error(
+            message=ticket_qr.REJECTION_MESSAGES[error.reason],
+            code=APIErrorCodes.VALIDATION_ERROR,
+            details={'reason': error.reason},
+        )
+
+    @http.route('/api/v1/transport/agent/qr-keys', type='json', auth='none',
+                methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
+    @api_exception_handler
+    @require_agent_auth
+    def get_qr_keys(self, agent_user=None, **kw):
+        """
+        Clés de vérification des QR codes pour le contrôle hors ligne
+
+        Retourne les clés publiques Ed25519 de la compagnie de l'agent
+        (tickets) et de la plateforme (QR passagers), y compris les clés
+        retirées encore acceptées. Les clés privées ne quittent jamais le
+        serveur. L'application doit les rafraîchir à chaque connexion.
+        """
+        company = self._get_agent_company(agent_user)
+        keys = request.env['transport.qr.key'].sudo().search([
+            ('company_id', 'in', [company.id, False] if company else [False]),
+        ])
+        return api_response(data={
+            'keys': [{
+                'kid': key.kid,
+                'public_key': key.public_key,
+                'scope': 'ticket' if key.company_id else 'passenger',
+                'state': key.state,
+            } for key in keys],
+            'algorithm': ticket_qr.ALGORITHM,
+            'passenger_qr_validity_days': ticket_qr.PASSENGER_QR_VALIDITY_DAYS,
+            'formats': {
+                'ticket': ticket_qr.TICKET_VERSION,
+                'passenger': ticket_qr.PASSENGER_VERSION,
+            },
+        })
+
     # ==================== EMBARQUEMENT ====================
 
     @http.route('/api/v1/transport/agent/boarding/<int:booking_id>', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_agent_auth
     def board_passenger(self, booking_id, agent_user=None, **kw):
@@ -559,58 +857,71 @@ class TransportAgentMobileAPI(http.Controller):
         Embarquer un passager
         
         Cette action marque le passager comme embarqué si le ticket est valide et payé.
+        Pendant l'embarquement, les contrôles sont faits sur la session en mémoire du
+        voyage ; l'embarquement lui-même est toujours écrit en base.
         """
         Booking = request.env['transport.booking'].sudo()
         
-        booking = Booking.browse(booking_id)
+        session = request.env['transport.boarding']._find_session(booking_id)
+        row = session.get(booking_id) if session else None
+        if not row:
+            session = None
+            booking = Booking.browse(booking_id).exists()
+            row = booking._get_boarding_rows()[0] if booking else None
         
-        if not booking.exists():
+        if not row:
             return api_error(
                 message="Réservation non trouvée",
                 code=APIErrorCodes.BOOKING_NOT_FOUND
             )
         
         # Vérifier la compagnie
-        company = self._get_agent_company(agent_user)
-        if company and booking.transport_company_id.id != company.id:
+        company_id = self._get_agent_company_id(agent_user, session)
+        if company_id and row['company_id'] != company_id:
             return api_error(
                 message="Vous n'avez pas accès à cette réservation",
                 code=APIErrorCodes.UNAUTHORIZED
             )
         
         # Vérifier l'état
-        if booking.state == 'checked_in':
+        if row['state'] == 'checked_in':
             return api_error(
                 message="Ce passager est déjà embarqué",
                 code=APIErrorCodes.VALIDATION_ERROR
             )
         
-        if booking.state != 'confirmed':
+        if row['state'] != 'confirmed':
             return api_error(
-                message=f"Impossible d'embarquer: ticket en état '{dict(booking._fields['state'].selection).get(booking.state)}'",
+                message=f"Impossible d'embarquer: ticket en état '{self._booking_state_labels().get(row['state'])}'",
                 code=APIErrorCodes.VALIDATION_ERROR
             )
         
         # Vérifier le paiement
-        if booking.amount_due > 0:
+        if row['amount_due'] > 0:
             return api_error(
-                message=f"Ticket non payé intégralement. Reste à payer: {format_currency(booking.amount_due)}",
+                message=f"Ticket non payé intégralement. Reste à payer: {format_currency(row['amount_due'])}",
                 code=APIErrorCodes.VALIDATION_ERROR
             )
         
         # Embarquer le passager
         try:
+            booking = Booking.browse(booking_id)
             booking.action_check_in()
             
             # Ajouter des points de fidélité au passager
-            if booking.passenger_id:
-                points = int(booking.total_amount / 100)  # 1 point pour 100 FCFA
-                booking.passenger_id.add_loyalty_points(points)
+            if row['passenger']:
+                points = int(row['total_amount'] / 100)  # 1 point pour 100 FCFA
+                booking.passenger_id.add_loyalty_points(points, booking=booking, reason="Embarquement")
+            
+            row = dict(row, state='checked_in')
+            if session:
+                with session.lock:
+                    session.apply(row)
             
             return api_response(
                 data={
-                    'booking': self._format_booking_for_agent(booking),
-                    'message': f"✓ {booking.passenger_name} embarqué avec succès"
+                    'booking': self._format_boarding_row(row),
+                    'message': f"✓ {row['passenger_name']} embarqué avec succès"
                 },
                 message="Embarquement réussi"
             )
@@ -624,6 +935,7 @@ class TransportAgentMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/agent/boarding/batch', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_agent_auth
     def board_passengers_batch(self, agent_user=None, **kw):
@@ -633,7 +945,7 @@ class TransportAgentMobileAPI(http.Controller):
         Body:
             - booking_ids: Liste des IDs de réservations à embarquer
         """
-        data = request.jsonrequest
+        data = request.params
         
         booking_ids = data.get('booking_ids', [])
         
@@ -651,6 +963,7 @@ class TransportAgentMobileAPI(http.Controller):
         }
         
         company = self._get_agent_company(agent_user)
+        to_board = Booking
         
         for booking_id in booking_ids:
             booking = Booking.browse(booking_id)
@@ -693,23 +1006,37 @@ class TransportAgentMobileAPI(http.Controller):
                 })
                 continue
             
+            to_board |= booking
+        
+        # Embarquement groupé : une seule écriture et un message de synthèse par voyage.
+        # Si le lot échoue, chaque réservation est reprise seule : une erreur
+        # n'empêche pas l'embarquement des autres passagers.
+        boarded = Booking
+        if to_board:
             try:
-                booking.action_check_in()
-                if booking.passenger_id:
-                    points = int(booking.total_amount / 100)
-                    booking.passenger_id.add_loyalty_points(points)
-                
-                results['success'].append({
-                    'id': booking.id,
-                    'reference': booking.name,
-                    'passenger': booking.passenger_name,
-                })
+                with request.env.cr.savepoint():
+                    self._check_in_bookings(to_board)
+                boarded = to_board
             except Exception as e:
-                results['failed'].append({
-                    'id': booking_id,
-                    'reference': booking.name,
-                    'reason': str(e)
-                })
+                _logger.warning(f"Embarquement groupé en échec, reprise par réservation: {e}")
+                for booking in to_board:
+                    try:
+                        with request.env.cr.savepoint():
+                            self._check_in_bookings(booking)
+                        boarded |= booking
+                    except Exception as e:
+                        _logger.exception(f"Erreur embarquement {booking.name}: {e}")
+                        results['failed'].append({
+                            'id': booking.id,
+                            'reference': booking.name,
+                            'reason': str(e)
+                        })
+        for booking in boarded:
+            results['success'].append({
+                'id': booking.id,
+                'reference': booking.name,
+                'passenger': booking.passenger_name,
+            })
         
         return api_response(
             data=results,
@@ -718,17 +1045,33 @@ class TransportAgentMobileAPI(http.Controller):
 
     # ==================== UTILITAIRES ====================
 
+    def _check_in_bookings(self, bookings):
+        """Embarquer des réservations validées : écriture groupée, synthèse et points de fidélité"""
+        bookings._bulk_mode().action_check_in()
+        bookings._post_bulk_summary(bookings, "Embarquement groupé")
+        # Une ligne de journal par passager pour tout le lot
+        points_by_passenger = defaultdict(int)
+        for booking in bookings:
+            if booking.passenger_id:
+                points_by_passenger[booking.passenger_id.id] += int(booking.total_amount / 100)
+        request.env['transport.passenger'].sudo()._add_loyalty_points(
+            points_by_passenger, reason="Embarquement groupé")
+
     def _get_agent_company(self, user):
         """Obtenir la compagnie de transport associée à l'agent"""
         # Chercher si l'utilisateur est lié à une compagnie
         Company = request.env['transport.company'].sudo()
         
-        # D'abord chercher par employee_ids ou partner_id
+        # Compagnies explicitement associées à l'agent
+        if user.transport_company_ids:
+            return user.transport_company_ids.sudo()[:1]
+        
+        # D'abord chercher par responsables ou partner_id
         if user.partner_id:
             company = Company.search([
                 '|',
                 ('partner_id', '=', user.partner_id.id),
-                ('user_ids', 'in', [user.id]),
+                ('manager_ids', 'in', [user.id]),
             ], limit=1)
             
             if company:
@@ -748,6 +1091,15 @@ class TransportAgentMobileAPI(http.Controller):
         # Retourner la première compagnie active si aucune association
         return Company.search([('state', '=', 'active')], limit=1)
 
+    def _get_agent_company_id(self, user, session=None):
+        """Identifiant de la compagnie de l'agent, mémorisé dans la session d'embarquement"""
+        if session and user.id in session.agents:
+            return session.agents[user.id]
+        company_id = self._get_agent_company(user).id
+        if session:
+            session.agents[user.id] = company_id
+        return company_id
+
     def _format_agent(self, user, include_company=False):
         """Formater les données d'un agent pour l'API"""
         data = {
@@ -769,15 +1121,22 @@ class TransportAgentMobileAPI(http.Controller):
         
         return data
 
-    def _format_trip_for_agent(self, trip):
+    def _get_trips_boarding_stats(self, trips):
+        """Compteurs d'embarquement de plusieurs voyages en une requête groupée"""
+        stats = {trip.id: {'total_confirmed': 0, 'checked_in': 0, 'pending': 0} for trip in trips}
+        for trip, state, count in request.env['transport.booking'].sudo()._read_group(
+            [('trip_id', 'in', trips.ids), ('state', 'in', ['confirmed', 'checked_in'])],
+            ['trip_id', 'state'],
+            ['__count'],
+        ):
+            stats[trip.id]['total_confirmed'] += count
+            stats[trip.id]['checked_in' if state == 'checked_in' else 'pending'] += count
+        return stats
+
+    def _format_trip_for_agent(self, trip, stats=None):
         """Formater un voyage pour l'API agent"""
-        Booking = request.env['transport.booking'].sudo()
-        
-        # Statistiques rapides
-        bookings = Booking.search([
-            ('trip_id', '=', trip.id),
-            ('state', 'in', ['confirmed', 'checked_in']),
-        ])
+        if stats is None:
+            stats = self._get_trips_boarding_stats(trip)[trip.id]
         
         return {
             'id': trip.id,
@@ -797,33 +1156,37 @@ class TransportAgentMobileAPI(http.Controller):
             },
             'driver': trip.driver_name,
             'stats': {
-                'total_confirmed': len(bookings),
-                'checked_in': len(bookings.filtered(lambda b: b.state == 'checked_in')),
-                'pending': len(bookings.filtered(lambda b: b.state == 'confirmed')),
+                'total_confirmed': stats['total_confirmed'],
+                'checked_in': stats['checked_in'],
+                'pending': stats['pending'],
                 'total_seats': trip.total_seats,
                 'available_seats': trip.available_seats,
             },
         }
 
-    def _format_booking_for_agent(self, booking):
-        """Formater une réservation pour l'API agent"""
+    def _format_boarding_row(self, row):
+        """Formater une ligne de session d'embarquement (voir transport.booking._get_boarding_rows)"""
         return {
-            'id': booking.id,
-            'reference': booking.name,
+            'id': row['id'],
+            'reference': row['reference'],
             'passenger': {
-                'id': booking.passenger_id.id if booking.passenger_id else None,
-                'name': booking.passenger_name,
-                'phone': booking.passenger_phone,
+                'id': row['passenger']['id'] if row['passenger'] else None,
+                'name': row['passenger_name'],
+                'phone': row['passenger_phone'],
             },
-            'seat': booking.seat_number or "Non assigné",
-            'ticket_type': booking.ticket_type,
-            'state': booking.state,
-            'state_label': dict(booking._fields['state'].selection).get(booking.state),
-            'is_paid': booking.amount_due <= 0,
-            'is_boarded': booking.state == 'checked_in',
-            'can_board': booking.state == 'confirmed' and booking.amount_due <= 0,
-            'total_amount': booking.total_amount,
-            'amount_due': booking.amount_due,
-            'boarding_stop': booking.boarding_stop_id.name if booking.boarding_stop_id else None,
-            'alighting_stop': booking.alighting_stop_id.name if booking.alighting_stop_id else None,
+            'seat': row['seat'] or "Non assigné",
+            'ticket_type': row['ticket_type'],
+            'state': row['state'],
+            'state_label': self._booking_state_labels().get(row['state']),
+            'is_paid': row['amount_due'] <= 0,
+            'is_boarded': row['state'] == 'checked_in',
+            'can_board': row['state'] == 'confirmed' and row['amount_due'] <= 0,
+            'total_amount': row['total_amount'],
+            'amount_due': row['amount_due'],
+            'boarding_stop': row['boarding_stop'],
+            'alighting_stop': row['alighting_stop'],
         }
+
+    def _booking_state_labels(self):
+        """Libellés des états de réservation"""
+        return dict(request.env['transport.booking']._fields['state'].selection)
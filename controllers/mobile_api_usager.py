@@ -27,6 +27,7 @@ Endpoints:
 - GET /api/v1/transport/usager/bookings - Mes réservations
 - GET /api/v1/transport/usager/bookings/<id> - Détails réservation
 - POST /api/v1/transport/usager/bookings/<id>/pay - Payer réservation
+- GET /api/v1/transport/usager/payments/<id> - État d'un paiement
 - GET /api/v1/transport/usager/bookings/<id>/ticket - Ticket avec QR
 - GET /api/v1/transport/usager/bookings/<id>/receipt - Reçu de paiement
 - POST /api/v1/transport/usager/bookings/<id>/cancel - Annuler réservation
@@ -39,6 +40,9 @@ from datetime import datetime, timedelta
 from odoo import http, _, fields
 from odoo.http import request
 
+from ..tools import keyset
+from ..tools.phone import normalize_phone
+from ..tools.ticket_render import FORMATS as TICKET_FORMATS
 from .api_utils import (
     APIErrorCodes,
     api_response, api_error, api_validation_error,
@@ -46,6 +50,7 @@ from .api_utils import (
     generate_api_token,
     require_passenger_auth,
     api_exception_handler,
+    api_instrumented,
     rate_limit,
     get_client_ip,
     format_currency,
@@ -60,6 +65,9 @@ _logger = logging.getLogger(__name__)
 class TransportUsagerMobileAPI(http.Controller):
     """Contrôleur API REST pour l'application mobile des usagers"""
 
+    # Préfixe des routes dans les mesures de performance
+    _api_scope = 'usager'
+
     # ==================== PING / HEALTH CHECK ====================
 
     @http.route('/api/v1/transport/ping', type='http', auth='none', 
@@ -92,6 +100,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/auth/register', type='json', auth='none', 
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @rate_limit(max_requests=10, window=60)
     def register(self, **kw):
@@ -108,7 +117,7 @@ class TransportUsagerMobileAPI(http.Controller):
             - date_of_birth: Date de naissance YYYY-MM-DD (optionnel)
             - gender: 'male' ou 'female' (optionnel)
         """
-        data = request.jsonrequest
+        data = request.params
         
         # Validation
         errors = []
@@ -135,7 +144,7 @@ class TransportUsagerMobileAPI(http.Controller):
         Passenger = request.env['transport.passenger'].sudo()
         
         # Vérifier si le téléphone existe déjà
-        existing = Passenger.search([('phone', '=', phone_result)], limit=1)
+        existing = Passenger.search([('phone_key', '=', phone_result)], limit=1)
         if existing:
             return api_error(
                 message="Ce numéro de téléphone est déjà enregistré",
@@ -187,6 +196,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/auth/login', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @rate_limit(max_requests=20, window=60)
     def login(self, **kw):
@@ -197,7 +207,7 @@ class TransportUsagerMobileAPI(http.Controller):
             - phone: Numéro de téléphone (requis)
             - pin_code: Code PIN 4 chiffres (requis)
         """
-        data = request.jsonrequest
+        data = request.params
         
         valid_phone, phone_result = InputValidator.validate_phone(data.get('phone'))
         if not valid_phone:
@@ -215,7 +225,7 @@ class TransportUsagerMobileAPI(http.Controller):
         Passenger = request.env['transport.passenger'].sudo()
         
         passenger = Passenger.search([
-            ('phone', '=', phone_result),
+            ('phone_key', '=', phone_result),
             ('active', '=', True),
         ], limit=1)
         
@@ -249,6 +259,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/auth/logout', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def logout(self, passenger=None, **kw):
@@ -261,6 +272,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/auth/refresh', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def refresh_token(self, passenger=None, **kw):
@@ -283,6 +295,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/profile', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def get_profile(self, passenger=None, **kw):
@@ -293,11 +306,12 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/profile', type='json', auth='none',
                 methods=['PUT', 'PATCH'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def update_profile(self, passenger=None, **kw):
         """Modifier le profil de l'usager"""
-        data = request.jsonrequest
+        data = request.params
         
         update_vals = {}
         errors = []
@@ -351,11 +365,12 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/profile/change-pin', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def change_pin(self, passenger=None, **kw):
         """Changer le code PIN"""
-        data = request.jsonrequest
+        data = request.params
         
         if passenger.pin_code != str(data.get('current_pin', '')):
             return api_error(
@@ -378,6 +393,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/qrcode', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def get_qrcode(self, passenger=None, **kw):
@@ -389,7 +405,7 @@ class TransportUsagerMobileAPI(http.Controller):
         """
         return api_response(
             data={
-                'qr_code_data': f"PASSENGER:{passenger.unique_token}",
+                'qr_code_data': passenger._get_qr_payload(),
                 'qr_code_image': passenger.unique_qr_code.decode('utf-8') if passenger.unique_qr_code else None,
                 'passenger_name': passenger.name,
                 'passenger_phone': passenger.phone,
@@ -400,6 +416,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/cities', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @rate_limit(max_requests=100, window=60)
     def get_cities(self, **kw):
@@ -421,6 +438,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/companies', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @rate_limit(max_requests=100, window=60)
     def get_companies(self, **kw):
@@ -447,6 +465,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/trips/search', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @rate_limit(max_requests=60, window=60)
     def search_trips(self, **kw):
@@ -461,7 +480,7 @@ class TransportUsagerMobileAPI(http.Controller):
             - passengers: Nombre de passagers (défaut: 1)
             - company_id: Filtrer par compagnie (optionnel)
         """
-        data = request.jsonrequest
+        data = request.params
         
         # Validation
         errors = []
@@ -552,6 +571,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/trips/<int:trip_id>', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     def get_trip_detail(self, trip_id, **kw):
         """Détails d'un voyage"""
@@ -572,6 +592,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/bookings', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def create_booking(self, passenger=None, **kw):
@@ -595,7 +616,7 @@ class TransportUsagerMobileAPI(http.Controller):
                 - id_number: Numéro de pièce (optionnel)
               }
         """
-        data = request.jsonrequest
+        data = request.params
         
         # Validation
         valid, trip_id = InputValidator.validate_positive_int(data.get('trip_id'), "Voyage")
@@ -640,7 +661,7 @@ class TransportUsagerMobileAPI(http.Controller):
             
             # Infos du passager tiers
             traveler_name = other_passenger_data['name']
-            traveler_phone = other_passenger_data.get('phone', '')
+            traveler_phone = phone_result
             traveler_email = other_passenger_data.get('email', '')
             traveler_id_type = other_passenger_data.get('id_type')
             traveler_id_number = other_passenger_data.get('id_number')
@@ -654,7 +675,8 @@ class TransportUsagerMobileAPI(http.Controller):
         
         # Créer ou récupérer le partner associé au voyageur
         Partner = request.env['res.partner'].sudo()
-        partner = Partner.search([('phone', '=', traveler_phone)], limit=1)
+        traveler_phone_key = normalize_phone(traveler_phone)
+        partner = Partner.search([('transport_phone_key', '=', traveler_phone_key)], limit=1) if traveler_phone_key else Partner
         if not partner:
             partner = Partner.create({
                 'name': traveler_name,
@@ -727,16 +749,19 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/bookings', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def get_bookings(self, passenger=None, **kw):
         """
-        Obtenir les réservations de l'usager
+        Obtenir les réservations de l'usager, des plus récentes aux plus anciennes
         
         Query params:
             - state: Filtrer par état (optionnel)
-            - limit: Nombre max de résultats (défaut: 50)
-            - offset: Décalage pour pagination (défaut: 0)
+            - limit: Nombre max de résultats (défaut: 50, max: 100)
+            - cursor: Curseur de la page suivante (``next_cursor`` de la réponse précédente)
+            - with_total: Inclure le total (toujours inclus sur la première page)
+            - offset: Décalage (ancien mode de pagination, déprécié au profit de ``cursor``)
         """
         Booking = request.env['transport.booking'].sudo()
         
@@ -747,23 +772,40 @@ class TransportUsagerMobileAPI(http.Controller):
         if params.get('state'):
             domain.append(('state', '=', params['state']))
         
-        limit = min(int(params.get('limit', 50)), 100)
-        offset = int(params.get('offset', 0))
+        limit, offset = params.get('limit', 50), params.get('offset', 0)
+        if not str(limit).isdigit() or not str(offset).isdigit():
+            return api_error(
+                message="Paramètres de pagination invalides",
+                code=APIErrorCodes.INVALID_FORMAT
+            )
+        limit = min(int(limit), keyset.MAX_LIMIT)
+        cursor = params.get('cursor')
         
-        bookings = Booking.search(domain, limit=limit, offset=offset, order='create_date desc')
-        total = Booking.search_count(domain)
+        try:
+            bookings, next_cursor = Booking._keyset_search(
+                domain, 'recent', cursor=cursor, limit=limit, offset=int(offset))
+        except ValueError:
+            return api_error(
+                message="Curseur de pagination invalide",
+                code=APIErrorCodes.INVALID_FORMAT
+            )
         
-        return api_response(
-            data={
-                'bookings': [self._format_booking(b) for b in bookings],
-                'total': total,
-                'limit': limit,
-                'offset': offset,
-            }
-        )
+        data = {
+            'bookings': [self._format_booking(b) for b in bookings],
+            'next_cursor': next_cursor,
+            'limit': limit,
+        }
+        # Total à la demande seulement : les pages suivantes ne recomptent pas l'historique
+        if params.get('with_total') or not (cursor or int(offset)):
+            data['total'] = Booking._keyset_count(domain)
+        if int(offset):
+            data['offset'] = int(offset)
+        
+        return api_response(data=data)
 
     @http.route('/api/v1/transport/usager/bookings/<int:booking_id>', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def get_booking_detail(self, booking_id, passenger=None, **kw):
@@ -787,6 +829,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/bookings/<int:booking_id>/pay', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def pay_booking(self, booking_id, passenger=None, **kw):
@@ -797,7 +840,7 @@ class TransportUsagerMobileAPI(http.Controller):
             - payment_method: 'wave', 'orange_money', 'mtn_money', etc.
             - phone: Numéro de téléphone pour le paiement
         """
-        data = request.jsonrequest
+        data = request.params
         
         Booking = request.env['transport.booking'].sudo()
         Payment = request.env['transport.payment'].sudo()
@@ -840,12 +883,17 @@ class TransportUsagerMobileAPI(http.Controller):
         # Pour Wave, initier le paiement
         if payment_method == 'wave':
             try:
-                payment.action_process_wave_payment()
+                if Payment._is_wave_async_checkout():
+                    # La session Wave est créée en arrière-plan : l'application
+                    # interroge /payments/<id> pour obtenir l'URL de paiement
+                    payment.action_request_wave_checkout()
+                else:
+                    payment.action_process_wave_payment()
                 
                 return api_response(
                     data={
                         'payment_id': payment.id,
-                        'payment_url': payment.wave_payment_url,
+                        'payment_url': payment.wave_payment_url or None,
                         'status': 'pending',
                         'amount': booking.amount_due,
                     },
@@ -884,8 +932,39 @@ class TransportUsagerMobileAPI(http.Controller):
                 message="Paiement effectué avec succès"
             )
 
+    @http.route('/api/v1/transport/usager/payments/<int:payment_id>', type='json', auth='none',
+                methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
+    @api_exception_handler
+    @require_passenger_auth
+    def get_payment_status(self, payment_id, passenger=None, **kw):
+        """État d'un paiement (URL Wave disponible une fois la session créée)"""
+        payment = request.env['transport.payment'].sudo().search([
+            ('id', '=', payment_id),
+            ('booking_id.passenger_id', '=', passenger.id),
+        ], limit=1)
+        
+        if not payment:
+            return api_error(
+                message="Paiement non trouvé",
+                code=APIErrorCodes.RESOURCE_NOT_FOUND
+            )
+        
+        return api_response(
+            data={
+                'payment_id': payment.id,
+                'reference': payment.name,
+                'status': payment.state,
+                'payment_url': payment.wave_payment_url or None,
+                'queued': payment.wave_checkout_queued,
+                'amount': payment.amount,
+                'error': payment.error_message if payment.state == 'failed' else None,
+            }
+        )
+
     @http.route('/api/v1/transport/usager/bookings/<int:booking_id>/ticket', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def get_ticket(self, booking_id, passenger=None, **kw):
@@ -897,6 +976,7 @@ class TransportUsagerMobileAPI(http.Controller):
         - QR Code unique du ticket
         - QR Code unique du passager
         - Informations d'achat pour tiers si applicable
+        - Fichier du billet si ``format`` est demandé (compact, escpos ou png)
         """
         Booking = request.env['transport.booking'].sudo()
         
@@ -929,7 +1009,7 @@ class TransportUsagerMobileAPI(http.Controller):
             'name': traveler.name if booking.is_for_other else passenger.name,
             'phone': traveler.phone if booking.is_for_other else passenger.phone,
             'unique_qr_code': traveler.unique_qr_code.decode('utf-8') if traveler.unique_qr_code else None,
-            'unique_qr_data': f"PASSENGER:{traveler.unique_token}",
+            'unique_qr_data': traveler._get_qr_payload() if traveler else None,
         }
         
         # Si c'est un achat pour tiers avec nom/téléphone custom
@@ -943,7 +1023,7 @@ class TransportUsagerMobileAPI(http.Controller):
             'ticket_number': booking.name,
             'ticket_token': booking.ticket_token,
             'ticket_qr_code': booking.qr_code.decode('utf-8') if booking.qr_code else None,
-            'ticket_qr_data': f"TICKET:{booking.name}|TOKEN:{booking.ticket_token}|TRIP:{booking.trip_id.name}",
+            'ticket_qr_data': booking._get_ticket_qr_payload(),
             'passenger': passenger_info,
             'trip': self._format_trip(booking.trip_id),
             'seat': booking.seat_number or "Non assigné",
@@ -959,7 +1039,24 @@ class TransportUsagerMobileAPI(http.Controller):
                 'name': booking.buyer_name or buyer.name,
                 'phone': booking.buyer_phone or buyer.phone,
             }
-        
+
+        # Rendu natif facultatif (?format=compact|escpos|png), encodé en base64
+        fmt = kw.get('format')
+        if fmt:
+            if fmt not in TICKET_FORMATS:
+                return api_error(
+                    message="Format de billet inconnu",
+                    code=APIErrorCodes.VALIDATION_ERROR,
+                    details={'formats': sorted(TICKET_FORMATS)},
+                )
+            content, mimetype, filename = booking._render_native_ticket(fmt)
+            ticket_data['file'] = {
+                'format': fmt,
+                'mimetype': mimetype,
+                'filename': filename,
+                'content': base64.b64encode(content).decode('ascii'),
+            }
+
         return api_response(
             data={
                 'ticket': ticket_data,
@@ -968,6 +1065,7 @@ class TransportUsagerMobileAPI(http.Controller):
 
     @http.route('/api/v1/transport/usager/bookings/<int:booking_id>/share', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def generate_share_link(self, booking_id, passenger=None, **kw):
@@ -1048,6 +1146,7 @@ Bon voyage! 🚌"""
 
     @http.route('/api/v1/transport/usager/bookings/<int:booking_id>/receipt', type='json', auth='none',
                 methods=['GET'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def get_receipt(self, booking_id, passenger=None, **kw):
@@ -1110,6 +1209,7 @@ Bon voyage! 🚌"""
 
     @http.route('/api/v1/transport/usager/bookings/<int:booking_id>/cancel', type='json', auth='none',
                 methods=['POST'], csrf=False, cors='*')
+    @api_instrumented
     @api_exception_handler
     @require_passenger_auth
     def cancel_booking(self, booking_id, passenger=None, **kw):
@@ -1196,7 +1296,7 @@ Bon voyage! 🚌"""
                     'name': trip.route_id.arrival_city_id.name,
                 },
                 'distance_km': trip.route_id.distance_km,
-                'duration_hours': trip.route_id.duration_hours,
+                'duration_hours': trip.route_id.estimated_duration,
             },
             'departure_datetime': format_datetime(trip.departure_datetime),
             'departure_date': format_date(trip.departure_date),
@@ -1215,7 +1315,10 @@ Bon voyage! 🚌"""
                 'id': trip.bus_id.id,
                 'name': trip.bus_id.name,
                 'model': trip.bus_id.model,
-                'amenities': trip.bus_id.amenities,
+                'amenities': [
+                    amenity for amenity in ('has_ac', 'has_wifi', 'has_toilet', 'has_tv', 'has_usb')
+                    if trip.bus_id[amenity]
+                ],
             },
             'manage_luggage': trip.manage_luggage,
             'luggage_included_kg': trip.luggage_included_kg,
@@ -1223,24 +1326,23 @@ Bon voyage! 🚌"""
         }
         
         if include_seats:
-            # Inclure les sièges disponibles
+            # Inclure les sièges disponibles (sièges occupés lus en une seule requête)
+            booked_seats = request.env['transport.booking'].sudo().search([
+                ('trip_id', '=', trip.id),
+                ('seat_id', '!=', False),
+                ('state', 'in', ['reserved', 'confirmed', 'checked_in']),
+            ]).seat_id
+            vip_supplement = max(trip.vip_price - trip.price, 0) if trip.vip_price else 0
             available_seats = []
             for seat in trip.bus_id.seat_ids:
-                # Vérifier si le siège est réservé
-                is_booked = request.env['transport.booking'].sudo().search_count([
-                    ('trip_id', '=', trip.id),
-                    ('seat_id', '=', seat.id),
-                    ('state', 'in', ['reserved', 'confirmed', 'checked_in']),
-                ]) > 0
-                
                 available_seats.append({
                     'id': seat.id,
                     'number': seat.seat_number,
                     'type': seat.seat_type,
-                    'row': seat.row_number,
-                    'column': seat.column_number,
-                    'is_available': not is_booked,
-                    'price_supplement': seat.price_supplement or 0,
+                    'row': seat.row,
+                    'column': seat.position,
+                    'is_available': seat not in booked_seats,
+                    'price_supplement': vip_supplement if seat.seat_type == 'vip' else 0,
                 })
             
             data['seats'] = available_seats
@@ -2,9 +2,11 @@
 
 from odoo import http
 from odoo.http import request
-import json
 import hmac
 import hashlib
+import logging
+
+_logger = logging.getLogger(__name__)
 
 
 class TransportPaymentController(http.Controller):
@@ -44,40 +46,47 @@ class TransportPaymentController(http.Controller):
         
         return request.redirect(f'/my/bookings/{booking.id}?payment_error=1')
 
-    @http.route('/transport/payment/webhook/<int:payment_id>', type='json', auth='public', 
-                methods=['POST'], csrf=False)
+    @http.route('/transport/payment/webhook/<int:payment_id>', type='http', auth='public',
+                methods=['POST'], csrf=False, save_session=False)
     def payment_webhook(self, payment_id, **kw):
-        """Webhook Wave pour confirmation asynchrone"""
-        Payment = request.env['transport.payment'].sudo()
-        
-        # Récupérer les données du webhook
-        data = request.jsonrequest
-        
-        # Vérifier la signature (à adapter selon Wave)
-        # signature = request.httprequest.headers.get('Wave-Signature')
-        # if not self._verify_wave_signature(data, signature, payment_id):
-        #     return {'error': 'Invalid signature'}
+        """
+        Webhook Wave pour confirmation asynchrone.
+
+        L'évènement est vérifié (HMAC), déposé dans la boîte de réception
+        transport.payment.event puis acquitté aussitôt ; il est appliqué au
+        paiement par une tâche planifiée. Une nouvelle livraison du même
+        évènement est acquittée sans être retraitée.
+        """
+        body = request.httprequest.get_data()
+        payment = request.env['transport.payment'].sudo().browse(payment_id).exists()
+        if not payment:
+            return self._webhook_response({'error': 'Unknown payment'}, status=404)
+        
+        signature = request.httprequest.headers.get('Wave-Signature')
+        if not self._verify_wave_signature(body, signature, payment):
+            _logger.warning("Webhook Wave refusé pour %s : signature invalide", payment.name)
+            return self._webhook_response({'error': 'Invalid signature'}, status=401)
         
-        # Traiter le webhook
-        Payment.process_wave_webhook(payment_id, data)
+        try:
+            request.env['transport.payment.event'].sudo()._receive('wave', payment, body)
+        except ValueError:
+            return self._webhook_response({'error': 'Invalid JSON'}, status=400)
         
-        return {'status': 'ok'}
+        return self._webhook_response({'status': 'ok'})
 
-    def _verify_wave_signature(self, data, signature, payment_id):
-        """Vérifier la signature du webhook Wave"""
-        payment = request.env['transport.payment'].sudo().browse(payment_id)
-        if not payment.exists():
-            return False
-        
+    def _webhook_response(self, data, status=200):
+        return request.make_json_response(data, status=status)
+
+    def _verify_wave_signature(self, body, signature, payment):
+        """Vérifier la signature HMAC-SHA256 du corps brut du webhook Wave"""
         api_key = payment.transport_company_id.wave_api_key
-        if not api_key:
+        if not api_key or not signature:
             return False
         
         # Calculer la signature attendue
-        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
         expected_signature = hmac.new(
             api_key.encode('utf-8'),
-            payload,
+            body,
             hashlib.sha256
         ).hexdigest()
         
@@ -173,15 +182,26 @@ class TransportPaymentController(http.Controller):
 
     @http.route('/api/transport/my/bookings', type='json', auth='user', methods=['POST'], csrf=False)
     def api_my_bookings(self, **kw):
-        """API: Liste des réservations de l'utilisateur"""
+        """
+        API: Liste des réservations de l'utilisateur
+
+        Sans paramètre ``cursor``, réponse historique : la liste des 50 départs
+        les plus récents. Avec ``cursor`` (null pour la première page) :
+        ``{'bookings': [...], 'next_cursor': ...}``, pages de ``limit`` lignes.
+        """
         Booking = request.env['transport.booking'].sudo()
         partner = request.env.user.partner_id
+        paged = 'cursor' in kw
         
-        bookings = Booking.search([
-            ('partner_id', '=', partner.id)
-        ], order='departure_datetime desc', limit=50)
-        
-        return [{
+        try:
+            bookings, next_cursor = Booking._keyset_search(
+                [('partner_id', '=', partner.id)], 'departure',
+                cursor=kw.get('cursor'), limit=(kw.get('limit') if paged else None) or 50,
+            )
+        except (TypeError, ValueError):
+            return {'error': 'Curseur ou limite invalide'}
+        
+        rows = [{
             'id': b.id,
             'reference': b.name,
             'trip_reference': b.trip_id.name,
@@ -196,3 +216,6 @@ class TransportPaymentController(http.Controller):
             'booking_type': b.booking_type,
             'reservation_deadline': b.reservation_deadline.isoformat() if b.reservation_deadline else None,
         } for b in bookings]
+        if not paged:
+            return rows
+        return {'bookings': rows, 'next_cursor': next_cursor}
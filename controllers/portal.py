@@ -2,8 +2,14 @@
 
 from odoo import http
 from odoo.http import request
+from urllib.parse import urlencode
 from odoo.addons.portal.controllers.portal import CustomerPortal, pager as portal_pager
 
+from ..tools.ticket_render import FORMATS as TICKET_FORMATS
+from .ticket_share import ticket_pdf_response
+
+PORTAL_BOOKINGS_PER_PAGE = 10
+
 
 class TransportPortal(CustomerPortal):
     """Portail client pour le transport"""
@@ -20,8 +26,8 @@ class TransportPortal(CustomerPortal):
 
     @http.route(['/my/bookings', '/my/bookings/page/<int:page>'], 
                 type='http', auth='user', website=True)
-    def portal_my_bookings(self, page=1, sortby=None, filterby=None, **kw):
-        """Liste des réservations du client"""
+    def portal_my_bookings(self, page=1, sortby=None, filterby=None, cursor=None, **kw):
+        """Liste des réservations du client, paginée par curseur"""
         Booking = request.env['transport.booking']
         partner = request.env.user.partner_id
         
@@ -34,53 +40,44 @@ class TransportPortal(CustomerPortal):
             'confirmed': {'label': 'Confirmés', 'domain': [('state', '=', 'confirmed')]},
             'completed': {'label': 'Terminés', 'domain': [('state', '=', 'completed')]},
         }
-        if not filterby:
+        if filterby not in searchbar_filters:
             filterby = 'all'
         domain += searchbar_filters[filterby]['domain']
         
-        # Tri
+        # Tri (ordres de pagination de tools/keyset.py)
         searchbar_sortings = {
-            'date': {'label': 'Date de départ', 'order': 'departure_datetime desc'},
+            'date': {'label': 'Date de départ', 'order': 'departure'},
             'name': {'label': 'Référence', 'order': 'name'},
             'state': {'label': 'État', 'order': 'state'},
         }
-        if not sortby:
+        if sortby not in searchbar_sortings:
             sortby = 'date'
         order = searchbar_sortings[sortby]['order']
         
-        # Compteur
-        booking_count = Booking.search_count(domain)
-        
-        # Pager
-        pager = portal_pager(
-            url='/my/bookings',
-            url_args={'sortby': sortby, 'filterby': filterby},
-            total=booking_count,
-            page=page,
-            step=10,
-        )
-        
-        # Récupérer les réservations
-        bookings = Booking.search(
-            domain,
-            order=order,
-            limit=10,
-            offset=pager['offset'],
-        )
-        
-        # Statistiques
-        all_bookings = Booking.search([('partner_id', '=', partner.id)])
+        # Page suivante lue après la dernière ligne affichée ; /page/<n> reste accepté pour les anciens liens
+        try:
+            bookings, next_cursor = Booking._keyset_search(
+                domain, order, cursor=cursor, limit=PORTAL_BOOKINGS_PER_PAGE,
+                offset=(max(int(page), 1) - 1) * PORTAL_BOOKINGS_PER_PAGE,
+            )
+        except ValueError:
+            return request.redirect('/my/bookings')
+        url_args = {'sortby': sortby, 'filterby': filterby}
+        
+        # Statistiques : requêtes groupées (voir transport.partner.stats)
+        partner_stats = request.env['transport.partner.stats']._get_partner_stats(partner.id)
         stats = {
-            'total': len(all_bookings),
-            'confirmed': len(all_bookings.filtered(lambda b: b.state == 'confirmed')),
-            'pending': len(all_bookings.filtered(lambda b: b.state in ['draft', 'reserved'])),
-            'spent': sum(all_bookings.filtered(lambda b: b.state in ['confirmed', 'completed']).mapped('total_amount')),
+            'total': partner_stats['total'],
+            'confirmed': partner_stats['by_state'].get('confirmed', 0),
+            'pending': partner_stats['pending'],
+            'spent': partner_stats['total_spent'],
         }
         
         return request.render('transport_interurbain.portal_my_bookings', {
             'bookings': bookings,
             'page_name': 'transport_bookings',
-            'pager': pager,
+            'first_url': '/my/bookings?%s' % urlencode(url_args) if cursor or int(page) > 1 else None,
+            'next_url': '/my/bookings?%s' % urlencode(dict(url_args, cursor=next_cursor)) if next_cursor else None,
             'searchbar_filters': searchbar_filters,
             'filterby': filterby,
             'searchbar_sortings': searchbar_sortings,
@@ -141,8 +138,8 @@ class TransportPortal(CustomerPortal):
         })
 
     @http.route('/transport/booking/<int:booking_id>/ticket', type='http', auth='user', website=True)
-    def booking_ticket(self, booking_id, **kw):
-        """Télécharger le ticket PDF"""
+    def booking_ticket(self, booking_id, format=None, **kw):
+        """Télécharger le ticket PDF (ou ``format`` compact / escpos / png, rendu natif)"""
         Booking = request.env['transport.booking'].sudo()
         booking = Booking.browse(booking_id)
         
@@ -152,19 +149,16 @@ class TransportPortal(CustomerPortal):
         if booking.state not in ['confirmed', 'checked_in']:
             return request.redirect(f'/my/bookings/{booking.id}')
         
-        # Générer le PDF
-        pdf_content, _ = request.env['ir.actions.report'].sudo()._render_qweb_pdf(
-            'transport_interurbain.action_report_ticket', [booking.id]
-        )
-        
-        filename = f"Ticket-{booking.name}.pdf"
-        pdfhttpheaders = [
-            ('Content-Type', 'application/pdf'),
-            ('Content-Length', len(pdf_content)),
-            ('Content-Disposition', f'attachment; filename="{filename}"'),
-        ]
-        
-        return request.make_response(pdf_content, headers=pdfhttpheaders)
+        if format in TICKET_FORMATS:
+            content, mimetype, filename = booking._render_native_ticket(format)
+            disposition = 'inline' if mimetype == 'image/png' else 'attachment'
+            return request.make_response(content, headers=[
+                ('Content-Type', mimetype),
+                ('Content-Length', len(content)),
+                ('Content-Disposition', f'{disposition}; filename="{filename}"'),
+            ])
+
+        return ticket_pdf_response(booking, f"Ticket-{booking.name}.pdf")
 
     @http.route('/transport/booking/<int:booking_id>/cancel', type='http', auth='user', website=True)
     def booking_cancel(self, booking_id, **kw):
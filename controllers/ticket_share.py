@@ -6,6 +6,26 @@ import logging
 
 _logger = logging.getLogger(__name__)
 
+# Le PDF peut être réutilisé par le navigateur, puis revalidé via l'ETag
+TICKET_PDF_CACHE_CONTROL = 'private, max-age=300, must-revalidate'
+
+
+def ticket_pdf_response(booking, filename):
+    """Réponse HTTP du billet PDF en cache, avec ETag (304 si le client a déjà cette version)"""
+    etag = booking._ticket_pdf_cache_key()
+    headers = [
+        ('ETag', '"%s"' % etag),
+        ('Cache-Control', TICKET_PDF_CACHE_CONTROL),
+    ]
+    if request.httprequest.if_none_match.contains(etag):
+        return request.make_response(b'', headers=headers, status=304)
+    pdf_content = booking._get_ticket_pdf()[0]
+    return request.make_response(pdf_content, headers=headers + [
+        ('Content-Type', 'application/pdf'),
+        ('Content-Length', len(pdf_content)),
+        ('Content-Disposition', f'attachment; filename="{filename}"'),
+    ])
+
 
 class TicketShareController(http.Controller):
     """Contrôleur pour le partage public de billets"""
@@ -89,16 +109,4 @@ class TicketShareController(http.Controller):
         if not booking:
             return request.not_found()
         
-        # Générer le PDF du ticket
-        pdf_content, _ = request.env['ir.actions.report'].sudo()._render_qweb_pdf(
-            'transport_interurbain.report_ticket',
-            [booking.id]
-        )
-        
-        return request.make_response(
-            pdf_content,
-            headers=[
-                ('Content-Type', 'application/pdf'),
-                ('Content-Disposition', f'attachment; filename=Billet_{booking.name}.pdf'),
-            ]
-        )
+        return ticket_pdf_response(booking, f'Billet_{booking.name}.pdf')
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Report des soldes de points de fidélité existants dans le journal des points
+(une ligne "Solde initial" par passager), pour que le solde reste la somme
+des mouvements.
+"""
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    cr.execute("""
+        INSERT INTO transport_loyalty_entry (passenger_id, points, reason, create_date, write_date)
+        SELECT p.id, p.loyalty_points, 'Solde initial', now() at time zone 'UTC', now() at time zone 'UTC'
+          FROM transport_passenger p
+         WHERE p.loyalty_points <> 0
+           AND NOT EXISTS (SELECT 1 FROM transport_loyalty_entry e WHERE e.passenger_id = p.id)
+    """)
+    _logger.info("Journal des points de fidélité : %s solde(s) initial(aux) reporté(s)", cr.rowcount)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Clés téléphone normalisées (E.164) : création et remplissage des colonnes
+avant la mise à jour du module, par lots en SQL. L'ORM trouve les colonnes
+déjà remplies et ne recalcule pas les champs enregistrement par
+enregistrement ; il ne fait qu'ajouter les index.
+"""
+
+import logging
+
+from odoo.addons.transport_interurbain.tools.phone import normalize_phone
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10000
+
+# (table, colonne du téléphone, colonne de la clé)
+PHONE_KEYS = [
+    ('transport_passenger', 'phone', 'phone_key'),
+    ('transport_booking', 'passenger_phone', 'passenger_phone_key'),
+    ('res_partner', 'phone', 'transport_phone_key'),
+]
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    for table, phone_column, key_column in PHONE_KEYS:
+        cr.execute('ALTER TABLE "%s" ADD COLUMN IF NOT EXISTS "%s" varchar' % (table, key_column))
+        last_id, filled = 0, 0
+        while True:
+            cr.execute('''
+                SELECT id, "%s" FROM "%s"
+                 WHERE id > %%s AND "%s" IS NOT NULL
+              ORDER BY id
+                 LIMIT %%s
+            ''' % (phone_column, table, phone_column), (last_id, BATCH_SIZE))
+            rows = cr.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            keys = [(record_id, normalize_phone(phone)) for record_id, phone in rows]
+            keys = [(record_id, key) for record_id, key in keys if key]
+            if keys:
+                cr.execute('''
+                    UPDATE "%s" t SET "%s" = v.key
+                      FROM unnest(%%s::int[], %%s::varchar[]) AS v(id, key)
+                     WHERE t.id = v.id
+                ''' % (table, key_column), ([k[0] for k in keys], [k[1] for k in keys]))
+                filled += len(keys)
+        _logger.info("%s.%s : %s clé(s) téléphone renseignée(s)", table, key_column, filled)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Nouveaux QR codes (Ed25519, format T2) des billets encore utilisables : les
+QR T1 sont désormais refusés au contrôle. La date de modification des
+réservations est avancée pour que les billets PDF en cache soient refaits.
+"""
+
+import logging
+
+from odoo import SUPERUSER_ID, api
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    bookings = env['transport.booking'].search([
+        ('state', 'in', ('confirmed', 'checked_in')),
+        ('trip_id.departure_datetime', '>=', '%s' % (env.cr.now().date(),)),
+    ])
+    env.add_to_compute(bookings._fields['qr_code'], bookings)
+    bookings.flush_model(['qr_code'])
+    cr.execute(
+        "UPDATE transport_booking SET write_date = (now() at time zone 'UTC') WHERE id = ANY(%s)",
+        (bookings.ids,),
+    )
+    _logger.info("QR codes : %s billet(s) signé(s) à nouveau", len(bookings))
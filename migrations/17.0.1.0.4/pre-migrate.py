@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+- Abandon des clés HMAC des QR codes : leurs secrets étaient transmis aux
+  applications de contrôle. Les clés sont supprimées avant l'ajout de la clé
+  publique (obligatoire) ; de nouvelles clés Ed25519 sont créées à la demande.
+- Statistiques journalières : ``no_show_count`` renommé ``expired_count`` (il
+  compte les réservations expirées, pas les passagers absents).
+"""
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    cr.execute("DELETE FROM transport_qr_key")
+    _logger.info("QR codes : %s clé(s) HMAC supprimée(s)", cr.rowcount)
+
+    cr.execute("""
+        SELECT 1 FROM information_schema.columns
+         WHERE table_name = 'transport_stats_daily' AND column_name = 'no_show_count'
+    """)
+    if cr.fetchone():
+        cr.execute("ALTER TABLE transport_stats_daily RENAME COLUMN no_show_count TO expired_count")
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from . import transport_bulk_mixin
+from . import transport_keyset_mixin
 from . import transport_city
 from . import transport_route
 from . import transport_company
@@ -8,7 +10,18 @@ from . import transport_trip
 from . import transport_schedule
 from . import transport_booking
 from . import transport_passenger
+from . import transport_loyalty
 from . import transport_payment
+from . import transport_payment_event
+from . import transport_notification
+from . import transport_reminder
+from . import transport_qr_key
+from . import transport_boarding
+from . import transport_realtime
 from . import res_partner
 from . import res_config_settings
 from . import res_users
+from . import ir_websocket
+from . import transport_stats_daily
+from . import transport_dashboard
+from . import transport_partner_stats
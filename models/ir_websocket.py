@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models
+
+
+class IrWebsocket(models.AbstractModel):
+    """Droits d'abonnement aux canaux temps réel du transport"""
+    _inherit = 'ir.websocket'
+
+    def _build_bus_channel_list(self, channels):
+        channels = self.env['transport.realtime']._filter_channels(list(channels))
+        return super()._build_bus_channel_list(channels)
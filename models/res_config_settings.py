@@ -14,6 +14,34 @@ class ResConfigSettings(models.TransientModel):
              "0 signifie pas de limite (utilise la capacité du bus).",
     )
 
+    transport_wave_api_url = fields.Char(
+        string="URL de l'API Wave",
+        default='https://api.wave.com/v1',
+        config_parameter='transport_interurbain.wave_api_url',
+        help="Adresse de base de l'API Wave. Pointer vers un simulateur local "
+             "(benchmarks/wave_simulator.py) pour les tests de charge.",
+    )
+
+    transport_wave_async_checkout = fields.Boolean(
+        string='Création asynchrone des paiements Wave',
+        config_parameter='transport_interurbain.wave_async_checkout',
+        help="L'API mobile renvoie immédiatement un paiement en attente ; la session "
+             "Wave est créée en arrière-plan par une tâche planifiée.",
+    )
+
+    transport_sms_provider = fields.Char(
+        string='Prestataire SMS',
+        default='log',
+        config_parameter='transport_interurbain.sms_provider',
+        help="Code du prestataire d'envoi des SMS (log, file ou prestataire ajouté par un module).",
+    )
+    transport_email_provider = fields.Char(
+        string='Prestataire email',
+        default='log',
+        config_parameter='transport_interurbain.email_provider',
+        help="Code du prestataire d'envoi des emails (log, file, mail ou prestataire ajouté par un module).",
+    )
+
     @api.model
     def get_values(self):
         res = super().get_values()
@@ -2,6 +2,8 @@
 
 from odoo import api, fields, models
 
+from ..tools.phone import normalize_phone
+
 
 class ResPartner(models.Model):
     """Extension du modèle partenaire pour le transport"""
@@ -41,14 +43,32 @@ class ResPartner(models.Model):
         string='Points fidélité transport',
         default=0,
     )
+    transport_phone_key = fields.Char(
+        string='Téléphone (E.164)',
+        compute='_compute_transport_phone_key',
+        store=True,
+        index=True,
+        help="Téléphone normalisé, utilisé pour retrouver le contact d'un voyageur",
+    )
 
-    def _compute_transport_booking_count(self):
+    @api.depends('phone')
+    def _compute_transport_phone_key(self):
         for partner in self:
-            bookings = partner.transport_booking_ids.filtered(
-                lambda b: b.state in ['confirmed', 'completed']
+            partner.transport_phone_key = normalize_phone(partner.phone)
+
+    def _compute_transport_booking_count(self):
+        stats = {
+            partner: (count, total)
+            for partner, count, total in self.env['transport.booking'].sudo()._read_group(
+                [('partner_id', 'in', self.ids), ('state', 'in', ['confirmed', 'completed'])],
+                ['partner_id'],
+                ['__count', 'total_amount:sum'],
             )
-            partner.transport_booking_count = len(bookings)
-            partner.total_transport_spent = sum(bookings.mapped('total_amount'))
+        }
+        for partner in self:
+            count, total = stats.get(partner._origin, (0, 0))
+            partner.transport_booking_count = count
+            partner.total_transport_spent = total
 
     def action_view_transport_bookings(self):
         """Voir les réservations de transport"""
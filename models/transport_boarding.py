@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, models
+import json
+import logging
+
+from odoo.addons.bus.models.bus import channel_with_db, json_dump
+
+from ..tools import boarding
+from ..tools.metrics import metrics
+
+_logger = logging.getLogger(__name__)
+
+# Notifications bus.bus du canal d'embarquement d'un voyage
+BOARDING_BOOKINGS = 'transport.boarding/bookings'
+BOARDING_CLOSED = 'transport.boarding/closed'
+# Champs de réservation repris dans les lignes des sessions d'embarquement
+BOARDING_FIELDS = {
+    'trip_id', 'state', 'name', 'ticket_token', 'seat_number', 'ticket_type',
+    'passenger_id', 'passenger_name', 'passenger_phone', 'ticket_price', 'amount_paid',
+    'boarding_stop_id', 'alighting_stop_id',
+}
+
+
+def boarding_channel(trip_id):
+    """Canal bus.bus des changements d'embarquement d'un voyage"""
+    return 'transport_boarding_%d' % trip_id
+
+
+class TransportBoarding(models.AbstractModel):
+    """Sessions d'embarquement en mémoire (voir tools/boarding.py)"""
+    _name = 'transport.boarding'
+    _description = "Sessions d'embarquement"
+
+    @api.model
+    def _get_session(self, trip_id):
+        """Session à jour du voyage ``trip_id``, ou None s'il n'est pas en embarquement"""
+        session = boarding.sessions.get(self.env.cr.dbname, trip_id)
+        if session is None or session.is_stale():
+            return self._load_session(trip_id)
+        if not self._sync_session(session):
+            return None
+        metrics.inc('transport_boarding_sessions_total', event='hit')
+        return session
+
+    @api.model
+    def _find_session(self, booking_id):
+        """Session à jour contenant la réservation ``booking_id``, s'il y en a une"""
+        session = boarding.sessions.find_booking(self.env.cr.dbname, booking_id)
+        return session and self._get_session(session.trip_id)
+
+    @api.model
+    def _load_session(self, trip_id):
+        """Charger le manifeste complet d'un voyage en embarquement"""
+        dbname = self.env.cr.dbname
+        trip = self.env['transport.trip'].sudo().browse(trip_id).exists()
+        if not trip or trip.state != 'boarding':
+            boarding.sessions.drop(dbname, trip_id)
+            return None
+        # Position du bus lue avant le manifeste : les changements suivants seront rejoués
+        self.env.cr.execute("SELECT COALESCE(MAX(id), 0) FROM bus_bus")
+        last_bus_id = self.env.cr.fetchone()[0]
+        bookings = self.env['transport.booking'].sudo().search([('trip_id', '=', trip.id)])
+        session = boarding.BoardingSession(trip._get_boarding_info(), bookings._get_boarding_rows(), last_bus_id)
+        boarding.sessions.put(dbname, session)
+        metrics.inc('transport_boarding_sessions_total', event='load')
+        return session
+
+    @api.model
+    def _sync_session(self, session):
+        """Rejouer les changements annoncés sur le bus ; False si l'embarquement est terminé"""
+        channel = json_dump(channel_with_db(self.env.cr.dbname, boarding_channel(session.trip_id)))
+        with session.lock:
+            self.env.cr.execute("""
+                SELECT id, message FROM bus_bus
+                 WHERE id > %s AND channel = %s
+              ORDER BY id
+            """, (session.last_bus_id, channel))
+            notifications = self.env.cr.fetchall()
+            if not notifications:
+                return True
+            session.last_bus_id = notifications[-1][0]
+            booking_ids = set()
+            for _bus_id, message in notifications:
+                message = json.loads(message)
+                if message['type'] == BOARDING_CLOSED:
+                    boarding.sessions.drop(self.env.cr.dbname, session.trip_id)
+                    return False
+                booking_ids.update(message['payload']['booking_ids'])
+            bookings = self.env['transport.booking'].sudo().browse(booking_ids).exists()
+            for row in bookings._get_boarding_rows():
+                if row['trip_id'] == session.trip_id:
+                    session.apply(row)
+                else:
+                    session.remove(row['id'])
+            for booking_id in booking_ids - set(bookings.ids):
+                session.remove(booking_id)
+        metrics.inc('transport_boarding_sessions_total', event='sync')
+        return True
+
+    @api.model
+    def _open_sessions(self, trip_ids):
+        """Préparer les sessions des voyages dont l'embarquement démarre (worker courant)"""
+        for trip_id in trip_ids:
+            self._load_session(trip_id)
+
+    @api.model
+    def _close_sessions(self, trip_ids):
+        """Fermer les sessions des voyages dont l'embarquement se termine, dans tous les workers"""
+        self.env['bus.bus']._sendmany([
+            (boarding_channel(trip_id), BOARDING_CLOSED, {'trip_id': trip_id})
+            for trip_id in trip_ids
+        ])
+        for trip_id in trip_ids:
+            boarding.sessions.drop(self.env.cr.dbname, trip_id)
+
+    @api.model
+    def _notify_bookings(self, bookings, trips=None):
+        """Annoncer les réservations modifiées sur le canal de leurs voyages en embarquement"""
+        trips = (bookings.trip_id | (trips or bookings.trip_id)).filtered(lambda t: t.state == 'boarding')
+        if not trips:
+            return
+        self.env['bus.bus']._sendmany([
+            (boarding_channel(trip.id), BOARDING_BOOKINGS, {'trip_id': trip.id, 'booking_ids': bookings.ids})
+            for trip in trips
+        ])
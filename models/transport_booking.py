@@ -3,7 +3,11 @@
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError, UserError
 from odoo.tools import float_compare, float_is_zero
+from odoo.tools.sql import create_index
 from datetime import datetime, timedelta
+from collections import defaultdict
+import hashlib
+import time
 import uuid
 import qrcode
 import base64
@@ -11,14 +15,31 @@ from io import BytesIO
 import re
 import logging
 
+from ..tools import ticket_qr, ticket_render
+from ..tools.metrics import metrics
+from ..tools.phone import normalize_phone
+from .transport_boarding import BOARDING_FIELDS
+from .transport_realtime import BOOKING_STATE_EVENTS
+
 _logger = logging.getLogger(__name__)
 
+# Expiration des réservations : taille d'un lot et budget de temps (secondes) par exécution
+EXPIRE_BATCH_SIZE = 1000
+EXPIRE_TIME_BUDGET = 240
+# Billets PDF mis en cache (pièces jointes) : préfixe du nom, taille de lot et budget du pré-rendu
+TICKET_PDF_PREFIX = 'ticket-pdf-'
+TICKET_PRERENDER_BATCH_SIZE = 50
+TICKET_PRERENDER_TIME_BUDGET = 240
+# Fenêtre de validité des QR codes signés, autour de l'heure de départ
+QR_VALID_BEFORE_HOURS = 24
+QR_VALID_AFTER_HOURS = 12
+
 
 class TransportBooking(models.Model):
     """Réservation de ticket"""
     _name = 'transport.booking'
     _description = 'Réservation de ticket'
-    _inherit = ['mail.thread', 'mail.activity.mixin', 'portal.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'portal.mixin', 'transport.bulk.mixin', 'transport.keyset.mixin']
     _order = 'create_date desc'
 
     name = fields.Char(
@@ -48,6 +69,7 @@ class TransportBooking(models.Model):
         'transport.passenger',
         string='Passager',
         tracking=True,
+        index=True,
     )
     
     # Informations passager (si différent du client)
@@ -58,6 +80,12 @@ class TransportBooking(models.Model):
     passenger_phone = fields.Char(
         string='Téléphone passager',
     )
+    passenger_phone_key = fields.Char(
+        string='Téléphone passager (E.164)',
+        compute='_compute_passenger_phone_key',
+        store=True,
+        index=True,
+    )
     passenger_email = fields.Char(
         string='Email passager',
     )
@@ -482,7 +510,31 @@ class TransportBooking(models.Model):
                 vals['passenger_name'] = partner.name
                 vals['passenger_phone'] = partner.phone or partner.mobile
                 vals['passenger_email'] = partner.email
-        return super().create(vals_list)
+        bookings = super().create(vals_list)
+        metrics.inc('transport_bookings_total', len(bookings), event='created')
+        self.env['transport.boarding']._notify_bookings(bookings)
+        self.env['transport.realtime']._queue_booking_events(bookings, 'booking')
+        return bookings
+
+    def write(self, vals):
+        if not BOARDING_FIELDS.intersection(vals):
+            return super().write(vals)
+        trips = self.trip_id if 'trip_id' in vals else None
+        Realtime = self.env['transport.realtime']
+        if trips:
+            Realtime._queue_booking_events(self, 'transfer')
+            self.env['transport.stats.daily']._mark_dates_dirty(trips.mapped('departure_date'))
+        res = super().write(vals)
+        self.env['transport.boarding']._notify_bookings(self, trips=trips)
+        if vals.get('state') in BOOKING_STATE_EVENTS:
+            Realtime._queue_booking_events(self, BOOKING_STATE_EVENTS[vals['state']])
+        elif 'seat_number' in vals or trips:
+            Realtime._queue_booking_events(self, 'seat')
+        return res
+
+    def unlink(self):
+        self.env['transport.stats.daily']._mark_dates_dirty(self.trip_id.mapped('departure_date'))
+        return super().unlink()
 
     @api.depends('trip_id.manage_luggage', 'luggage_weight', 'trip_id.luggage_included_kg', 'trip_id.extra_luggage_price')
     def _compute_luggage_extra(self):
@@ -496,6 +548,11 @@ class TransportBooking(models.Model):
                 booking.luggage_extra_kg = 0
                 booking.luggage_extra_price = 0
 
+    @api.depends('passenger_phone')
+    def _compute_passenger_phone_key(self):
+        for booking in self:
+            booking.passenger_phone_key = normalize_phone(booking.passenger_phone)
+
     @api.depends('ticket_price', 'luggage_extra_price', 'reservation_fee')
     def _compute_total_amount(self):
         for booking in self:
@@ -519,12 +576,12 @@ class TransportBooking(models.Model):
             else:
                 booking.reservation_deadline = False
 
-    @api.depends('ticket_token', 'name', 'state')
+    @api.depends('ticket_token', 'name', 'state', 'seat_number', 'trip_id.departure_datetime')
     def _compute_qr_code(self):
         for booking in self:
             if booking.ticket_token and booking.state in ['confirmed', 'checked_in']:
                 # Générer le QR code
-                qr_data = f"TICKET:{booking.name}|TOKEN:{booking.ticket_token}|TRIP:{booking.trip_id.name}"
+                qr_data = booking._get_ticket_qr_payload()
                 qr = qrcode.QRCode(
                     version=1,
                     error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -654,13 +711,38 @@ class TransportBooking(models.Model):
             _logger.info("Réservation %s confirmée - Passager: %s", booking.name, booking.passenger_name)
             # Envoyer le ticket
             booking._send_ticket_notification()
+        self.env['transport.reminder']._schedule_for_bookings(self.ids)
+        # Billets PDF générés en tâche de fond, avant le premier téléchargement
+        self.env.ref('transport_interurbain.ir_cron_prerender_ticket_pdfs').sudo()._trigger()
+        metrics.inc('transport_bookings_total', len(self), event='confirmed')
+
+    def _get_boarding_rows(self):
+        """Lignes compactes des réservations pour les sessions d'embarquement"""
+        return [{
+            'id': booking.id,
+            'trip_id': booking.trip_id.id,
+            'company_id': booking.transport_company_id.id,
+            'reference': booking.name,
+            'ticket_token': booking.ticket_token,
+            'state': booking.state,
+            'seat': booking.seat_number,
+            'ticket_type': booking.ticket_type,
+            'passenger_name': booking.passenger_name,
+            'passenger_phone': booking.passenger_phone,
+            'total_amount': booking.total_amount,
+            'amount_paid': booking.amount_paid,
+            'amount_due': booking.amount_due,
+            'boarding_stop': booking.boarding_stop_id.name or None,
+            'alighting_stop': booking.alighting_stop_id.name or None,
+            'passenger': booking.passenger_id._get_boarding_info() if booking.passenger_id else None,
+        } for booking in self]
 
     def action_check_in(self):
         """Marquer le passager comme embarqué"""
         for booking in self:
             if booking.state != 'confirmed':
                 raise UserError(_("Seuls les billets confirmés peuvent être embarqués!"))
-            booking.write({'state': 'checked_in'})
+        self.write({'state': 'checked_in'})
 
     def action_cancel(self):
         """Annuler la réservation"""
@@ -691,26 +773,127 @@ class TransportBooking(models.Model):
     def _send_reservation_notification(self):
         """Envoyer une notification de réservation"""
         self.ensure_one()
-        # TODO: Implémenter l'envoi de SMS/Email
-        pass
+        deadline = self.reservation_deadline.strftime('%d/%m/%Y %H:%M') if self.reservation_deadline else '-'
+        self.env['transport.notification']._enqueue([{
+            'channel': 'sms',
+            'recipient': self.passenger_phone,
+            'body': _("Réservation %(ref)s : %(route)s le %(date)s. Payez avant le %(deadline)s "
+                      "pour confirmer votre place.",
+                      ref=self.name, route=self.route_id.name, date=self._notification_departure(),
+                      deadline=deadline),
+            'dedup_key': 'reservation:%d:sms' % self.id,
+            'booking_id': self.id,
+        }])
 
     def _send_ticket_notification(self):
         """Envoyer le ticket par email/SMS"""
         self.ensure_one()
-        # TODO: Implémenter l'envoi du ticket
-        pass
+        body = _("Billet %(ref)s confirmé : %(route)s le %(date)s, siège %(seat)s. Bon voyage !",
+                 ref=self.name, route=self.route_id.name, date=self._notification_departure(),
+                 seat=self.seat_number or '-')
+        self.env['transport.notification']._enqueue([{
+            'channel': 'sms',
+            'recipient': self.passenger_phone,
+            'body': body,
+            'dedup_key': 'ticket:%d:sms' % self.id,
+            'booking_id': self.id,
+        }, {
+            'channel': 'email',
+            'recipient': self.passenger_email,
+            'subject': _("Votre billet %s", self.name),
+            'body': body,
+            'dedup_key': 'ticket:%d:email' % self.id,
+            'booking_id': self.id,
+        }])
+
+    def _notification_departure(self):
+        """Date de départ affichée dans les notifications"""
+        return self.departure_datetime.strftime('%d/%m/%Y %H:%M') if self.departure_datetime else '-'
+
+    def init(self):
+        # Index partiel pour le balayage des réservations à expirer
+        create_index(
+            self._cr, 'transport_booking_reserved_deadline_idx', self._table,
+            ['reservation_deadline'], where="state = 'reserved'",
+        )
+        # Index composites de la pagination par curseur (voir tools/keyset.py)
+        create_index(self._cr, 'transport_booking_passenger_recent_idx', self._table, ['passenger_id', 'id DESC'])
+        create_index(
+            self._cr, 'transport_booking_partner_departure_idx', self._table,
+            ['partner_id', 'departure_datetime DESC', 'id DESC'],
+        )
+        create_index(self._cr, 'transport_booking_partner_name_idx', self._table, ['partner_id', 'name', 'id'])
 
     @api.model
-    def cron_expire_reservations(self):
-        """Tâche planifiée pour expirer les réservations non payées"""
-        expired = self.search([
-            ('state', '=', 'reserved'),
-            ('booking_type', '=', 'reservation'),
-            ('reservation_deadline', '<', fields.Datetime.now()),
-        ])
-        expired.write({'state': 'expired'})
+    @metrics.track_duration('transport_cron_duration_seconds', cron='expire_reservations')
+    def cron_expire_reservations(self, batch_size=EXPIRE_BATCH_SIZE, time_budget=EXPIRE_TIME_BUDGET):
+        """
+        Tâche planifiée pour expirer les réservations non payées.
+        
+        Les réservations sont traitées par lots verrouillés avec SKIP LOCKED
+        (une réservation en cours de paiement est reprise au passage suivant),
+        avec un commit par lot. Au-delà du budget de temps, la tâche se
+        replanifie immédiatement pour traiter la suite.
+        """
+        started = time.monotonic()
+        # Pas de commit intermédiaire en test ou sur demande (mesures de performance)
+        auto_commit = not self.env.registry.in_test_mode() and not self.env.context.get('transport_no_commit')
+        now = fields.Datetime.now()
+        total = 0
+        self.env.flush_all()
+        while True:
+            self.env.cr.execute("""
+                SELECT id
+                  FROM transport_booking
+                 WHERE state = 'reserved'
+                   AND booking_type = 'reservation'
+                   AND reservation_deadline < %s
+              ORDER BY reservation_deadline
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, (now, batch_size))
+            booking_ids = [row[0] for row in self.env.cr.fetchall()]
+            if not booking_ids:
+                break
+            self._expire_reservation_batch(booking_ids)
+            total += len(booking_ids)
+            if auto_commit:
+                self.env.cr.commit()
+            if len(booking_ids) < batch_size:
+                break
+            if time.monotonic() - started > time_budget:
+                # Budget épuisé : la suite sera traitée par une nouvelle exécution
+                self.env.ref('transport_interurbain.ir_cron_expire_reservations').sudo()._trigger()
+                break
+        if total:
+            _logger.info("%d réservation(s) expirée(s) en %.1fs", total, time.monotonic() - started)
         return True
 
+    def _expire_reservation_batch(self, booking_ids):
+        """Expirer un lot de réservations et recalculer les places par voyage"""
+        cr = self.env.cr
+        cr.execute("""
+            UPDATE transport_booking
+               SET state = 'expired',
+                   write_uid = %s,
+                   write_date = (now() at time zone 'UTC')
+             WHERE id IN %s
+         RETURNING id, trip_id
+        """, (self.env.uid, tuple(booking_ids)))
+        booking_ids_by_trip = defaultdict(list)
+        for booking_id, trip_id in cr.fetchall():
+            if trip_id:
+                booking_ids_by_trip[trip_id].append(booking_id)
+        trip_ids = tuple(booking_ids_by_trip)
+        metrics.inc('transport_bookings_total', len(booking_ids), event='expired')
+        self.env['transport.trip'].browse(trip_ids)._sql_refresh_seat_counters()
+        self.invalidate_model(['state', 'write_uid', 'write_date'])
+        self.env['transport.boarding']._notify_bookings(self.browse(booking_ids))
+        self.env['transport.realtime']._queue_events('expiry', booking_ids_by_trip)
+        self._post_bulk_summary(
+            self.browse(booking_ids), _("Réservations expirées (délai de paiement dépassé)")
+        )
+
     def _get_report_filename(self):
         """Nom du fichier pour le rapport de ticket"""
         return f"Ticket-{self.name}"
@@ -719,6 +902,158 @@ class TransportBooking(models.Model):
         """Imprimer le ticket"""
         return self.env.ref('transport_interurbain.action_report_ticket').report_action(self)
 
+    def _get_ticket_qr_payload(self):
+        """Contenu du QR code du billet : format signé T2 (voir tools/ticket_qr.py)"""
+        self.ensure_one()
+        departure = self.trip_id.departure_datetime
+        if not self.id or not departure:
+            return f"TICKET:{self.name}|TOKEN:{self.ticket_token}|TRIP:{self.trip_id.name}"
+        kid, secret = self.env['transport.qr.key']._get_signing_key(self.transport_company_id.id)
+        return ticket_qr.encode_ticket(
+            kid, secret, self.id, self.trip_id.id, self.seat_number,
+            departure - timedelta(hours=QR_VALID_BEFORE_HOURS),
+            departure + timedelta(hours=QR_VALID_AFTER_HOURS),
+        )
+
+    # ---------- Rendu natif du billet (PDF compact, ESC/POS, PNG) ----------
+
+    def _get_ticket_render_data(self):
+        """Données du billet pour le rendu natif (sans QWeb)"""
+        self.ensure_one()
+        trip = self.trip_id
+        return {
+            'reference': self.name,
+            'company': self.transport_company_id.name,
+            'route': trip.route_id.name,
+            'departure': self._notification_departure(),
+            'boarding': self.boarding_stop_id.name or trip.route_id.departure_city_id.name,
+            'alighting': self.alighting_stop_id.name or trip.route_id.arrival_city_id.name,
+            'passenger': self.traveler_name or self.passenger_name,
+            'phone': self.traveler_phone or self.passenger_phone,
+            'seat': self.seat_number,
+            'bus': trip.bus_id.name,
+            'meeting_point': trip.meeting_point,
+            'meeting_minutes': trip.meeting_time_before,
+            'price': '{:,.0f} FCFA'.format(self.total_amount).replace(',', ' '),
+            'status': dict(self._fields['state'].selection).get(self.state),
+            'qr_payload': self._get_ticket_qr_payload(),
+        }
+
+    def _render_native_ticket(self, fmt):
+        """Billet au format ``compact``, ``escpos`` ou ``png`` : (contenu, type MIME, nom de fichier)"""
+        self.ensure_one()
+        with metrics.track_duration('transport_ticket_render_duration_seconds', format=fmt):
+            content, mimetype, extension = ticket_render.render(fmt, self._get_ticket_render_data())
+        return content, mimetype, 'Billet_%s.%s' % (self.name.replace('/', '-'), extension)
+
+    # ---------- Billet PDF en cache ----------
+
+    def _ticket_pdf_cache_key(self):
+        """Empreinte du billet : change dès que la réservation ou l'horaire du voyage est modifié"""
+        self.ensure_one()
+        trip = self.trip_id
+        raw = '%s|%s|%s|%s|%s|%s' % (
+            self.id, self.state, self.write_date,
+            trip.departure_datetime, trip.meeting_point, trip.bus_id.id,
+        )
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+    def _get_ticket_pdf(self):
+        """
+        Contenu PDF du billet et son empreinte (utilisable comme ETag).
+
+        Le PDF est rendu une seule fois par version de la réservation et
+        conservé en pièce jointe ; les versions périmées sont supprimées au
+        rendu suivant.
+        """
+        self.ensure_one()
+        key = self._ticket_pdf_cache_key()
+        name = '%s%s.pdf' % (TICKET_PDF_PREFIX, key)
+        Attachment = self.env['ir.attachment'].sudo()
+        cached = Attachment.search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('name', '=like', TICKET_PDF_PREFIX + '%'),
+        ])
+        current = cached.filtered(lambda a: a.name == name)[:1]
+        if current:
+            metrics.inc('transport_ticket_pdf_total', cache='hit')
+            return current.raw, key
+        pdf = self.env['ir.actions.report'].sudo()._render_qweb_pdf(
+            'transport_interurbain.action_report_ticket', self.ids
+        )[0]
+        cached.unlink()
+        Attachment.create({
+            'name': name,
+            'type': 'binary',
+            'raw': pdf,
+            'mimetype': 'application/pdf',
+            'res_model': self._name,
+            'res_id': self.id,
+        })
+        metrics.inc('transport_ticket_pdf_total', cache='miss')
+        return pdf, key
+
+    @api.model
+    @metrics.track_duration('transport_cron_duration_seconds', cron='ticket_pdf')
+    def cron_prerender_ticket_pdfs(self, batch_size=TICKET_PRERENDER_BATCH_SIZE,
+                                   time_budget=TICKET_PRERENDER_TIME_BUDGET):
+        """
+        Pré-générer les billets PDF des réservations confirmées à venir.
+
+        Sélectionne en une requête les réservations sans PDF postérieur à leur
+        dernière modification, puis les rend hors du chemin des requêtes HTTP.
+        Un changement d'horaire du voyage est rattrapé au premier
+        téléchargement (l'empreinte ne correspond plus).
+        """
+        started = time.monotonic()
+        auto_commit = not self.env.registry.in_test_mode() and not self.env.context.get('transport_no_commit')
+        total = failed = 0
+        last_id = 0
+        self.env.flush_all()
+        while True:
+            self.env.cr.execute("""
+                SELECT b.id
+                  FROM transport_booking b
+                  JOIN transport_trip t ON t.id = b.trip_id
+                 WHERE b.state = 'confirmed'
+                   AND b.id > %s
+                   AND t.departure_datetime > %s
+                   AND NOT EXISTS (
+                        SELECT 1
+                          FROM ir_attachment a
+                         WHERE a.res_model = 'transport.booking'
+                           AND a.res_id = b.id
+                           AND a.name LIKE %s
+                           AND a.create_date >= b.write_date
+                       )
+              ORDER BY b.id
+                 LIMIT %s
+            """, (last_id, fields.Datetime.now(), TICKET_PDF_PREFIX + '%', batch_size))
+            booking_ids = [row[0] for row in self.env.cr.fetchall()]
+            if not booking_ids:
+                break
+            last_id = booking_ids[-1]
+            for booking in self.browse(booking_ids):
+                try:
+                    with self.env.cr.savepoint():
+                        booking._get_ticket_pdf()
+                    total += 1
+                except Exception:
+                    failed += 1
+                    _logger.exception("Échec du pré-rendu du billet %s", booking.name)
+            if auto_commit:
+                self.env.cr.commit()
+            if len(booking_ids) < batch_size:
+                break
+            if time.monotonic() - started > time_budget:
+                self.env.ref('transport_interurbain.ir_cron_prerender_ticket_pdfs').sudo()._trigger()
+                break
+        if total or failed:
+            _logger.info("%d billet(s) PDF pré-générés (%d échec(s)) en %.1fs",
+                         total, failed, time.monotonic() - started)
+        return True
+
     def _compute_access_url(self):
         super()._compute_access_url()
         for booking in self:
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+
+from odoo import api, models
+
+# Mode "opération système" (bulk) pour les transitions à fort volume.
+#
+# Les modèles transport.trip, transport.booking, transport.payment et
+# transport.trip.schedule héritent de mail.thread : chaque write sur un champ
+# suivi crée un mail.message et ses mail.tracking.value. Pour les transitions
+# déclenchées par le système (expiration par cron, départ/arrivée d'un voyage,
+# génération depuis un programme, embarquement groupé), ce suivi par
+# enregistrement est remplacé par un seul message de synthèse par voyage.
+#
+# Clés de contexte positionnées :
+#   - tracking_disable        : désactive le suivi et les messages de création
+#   - mail_notrack            : aucune valeur de suivi sur write
+#   - mail_create_nolog       : pas de message "Document créé"
+#   - mail_create_nosubscribe : pas d'abonnement automatique de l'utilisateur
+#   - transport_bulk_mode     : marqueur du module, testé par _is_bulk_mode()
+BULK_MODE_CONTEXT = {
+    'tracking_disable': True,
+    'mail_notrack': True,
+    'mail_create_nolog': True,
+    'mail_create_nosubscribe': True,
+    'transport_bulk_mode': True,
+}
+
+# Nombre maximum de références listées dans un message de synthèse
+BULK_SUMMARY_MAX_REFS = 50
+
+
+class TransportBulkMixin(models.AbstractModel):
+    """Mode opération en masse (sans suivi de chatter par enregistrement)
+
+    Usage::
+
+        bookings._bulk_mode().write({'state': 'completed'})
+        self.env['transport.trip']._post_bulk_summary(bookings, _("Voyage terminé"))
+    """
+    _name = 'transport.bulk.mixin'
+    _description = 'Mode opération en masse'
+
+    def _bulk_mode(self):
+        """Retourner le recordset avec le contexte d'opération en masse"""
+        return self.with_context(**BULK_MODE_CONTEXT)
+
+    def _is_bulk_mode(self):
+        """Indique si l'appel courant est une opération en masse"""
+        return bool(self.env.context.get('transport_bulk_mode'))
+
+    @api.model
+    def _post_bulk_summary(self, bookings, label):
+        """Publier un message de synthèse par voyage pour les réservations traitées"""
+        refs_by_trip = defaultdict(list)
+        for booking in bookings:
+            if booking.trip_id:
+                refs_by_trip[booking.trip_id.id].append(booking.name)
+        if not refs_by_trip:
+            return
+        bodies = {}
+        for trip_id, refs in refs_by_trip.items():
+            listed = ', '.join(refs[:BULK_SUMMARY_MAX_REFS])
+            if len(refs) > BULK_SUMMARY_MAX_REFS:
+                listed += ', …'
+            bodies[trip_id] = "%s (%d) : %s" % (label, len(refs), listed)
+        trips = self.env['transport.trip'].browse(list(bodies))
+        trips._message_log_batch(bodies=bodies)
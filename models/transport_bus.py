@@ -208,10 +208,11 @@ class TransportBus(models.Model):
         return vip_seats
 
     def _compute_trip_count(self):
+        trip_counts = dict(self.env['transport.trip']._read_group(
+            [('bus_id', 'in', self.ids)], ['bus_id'], ['__count'],
+        ))
         for bus in self:
-            bus.trip_count = self.env['transport.trip'].search_count([
-                ('bus_id', '=', bus.id),
-            ])
+            bus.trip_count = trip_counts.get(bus._origin, 0)
 
     def action_set_available(self):
         """Marquer comme disponible"""
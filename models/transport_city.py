@@ -71,15 +71,26 @@ class TransportCity(models.Model):
     @api.depends('name')
     def _compute_trip_counts(self):
         """Calcule le nombre de voyages en départ/arrivée de cette ville"""
-        for city in self:
-            city.departure_count = self.env['transport.trip'].search_count([
-                ('route_id.departure_city_id', '=', city.id),
-                ('state', 'not in', ['cancelled']),
-            ])
-            city.arrival_count = self.env['transport.trip'].search_count([
-                ('route_id.arrival_city_id', '=', city.id),
+        # Une seule requête groupée par itinéraire, répartie ensuite par ville
+        departures = {}
+        arrivals = {}
+        for route, count in self.env['transport.trip']._read_group(
+            [
                 ('state', 'not in', ['cancelled']),
-            ])
+                '|',
+                ('route_id.departure_city_id', 'in', self.ids),
+                ('route_id.arrival_city_id', 'in', self.ids),
+            ],
+            ['route_id'],
+            ['__count'],
+        ):
+            departure_city = route.departure_city_id
+            arrival_city = route.arrival_city_id
+            departures[departure_city] = departures.get(departure_city, 0) + count
+            arrivals[arrival_city] = arrivals.get(arrival_city, 0) + count
+        for city in self:
+            city.departure_count = departures.get(city._origin, 0)
+            city.arrival_count = arrivals.get(city._origin, 0)
 
     def action_view_departures(self):
         """Voir les voyages partant de cette ville"""
@@ -137,11 +137,13 @@ class TransportCompany(models.Model):
     rating = fields.Float(
         string='Note moyenne',
         compute='_compute_rating',
+        store=True,
         digits=(2, 1),
     )
     rating_count = fields.Integer(
         string='Nombre d\'avis',
         compute='_compute_rating',
+        store=True,
     )
 
     _sql_constraints = [
@@ -166,29 +168,42 @@ class TransportCompany(models.Model):
                 raise ValidationError(_("La durée de réservation doit être d'au moins 1 heure!"))
 
     def _compute_counts(self):
+        # Une requête groupée par modèle pour l'ensemble des compagnies
+        domain = [('transport_company_id', 'in', self.ids)]
+        bus_counts = dict(self.env['transport.bus']._read_group(
+            domain, ['transport_company_id'], ['__count'],
+        ))
+        trip_counts = {}
+        active_trip_counts = {}
+        for company, state, count in self.env['transport.trip']._read_group(
+            domain, ['transport_company_id', 'state'], ['__count'],
+        ):
+            trip_counts[company] = trip_counts.get(company, 0) + count
+            if state == 'scheduled':
+                active_trip_counts[company] = count
+        booking_counts = dict(self.env['transport.booking']._read_group(
+            domain, ['transport_company_id'], ['__count'],
+        ))
         for company in self:
-            company.bus_count = len(company.bus_ids)
-            company.trip_count = len(company.trip_ids)
-            company.active_trip_count = self.env['transport.trip'].search_count([
-                ('transport_company_id', '=', company.id),
-                ('state', '=', 'scheduled'),
-            ])
-            company.total_bookings = self.env['transport.booking'].search_count([
-                ('trip_id.transport_company_id', '=', company.id),
-            ])
+            company.bus_count = bus_counts.get(company._origin, 0)
+            company.trip_count = trip_counts.get(company._origin, 0)
+            company.active_trip_count = active_trip_counts.get(company._origin, 0)
+            company.total_bookings = booking_counts.get(company._origin, 0)
 
+    @api.depends('trip_ids.booking_ids.rating')
     def _compute_rating(self):
+        ratings = {
+            company: (rating_sum, count)
+            for company, rating_sum, count in self.env['transport.booking']._read_group(
+                [('transport_company_id', 'in', self.ids), ('rating', '>', 0)],
+                ['transport_company_id'],
+                ['rating:sum', '__count'],
+            )
+        }
         for company in self:
-            ratings = self.env['transport.booking'].search([
-                ('trip_id.transport_company_id', '=', company.id),
-                ('rating', '>', 0),
-            ])
-            if ratings:
-                company.rating = sum(ratings.mapped('rating')) / len(ratings)
-                company.rating_count = len(ratings)
-            else:
-                company.rating = 0
-                company.rating_count = 0
+            rating_sum, count = ratings.get(company._origin, (0, 0))
+            company.rating = rating_sum / count if count else 0
+            company.rating_count = count
 
     def action_activate(self):
         """Activer la compagnie"""
@@ -198,6 +213,18 @@ class TransportCompany(models.Model):
         """Suspendre la compagnie"""
         self.write({'state': 'suspended'})
 
+    def action_rotate_qr_key(self):
+        """Renouveler la clé de signature des QR codes (les billets déjà émis restent valables)"""
+        self.env['transport.qr.key']._rotate(self.ids)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': _("Nouvelle clé de signature des QR codes créée."),
+                'type': 'success',
+            },
+        }
+
     def action_view_buses(self):
         """Voir la flotte de bus"""
         self.ensure_one()
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models, _
+from odoo.exceptions import AccessError
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+import time
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Durée de vie (secondes) du cache des tableaux de bord, par base et par compagnie
+DASHBOARD_CACHE_TTL = 60
+
+# Cache en mémoire du processus : {(base, tableau, compagnie): (expiration, données)}
+_dashboard_cache = {}
+
+PAID_STATES = ('confirmed', 'checked_in', 'completed')
+WEEK_DAYS = ['Lun', 'Mar', 'Mer', 'Jeu', 'Ven', 'Sam', 'Dim']
+
+
+class TransportDashboard(models.AbstractModel):
+    """Données agrégées des tableaux de bord (un seul appel RPC par chargement)"""
+    _name = 'transport.dashboard'
+    _description = 'Tableau de bord transport'
+
+    # =============================================
+    # POINTS D'ENTRÉE RPC
+    # =============================================
+
+    @api.model
+    def get_admin_dashboard_data(self, force=False):
+        """Indicateurs du tableau de bord administrateur"""
+        if not self.env.user.has_group('transport_interurbain.group_transport_admin'):
+            raise AccessError(_("Seuls les administrateurs transport ont accès à ce tableau de bord."))
+        return self._get_cached('admin', 0, self._compute_admin_data, force)
+
+    @api.model
+    def get_company_dashboard_data(self, force=False):
+        """Indicateurs du tableau de bord de la compagnie du responsable connecté"""
+        company = self.env['transport.company'].sudo().search([
+            ('manager_ids', 'in', self.env.user.id),
+        ], limit=1)
+        if not company:
+            return {'companyId': False}
+        return self._get_cached('company', company.id, lambda: self._compute_company_data(company), force)
+
+    @api.model
+    def _get_cached(self, kind, company_id, compute, force=False):
+        """Retourner les données en cache ou les recalculer après expiration"""
+        key = (self.env.cr.dbname, kind, company_id)
+        now = time.monotonic()
+        cached = _dashboard_cache.get(key)
+        if cached and not force and cached[0] > now:
+            return cached[1]
+        data = compute()
+        data['lastUpdate'] = fields.Datetime.context_timestamp(self, fields.Datetime.now()).strftime('%H:%M:%S')
+        _dashboard_cache[key] = (now + DASHBOARD_CACHE_TTL, data)
+        return data
+
+    # =============================================
+    # CALCULS
+    # =============================================
+
+    def _get_periods(self):
+        """Bornes de dates utilisées par les indicateurs"""
+        today = fields.Date.context_today(self)
+        month_start = today.replace(day=1)
+        last_month_end = month_start - timedelta(days=1)
+        now = fields.Datetime.now()
+        return {
+            'today': today,
+            'week_ago': today - timedelta(days=7),
+            'two_weeks_ago': today - timedelta(days=14),
+            'six_days_ago': today - timedelta(days=6),
+            'month_start': month_start,
+            'last_month_start': last_month_end.replace(day=1),
+            'last_month_end': last_month_end,
+            'now': now,
+            'expiring_limit': now + timedelta(hours=2),
+            'month_start_dt': datetime.combine(month_start, datetime.min.time()),
+            'trend_start': month_start - relativedelta(months=5),
+            'thirty_days_ago': today - timedelta(days=30),
+            'paid_states': PAID_STATES,
+        }
+
+    def _company_clause(self, company, alias=''):
+        """Filtre SQL optionnel sur la compagnie"""
+        if not company:
+            return ''
+        prefix = f'{alias}.' if alias else ''
+        return f' AND {prefix}transport_company_id = %(company_id)s'
+
+    def _query_trip_counts(self, params, company=None):
+        """Voyages par état (une requête GROUP BY)"""
+        self.env.cr.execute("""
+            SELECT state, COUNT(*), COUNT(*) FILTER (WHERE departure_date = %(today)s)
+              FROM transport_trip
+             WHERE TRUE""" + self._company_clause(company) + """
+          GROUP BY state
+        """, params)
+        by_state = {}
+        today_trips = 0
+        for state, count, today_count in self.env.cr.fetchall():
+            by_state[state] = count
+            today_trips += today_count
+        total = sum(by_state.values())
+        cancelled = by_state.get('cancelled', 0)
+        return {
+            'totalTrips': total,
+            'scheduledTrips': by_state.get('scheduled', 0),
+            'boardingTrips': by_state.get('boarding', 0),
+            'departedTrips': by_state.get('departed', 0),
+            'completedTrips': by_state.get('arrived', 0),
+            'cancelledTrips': cancelled,
+            'todayTrips': today_trips,
+            'cancellationRate': round(cancelled * 100 / total) if total else 0,
+        }
+
+    def _query_booking_kpis(self, params, company=None):
+        """Compteurs et revenus des réservations (une seule requête agrégée)"""
+        self.env.cr.execute("""
+            SELECT COUNT(*),
+                   COUNT(*) FILTER (WHERE state = 'confirmed'),
+                   COUNT(*) FILTER (WHERE state = 'reserved'),
+                   COUNT(*) FILTER (WHERE state IN ('draft', 'reserved')),
+                   COUNT(*) FILTER (WHERE booking_date >= %(today)s),
+                   COUNT(*) FILTER (WHERE amount_due > 0
+                                      AND state NOT IN ('cancelled', 'expired', 'refunded')),
+                   COUNT(*) FILTER (WHERE state = 'reserved'
+                                      AND reservation_deadline > %(now)s
+                                      AND reservation_deadline <= %(expiring_limit)s),
+                   COALESCE(SUM(total_amount) FILTER (WHERE state IN %(paid_states)s), 0),
+                   COALESCE(SUM(total_amount) FILTER (WHERE state IN %(paid_states)s
+                                                        AND booking_date >= %(today)s), 0),
+                   COALESCE(SUM(total_amount) FILTER (WHERE state IN %(paid_states)s
+                                                        AND booking_date >= %(week_ago)s), 0),
+                   COALESCE(SUM(total_amount) FILTER (WHERE state IN %(paid_states)s
+                                                        AND booking_date >= %(two_weeks_ago)s
+                                                        AND booking_date < %(week_ago)s), 0),
+                   COALESCE(SUM(total_amount) FILTER (WHERE state IN %(paid_states)s
+                                                        AND booking_date >= %(month_start)s), 0),
+                   COALESCE(SUM(total_amount) FILTER (WHERE state IN %(paid_states)s
+                                                        AND booking_date >= %(last_month_start)s
+                                                        AND booking_date <= %(last_month_end)s), 0),
+                   COUNT(*) FILTER (WHERE state IN %(paid_states)s AND booking_date >= %(week_ago)s),
+                   COUNT(*) FILTER (WHERE state IN %(paid_states)s
+                                      AND booking_date >= %(two_weeks_ago)s
+                                      AND booking_date < %(week_ago)s)
+              FROM transport_booking
+             WHERE TRUE""" + self._company_clause(company), params)
+        (total, confirmed, reserved, pending, today_count, unpaid, expiring,
+         total_revenue, today_revenue, week_revenue, last_week_revenue,
+         month_revenue, last_month_revenue, week_count, last_week_count) = self.env.cr.fetchone()
+
+        def trend(current, previous):
+            return round((current - previous) * 100 / previous) if previous else 0
+
+        return {
+            'totalBookings': total,
+            'confirmedBookings': confirmed,
+            'reservedBookings': reserved,
+            'pendingBookings': pending,
+            'todayBookings': today_count,
+            'unpaidBookings': unpaid,
+            'expiringReservations': expiring,
+            'totalRevenue': float(total_revenue),
+            'todayRevenue': float(today_revenue),
+            'weekRevenue': float(week_revenue),
+            'monthRevenue': float(month_revenue),
+            'lastMonthRevenue': float(last_month_revenue),
+            'revenueGrowth': trend(month_revenue, last_month_revenue),
+            'bookingsTrend': trend(week_count, last_week_count),
+            'revenueTrend': trend(week_revenue, last_week_revenue),
+            # Prédiction simple : la semaine à venir au rythme des 7 derniers jours
+            'predictedRevenue': round(float(week_revenue)),
+            'predictedBookings': week_count,
+        }
+
+    def _query_weekly_series(self, params, company=None):
+        """Revenus et réservations payées des 7 derniers jours (GROUP BY jour)"""
+        self.env.cr.execute("""
+            SELECT booking_date, COUNT(*), COALESCE(SUM(total_amount), 0)
+              FROM transport_booking
+             WHERE state IN %(paid_states)s
+               AND booking_date >= %(six_days_ago)s""" + self._company_clause(company) + """
+          GROUP BY booking_date
+        """, params)
+        by_day = {row[0]: row for row in self.env.cr.fetchall()}
+        revenues, counts = [], []
+        for offset in range(6, -1, -1):
+            day = params['today'] - timedelta(days=offset)
+            row = by_day.get(day)
+            label = WEEK_DAYS[day.weekday()]
+            revenues.append({'day': label, 'value': float(row[2]) if row else 0})
+            counts.append({'day': label, 'value': row[1] if row else 0})
+        return {'weeklyRevenue': revenues, 'weeklyBookings': counts}
+
+    def _query_stats_trends(self, params, company=None):
+        """Tendances mensuelles et top itinéraires lus dans les statistiques journalières"""
+        Stats = self.env['transport.stats.daily']
+        return {
+            'monthlyTrend': Stats.get_monthly_trend(params['trend_start'], company),
+            'topRoutes': Stats.get_top_routes(params['thirty_days_ago'], company),
+        }
+
+    def _query_recent_bookings(self, company=None, fields_list=None):
+        """Dernières réservations"""
+        domain = [('transport_company_id', '=', company.id)] if company else []
+        return self.env['transport.booking'].sudo().search_read(
+            domain,
+            fields_list or ['name', 'passenger_name', 'total_amount', 'amount_due',
+                            'state', 'booking_date', 'trip_id'],
+            order='create_date desc',
+            limit=10,
+        )
+
+    def _compute_admin_data(self):
+        """Calculer l'ensemble des indicateurs administrateur"""
+        cr = self.env.cr
+        # Les indicateurs sont lus en SQL : écritures ORM en attente d'abord
+        self.env.flush_all()
+        params = self._get_periods()
+        data = {}
+        data.update(self._query_trip_counts(params))
+        data.update(self._query_booking_kpis(params))
+        data.update(self._query_weekly_series(params))
+
+        cr.execute("""
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE state = 'active')
+              FROM transport_company
+        """)
+        data['totalCompanies'], data['activeCompanies'] = cr.fetchone()
+
+        cr.execute("""
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE create_date >= %(month_start_dt)s)
+              FROM transport_passenger
+        """, params)
+        data['totalPassengers'], data['newPassengersThisMonth'] = cr.fetchone()
+
+        cr.execute("""
+            SELECT COALESCE(SUM(total_seats), 0), COALESCE(SUM(total_seats - available_seats), 0)
+              FROM transport_trip
+             WHERE state IN ('scheduled', 'boarding', 'departed')
+        """)
+        total_seats, booked_seats = cr.fetchone()
+        data['avgOccupancyRate'] = round(booked_seats * 100 / total_seats) if total_seats else 0
+
+        # Notes moyennes par compagnie active (une requête GROUP BY)
+        cr.execute("""
+            SELECT c.id, c.name, AVG(b.rating), COUNT(b.id)
+              FROM transport_company c
+         LEFT JOIN transport_booking b ON b.transport_company_id = c.id AND b.rating > 0
+             WHERE c.state = 'active'
+          GROUP BY c.id, c.name
+          ORDER BY AVG(b.rating) DESC NULLS LAST, COUNT(b.id) DESC
+        """)
+        companies = [{
+            'id': company_id,
+            'name': name,
+            'rating': round(float(rating or 0), 1),
+            'rating_count': count,
+        } for company_id, name, rating, count in cr.fetchall()]
+        rating_count = sum(c['rating_count'] for c in companies)
+        rating_weight = sum(c['rating'] * c['rating_count'] for c in companies)
+        data['avgRating'] = round(rating_weight / rating_count, 1) if rating_count else 0
+        data['topCompanies'] = companies[:5]
+
+        data.update(self._query_stats_trends(params))
+        data['recentBookings'] = self._query_recent_bookings()
+        return data
+
+    def _compute_company_data(self, company):
+        """Calculer l'ensemble des indicateurs d'une compagnie"""
+        cr = self.env.cr
+        # Les indicateurs sont lus en SQL : écritures ORM en attente d'abord
+        self.env.flush_all()
+        params = dict(self._get_periods(), company_id=company.id)
+        data = {
+            'companyId': company.id,
+            'companyName': company.name,
+            'companyRating': company.rating or 0,
+            'companyRatingCount': company.rating_count or 0,
+        }
+        data.update(self._query_trip_counts(params, company))
+        data.update(self._query_booking_kpis(params, company))
+        data.update(self._query_weekly_series(params, company))
+
+        cr.execute("""
+            SELECT state, COUNT(*)
+              FROM transport_bus
+             WHERE transport_company_id = %(company_id)s
+          GROUP BY state
+        """, params)
+        buses = dict(cr.fetchall())
+        data['totalBuses'] = sum(buses.values())
+        data['activeBuses'] = buses.get('available', 0)
+        data['inMaintenanceBuses'] = buses.get('maintenance', 0)
+
+        upcoming = self.env['transport.trip'].sudo().search_read(
+            [
+                ('transport_company_id', '=', company.id),
+                ('state', 'in', ['scheduled', 'boarding']),
+                ('departure_date', '>=', params['today']),
+            ],
+            ['name', 'route_id', 'departure_datetime', 'available_seats', 'total_seats', 'state', 'bus_id'],
+            order='departure_datetime asc',
+            limit=10,
+        )
+        data['upcomingTrips'] = upcoming
+        total_seats = sum(t['total_seats'] or 0 for t in upcoming)
+        booked_seats = sum((t['total_seats'] or 0) - (t['available_seats'] or 0) for t in upcoming)
+        data['avgOccupancyRate'] = round(booked_seats * 100 / total_seats) if total_seats else 0
+
+        data.update(self._query_stats_trends(params, company))
+        data['recentBookings'] = self._query_recent_bookings(company, [
+            'name', 'passenger_name', 'passenger_phone', 'trip_id', 'total_amount',
+            'amount_due', 'state', 'booking_date', 'seat_number',
+        ])
+        return data
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from odoo import api, models
+
+from ..tools import keyset
+
+# Durée de vie (secondes) des totaux de listes paginées mis en cache
+KEYSET_COUNT_CACHE_TTL = 60
+KEYSET_COUNT_CACHE_SIZE = 10000
+
+# Cache en mémoire du processus : {(base, modèle, utilisateur, domaine): (expiration, total)}
+_count_cache = {}
+
+
+class TransportKeysetMixin(models.AbstractModel):
+    """Pagination par curseur (voir tools/keyset.py)
+
+    Usage::
+
+        bookings, next_cursor = Booking._keyset_search(domain, 'departure', cursor, limit=20)
+        total = Booking._keyset_count(domain)
+    """
+    _name = 'transport.keyset.mixin'
+    _description = 'Pagination par curseur'
+
+    @api.model
+    def _keyset_search(self, domain, order='recent', cursor=None, limit=keyset.DEFAULT_LIMIT, offset=0):
+        """Une page et le curseur de la page suivante (None en fin de liste) ; ValueError si le curseur est invalide
+
+        ``offset`` ne sert qu'aux anciens clients qui paginent encore par décalage.
+        """
+        limit = max(1, min(int(limit), keyset.MAX_LIMIT))
+        after = keyset.decode_cursor(cursor, order) if cursor else None
+        query = self._search(domain, offset=0 if after else offset, limit=limit + 1, order=keyset.order_clause(order))
+        if after:
+            # Comparaison de lignes (clé de tri, id) : servie par l'index composite, règles d'accès comprises
+            query.add_where(*keyset.after_clause(order, after, self._table))
+        records = self.browse(query)
+        if len(records) <= limit:
+            return records, None
+        records = records[:limit]
+        last = records[-1]
+        return records, keyset.encode_cursor(order, [last[field] for field, _direction in keyset.ORDERS[order]])
+
+    @api.model
+    def _keyset_count(self, domain):
+        """Total d'une liste paginée, en cache quelques secondes (à ne demander qu'au besoin)"""
+        key = (self.env.cr.dbname, self._name, self.env.uid, repr(domain))
+        now = time.monotonic()
+        cached = _count_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        if len(_count_cache) >= KEYSET_COUNT_CACHE_SIZE:
+            for expired in [k for k, (expiry, _total) in _count_cache.items() if expiry <= now]:
+                _count_cache.pop(expired, None)
+        total = self.search_count(domain)
+        _count_cache[key] = (now + KEYSET_COUNT_CACHE_TTL, total)
+        return total
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+
+class TransportLoyaltyEntry(models.Model):
+    """Mouvement de points de fidélité d'un passager (journal en ajout seul)
+
+    Le solde ``loyalty_points`` du passager est la somme de ses mouvements ;
+    il est mis à jour en même temps que l'insertion, par un incrément SQL
+    atomique (voir transport.passenger._add_loyalty_points).
+    """
+    _name = 'transport.loyalty.entry'
+    _description = 'Mouvement de points de fidélité'
+    _order = 'id desc'
+
+    passenger_id = fields.Many2one(
+        'transport.passenger',
+        string='Passager',
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete='cascade',
+    )
+    points = fields.Integer(
+        string='Points',
+        required=True,
+        readonly=True,
+    )
+    booking_id = fields.Many2one(
+        'transport.booking',
+        string='Réservation',
+        readonly=True,
+        ondelete='set null',
+    )
+    reason = fields.Char(
+        string='Motif',
+        readonly=True,
+    )
+
+    def write(self, vals):
+        raise UserError(_("Les mouvements de points de fidélité ne peuvent pas être modifiés."))
+
+    def unlink(self):
+        """Jamais de suppression : une annulation est un mouvement négatif (_add_loyalty_points)"""
+        raise UserError(_("Les mouvements de points de fidélité ne peuvent pas être supprimés."))
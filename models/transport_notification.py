@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models, _
+from odoo.tools.sql import create_index
+from collections import Counter, defaultdict
+from datetime import timedelta
+import logging
+import time
+
+from ..tools.metrics import metrics
+from ..tools.notifications import get_provider
+
+_logger = logging.getLogger(__name__)
+
+PROVIDER_PARAMS = {
+    'sms': 'transport_interurbain.sms_provider',
+    'email': 'transport_interurbain.email_provider',
+}
+DEFAULT_PROVIDER = 'log'
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_TIME_BUDGET = 120  # secondes
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 60  # secondes, doublé à chaque tentative
+OUTBOX_MAX_RETRY_DELAY = 3600  # secondes
+
+
+class TransportNotification(models.Model):
+    """Message SMS / email en attente d'envoi (file transactionnelle)"""
+    _name = 'transport.notification'
+    _description = 'Notification à envoyer'
+    _order = 'id desc'
+    _rec_name = 'dedup_key'
+
+    channel = fields.Selection([
+        ('sms', 'SMS'),
+        ('email', 'Email'),
+    ], string='Canal', required=True, readonly=True)
+    provider = fields.Char(
+        string='Prestataire',
+        required=True,
+        readonly=True,
+    )
+    recipient = fields.Char(
+        string='Destinataire',
+        required=True,
+        readonly=True,
+    )
+    subject = fields.Char(
+        string='Objet',
+        readonly=True,
+    )
+    body = fields.Text(
+        string='Message',
+        readonly=True,
+    )
+    dedup_key = fields.Char(
+        string='Clé de déduplication',
+        required=True,
+        readonly=True,
+        help="Un même message (type, réservation, canal) n'est mis en file qu'une fois",
+    )
+    booking_id = fields.Many2one(
+        'transport.booking',
+        string='Réservation',
+        readonly=True,
+        index='btree_not_null',
+        ondelete='cascade',
+    )
+    state = fields.Selection([
+        ('pending', 'À envoyer'),
+        ('sent', 'Envoyé'),
+        ('failed', 'Échoué'),
+    ], string='État', default='pending', required=True, readonly=True)
+    attempts = fields.Integer(
+        string='Tentatives',
+        readonly=True,
+    )
+    next_attempt_at = fields.Datetime(
+        string='Prochaine tentative',
+        default=fields.Datetime.now,
+        readonly=True,
+    )
+    sent_at = fields.Datetime(
+        string='Envoyé le',
+        readonly=True,
+    )
+    last_error = fields.Text(
+        string='Dernière erreur',
+        readonly=True,
+    )
+
+    _sql_constraints = [
+        ('dedup_key_uniq', 'UNIQUE(dedup_key)', "Cette notification est déjà en file!"),
+    ]
+
+    def init(self):
+        # Index partiel : la tâche d'envoi ne parcourt que les messages à envoyer
+        create_index(
+            self._cr, 'transport_notification_pending_idx', self._table,
+            ['next_attempt_at', 'id'], where="state = 'pending'",
+        )
+
+    @api.model
+    def _get_provider_code(self, channel):
+        return self.env['ir.config_parameter'].sudo().get_param(PROVIDER_PARAMS[channel]) or DEFAULT_PROVIDER
+
+    @api.model
+    def _enqueue(self, messages):
+        """
+        Mettre des messages en file dans la transaction courante.
+
+        ``messages`` : liste de dict (channel, recipient, body, dedup_key,
+        subject et booking_id facultatifs). Les messages déjà en file (même
+        clé) sont ignorés sans erreur, ce qui ne compromet jamais la
+        transaction appelante. Renvoie le nombre de messages ajoutés.
+        """
+        providers = {}
+        created = 0
+        for message in messages:
+            if not message.get('recipient'):
+                continue
+            channel = message['channel']
+            if channel not in providers:
+                providers[channel] = self._get_provider_code(channel)
+            self.env.cr.execute("""
+                INSERT INTO transport_notification
+                       (channel, provider, recipient, subject, body, dedup_key, booking_id,
+                        state, attempts, next_attempt_at, create_uid, create_date, write_uid, write_date)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 'pending', 0, now() at time zone 'UTC',
+                        %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+                ON CONFLICT (dedup_key) DO NOTHING
+            """, (channel, providers[channel], message['recipient'], message.get('subject'),
+                  message.get('body'), message['dedup_key'], message.get('booking_id'),
+                  self.env.uid, self.env.uid))
+            created += self.env.cr.rowcount
+        if created:
+            # Le déclencheur est annulé avec la transaction si la réservation échoue
+            self.env.ref('transport_interurbain.ir_cron_send_notifications').sudo()._trigger()
+        return created
+
+    @api.model
+    @metrics.track_duration('transport_cron_duration_seconds', cron='notifications')
+    def cron_send_notifications(self, batch_size=OUTBOX_BATCH_SIZE, time_budget=OUTBOX_TIME_BUDGET):
+        """
+        Envoyer les messages en file, par prestataire et par lots.
+
+        Chaque prestataire reçoit des lots de sa taille maximale, espacés pour
+        respecter son débit, y compris d'un lot de la file au suivant. Un message en échec est retenté avec une attente
+        doublée à chaque fois, puis abandonné après OUTBOX_MAX_ATTEMPTS essais.
+        """
+        started = time.monotonic()
+        auto_commit = not self.env.registry.in_test_mode() and not self.env.context.get('transport_no_commit')
+        total = 0
+        # Prochain envoi autorisé par prestataire (horloge monotone), sur toute l'exécution
+        next_send = {}
+        self.env.flush_all()
+        while True:
+            self.env.cr.execute("""
+                SELECT id
+                  FROM transport_notification
+                 WHERE state = 'pending'
+                   AND next_attempt_at <= %s
+              ORDER BY next_attempt_at, id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, (fields.Datetime.now(), batch_size))
+            messages = self.browse([row[0] for row in self.env.cr.fetchall()])
+            if not messages:
+                break
+            by_provider = defaultdict(lambda: self.browse())
+            for message in messages:
+                by_provider[message.provider] |= message
+            for provider_code, provider_messages in by_provider.items():
+                provider_messages._send_with_provider(provider_code, next_send)
+            total += len(messages)
+            self.env.flush_all()
+            if auto_commit:
+                self.env.cr.commit()
+            if len(messages) < batch_size:
+                break
+            if time.monotonic() - started > time_budget:
+                self.env.ref('transport_interurbain.ir_cron_send_notifications').sudo()._trigger()
+                break
+        if total:
+            _logger.info("%d notification(s) traitée(s) en %.1fs", total, time.monotonic() - started)
+        return True
+
+    def _send_with_provider(self, provider_code, next_send=None):
+        """Envoyer les messages par lots en respectant le débit du prestataire
+
+        ``next_send`` : {prestataire: instant du prochain envoi autorisé}, mis
+        à jour après chaque lot et partagé entre les appels d'une exécution.
+        """
+        next_send = {} if next_send is None else next_send
+        try:
+            provider = get_provider(self.env, provider_code)
+        except KeyError:
+            self._record_results(dict.fromkeys(self.ids, _("Prestataire inconnu: %s", provider_code)))
+            return
+        unsupported = self.filtered(lambda m: m.channel not in provider.channels)
+        if unsupported:
+            unsupported._record_results(dict.fromkeys(
+                unsupported.ids, _("Canal non pris en charge par %s", provider_code)))
+        messages = self - unsupported
+        for start in range(0, len(messages), provider.batch_size):
+            batch = messages[start:start + provider.batch_size]
+            wait = next_send.get(provider_code, 0) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            batch_started = time.monotonic()
+            try:
+                results = provider.send_batch(batch)
+            except Exception as e:
+                _logger.exception("Échec d'envoi d'un lot de %d message(s) via %s", len(batch), provider_code)
+                results = dict.fromkeys(batch.ids, str(e))
+            batch._record_results(results)
+            # Limitation de débit : un lot de n messages occupe au moins n / rate_limit secondes
+            next_send[provider_code] = batch_started + len(batch) / float(provider.rate_limit)
+
+    def _record_results(self, results):
+        """Enregistrer le résultat d'envoi : {id: None si envoyé, sinon message d'erreur}
+
+        Un message absent du résultat n'est pas considéré comme envoyé.
+        """
+        now = fields.Datetime.now()
+        sent = self.filtered(lambda m: m.id in results and results[m.id] is None)
+        sent.write({'state': 'sent', 'sent_at': now, 'last_error': False})
+        for message in self - sent:
+            attempts = message.attempts + 1
+            delay = min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_MAX_RETRY_DELAY)
+            message.write({
+                'state': 'pending' if attempts < OUTBOX_MAX_ATTEMPTS else 'failed',
+                'attempts': attempts,
+                'next_attempt_at': now + timedelta(seconds=delay),
+                'last_error': results.get(message.id) or _("Aucun résultat du prestataire pour ce message"),
+            })
+        outcomes = Counter(
+            (m.channel, m.provider, 'sent' if m.state == 'sent' else 'retry' if m.state == 'pending' else 'failed')
+            for m in self
+        )
+        for (channel, provider, outcome), count in outcomes.items():
+            metrics.inc('transport_notifications_total', count, channel=channel, provider=provider, outcome=outcome)
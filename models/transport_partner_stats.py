@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, models
+from collections import defaultdict
+
+# États comptés dans les dépenses d'un client
+SPENT_STATES = ('confirmed', 'completed')
+# Nombre d'itinéraires fréquents retournés
+FREQUENT_ROUTES_LIMIT = 5
+
+
+class TransportPartnerStats(models.AbstractModel):
+    """Statistiques de voyage d'un client, calculées par requêtes groupées
+
+    Le coût ne dépend pas de l'historique du client : deux GROUP BY sur ses
+    réservations (par état, puis par itinéraire et compagnie pour les voyages
+    terminés), servis par l'index ``transport_booking_partner_departure_idx``.
+    """
+    _name = 'transport.partner.stats'
+    _description = 'Statistiques voyageur'
+
+    @api.model
+    def _get_partner_stats(self, partner_id):
+        """Statistiques du client ``partner_id`` (compteurs par état, km, dépenses, habitudes)"""
+        Booking = self.env['transport.booking'].sudo()
+        by_state = defaultdict(int)
+        total_spent = 0
+        for state, count, amount in Booking._read_group(
+            [('partner_id', '=', partner_id)], ['state'], ['__count', 'total_amount:sum'],
+        ):
+            by_state[state] = count
+            if state in SPENT_STATES:
+                total_spent += amount or 0
+
+        total_km = 0
+        company_counts = defaultdict(int)
+        route_counts = defaultdict(int)
+        for route, company, count in Booking._read_group(
+            [('partner_id', '=', partner_id), ('state', '=', 'completed')],
+            ['route_id', 'transport_company_id'], ['__count'],
+        ):
+            if route:
+                total_km += route.distance_km * count
+                route_counts[route] += count
+            if company:
+                company_counts[company] += count
+
+        favorite_company = max(company_counts, key=company_counts.get) if company_counts else None
+        frequent_routes = sorted(route_counts.items(), key=lambda item: (-item[1], item[0].id))
+        return {
+            'by_state': dict(by_state),
+            'total': sum(by_state.values()),
+            'pending': by_state['draft'] + by_state['reserved'],
+            'total_trips': by_state['completed'],
+            'total_km': total_km,
+            'total_spent': total_spent,
+            'favorite_company': favorite_company.name if favorite_company else 'N/A',
+            'frequent_routes': [
+                {'name': route.name, 'count': count}
+                for route, count in frequent_routes[:FREQUENT_ROUTES_LIMIT]
+            ],
+        }
@@ -6,6 +6,13 @@ import qrcode
 import base64
 from io import BytesIO
 
+from ..tools import ticket_qr
+from ..tools.phone import normalize_phone
+
+# Niveaux de fidélité : (seuil de points, niveau), du plus élevé au plus bas
+LOYALTY_LEVELS = [(10000, 'platinum'), (5000, 'gold'), (2000, 'silver')]
+LOYALTY_DEFAULT_LEVEL = 'bronze'
+
 
 class TransportPassenger(models.Model):
     """Passager enregistré"""
@@ -29,6 +36,13 @@ class TransportPassenger(models.Model):
         string='Téléphone',
         tracking=True,
     )
+    phone_key = fields.Char(
+        string='Téléphone (E.164)',
+        compute='_compute_phone_key',
+        store=True,
+        index=True,
+        help="Clé d'identité : téléphone normalisé, utilisé pour la connexion et l'inscription",
+    )
     email = fields.Char(
         string='Email',
     )
@@ -73,24 +87,39 @@ class TransportPassenger(models.Model):
     )
     
     # Statistiques
+    booking_ids = fields.One2many(
+        'transport.booking',
+        'passenger_id',
+        string='Réservations',
+    )
     booking_count = fields.Integer(
         string='Nombre de voyages',
         compute='_compute_booking_count',
+        store=True,
     )
     total_spent = fields.Monetary(
         string='Total dépensé',
         compute='_compute_booking_count',
         currency_field='currency_id',
+        store=True,
     )
     last_trip_date = fields.Datetime(
         string='Dernier voyage',
         compute='_compute_booking_count',
+        store=True,
     )
     
     # Fidélité
     loyalty_points = fields.Integer(
         string='Points de fidélité',
         default=0,
+        readonly=True,
+        help="Solde du journal des points, mis à jour par _add_loyalty_points",
+    )
+    loyalty_entry_ids = fields.One2many(
+        'transport.loyalty.entry',
+        'passenger_id',
+        string='Mouvements de points',
     )
     loyalty_level = fields.Selection([
         ('bronze', 'Bronze'),
@@ -121,8 +150,7 @@ class TransportPassenger(models.Model):
     unique_qr_code = fields.Binary(
         string='QR Code unique',
         compute='_compute_unique_qr_code',
-        store=True,
-        help="QR Code unique pour identification du passager",
+        help="QR Code d'identification du passager (signé, valable quelques semaines)",
     )
     pin_code = fields.Char(
         string='Code PIN',
@@ -154,7 +182,7 @@ class TransportPassenger(models.Model):
         """Générer le QR Code unique pour identification du passager"""
         for passenger in self:
             if passenger.unique_token:
-                qr_data = f"PASSENGER:{passenger.unique_token}"
+                qr_data = passenger._get_qr_payload()
                 qr = qrcode.QRCode(
                     version=1,
                     error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -170,13 +198,66 @@ class TransportPassenger(models.Model):
             else:
                 passenger.unique_qr_code = False
 
+    def _get_boarding_info(self):
+        """Données du passager reprises dans les sessions d'embarquement"""
+        self.ensure_one()
+        return {
+            'id': self.id,
+            'token': self.unique_token,
+            'name': self.name,
+            'phone': self.phone,
+            'email': self.email,
+            'loyalty_level': self.loyalty_level,
+            'loyalty_points': self.loyalty_points,
+        }
+
+    def _get_qr_payload(self):
+        """Contenu du QR code du passager : format signé P2 (clé de la plateforme, avec expiration)"""
+        self.ensure_one()
+        if not self.id:
+            return f"PASSENGER:{self.unique_token}"
+        kid, secret = self.env['transport.qr.key']._get_signing_key()
+        return ticket_qr.encode_passenger(kid, secret, self.id, self.unique_token)
+
+    def _notify_boarding(self):
+        """Annoncer les réservations des passagers sur les voyages en embarquement (sessions en cache)"""
+        bookings = self.env['transport.booking'].sudo().search([
+            ('passenger_id', 'in', self.ids),
+            ('trip_id.state', '=', 'boarding'),
+        ])
+        if bookings:
+            self.env['transport.boarding']._notify_bookings(bookings)
+
+    def action_revoke_qr_code(self):
+        """Révoquer les QR codes déjà émis en régénérant le token unique du passager"""
+        for passenger in self:
+            passenger.unique_token = str(uuid.uuid4())
+        self._notify_boarding()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': _("Les anciens QR codes du passager ne sont plus acceptés."),
+                'type': 'success',
+            },
+        }
+
     @api.model_create_multi
     def create(self, vals_list):
         """Générer automatiquement le token unique à la création"""
         for vals in vals_list:
             if not vals.get('unique_token'):
                 vals['unique_token'] = str(uuid.uuid4())
-        return super().create(vals_list)
+        passengers = super().create(vals_list)
+        # Solde initial éventuel (import, données de démonstration) reporté au journal
+        opening = passengers.filtered('loyalty_points')
+        if opening:
+            self.env['transport.loyalty.entry'].sudo().create([{
+                'passenger_id': passenger.id,
+                'points': passenger.loyalty_points,
+                'reason': _("Solde initial"),
+            } for passenger in opening])
+        return passengers
 
     def _generate_pin_code(self):
         """Générer un code PIN à 4 chiffres"""
@@ -185,33 +266,76 @@ class TransportPassenger(models.Model):
         self.pin_code = str(random.randint(1000, 9999))
         return self.pin_code
 
+    @api.depends('booking_ids.state', 'booking_ids.total_amount', 'booking_ids.departure_datetime')
     def _compute_booking_count(self):
+        stats = {
+            passenger: (count, total, last_date)
+            for passenger, count, total, last_date in self.env['transport.booking']._read_group(
+                [('passenger_id', 'in', self.ids), ('state', 'in', ['confirmed', 'completed'])],
+                ['passenger_id'],
+                ['__count', 'total_amount:sum', 'departure_datetime:max'],
+            )
+        }
+        for passenger in self:
+            count, total, last_date = stats.get(passenger._origin, (0, 0, False))
+            passenger.booking_count = count
+            passenger.total_spent = total
+            passenger.last_trip_date = last_date
+
+    @api.depends('phone')
+    def _compute_phone_key(self):
         for passenger in self:
-            bookings = self.env['transport.booking'].search([
-                ('passenger_id', '=', passenger.id),
-                ('state', 'in', ['confirmed', 'completed']),
-            ])
-            passenger.booking_count = len(bookings)
-            passenger.total_spent = sum(bookings.mapped('total_amount'))
-            last_booking = bookings.sorted('departure_datetime', reverse=True)[:1]
-            passenger.last_trip_date = last_booking.departure_datetime if last_booking else False
+            passenger.phone_key = normalize_phone(passenger.phone)
 
     @api.depends('loyalty_points')
     def _compute_loyalty_level(self):
         for passenger in self:
-            if passenger.loyalty_points >= 10000:
-                passenger.loyalty_level = 'platinum'
-            elif passenger.loyalty_points >= 5000:
-                passenger.loyalty_level = 'gold'
-            elif passenger.loyalty_points >= 2000:
-                passenger.loyalty_level = 'silver'
-            else:
-                passenger.loyalty_level = 'bronze'
+            passenger.loyalty_level = next(
+                (level for threshold, level in LOYALTY_LEVELS if passenger.loyalty_points >= threshold),
+                LOYALTY_DEFAULT_LEVEL,
+            )
 
-    def add_loyalty_points(self, points):
+    def add_loyalty_points(self, points, booking=None, reason=None):
         """Ajouter des points de fidélité"""
-        for passenger in self:
-            passenger.loyalty_points += points
+        self._add_loyalty_points(
+            {passenger.id: points for passenger in self},
+            reason=reason, booking_id=booking.id if booking else False,
+        )
+
+    @api.model
+    def _add_loyalty_points(self, points_by_passenger, reason=None, booking_id=False):
+        """Créditer des points : {passager: points}
+
+        Une ligne de journal par passager, insérées en une requête, puis un
+        incrément SQL atomique du solde et du niveau : deux embarquements
+        simultanés ne perdent pas de points et le niveau n'est pas recalculé
+        par l'ORM. Les sessions d'embarquement en cache sont prévenues, car
+        elles reprennent le solde et le niveau des passagers.
+        """
+        points_by_passenger = {pid: points for pid, points in points_by_passenger.items() if pid and points}
+        if not points_by_passenger:
+            return
+        self.env['transport.loyalty.entry'].sudo().create([{
+            'passenger_id': passenger_id,
+            'points': points,
+            'booking_id': booking_id,
+            'reason': reason,
+        } for passenger_id, points in points_by_passenger.items()])
+        self.flush_model(['loyalty_points'])
+        level = ' '.join("WHEN p.loyalty_points + v.points >= %d THEN '%s'" % item for item in LOYALTY_LEVELS)
+        self.env.cr.execute("""
+            UPDATE transport_passenger p
+               SET loyalty_points = p.loyalty_points + v.points,
+                   loyalty_level = CASE %s ELSE '%s' END,
+                   write_date = (now() at time zone 'UTC'),
+                   write_uid = %%s
+              FROM unnest(%%s::int[], %%s::int[]) AS v(id, points)
+             WHERE p.id = v.id
+        """ % (level, LOYALTY_DEFAULT_LEVEL), (
+            self.env.uid, list(points_by_passenger), list(points_by_passenger.values()),
+        ))
+        self.invalidate_model(['loyalty_points', 'loyalty_level', 'write_date', 'write_uid'])
+        self.browse(list(points_by_passenger))._notify_boarding()
 
     def action_view_bookings(self):
         """Voir les réservations du passager"""
@@ -6,15 +6,38 @@ import uuid
 import hashlib
 import hmac
 import json
-import requests
-from datetime import datetime
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from odoo.tools import str2bool
+
+from ..tools.metrics import metrics
+from ..tools.wave import RETRYABLE_STATUS, WAVE_INTERACTIVE_DEADLINE, WaveClient, WaveError, WaveUnavailable
+
+_logger = logging.getLogger(__name__)
+
+WAVE_API_URL_PARAM = 'transport_interurbain.wave_api_url'
+WAVE_ASYNC_PARAM = 'transport_interurbain.wave_async_checkout'
+DEFAULT_WAVE_API_URL = 'https://api.wave.com/v1'
+WAVE_CHECKOUT_BATCH_SIZE = 50
+WAVE_CHECKOUT_TIME_BUDGET = 120  # secondes
+# Essais de création d'une session Wave avant échec, délai doublé à chaque essai
+WAVE_CHECKOUT_MAX_ATTEMPTS = 5
+WAVE_CHECKOUT_RETRY_DELAY = 60  # secondes
+RECONCILE_STALE_MINUTES = 15
+RECONCILE_BATCH_SIZE = 100
+RECONCILE_CONCURRENCY = 8
+RECONCILE_TIME_BUDGET = 300  # secondes
 
 
 class TransportPayment(models.Model):
     """Paiement pour une réservation"""
     _name = 'transport.payment'
     _description = 'Paiement'
-    _inherit = ['mail.thread']
+    _inherit = ['mail.thread', 'transport.bulk.mixin']
     _order = 'create_date desc'
 
     name = fields.Char(
@@ -73,6 +96,22 @@ class TransportPayment(models.Model):
     wave_response = fields.Text(
         string='Réponse Wave',
     )
+    wave_checkout_queued = fields.Boolean(
+        string='Session Wave en file',
+        copy=False,
+        index=True,
+        help="La session de paiement Wave sera créée par la tâche planifiée",
+    )
+    wave_checkout_attempts = fields.Integer(
+        string='Essais de session Wave',
+        copy=False,
+        readonly=True,
+    )
+    wave_checkout_retry_at = fields.Datetime(
+        string='Prochain essai Wave',
+        copy=False,
+        readonly=True,
+    )
     
     # État
     state = fields.Selection([
@@ -107,69 +146,296 @@ class TransportPayment(models.Model):
                 vals['name'] = self.env['ir.sequence'].next_by_code('transport.payment') or '/'
         return super().create(vals_list)
 
-    def action_process_wave_payment(self):
-        """Initier un paiement Wave"""
+    def _check_wave_configuration(self):
+        """Vérifier que le paiement peut passer par Wave"""
         self.ensure_one()
-        
         if self.payment_method != 'wave':
             raise UserError(_("Cette méthode est réservée aux paiements Wave!"))
-        
         company = self.transport_company_id
         if not company.wave_merchant_id or not company.wave_api_key:
             raise UserError(_("La compagnie n'a pas configuré Wave!"))
-        
-        # Préparer les données pour Wave
-        checkout_data = {
+
+    def _get_wave_checkout_data(self):
+        """Données de création de la session de paiement Wave"""
+        self.ensure_one()
+        base_url = self.get_base_url()
+        return {
             'amount': str(int(self.amount)),
             'currency': 'XOF',
-            'merchant_id': company.wave_merchant_id,
+            'merchant_id': self.transport_company_id.wave_merchant_id,
             'payment_id': self.name,
             'client_reference': self.booking_id.name,
-            'success_url': f'/transport/payment/success/{self.id}',
-            'error_url': f'/transport/payment/error/{self.id}',
-            'webhook_url': f'/transport/payment/webhook/{self.id}',
+            'success_url': f'{base_url}/transport/payment/success/{self.id}',
+            'error_url': f'{base_url}/transport/payment/error/{self.id}',
+            'webhook_url': f'{base_url}/transport/payment/webhook/{self.id}',
         }
+
+    def _create_wave_checkout(self, interactive=False):
+        """Créer la session Wave et enregistrer la réponse (lève WaveError)
+
+        ``interactive`` : appel fait pendant une requête utilisateur, borné à
+        WAVE_INTERACTIVE_DEADLINE secondes au total.
+        """
+        self.ensure_one()
+        client = WaveClient(
+            self._get_wave_api_url(), self.transport_company_id.wave_api_key,
+            deadline=WAVE_INTERACTIVE_DEADLINE if interactive else None,
+        )
+        started = time.monotonic()
+        try:
+            # La référence du paiement sert de clé d'idempotence : un nouvel essai
+            # ne crée pas de seconde session chez Wave
+            result = client.create_checkout_session(self._get_wave_checkout_data(), idempotency_key=self.name)
+        except WaveError as e:
+            metrics.inc('transport_wave_checkout_failures_total', reason=e.reason)
+            raise
+        finally:
+            metrics.observe('transport_wave_checkout_duration_seconds', time.monotonic() - started)
+        self.write({
+            'state': 'processing',
+            'wave_checkout_queued': False,
+            'wave_checkout_id': result.get('id'),
+            'wave_payment_url': result.get('wave_launch_url'),
+            'wave_response': json.dumps(result),
+        })
+        return result
+
+    def action_process_wave_payment(self):
+        """Initier un paiement Wave"""
+        self.ensure_one()
+        self._check_wave_configuration()
         
         try:
-            # Appel API Wave (à adapter selon la documentation Wave)
-            headers = {
-                'Authorization': f'Bearer {company.wave_api_key}',
-                'Content-Type': 'application/json',
-            }
-            
-            response = requests.post(
-                'https://api.wave.com/v1/checkout/sessions',
-                json=checkout_data,
-                headers=headers,
-                timeout=30,
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                self.write({
-                    'state': 'processing',
-                    'wave_checkout_id': result.get('id'),
-                    'wave_payment_url': result.get('wave_launch_url'),
-                    'wave_response': json.dumps(result),
-                })
-                return {
-                    'type': 'ir.actions.act_url',
-                    'url': result.get('wave_launch_url'),
-                    'target': 'new',
-                }
-            else:
-                self.write({
-                    'state': 'failed',
-                    'error_message': f"Erreur Wave: {response.text}",
-                })
-                raise UserError(_("Erreur lors de l'initiation du paiement Wave"))
-                
-        except requests.exceptions.RequestException as e:
+            result = self._create_wave_checkout(interactive=True)
+        except WaveUnavailable:
+            raise UserError(_("Le service Wave est momentanément indisponible. Réessayez dans quelques instants."))
+        except WaveError as e:
             self.write({
                 'state': 'failed',
-                'error_message': str(e),
+                'error_message': f"Erreur Wave: {e}",
             })
+            if e.status_code:
+                raise UserError(_("Erreur lors de l'initiation du paiement Wave"))
             raise UserError(_("Erreur de connexion au service Wave"))
+        
+        return {
+            'type': 'ir.actions.act_url',
+            'url': result.get('wave_launch_url'),
+            'target': 'new',
+        }
+
+    def action_request_wave_checkout(self):
+        """Mettre en file la création de la session Wave (mode asynchrone)"""
+        for payment in self:
+            payment._check_wave_configuration()
+        self.write({
+            'state': 'pending',
+            'wave_checkout_queued': True,
+            'wave_checkout_attempts': 0,
+            'wave_checkout_retry_at': False,
+        })
+        self.env.ref('transport_interurbain.ir_cron_process_wave_checkouts').sudo()._trigger()
+
+    @api.model
+    def _is_wave_async_checkout(self):
+        """Création des sessions Wave déléguée à la tâche planifiée"""
+        return str2bool(self.env['ir.config_parameter'].sudo().get_param(WAVE_ASYNC_PARAM, 'False'))
+
+    @api.model
+    @metrics.track_duration('transport_cron_duration_seconds', cron='wave_checkouts')
+    def cron_process_wave_checkouts(self, batch_size=WAVE_CHECKOUT_BATCH_SIZE, time_budget=WAVE_CHECKOUT_TIME_BUDGET):
+        """
+        Créer les sessions Wave des paiements mis en file.
+
+        Les paiements sont verrouillés par lots avec SKIP LOCKED et validés un
+        par un (chaque appel Wave est suivi d'un commit). Seul le disjoncteur
+        ouvert interrompt l'exécution. Une erreur transitoire (réseau, délai,
+        429, 5xx) reporte le paiement seul, avec un délai croissant, et le
+        passe en échec après WAVE_CHECKOUT_MAX_ATTEMPTS essais ; un refus de
+        Wave ou une réponse illisible le passe en échec immédiatement.
+        """
+        started = time.monotonic()
+        auto_commit = not self.env.registry.in_test_mode() and not self.env.context.get('transport_no_commit')
+        total = 0
+        while True:
+            self.env.flush_all()
+            self.env.cr.execute("""
+                SELECT id
+                  FROM transport_payment
+                 WHERE wave_checkout_queued
+                   AND state = 'pending'
+                   AND (wave_checkout_retry_at IS NULL
+                        OR wave_checkout_retry_at <= (now() at time zone 'UTC'))
+              ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, (batch_size,))
+            payments = self.browse([row[0] for row in self.env.cr.fetchall()])
+            if not payments:
+                break
+            for payment in payments:
+                try:
+                    payment._create_wave_checkout()
+                except WaveUnavailable as e:
+                    _logger.warning("Wave indisponible, sessions reportées: %s", e)
+                    return True
+                except WaveError as e:
+                    payment._postpone_wave_checkout(e)
+                    if auto_commit:
+                        self.env.cr.commit()
+                    continue
+                total += 1
+                if auto_commit:
+                    self.env.cr.commit()
+            if len(payments) < batch_size:
+                break
+            if time.monotonic() - started > time_budget:
+                self.env.ref('transport_interurbain.ir_cron_process_wave_checkouts').sudo()._trigger()
+                break
+        if total:
+            _logger.info("%d session(s) Wave créée(s) en %.1fs", total, time.monotonic() - started)
+        return True
+
+    def _postpone_wave_checkout(self, error):
+        """Reporter la session Wave après une erreur, ou passer le paiement en échec"""
+        self.ensure_one()
+        attempts = self.wave_checkout_attempts + 1
+        transient = error.status_code in RETRYABLE_STATUS or (
+            not error.status_code and error.reason != 'invalid_json')
+        if transient and attempts < WAVE_CHECKOUT_MAX_ATTEMPTS:
+            delay = WAVE_CHECKOUT_RETRY_DELAY * 2 ** (attempts - 1)
+            _logger.warning("Session Wave de %s reportée de %ds (essai %d): %s", self.name, delay, attempts, error)
+            self.write({
+                'wave_checkout_attempts': attempts,
+                'wave_checkout_retry_at': fields.Datetime.now() + timedelta(seconds=delay),
+                'error_message': f"Erreur Wave: {error}",
+            })
+            return
+        self.write({
+            'state': 'failed',
+            'wave_checkout_queued': False,
+            'wave_checkout_attempts': attempts,
+            'wave_checkout_retry_at': False,
+            'error_message': f"Erreur Wave: {error}",
+        })
+
+    @api.model
+    @metrics.track_duration('transport_cron_duration_seconds', cron='wave_reconcile')
+    def cron_reconcile_wave_payments(self, stale_minutes=RECONCILE_STALE_MINUTES, batch_size=RECONCILE_BATCH_SIZE,
+                                     concurrency=RECONCILE_CONCURRENCY, time_budget=RECONCILE_TIME_BUDGET):
+        """
+        Rapprocher avec Wave les paiements restés « En cours ».
+
+        Les paiements sans nouvelle depuis ``stale_minutes`` (webhook perdu,
+        application fermée) sont pris par lots verrouillés (SKIP LOCKED) ;
+        l'état de leur session Wave est interrogé en parallèle
+        (``concurrency`` appels simultanés au plus), puis ils sont soldés ou
+        passés en échec. Renvoie le nombre de paiements par résultat.
+        """
+        started = time.monotonic()
+        auto_commit = not self.env.registry.in_test_mode() and not self.env.context.get('transport_no_commit')
+        limit_date = fields.Datetime.now() - timedelta(minutes=stale_minutes)
+        summary = Counter()
+        last_id = 0
+        self.env.flush_all()
+        while True:
+            # Pagination sur l'id : les paiements encore en cours chez Wave restent éligibles
+            self.env.cr.execute("""
+                SELECT id
+                  FROM transport_payment
+                 WHERE state = 'processing'
+                   AND payment_method = 'wave'
+                   AND wave_checkout_id IS NOT NULL
+                   AND write_date < %s
+                   AND id > %s
+              ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, (limit_date, last_id, batch_size))
+            payment_ids = [row[0] for row in self.env.cr.fetchall()]
+            if not payment_ids:
+                break
+            last_id = payment_ids[-1]
+            summary.update(self.browse(payment_ids)._reconcile_wave_batch(concurrency))
+            if auto_commit:
+                self.env.cr.commit()
+            if len(payment_ids) < batch_size:
+                break
+            if time.monotonic() - started > time_budget:
+                self.env.ref('transport_interurbain.ir_cron_reconcile_wave_payments').sudo()._trigger()
+                break
+        if summary:
+            _logger.info("Rapprochement Wave en %.1fs : %s", time.monotonic() - started,
+                         ', '.join('%s=%d' % item for item in sorted(summary.items())))
+        return dict(summary)
+
+    def _reconcile_wave_batch(self, concurrency=RECONCILE_CONCURRENCY):
+        """Interroger Wave pour un lot de paiements puis les solder en bloc"""
+        api_url = self._get_wave_api_url()
+        # Les threads ne font que des appels HTTP : aucun accès à l'ORM hors du thread principal
+        jobs = [(p.id, p.transport_company_id.wave_api_key, p.wave_checkout_id) for p in self]
+
+        def fetch(job):
+            payment_id, api_key, checkout_id = job
+            started = time.monotonic()
+            try:
+                return payment_id, WaveClient(api_url, api_key).get_checkout_session(checkout_id), None
+            except WaveError as e:
+                return payment_id, None, e
+            finally:
+                metrics.observe('transport_wave_status_duration_seconds', time.monotonic() - started)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(jobs)))) as pool:
+            results = list(pool.map(fetch, jobs))
+
+        outcomes = Counter()
+        sessions = {}
+        failed = self.browse()
+        for payment_id, session, error in results:
+            if error:
+                _logger.warning("Rapprochement Wave impossible pour le paiement %s: %s", payment_id, error)
+                outcomes['error'] += 1
+            elif session.get('payment_status') == 'succeeded':
+                sessions[payment_id] = session
+            elif session.get('payment_status') == 'cancelled' or session.get('checkout_status') == 'expired':
+                failed |= self.browse(payment_id)
+            else:
+                outcomes['pending'] += 1
+
+        now = fields.Datetime.now()
+        for payment in self.browse(list(sessions)):
+            session = sessions[payment.id]
+            payment.write({
+                'state': 'completed',
+                'transaction_id': session.get('transaction_id'),
+                'wave_response': json.dumps(session),
+                'payment_date': now,
+            })
+            payment._update_booking_payment()
+            if payment.booking_id.state not in ('confirmed', 'checked_in', 'completed'):
+                _logger.warning("Paiement %s encaissé après l'expiration de %s : remboursement à prévoir",
+                                payment.name, payment.booking_id.name)
+        failed.write({
+            'state': 'failed',
+            'error_message': _("Session Wave non aboutie (rapprochement automatique)"),
+        })
+        # Libérer les places des réservations dont le délai de paiement est dépassé
+        released = failed.booking_id.filtered(
+            lambda b: b.state == 'reserved' and b.reservation_deadline and b.reservation_deadline < now)
+        if released:
+            self.env['transport.booking']._expire_reservation_batch(released.ids)
+
+        outcomes.update(completed=len(sessions), failed=len(failed), released=len(released))
+        for outcome, count in outcomes.items():
+            if count:
+                metrics.inc('transport_wave_reconciliations_total', count, outcome=outcome)
+        return outcomes
+
+    @api.model
+    def _get_wave_api_url(self):
+        """URL de base de l'API Wave (configurable pour les simulateurs)"""
+        url = self.env['ir.config_parameter'].sudo().get_param(WAVE_API_URL_PARAM)
+        return (url or DEFAULT_WAVE_API_URL).rstrip('/')
 
     def action_confirm_cash_payment(self):
         """Confirmer un paiement en espèces"""
@@ -235,21 +501,33 @@ class TransportPayment(models.Model):
         payment = self.browse(payment_id)
         if not payment.exists():
             return False
-        
+        payment._apply_wave_event(data)
+        return True
+
+    def _apply_wave_event(self, data):
+        """Appliquer un évènement Wave (sans effet s'il a déjà été appliqué)"""
+        self.ensure_one()
+        # Format Wave : {"id", "type", "data": {session}} ; ancien format à plat accepté
+        session = data.get('data') or data
         event_type = data.get('type')
         if event_type == 'checkout.session.completed':
-            payment.write({
+            if self.state in ('completed', 'refunded'):
+                return False
+            self.write({
                 'state': 'completed',
-                'transaction_id': data.get('transaction_id'),
+                'transaction_id': session.get('transaction_id'),
                 'wave_response': json.dumps(data),
                 'payment_date': fields.Datetime.now(),
             })
-            payment._update_booking_payment()
-        elif event_type == 'checkout.session.failed':
-            payment.write({
+            self._update_booking_payment()
+            return True
+        if event_type == 'checkout.session.failed':
+            if self.state not in ('pending', 'processing'):
+                return False
+            self.write({
                 'state': 'failed',
-                'error_message': data.get('error_message'),
+                'error_message': session.get('error_message') or data.get('error_message'),
                 'wave_response': json.dumps(data),
             })
-        
-        return True
+            return True
+        return False
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models, _
+import hashlib
+import json
+import logging
+import time
+
+from ..tools.metrics import metrics
+
+_logger = logging.getLogger(__name__)
+
+EVENT_BATCH_SIZE = 200
+EVENT_TIME_BUDGET = 60  # secondes
+EVENT_MAX_ATTEMPTS = 5
+
+
+class TransportPaymentEvent(models.Model):
+    """Évènement reçu d'un prestataire de paiement (boîte de réception des webhooks)"""
+    _name = 'transport.payment.event'
+    _description = 'Évènement de paiement'
+    _order = 'received_at desc, id desc'
+    _rec_name = 'event_id'
+
+    provider = fields.Selection([
+        ('wave', 'Wave'),
+    ], string='Prestataire', required=True, default='wave', readonly=True)
+    event_id = fields.Char(
+        string='ID évènement',
+        required=True,
+        readonly=True,
+    )
+    event_type = fields.Char(
+        string='Type',
+        readonly=True,
+    )
+    payment_id = fields.Many2one(
+        'transport.payment',
+        string='Paiement',
+        readonly=True,
+        index=True,
+        ondelete='cascade',
+    )
+    booking_id = fields.Many2one(
+        'transport.booking',
+        string='Réservation',
+        readonly=True,
+        ondelete='cascade',
+    )
+    payload = fields.Text(
+        string='Contenu',
+        readonly=True,
+    )
+    state = fields.Selection([
+        ('pending', 'À traiter'),
+        ('done', 'Traité'),
+        ('ignored', 'Ignoré'),
+        ('error', 'En erreur'),
+    ], string='État', default='pending', required=True, readonly=True)
+    attempts = fields.Integer(
+        string='Tentatives',
+        readonly=True,
+    )
+    error_message = fields.Text(
+        string='Erreur',
+        readonly=True,
+    )
+    received_at = fields.Datetime(
+        string='Reçu le',
+        default=fields.Datetime.now,
+        readonly=True,
+    )
+    processed_at = fields.Datetime(
+        string='Traité le',
+        readonly=True,
+    )
+
+    _sql_constraints = [
+        ('provider_event_uniq', 'UNIQUE(provider, event_id)',
+         "Cet évènement de paiement a déjà été reçu!"),
+    ]
+
+    def init(self):
+        # Index partiel : seuls les évènements à traiter sont parcourus par la tâche planifiée
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS transport_payment_event_pending_idx
+                ON transport_payment_event (booking_id, id)
+             WHERE state = 'pending'
+        """)
+
+    @api.model
+    def _receive(self, provider, payment, body):
+        """
+        Enregistrer un évènement brut et planifier son traitement.
+
+        Un seul INSERT, sans verrou sur le paiement ni la réservation : une
+        rafale de webhooks ne ralentit pas le trafic des usagers. Un doublon
+        (même prestataire, même identifiant) est ignoré. Renvoie True si
+        l'évènement est nouveau. ValueError si le corps n'est pas un objet JSON.
+        """
+        data = json.loads(body)
+        if not isinstance(data, dict):
+            raise ValueError("Le corps du webhook doit être un objet JSON")
+        event_id = data.get('id') or hashlib.sha256(body).hexdigest()
+        self.env.cr.execute("""
+            INSERT INTO transport_payment_event
+                   (provider, event_id, event_type, payment_id, booking_id, payload,
+                    state, attempts, received_at, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, %s, %s, 'pending', 0, now() at time zone 'UTC',
+                    %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+            ON CONFLICT (provider, event_id) DO NOTHING
+         RETURNING id
+        """, (provider, str(event_id), data.get('type'), payment.id, payment.booking_id.id,
+              body.decode('utf-8'), self.env.uid, self.env.uid))
+        created = bool(self.env.cr.fetchone())
+        metrics.inc('transport_payment_events_total', provider=provider,
+                    outcome='received' if created else 'duplicate')
+        if created:
+            self.env.ref('transport_interurbain.ir_cron_process_payment_events').sudo()._trigger()
+        return created
+
+    @api.model
+    @metrics.track_duration('transport_cron_duration_seconds', cron='payment_events')
+    def cron_process_payment_events(self, batch_size=EVENT_BATCH_SIZE, time_budget=EVENT_TIME_BUDGET):
+        """
+        Traiter les évènements reçus, par lots.
+
+        Les évènements d'une même réservation sont appliqués dans l'ordre de
+        réception : seul le plus ancien évènement en attente d'une réservation
+        est sélectionné, les suivants attendent qu'il soit traité. Chaque
+        évènement est traité dans un savepoint : une erreur est consignée et
+        l'évènement retenté au passage suivant (jusqu'à EVENT_MAX_ATTEMPTS
+        fois), sans bloquer les autres réservations ; les évènements suivants
+        de sa réservation restent en file jusque-là.
+        """
+        started = time.monotonic()
+        auto_commit = not self.env.registry.in_test_mode() and not self.env.context.get('transport_no_commit')
+        total = 0
+        # Évènements déjà tentés pendant ce passage (en erreur, retentés au suivant)
+        tried = []
+        self.env.flush_all()
+        while True:
+            self.env.cr.execute("""
+                SELECT e.id
+                  FROM transport_payment_event e
+                 WHERE e.state = 'pending'
+                   AND e.id != ALL(%s::int[])
+                   AND NOT EXISTS (
+                        SELECT 1
+                          FROM transport_payment_event older
+                         WHERE older.booking_id = e.booking_id
+                           AND older.state = 'pending'
+                           AND older.id < e.id
+                   )
+              ORDER BY e.booking_id, e.id
+                 LIMIT %s
+                   FOR UPDATE OF e SKIP LOCKED
+            """, (tried, batch_size))
+            events = self.browse([row[0] for row in self.env.cr.fetchall()])
+            if not events:
+                break
+            for event in events:
+                event._process()
+            tried += events.filtered(lambda e: e.state == 'pending').ids
+            total += len(events)
+            self.env.flush_all()
+            if auto_commit:
+                self.env.cr.commit()
+            if time.monotonic() - started > time_budget:
+                self.env.ref('transport_interurbain.ir_cron_process_payment_events').sudo()._trigger()
+                break
+        if total:
+            _logger.info("%d évènement(s) de paiement traité(s) en %.1fs", total, time.monotonic() - started)
+        return True
+
+    def _process(self):
+        """Appliquer un évènement au paiement (idempotent)"""
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                data = json.loads(self.payload)
+                if not self.payment_id:
+                    outcome = 'ignored'
+                elif self.provider == 'wave':
+                    outcome = 'done' if self.payment_id._apply_wave_event(data) else 'ignored'
+                else:
+                    outcome = 'ignored'
+                self.write({
+                    'state': outcome,
+                    'attempts': self.attempts + 1,
+                    'error_message': False,
+                    'processed_at': fields.Datetime.now(),
+                })
+        except Exception as e:
+            _logger.exception("Erreur de traitement de l'évènement de paiement %s", self.event_id)
+            outcome = 'error'
+            attempts = self.attempts + 1
+            self.write({
+                'state': 'pending' if attempts < EVENT_MAX_ATTEMPTS else 'error',
+                'attempts': attempts,
+                'error_message': str(e),
+            })
+        metrics.inc('transport_payment_events_total', provider=self.provider, outcome=outcome)
+
+    def action_retry(self):
+        """Remettre les évènements en erreur dans la file de traitement"""
+        self.filtered(lambda e: e.state == 'error').write({'state': 'pending', 'attempts': 0})
+        self.env.ref('transport_interurbain.ir_cron_process_payment_events').sudo()._trigger()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models, tools
+import logging
+
+from ..tools import ticket_qr
+
+_logger = logging.getLogger(__name__)
+
+
+class TransportQrKey(models.Model):
+    """Clé Ed25519 de signature des QR codes (une clé active par compagnie, plus la clé plateforme)
+
+    La clé privée ne quitte jamais le serveur ; seule la clé publique est
+    transmise aux applications de contrôle.
+    """
+    _name = 'transport.qr.key'
+    _description = 'Clé de signature des QR codes'
+    _order = 'company_id, id desc'
+    _rec_name = 'kid'
+
+    company_id = fields.Many2one(
+        'transport.company',
+        string='Compagnie',
+        readonly=True,
+        index=True,
+        ondelete='cascade',
+        help="Vide : clé de la plateforme, utilisée pour les QR codes des passagers",
+    )
+    kid = fields.Char(
+        string='Identifiant',
+        required=True,
+        readonly=True,
+    )
+    secret = fields.Char(
+        string='Clé privée',
+        required=True,
+        readonly=True,
+        groups='transport_interurbain.group_transport_admin',
+    )
+    public_key = fields.Char(
+        string='Clé publique',
+        required=True,
+        readonly=True,
+    )
+    state = fields.Selection([
+        ('active', 'Active'),
+        ('retired', 'Retirée'),
+    ], string='État', default='active', required=True, readonly=True,
+        help="Une clé retirée ne signe plus mais reste acceptée à la vérification. "
+             "Supprimer une clé invalide immédiatement tous les QR codes signés avec elle.")
+    retired_at = fields.Datetime(
+        string='Retirée le',
+        readonly=True,
+    )
+
+    _sql_constraints = [
+        ('kid_uniq', 'UNIQUE(kid)', "Cet identifiant de clé existe déjà!"),
+    ]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
+
+    @api.model
+    @tools.ormcache()
+    def _get_verification_keys(self):
+        """Clés acceptées à la vérification : {identifiant: (clé publique, compagnie)} (en cache par worker)"""
+        self.env.cr.execute("SELECT kid, public_key, company_id FROM transport_qr_key")
+        return {kid: (public_key, company_id or False) for kid, public_key, company_id in self.env.cr.fetchall()}
+
+    @api.model
+    def _get_signing_key(self, company_id=False):
+        """Clé active (identifiant, clé privée) de la compagnie ou de la plateforme, créée au besoin"""
+        key = self.sudo().search([('company_id', '=', company_id), ('state', '=', 'active')], limit=1)
+        if not key:
+            key = self.sudo()._create_key(company_id)
+        return key.kid, key.sudo().secret
+
+    @api.model
+    def _create_key(self, company_id=False):
+        kid, secret, public_key = ticket_qr.new_key()
+        while self._get_verification_keys().get(kid):
+            kid, secret, public_key = ticket_qr.new_key()
+        return self.sudo().create({
+            'company_id': company_id,
+            'kid': kid,
+            'secret': secret,
+            'public_key': public_key,
+        })
+
+    @api.model
+    def _rotate(self, company_ids):
+        """Retirer les clés actives des compagnies (False : plateforme) et en créer de nouvelles"""
+        keys = self.sudo()
+        for company_id in company_ids:
+            self.sudo().search([('company_id', '=', company_id), ('state', '=', 'active')]).write({
+                'state': 'retired',
+                'retired_at': fields.Datetime.now(),
+            })
+            keys |= self._create_key(company_id)
+        _logger.info("Rotation des clés QR: %s", ', '.join(keys.mapped('kid')))
+        return keys
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, models
+from collections import defaultdict
+import json
+import logging
+
+from odoo.addons.bus.models.bus import channel_with_db, json_dump
+
+_logger = logging.getLogger(__name__)
+
+# Notification bus.bus de l'avancement des voyages (réservations, embarquement)
+PROGRESS_NOTIFICATION = 'transport.trip/progress'
+ADMIN_CHANNEL = 'transport_admin'
+# Évènement publié selon le nouvel état d'une réservation
+BOOKING_STATE_EVENTS = {
+    'reserved': 'reservation',
+    'confirmed': 'confirmation',
+    'checked_in': 'check_in',
+    'cancelled': 'cancellation',
+    'expired': 'expiry',
+    'refunded': 'refund',
+}
+_PRECOMMIT_KEY = 'transport.realtime'
+
+
+def trip_channel(trip_id):
+    return 'transport_trip_%d' % trip_id
+
+
+def company_channel(company_id):
+    return 'transport_company_%d' % company_id
+
+
+class TransportRealtime(models.AbstractModel):
+    """Diffusion en temps réel de l'avancement des voyages (bus.bus)
+
+    Les changements d'une transaction sont regroupés par voyage et publiés
+    une seule fois, juste avant le commit, avec les compteurs à jour du
+    voyage : les clients appliquent le delta au lieu de recharger leurs
+    statistiques. Canaux : ``transport_trip_<id>`` (avec les places
+    modifiées, pour le plan des sièges), ``transport_company_<id>`` et
+    ``transport_admin`` (voir ir.websocket pour les droits d'abonnement).
+    """
+    _name = 'transport.realtime'
+    _description = 'Diffusion temps réel transport'
+
+    @api.model
+    def _queue_booking_events(self, bookings, event):
+        """Annoncer un évènement sur des réservations (publié au commit)"""
+        booking_ids_by_trip = defaultdict(list)
+        for booking in bookings:
+            if booking.trip_id:
+                booking_ids_by_trip[booking.trip_id.id].append(booking.id)
+        self._queue_events(event, booking_ids_by_trip)
+
+    @api.model
+    def _queue_events(self, event, booking_ids_by_trip):
+        """Annoncer un évènement sur des voyages : {voyage: [réservations]} (publié au commit)"""
+        if not booking_ids_by_trip:
+            return
+        precommit = self.env.cr.precommit
+        queue = precommit.data.get(_PRECOMMIT_KEY)
+        if queue is None:
+            queue = precommit.data[_PRECOMMIT_KEY] = {}
+            precommit.add(self._publish_queued_events)
+        for trip_id, booking_ids in booking_ids_by_trip.items():
+            entry = queue.setdefault(trip_id, {'events': defaultdict(int), 'booking_ids': set()})
+            entry['events'][event] += max(len(booking_ids), 1)
+            entry['booking_ids'].update(booking_ids)
+
+    def _publish_queued_events(self):
+        """Publier les évènements de la transaction : une notification par voyage, compagnie et administrateur"""
+        queue = self.env.cr.precommit.data.pop(_PRECOMMIT_KEY, None)
+        if not queue:
+            return
+        progress = self._get_trip_progress(list(queue))
+        booking_ids = set().union(*(entry['booking_ids'] for entry in queue.values()))
+        seats = defaultdict(list)
+        if booking_ids:
+            self.env.cr.execute("""
+                SELECT id, trip_id, seat_number, state
+                  FROM transport_booking
+                 WHERE id IN %s
+            """, (tuple(booking_ids),))
+            for booking_id, trip_id, seat, state in self.env.cr.fetchall():
+                seats[trip_id].append({'id': booking_id, 'seat': seat, 'state': state})
+
+        notifications = []
+        by_company = defaultdict(list)
+        for trip_id, entry in queue.items():
+            trip = progress.get(trip_id)
+            if not trip:
+                continue
+            trip['events'] = dict(entry['events'])
+            by_company[trip['company_id']].append(trip)
+            notifications.append((
+                trip_channel(trip_id), PROGRESS_NOTIFICATION,
+                {'trips': [dict(trip, bookings=seats.get(trip_id, []))]},
+            ))
+        for company_id, trips in by_company.items():
+            notifications.append((company_channel(company_id), PROGRESS_NOTIFICATION, {'trips': trips}))
+        if by_company:
+            notifications.append((ADMIN_CHANNEL, PROGRESS_NOTIFICATION, {
+                'trips': [trip for trips in by_company.values() for trip in trips],
+            }))
+        self.env['bus.bus'].sudo()._sendmany(notifications)
+
+    @api.model
+    def _get_trip_progress(self, trip_ids):
+        """Compteurs à jour des voyages, en une requête : {voyage: {...}}"""
+        if not trip_ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT t.id, t.transport_company_id, t.state, t.total_seats, t.available_seats,
+                   COUNT(b.id) FILTER (WHERE b.state = 'reserved'),
+                   COUNT(b.id) FILTER (WHERE b.state = 'confirmed'),
+                   COUNT(b.id) FILTER (WHERE b.state = 'checked_in')
+              FROM transport_trip t
+         LEFT JOIN transport_booking b ON b.trip_id = t.id
+             WHERE t.id IN %s
+          GROUP BY t.id
+        """, (tuple(trip_ids),))
+        return {
+            trip_id: {
+                'trip_id': trip_id,
+                'company_id': company_id,
+                'state': state,
+                'total_seats': total_seats or 0,
+                'available_seats': available_seats or 0,
+                'reserved': reserved,
+                'confirmed': confirmed,
+                'checked_in': checked_in,
+            }
+            for trip_id, company_id, state, total_seats, available_seats, reserved, confirmed, checked_in
+            in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _fetch_trip_events(self, trip_id, cursor):
+        """Évènements publiés sur le canal d'un voyage après ``cursor`` : (évènements, nouveau curseur)"""
+        channel = json_dump(channel_with_db(self.env.cr.dbname, trip_channel(trip_id)))
+        self.env.cr.execute("""
+            SELECT id, message FROM bus_bus
+             WHERE id > %s AND channel = %s
+          ORDER BY id
+        """, (cursor, channel))
+        events = []
+        for cursor, message in self.env.cr.fetchall():
+            message = json.loads(message)
+            if message['type'] == PROGRESS_NOTIFICATION:
+                events.extend(message['payload']['trips'])
+        return events, cursor
+
+    @api.model
+    def _get_bus_bounds(self):
+        """Plus petit et plus grand identifiant de bus.bus (détection d'un curseur périmé)"""
+        self.env.cr.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM bus_bus")
+        return self.env.cr.fetchone()
+
+    # =============================================
+    # ABONNEMENTS
+    # =============================================
+
+    @api.model
+    def _filter_channels(self, channels):
+        """Retirer les canaux transport auxquels l'utilisateur courant n'a pas droit"""
+        requested = [c for c in channels if isinstance(c, str) and c.startswith('transport_')]
+        if not requested:
+            return channels
+        user = self.env.user
+        allowed = set()
+        if not user._is_public():
+            is_admin = user.has_group('transport_interurbain.group_transport_admin')
+            if is_admin:
+                allowed.add(ADMIN_CHANNEL)
+            companies = self.env['transport.company'].sudo().search(
+                [] if is_admin else ['|', ('manager_ids', 'in', user.id), ('id', 'in', user.transport_company_ids.ids)]
+            )
+            allowed.update(company_channel(company_id) for company_id in companies.ids)
+            trip_ids = [int(c[len('transport_trip_'):]) for c in requested
+                        if c.startswith('transport_trip_') and c[len('transport_trip_'):].isdigit()]
+            if trip_ids:
+                trips = self.env['transport.trip'].sudo().search([
+                    ('id', 'in', trip_ids), ('transport_company_id', 'in', companies.ids),
+                ])
+                allowed.update(trip_channel(trip_id) for trip_id in trips.ids)
+        return [c for c in channels if c not in requested or c in allowed]
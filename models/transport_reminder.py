@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models, _
+from odoo.tools.sql import create_index
+from collections import Counter
+import logging
+import time
+
+from ..tools.metrics import metrics
+
+_logger = logging.getLogger(__name__)
+
+# Rappels planifiés : (type, minutes avant le départ) ; None = heure de présentation du voyage
+REMINDER_OFFSETS = (
+    ('day_before', 24 * 60),
+    ('two_hours', 120),
+    ('boarding', None),
+)
+REMINDER_BATCH_SIZE = 1000
+REMINDER_TIME_BUDGET = 120  # secondes
+
+
+class TransportReminder(models.Model):
+    """File des rappels avant départ (une ligne par réservation et type de rappel)"""
+    _name = 'transport.reminder'
+    _description = 'Rappel avant départ'
+    _order = 'due_at, id'
+    _log_access = False
+
+    booking_id = fields.Many2one(
+        'transport.booking',
+        string='Réservation',
+        required=True,
+        readonly=True,
+        ondelete='cascade',
+    )
+    trip_id = fields.Many2one(
+        'transport.trip',
+        string='Voyage',
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete='cascade',
+    )
+    kind = fields.Selection([
+        ('day_before', 'Veille du départ'),
+        ('two_hours', 'Deux heures avant'),
+        ('boarding', 'Appel à l\'embarquement'),
+    ], string='Type', required=True, readonly=True)
+    due_at = fields.Datetime(
+        string='Échéance',
+        required=True,
+        readonly=True,
+    )
+
+    _sql_constraints = [
+        ('booking_kind_uniq', 'UNIQUE(booking_id, kind)', "Ce rappel est déjà planifié!"),
+    ]
+
+    def init(self):
+        create_index(self._cr, 'transport_reminder_due_at_idx', self._table, ['due_at'])
+
+    # ---------- Planification ----------
+
+    @api.model
+    def _schedule_for_bookings(self, booking_ids):
+        """Planifier (ou replanifier) les rappels de réservations confirmées"""
+        if booking_ids:
+            self._schedule("b.id IN %s", (tuple(booking_ids),))
+
+    @api.model
+    def _reschedule_trips(self, trip_ids):
+        """Recalculer les échéances après un changement d'horaire des voyages"""
+        if not trip_ids:
+            return
+        self.env.cr.execute("DELETE FROM transport_reminder WHERE trip_id IN %s", (tuple(trip_ids),))
+        self._schedule("b.trip_id IN %s", (tuple(trip_ids),))
+
+    @api.model
+    def _unschedule_trips(self, trip_ids):
+        """Retirer les rappels de voyages annulés"""
+        if trip_ids:
+            self.env.cr.execute("DELETE FROM transport_reminder WHERE trip_id IN %s", (tuple(trip_ids),))
+
+    @api.model
+    def _schedule(self, where, params):
+        """Insérer en une requête les rappels à venir des réservations confirmées sélectionnées"""
+        self.env['transport.booking'].flush_model(['state', 'trip_id'])
+        self.env['transport.trip'].flush_model(['departure_datetime', 'meeting_time_before'])
+        offsets = ', '.join(self.env.cr.mogrify('(%s, %s)', offset).decode() for offset in REMINDER_OFFSETS)
+        self.env.cr.execute("""
+            INSERT INTO transport_reminder (booking_id, trip_id, kind, due_at)
+            SELECT b.id, t.id, k.kind,
+                   t.departure_datetime - make_interval(mins => COALESCE(k.minutes, t.meeting_time_before))
+              FROM transport_booking b
+              JOIN transport_trip t ON t.id = b.trip_id
+        CROSS JOIN (VALUES {offsets}) AS k(kind, minutes)
+             WHERE {where}
+               AND b.state = 'confirmed'
+               AND t.state IN ('scheduled', 'boarding')
+               AND t.departure_datetime - make_interval(mins => COALESCE(k.minutes, t.meeting_time_before))
+                   > (now() at time zone 'UTC')
+            ON CONFLICT (booking_id, kind) DO UPDATE
+               SET due_at = EXCLUDED.due_at,
+                   trip_id = EXCLUDED.trip_id
+        """.format(offsets=offsets, where=where), params)
+
+    # ---------- Envoi ----------
+
+    @api.model
+    @metrics.track_duration('transport_cron_duration_seconds', cron='reminders')
+    def cron_send_due_reminders(self, batch_size=REMINDER_BATCH_SIZE, time_budget=REMINDER_TIME_BUDGET):
+        """
+        Transférer les rappels échus vers la file de notifications.
+
+        Seules les lignes échues sont lues (index sur l'échéance) puis
+        supprimées, avec SKIP LOCKED : le coût est proportionnel au nombre de
+        rappels à envoyer, pas au nombre de réservations.
+        """
+        started = time.monotonic()
+        auto_commit = not self.env.registry.in_test_mode() and not self.env.context.get('transport_no_commit')
+        total = 0
+        while True:
+            self.env.cr.execute("""
+                DELETE FROM transport_reminder
+                 WHERE id IN (
+                        SELECT id
+                          FROM transport_reminder
+                         WHERE due_at <= %s
+                      ORDER BY due_at
+                         LIMIT %s
+                           FOR UPDATE SKIP LOCKED
+                       )
+             RETURNING booking_id, kind
+            """, (fields.Datetime.now(), batch_size))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            self._push_to_outbox(rows)
+            total += len(rows)
+            if auto_commit:
+                self.env.cr.commit()
+            if len(rows) < batch_size:
+                break
+            if time.monotonic() - started > time_budget:
+                self.env.ref('transport_interurbain.ir_cron_send_due_reminders').sudo()._trigger()
+                break
+        if total:
+            _logger.info("%d rappel(s) traité(s) en %.1fs", total, time.monotonic() - started)
+        return True
+
+    @api.model
+    def _push_to_outbox(self, rows):
+        """Mettre en file les SMS des rappels (booking_id, kind) encore pertinents"""
+        bookings = self.env['transport.booking'].browse({booking_id for booking_id, _kind in rows})
+        # Lecture groupée des champs utilisés pour composer les messages
+        bookings.fetch(['name', 'state', 'passenger_phone', 'seat_number', 'trip_id'])
+        bookings.trip_id.fetch(['state', 'departure_datetime', 'meeting_point', 'meeting_time_before', 'route_id'])
+        messages = []
+        outcomes = Counter()
+        for booking_id, kind in rows:
+            booking = bookings.browse(booking_id)
+            trip = booking.trip_id
+            if booking.state != 'confirmed' or trip.state not in ('scheduled', 'boarding'):
+                outcomes[(kind, 'skipped')] += 1
+                continue
+            messages.append({
+                'channel': 'sms',
+                'recipient': booking.passenger_phone,
+                'body': self._reminder_body(kind, booking),
+                # L'horaire fait partie de la clé : un voyage reprogrammé donne lieu à un nouveau rappel
+                'dedup_key': 'reminder:%s:%d:%s' % (kind, booking.id, trip.departure_datetime.isoformat()),
+                'booking_id': booking.id,
+            })
+            outcomes[(kind, 'queued')] += 1
+        self.env['transport.notification']._enqueue(messages)
+        for (kind, outcome), count in outcomes.items():
+            metrics.inc('transport_reminders_total', count, kind=kind, outcome=outcome)
+
+    @api.model
+    def _reminder_body(self, kind, booking):
+        trip = booking.trip_id
+        values = {
+            'ref': booking.name,
+            'route': trip.route_id.name,
+            'time': trip.departure_datetime.strftime('%H:%M'),
+            'date': trip.departure_datetime.strftime('%d/%m/%Y'),
+            'place': trip.meeting_point or '-',
+            'minutes': trip.meeting_time_before,
+            'seat': booking.seat_number or '-',
+        }
+        if kind == 'day_before':
+            return _("Rappel : votre voyage %(route)s part le %(date)s à %(time)s (billet %(ref)s). "
+                     "Présentez-vous à %(place)s %(minutes)s min avant le départ.", **values)
+        if kind == 'two_hours':
+            return _("Départ dans 2 h : %(route)s à %(time)s depuis %(place)s (billet %(ref)s).", **values)
+        return _("Embarquement ouvert : %(route)s, départ %(time)s, %(place)s. Siège %(seat)s, billet %(ref)s.",
+                 **values)
@@ -108,10 +108,11 @@ class TransportRoute(models.Model):
                 route.name = '/'
 
     def _compute_trip_count(self):
+        trip_counts = dict(self.env['transport.trip']._read_group(
+            [('route_id', 'in', self.ids)], ['route_id'], ['__count'],
+        ))
         for route in self:
-            route.trip_count = self.env['transport.trip'].search_count([
-                ('route_id', '=', route.id),
-            ])
+            route.trip_count = trip_counts.get(route._origin, 0)
 
     @api.depends('stop_ids')
     def _compute_stop_count(self):
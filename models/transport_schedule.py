@@ -12,7 +12,7 @@ class TransportTripSchedule(models.Model):
     """Programme de voyages - Template pour générer des voyages récurrents"""
     _name = 'transport.trip.schedule'
     _description = 'Programme de voyages'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'transport.bulk.mixin']
     _order = 'name'
 
     name = fields.Char(
@@ -295,7 +295,8 @@ class TransportTripSchedule(models.Model):
         if self.state != 'active':
             raise UserError(_("Le programme doit être actif pour générer des voyages!"))
         
-        Trip = self.env['transport.trip']
+        # Génération système : pas de message de création par voyage
+        Trip = self.env['transport.trip']._bulk_mode()
         created_trips = Trip
         operating_days = self._get_operating_days()
         
@@ -365,10 +366,16 @@ class TransportTripSchedule(models.Model):
             'generated_trips_count': self.generated_trips_count + len(created_trips),
         })
         
+        if created_trips:
+            self._message_log(body=_("%(count)d voyage(s) générés du %(date_from)s au %(date_to)s") % {
+                'count': len(created_trips),
+                'date_from': date_from,
+                'date_to': date_to,
+            })
         _logger.info("Programme %s: %d voyages générés du %s au %s", 
                      self.name, len(created_trips), date_from, date_to)
         
-        return created_trips
+        return created_trips.with_env(self.env)
 
     def action_view_trips(self):
         """Voir les voyages générés par ce programme"""
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models, _
+from odoo.tools.sql import create_index
+from datetime import timedelta
+import time
+import logging
+
+from ..tools.metrics import metrics
+
+_logger = logging.getLogger(__name__)
+
+STATS_LAST_RUN_PARAM = 'transport_interurbain.stats_daily_last_run'
+# Marge de relecture avant le dernier passage : write_date est l'heure de début
+# de la transaction, une écriture validée après le passage peut être antérieure
+STATS_RESCAN_OVERLAP = timedelta(minutes=30)
+
+
+class TransportStatsDailyQueue(models.Model):
+    """Jours de statistiques à recalculer au prochain passage"""
+    _name = 'transport.stats.daily.queue'
+    _description = 'Jours de statistiques à recalculer'
+    _log_access = False
+
+    date = fields.Date(
+        string='Date',
+        required=True,
+        readonly=True,
+    )
+
+    _sql_constraints = [
+        ('date_uniq', 'UNIQUE(date)', 'Ce jour est déjà à recalculer!'),
+    ]
+
+
+class TransportStatsDaily(models.Model):
+    """Statistiques journalières pré-agrégées par compagnie et itinéraire"""
+    _name = 'transport.stats.daily'
+    _description = 'Statistiques journalières'
+    _order = 'date desc, transport_company_id, route_id'
+    _rec_name = 'date'
+
+    date = fields.Date(
+        string='Date',
+        required=True,
+        readonly=True,
+        index=True,
+    )
+    transport_company_id = fields.Many2one(
+        'transport.company',
+        string='Compagnie',
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete='cascade',
+    )
+    route_id = fields.Many2one(
+        'transport.route',
+        string='Itinéraire',
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete='cascade',
+    )
+    departure_city_id = fields.Many2one(
+        related='route_id.departure_city_id',
+        string='Ville de départ',
+        store=True,
+    )
+    arrival_city_id = fields.Many2one(
+        related='route_id.arrival_city_id',
+        string='Ville d\'arrivée',
+        store=True,
+    )
+    currency_id = fields.Many2one(
+        related='transport_company_id.currency_id',
+    )
+    trip_count = fields.Integer(
+        string='Voyages',
+        readonly=True,
+    )
+    seats_offered = fields.Integer(
+        string='Places offertes',
+        readonly=True,
+    )
+    seats_sold = fields.Integer(
+        string='Places vendues',
+        readonly=True,
+    )
+    revenue = fields.Monetary(
+        string='Chiffre d\'affaires',
+        currency_field='currency_id',
+        readonly=True,
+    )
+    cancellation_count = fields.Integer(
+        string='Annulations',
+        readonly=True,
+    )
+    expired_count = fields.Integer(
+        string='Réservations expirées',
+        readonly=True,
+        help="Réservations temporaires expirées faute de paiement (et non passagers absents à l'embarquement)",
+    )
+    occupancy_rate = fields.Float(
+        string='Taux de remplissage (%)',
+        readonly=True,
+        group_operator='avg',
+    )
+
+    _sql_constraints = [
+        ('date_company_route_uniq', 'UNIQUE(date, transport_company_id, route_id)',
+         'Une seule ligne de statistiques par jour, compagnie et itinéraire!'),
+    ]
+
+    def init(self):
+        # Index de détection des jours modifiés depuis le dernier passage
+        create_index(self._cr, 'transport_booking_write_date_idx', 'transport_booking', ['write_date'])
+        create_index(self._cr, 'transport_trip_write_date_idx', 'transport_trip', ['write_date'])
+
+    # =============================================
+    # MISE À JOUR INCRÉMENTALE
+    # =============================================
+
+    @api.model
+    @metrics.track_duration('transport_cron_duration_seconds', cron='refresh_daily_stats')
+    def cron_refresh_daily_stats(self):
+        """Tâche planifiée : recalculer uniquement les jours modifiés depuis le dernier passage"""
+        started = time.monotonic()
+        ICP = self.env['ir.config_parameter'].sudo()
+        last_run = ICP.get_param(STATS_LAST_RUN_PARAM)
+        run_at = fields.Datetime.now()
+        self.env.flush_all()
+        dirty = self._pop_dirty_dates()
+        if last_run:
+            since = fields.Datetime.to_datetime(last_run) - STATS_RESCAN_OVERLAP
+            dates = sorted(set(self._get_changed_dates(since)) | set(dirty))
+        else:
+            dates = None
+        count = self._refresh_days(dates)
+        ICP.set_param(STATS_LAST_RUN_PARAM, fields.Datetime.to_string(run_at))
+        _logger.info("Statistiques journalières: %d ligne(s) recalculée(s) en %.1fs",
+                     count, time.monotonic() - started)
+        return True
+
+    @api.model
+    def action_rebuild_all(self):
+        """Reconstruire intégralement la table de statistiques"""
+        self.env.flush_all()
+        self._pop_dirty_dates()
+        self._refresh_days(None)
+        self.env['ir.config_parameter'].sudo().set_param(
+            STATS_LAST_RUN_PARAM, fields.Datetime.to_string(fields.Datetime.now())
+        )
+        return True
+
+    @api.model
+    def _mark_dates_dirty(self, dates):
+        """Jours à recalculer que write_date ne retrouve pas (ancienne date d'un voyage reprogrammé, suppressions)"""
+        dates = sorted({date for date in dates if date})
+        if not dates:
+            return
+        self.env.cr.execute("""
+            INSERT INTO transport_stats_daily_queue (date)
+            SELECT unnest(%s::date[])
+            ON CONFLICT (date) DO NOTHING
+        """, (dates,))
+
+    @api.model
+    def _pop_dirty_dates(self):
+        """Retirer et retourner les jours marqués à recalculer"""
+        self.env.cr.execute("DELETE FROM transport_stats_daily_queue RETURNING date")
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _get_changed_dates(self, since):
+        """Jours de départ touchés par un voyage ou une réservation modifié depuis `since`"""
+        self.env.cr.execute("""
+            SELECT departure_date
+              FROM transport_trip
+             WHERE write_date >= %(since)s AND departure_date IS NOT NULL
+             UNION
+            SELECT t.departure_date
+              FROM transport_booking b
+              JOIN transport_trip t ON t.id = b.trip_id
+             WHERE b.write_date >= %(since)s AND t.departure_date IS NOT NULL
+        """, {'since': since})
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _refresh_days(self, dates=None):
+        """Recalculer les lignes des jours donnés (tous les jours si `dates` vaut None)"""
+        if dates is not None and not dates:
+            return 0
+        cr = self.env.cr
+        params = {
+            'dates': tuple(dates) if dates else None,
+            'uid': self.env.uid,
+            'paid_states': ('confirmed', 'checked_in', 'completed'),
+        }
+        date_filter = "t.departure_date IN %(dates)s" if dates else "t.departure_date IS NOT NULL"
+        if dates:
+            cr.execute("DELETE FROM transport_stats_daily WHERE date IN %(dates)s", params)
+        else:
+            cr.execute("DELETE FROM transport_stats_daily")
+        cr.execute("""
+            INSERT INTO transport_stats_daily (
+                date, transport_company_id, route_id, departure_city_id, arrival_city_id,
+                trip_count, seats_offered, seats_sold, revenue,
+                cancellation_count, expired_count, occupancy_rate,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT t.departure_date,
+                   t.transport_company_id,
+                   t.route_id,
+                   r.departure_city_id,
+                   r.arrival_city_id,
+                   COUNT(t.id) FILTER (WHERE t.state != 'cancelled'),
+                   COALESCE(SUM(t.total_seats) FILTER (WHERE t.state != 'cancelled'), 0),
+                   COALESCE(SUM(b.sold), 0),
+                   COALESCE(SUM(b.revenue), 0),
+                   COALESCE(SUM(b.cancelled), 0),
+                   COALESCE(SUM(b.expired), 0),
+                   CASE WHEN COALESCE(SUM(t.total_seats) FILTER (WHERE t.state != 'cancelled'), 0) > 0
+                        THEN COALESCE(SUM(b.sold), 0) * 100.0
+                             / SUM(t.total_seats) FILTER (WHERE t.state != 'cancelled')
+                        ELSE 0 END,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM transport_trip t
+              JOIN transport_route r ON r.id = t.route_id
+         LEFT JOIN (
+                    SELECT bk.trip_id,
+                           COUNT(*) FILTER (WHERE bk.state IN %(paid_states)s) AS sold,
+                           SUM(bk.total_amount) FILTER (WHERE bk.state IN %(paid_states)s) AS revenue,
+                           COUNT(*) FILTER (WHERE bk.state IN ('cancelled', 'refunded')) AS cancelled,
+                           COUNT(*) FILTER (WHERE bk.state = 'expired') AS expired
+                      FROM transport_booking bk
+                      JOIN transport_trip t ON t.id = bk.trip_id
+                     WHERE """ + date_filter + """
+                  GROUP BY bk.trip_id
+                   ) b ON b.trip_id = t.id
+             WHERE """ + date_filter + """
+          GROUP BY t.departure_date, t.transport_company_id, t.route_id,
+                   r.departure_city_id, r.arrival_city_id
+        """, params)
+        count = cr.rowcount
+        self.invalidate_model()
+        return count
+
+    # =============================================
+    # LECTURE POUR LES TABLEAUX DE BORD
+    # =============================================
+
+    @api.model
+    def get_monthly_trend(self, date_from, company=None):
+        """Revenus et remplissage par mois depuis `date_from` (une requête GROUP BY)"""
+        params = {'date_from': date_from, 'company_id': company.id if company else None}
+        self.env.cr.execute("""
+            SELECT date_trunc('month', date)::date AS month,
+                   SUM(revenue), SUM(seats_sold), SUM(seats_offered), SUM(trip_count)
+              FROM transport_stats_daily
+             WHERE date >= %(date_from)s
+               AND (%(company_id)s IS NULL OR transport_company_id = %(company_id)s)
+          GROUP BY month
+          ORDER BY month
+        """, params)
+        return [{
+            'month': month.strftime('%m/%Y'),
+            'revenue': float(revenue or 0),
+            'trips': trips or 0,
+            'occupancy': round(sold * 100 / offered) if offered else 0,
+        } for month, revenue, sold, offered, trips in self.env.cr.fetchall()]
+
+    @api.model
+    def get_top_routes(self, date_from, company=None, limit=5):
+        """Itinéraires les plus rentables depuis `date_from`"""
+        params = {'date_from': date_from, 'company_id': company.id if company else None, 'limit': limit}
+        self.env.cr.execute("""
+            SELECT s.route_id, r.name, SUM(s.revenue), SUM(s.seats_sold), SUM(s.seats_offered)
+              FROM transport_stats_daily s
+              JOIN transport_route r ON r.id = s.route_id
+             WHERE s.date >= %(date_from)s
+               AND (%(company_id)s IS NULL OR s.transport_company_id = %(company_id)s)
+          GROUP BY s.route_id, r.name
+          ORDER BY SUM(s.revenue) DESC
+             LIMIT %(limit)s
+        """, params)
+        return [{
+            'id': route_id,
+            'name': name,
+            'revenue': float(revenue or 0),
+            'seats_sold': sold or 0,
+            'occupancy': round(sold * 100 / offered) if offered else 0,
+        } for route_id, name, revenue, sold, offered in self.env.cr.fetchall()]
@@ -4,17 +4,21 @@ from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError, UserError
 from odoo.tools import float_compare
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
 import pytz
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Champs qui déplacent un voyage d'une ligne de statistiques journalières à une autre
+STATS_DAILY_KEYS = {'departure_datetime', 'route_id', 'transport_company_id'}
+
 
 class TransportTrip(models.Model):
     """Voyage programmé"""
     _name = 'transport.trip'
     _description = 'Voyage programmé'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'transport.bulk.mixin']
     _order = 'departure_datetime desc'
 
     name = fields.Char(
@@ -313,6 +317,27 @@ class TransportTrip(models.Model):
             trip._create_stop_times()
         return trips
 
+    def write(self, vals):
+        closing = self.browse()
+        if vals.get('state') not in (None, 'boarding'):
+            closing = self.filtered(lambda t: t.state == 'boarding')
+        if STATS_DAILY_KEYS.intersection(vals):
+            # Le jour quitté par un voyage reprogrammé ou déplacé n'a plus de write_date récent
+            self.env['transport.stats.daily']._mark_dates_dirty(self.mapped('departure_date'))
+        res = super().write(vals)
+        if 'departure_datetime' in vals or 'meeting_time_before' in vals:
+            # Voyage reprogrammé : recalculer les échéances des rappels
+            self.env['transport.reminder']._reschedule_trips(self.ids)
+        if closing:
+            self.env['transport.boarding']._close_sessions(closing.ids)
+        if 'state' in vals:
+            self.env['transport.realtime']._queue_events('trip_%s' % vals['state'], {trip.id: [] for trip in self})
+        return res
+
+    def unlink(self):
+        self.env['transport.stats.daily']._mark_dates_dirty(self.mapped('departure_date'))
+        return super().unlink()
+
     def _create_stop_times(self):
         """Créer les horaires des arrêts intermédiaires"""
         self.ensure_one()
@@ -407,6 +432,18 @@ class TransportTrip(models.Model):
             
             trip.write({'state': 'boarding'})
             _logger.info("Embarquement démarré pour voyage %s (%d passagers)", trip.name, confirmed_count)
+        self.env['transport.boarding']._open_sessions(self.ids)
+
+    def _get_boarding_info(self):
+        """Données du voyage reprises dans les sessions d'embarquement"""
+        self.ensure_one()
+        return {
+            'id': self.id,
+            'reference': self.name,
+            'company_id': self.transport_company_id.id,
+            'route': f"{self.route_id.departure_city_id.name} → {self.route_id.arrival_city_id.name}",
+            'departure': self.departure_datetime,
+        }
 
     def action_depart(self):
         """Marquer comme parti"""
@@ -417,7 +454,8 @@ class TransportTrip(models.Model):
             # Marquer les réservations non embarquées comme no-show
             no_shows = trip.booking_ids.filtered(lambda b: b.state == 'confirmed')
             if no_shows:
-                no_shows.write({'state': 'checked_in'})  # Considérer comme embarqués par défaut
+                no_shows._bulk_mode().write({'state': 'checked_in'})  # Considérer comme embarqués par défaut
+                self._post_bulk_summary(no_shows, _("Embarqués au départ"))
             
             trip.write({
                 'state': 'departed',
@@ -438,10 +476,11 @@ class TransportTrip(models.Model):
                 'actual_arrival': fields.Datetime.now(),
             })
             trip.bus_id.write({'state': 'available'})
-            # Marquer toutes les réservations comme terminées
-            trip.booking_ids.filtered(lambda b: b.state == 'confirmed').write({
-                'state': 'completed'
-            })
+            # Marquer toutes les réservations comme terminées (un seul message de synthèse)
+            completed = trip.booking_ids.filtered(lambda b: b.state == 'confirmed')
+            if completed:
+                completed._bulk_mode().write({'state': 'completed'})
+                self._post_bulk_summary(completed, _("Réservations terminées"))
 
     def action_cancel(self):
         """Annuler le voyage"""
@@ -453,6 +492,7 @@ class TransportTrip(models.Model):
                 lambda b: b.state in ['reserved', 'confirmed']
             ).action_cancel()
             trip.write({'state': 'cancelled'})
+        self.env['transport.reminder']._unschedule_trips(self.ids)
 
     def action_reset_draft(self):
         """Remettre en brouillon"""
@@ -465,7 +505,9 @@ class TransportTrip(models.Model):
         """Annuler les réservations non confirmées avant le départ"""
         self.ensure_one()
         unconfirmed = self.booking_ids.filtered(lambda b: b.state == 'reserved')
-        unconfirmed.write({'state': 'expired'})
+        if unconfirmed:
+            unconfirmed._bulk_mode().write({'state': 'expired'})
+            self._post_bulk_summary(unconfirmed, _("Réservations expirées au départ"))
 
     def get_available_seats(self, boarding_stop=None, alighting_stop=None):
         """
@@ -515,6 +557,29 @@ class TransportTrip(models.Model):
         
         return self.total_seats - max_occupation
 
+    def _sql_refresh_seat_counters(self):
+        """Recalculer en SQL les compteurs de places (une requête agrégée pour tous les voyages)"""
+        if not self:
+            return
+        self.env.cr.execute("""
+            UPDATE transport_trip t
+               SET booked_seats = c.booked,
+                   available_seats = GREATEST(t.effective_quota - c.booked, 0),
+                   occupancy_rate = CASE WHEN t.effective_quota > 0
+                                         THEN c.booked * 100.0 / t.effective_quota
+                                         ELSE 0 END
+              FROM (
+                    SELECT trip.id AS trip_id, COUNT(b.id) AS booked
+                      FROM transport_trip trip
+                 LEFT JOIN transport_booking b
+                        ON b.trip_id = trip.id AND b.state IN ('reserved', 'confirmed')
+                     WHERE trip.id IN %s
+                  GROUP BY trip.id
+                   ) c
+             WHERE t.id = c.trip_id
+        """, (tuple(self.ids),))
+        self.invalidate_model(['booked_seats', 'available_seats', 'occupancy_rate'])
+
     def action_view_bookings(self):
         """Voir les réservations du voyage"""
         self.ensure_one()
@@ -552,6 +617,41 @@ class TransportTrip(models.Model):
         
         return self.search(domain, order='departure_datetime')
 
+    # ---------- Manifestes ----------
+
+    @api.model
+    def _get_manifest_trips(self, date, city_id=None, company_id=None):
+        """Départs d'une journée, éventuellement limités à une gare (ville de départ) et une compagnie"""
+        domain = [
+            ('departure_date', '=', date),
+            ('state', 'in', ['scheduled', 'boarding', 'departed']),
+        ]
+        if city_id:
+            domain.append(('route_id.departure_city_id', '=', city_id))
+        if company_id:
+            domain.append(('transport_company_id', '=', company_id))
+        return self.search(domain, order='departure_datetime')
+
+    def action_print_manifests(self):
+        """Manifestes PDF des voyages sélectionnés (un document, une section par voyage)"""
+        return self._action_download_manifests('pdf')
+
+    def action_export_manifests_csv(self):
+        """Manifestes CSV des voyages sélectionnés"""
+        return self._action_download_manifests('csv')
+
+    def _action_download_manifests(self, fmt):
+        if not self:
+            raise UserError(_("Sélectionnez au moins un voyage."))
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/transport/manifests?%s' % urlencode({
+                'trip_ids': ','.join(str(trip_id) for trip_id in self.ids),
+                'format': fmt,
+            }),
+            'target': 'self',
+        }
+
 
 class TransportTripStop(models.Model):
     """Horaires des arrêts pour un voyage"""
@@ -616,14 +716,21 @@ class TransportTripStop(models.Model):
     )
 
     def _compute_passenger_counts(self):
+        Booking = self.env['transport.booking']
+        domain = [('trip_id', 'in', self.trip_id.ids), ('state', 'in', ['reserved', 'confirmed'])]
+        boardings = {
+            (trip.id, city.id): count
+            for trip, city, count in Booking._read_group(
+                domain, ['trip_id', 'boarding_stop_id'], ['__count'],
+            )
+        }
+        alightings = {
+            (trip.id, city.id): count
+            for trip, city, count in Booking._read_group(
+                domain, ['trip_id', 'alighting_stop_id'], ['__count'],
+            )
+        }
         for stop in self:
-            stop.boarding_count = self.env['transport.booking'].search_count([
-                ('trip_id', '=', stop.trip_id.id),
-                ('boarding_stop_id', '=', stop.city_id.id),
-                ('state', 'in', ['reserved', 'confirmed']),
-            ])
-            stop.alighting_count = self.env['transport.booking'].search_count([
-                ('trip_id', '=', stop.trip_id.id),
-                ('alighting_stop_id', '=', stop.city_id.id),
-                ('state', 'in', ['reserved', 'confirmed']),
-            ])
+            key = (stop.trip_id.id, stop.city_id.id)
+            stop.boarding_count = boardings.get(key, 0)
+            stop.alighting_count = alightings.get(key, 0)
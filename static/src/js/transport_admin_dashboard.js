@@ -1,10 +1,13 @@
 /** @odoo-module **/
 
 import { registry } from "@web/core/registry";
-import { Component, useState, onWillStart, onMounted } from "@odoo/owl";
+import { Component, useState, onWillStart, onMounted, onWillUnmount } from "@odoo/owl";
 import { useService } from "@web/core/utils/hooks";
 import { _t } from "@web/core/l10n/translation";
 
+// Délai (ms) avant rechargement des indicateurs après une rafale d'évènements temps réel
+const RELOAD_DELAY = 15000;
+
 /**
  * Dashboard Administrateur Intelligent
  * Affiche les KPIs, tendances, alertes et prédictions
@@ -18,6 +21,7 @@ class TransportAdminDashboard extends Component {
         this.action = useService("action");
         this.rpc = useService("rpc");
         this.notification = useService("notification");
+        this.busService = useService("bus_service");
         
         this.state = useState({
             loading: true,
@@ -65,6 +69,8 @@ class TransportAdminDashboard extends Component {
             // Prédictions
             predictedRevenue: 0,
             predictedBookings: 0,
+            // Tendances mensuelles (statistiques journalières)
+            monthlyTrend: [],
             // Comparaisons
             tripsTrend: 0, // % vs semaine précédente
             bookingsTrend: 0,
@@ -76,208 +82,42 @@ class TransportAdminDashboard extends Component {
         });
         
         onMounted(() => {
-            // Auto-refresh toutes les 5 minutes
-            this.refreshInterval = setInterval(() => this.loadDashboardData(), 300000);
+            // Mises à jour poussées par le serveur (bus) au lieu d'un rafraîchissement périodique
+            this.busService.addChannel("transport_admin");
+            this.busService.subscribe("transport.trip/progress", this.onTripProgress);
+        });
+
+        onWillUnmount(() => {
+            this.busService.unsubscribe("transport.trip/progress", this.onTripProgress);
+            this.busService.deleteChannel("transport_admin");
+            clearTimeout(this.reloadTimeout);
         });
     }
-    
-    willUnmount() {
-        if (this.refreshInterval) {
-            clearInterval(this.refreshInterval);
+
+    /**
+     * Avancement de voyages publié par le serveur : les indicateurs agrégés
+     * sont rechargés une seule fois par rafale d'évènements.
+     */
+    onTripProgress = () => {
+        if (!this.reloadTimeout) {
+            this.reloadTimeout = setTimeout(() => {
+                this.reloadTimeout = null;
+                // Sans passer par le cache serveur, qui ignorerait l'évènement reçu
+                this.loadDashboardData(true);
+            }, RELOAD_DELAY);
         }
-    }
+    };
 
-    async loadDashboardData() {
+    async loadDashboardData(force = false) {
         this.state.loading = true;
         try {
-            const today = new Date().toISOString().split('T')[0];
-            const weekAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000).toISOString().split('T')[0];
-            const twoWeeksAgo = new Date(Date.now() - 14 * 24 * 60 * 60 * 1000).toISOString().split('T')[0];
-            const monthStart = new Date();
-            monthStart.setDate(1);
-            const lastMonthStart = new Date(monthStart);
-            lastMonthStart.setMonth(lastMonthStart.getMonth() - 1);
-            const lastMonthEnd = new Date(monthStart);
-            lastMonthEnd.setDate(lastMonthEnd.getDate() - 1);
-            
-            // ============ STATISTIQUES VOYAGES ============
-            const [totalTrips, scheduledTrips, completedTrips, cancelledTrips, boardingTrips] = await Promise.all([
-                this.orm.searchCount("transport.trip", []),
-                this.orm.searchCount("transport.trip", [["state", "=", "scheduled"]]),
-                this.orm.searchCount("transport.trip", [["state", "=", "completed"]]),
-                this.orm.searchCount("transport.trip", [["state", "=", "cancelled"]]),
-                this.orm.searchCount("transport.trip", [["state", "=", "boarding"]]),
-            ]);
-            
-            Object.assign(this.state, { totalTrips, scheduledTrips, completedTrips, cancelledTrips, boardingTrips });
-            
-            // Taux d'annulation
-            this.state.cancellationRate = totalTrips > 0 ? Math.round((cancelledTrips / totalTrips) * 100) : 0;
-            
-            // ============ STATISTIQUES RÉSERVATIONS ============
-            const [totalBookings, confirmedBookings, reservedBookings, unpaidBookings] = await Promise.all([
-                this.orm.searchCount("transport.booking", []),
-                this.orm.searchCount("transport.booking", [["state", "=", "confirmed"]]),
-                this.orm.searchCount("transport.booking", [["state", "=", "reserved"]]),
-                this.orm.searchCount("transport.booking", [["amount_due", ">", 0], ["state", "not in", ["cancelled", "expired", "refunded"]]]),
-            ]);
-            
-            const todayBookings = await this.orm.searchCount("transport.booking", [["booking_date", ">=", today]]);
-            
-            // Réservations expirant bientôt (dans les 2 prochaines heures)
-            const twoHoursLater = new Date(Date.now() + 2 * 60 * 60 * 1000).toISOString();
-            const expiringReservations = await this.orm.searchCount("transport.booking", [
-                ["state", "=", "reserved"],
-                ["reservation_deadline", "<=", twoHoursLater],
-                ["reservation_deadline", ">", new Date().toISOString()],
-            ]);
-            
-            Object.assign(this.state, { 
-                totalBookings, confirmedBookings, reservedBookings, 
-                todayBookings, unpaidBookings, expiringReservations 
-            });
-            
-            // ============ REVENUS ============
-            const confirmedBookingsData = await this.orm.searchRead(
-                "transport.booking",
-                [["state", "in", ["confirmed", "completed", "checked_in"]]],
-                ["total_amount", "booking_date", "create_date"]
-            );
-            
-            this.state.totalRevenue = confirmedBookingsData.reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            
-            // Revenus d'aujourd'hui
-            const todayBookingsRevenue = confirmedBookingsData.filter(b => b.booking_date >= today);
-            this.state.todayRevenue = todayBookingsRevenue.reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            
-            // Revenus de la semaine
-            const weekBookingsRevenue = confirmedBookingsData.filter(b => b.booking_date >= weekAgo);
-            this.state.weekRevenue = weekBookingsRevenue.reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            
-            // Revenus du mois
-            const monthBookingsRevenue = confirmedBookingsData.filter(b => b.booking_date >= monthStart.toISOString().split('T')[0]);
-            this.state.monthRevenue = monthBookingsRevenue.reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            
-            // Revenus du mois précédent (pour comparaison)
-            const lastMonthBookingsRevenue = confirmedBookingsData.filter(b => 
-                b.booking_date >= lastMonthStart.toISOString().split('T')[0] &&
-                b.booking_date <= lastMonthEnd.toISOString().split('T')[0]
-            );
-            this.state.lastMonthRevenue = lastMonthBookingsRevenue.reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            
-            // Croissance des revenus
-            if (this.state.lastMonthRevenue > 0) {
-                this.state.revenueGrowth = Math.round(
-                    ((this.state.monthRevenue - this.state.lastMonthRevenue) / this.state.lastMonthRevenue) * 100
-                );
-            }
-            
-            // ============ TENDANCES SEMAINE ============
-            // Calculer les tendances sur les 7 derniers jours
-            const weeklyData = this._calculateWeeklyData(confirmedBookingsData);
-            this.state.weeklyRevenue = weeklyData.revenues;
-            this.state.weeklyBookings = weeklyData.counts;
-            
-            // Comparer cette semaine vs semaine précédente
-            const thisWeekBookings = confirmedBookingsData.filter(b => b.booking_date >= weekAgo).length;
-            const lastWeekBookings = confirmedBookingsData.filter(b => 
-                b.booking_date >= twoWeeksAgo && b.booking_date < weekAgo
-            ).length;
-            
-            if (lastWeekBookings > 0) {
-                this.state.bookingsTrend = Math.round(((thisWeekBookings - lastWeekBookings) / lastWeekBookings) * 100);
-            }
-            
-            const thisWeekRevenue = weekBookingsRevenue.reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            const lastWeekRevenueData = confirmedBookingsData.filter(b => 
-                b.booking_date >= twoWeeksAgo && b.booking_date < weekAgo
-            );
-            const lastWeekRevenue = lastWeekRevenueData.reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            
-            if (lastWeekRevenue > 0) {
-                this.state.revenueTrend = Math.round(((thisWeekRevenue - lastWeekRevenue) / lastWeekRevenue) * 100);
-            }
-            
-            // ============ COMPAGNIES ET CLIENTS ============
-            const [totalCompanies, activeCompanies, totalPassengers] = await Promise.all([
-                this.orm.searchCount("transport.company", []),
-                this.orm.searchCount("transport.company", [["state", "=", "active"]]),
-                this.orm.searchCount("transport.passenger", []),
-            ]);
-            
-            // Nouveaux passagers ce mois
-            const newPassengersThisMonth = await this.orm.searchCount("transport.passenger", [
-                ["create_date", ">=", monthStart.toISOString()]
-            ]);
-            
-            Object.assign(this.state, { totalCompanies, activeCompanies, totalPassengers, newPassengersThisMonth });
-            
-            // ============ TAUX D'OCCUPATION ============
-            const tripsWithBookings = await this.orm.searchRead(
-                "transport.trip",
-                [["state", "in", ["scheduled", "boarding", "departed"]]],
-                ["total_seats", "available_seats"]
-            );
-            
-            if (tripsWithBookings.length > 0) {
-                const totalSeats = tripsWithBookings.reduce((sum, t) => sum + (t.total_seats || 0), 0);
-                const bookedSeats = tripsWithBookings.reduce((sum, t) => sum + ((t.total_seats || 0) - (t.available_seats || 0)), 0);
-                this.state.avgOccupancyRate = totalSeats > 0 ? Math.round((bookedSeats / totalSeats) * 100) : 0;
-            }
-            
-            // ============ NOTE MOYENNE ============
-            // Note: rating est un champ calculé non stocké, on récupère toutes les compagnies
-            const allCompanies = await this.orm.searchRead(
-                "transport.company",
-                [["state", "=", "active"]],
-                ["rating", "rating_count"]
-            );
-            const companiesWithRating = allCompanies.filter(c => c.rating > 0);
-            
-            if (companiesWithRating.length > 0) {
-                const totalRatingWeight = companiesWithRating.reduce((sum, c) => sum + (c.rating * c.rating_count), 0);
-                const totalRatingCount = companiesWithRating.reduce((sum, c) => sum + c.rating_count, 0);
-                this.state.avgRating = totalRatingCount > 0 ? (totalRatingWeight / totalRatingCount).toFixed(1) : 0;
-            }
-            
-            // ============ TOP ITINÉRAIRES ============
-            const routes = await this.orm.searchRead(
-                "transport.route",
-                [["state", "=", "active"]],
-                ["name", "departure_city_id", "arrival_city_id", "base_price"],
-                { limit: 5, order: "id desc" }
-            );
-            this.state.topRoutes = routes;
-            
-            // ============ TOP COMPAGNIES ============
-            // Note: rating est calculé, on trie côté client
-            const companies = await this.orm.searchRead(
-                "transport.company",
-                [["state", "=", "active"]],
-                ["name", "rating", "rating_count"]
-            );
-            // Tri côté client car rating est un champ calculé non stocké
-            this.state.topCompanies = companies
-                .sort((a, b) => (b.rating - a.rating) || (b.rating_count - a.rating_count))
-                .slice(0, 5);
-            
-            // ============ RÉSERVATIONS RÉCENTES ============
-            const recentBookings = await this.orm.searchRead(
-                "transport.booking",
-                [],
-                ["name", "passenger_name", "total_amount", "amount_due", "state", "booking_date", "trip_id"],
-                { order: "create_date desc", limit: 10 }
-            );
-            this.state.recentBookings = recentBookings;
+            // Un seul appel : les indicateurs sont agrégés côté serveur (mis en cache quelques secondes)
+            const data = await this.orm.call("transport.dashboard", "get_admin_dashboard_data", [], { force });
+            Object.assign(this.state, data);
             
             // ============ ALERTES INTELLIGENTES ============
             this._generateAlerts();
             
-            // ============ PRÉDICTIONS ============
-            this._generatePredictions(confirmedBookingsData);
-            
-            this.state.lastUpdate = new Date().toLocaleTimeString('fr-FR');
-            
         } catch (error) {
             console.error("Erreur chargement dashboard:", error);
             this.notification.add(_t("Erreur lors du chargement du tableau de bord"), { type: "danger" });
@@ -285,30 +125,6 @@ class TransportAdminDashboard extends Component {
         this.state.loading = false;
     }
     
-    _calculateWeeklyData(bookingsData) {
-        const revenues = [];
-        const counts = [];
-        const days = ['Dim', 'Lun', 'Mar', 'Mer', 'Jeu', 'Ven', 'Sam'];
-        
-        for (let i = 6; i >= 0; i--) {
-            const date = new Date();
-            date.setDate(date.getDate() - i);
-            const dateStr = date.toISOString().split('T')[0];
-            
-            const dayBookings = bookingsData.filter(b => b.booking_date === dateStr);
-            revenues.push({
-                day: days[date.getDay()],
-                value: dayBookings.reduce((sum, b) => sum + (b.total_amount || 0), 0)
-            });
-            counts.push({
-                day: days[date.getDay()],
-                value: dayBookings.length
-            });
-        }
-        
-        return { revenues, counts };
-    }
-    
     _generateAlerts() {
         const alerts = [];
         
@@ -392,22 +208,6 @@ class TransportAdminDashboard extends Component {
         this.state.alerts = alerts;
     }
     
-    _generatePredictions(bookingsData) {
-        // Prédiction simple basée sur la moyenne des 7 derniers jours
-        const last7Days = bookingsData.filter(b => {
-            const bookingDate = new Date(b.booking_date);
-            const weekAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000);
-            return bookingDate >= weekAgo;
-        });
-        
-        const avgDailyRevenue = last7Days.reduce((sum, b) => sum + (b.total_amount || 0), 0) / 7;
-        const avgDailyBookings = last7Days.length / 7;
-        
-        // Prédiction pour les 7 prochains jours
-        this.state.predictedRevenue = Math.round(avgDailyRevenue * 7);
-        this.state.predictedBookings = Math.round(avgDailyBookings * 7);
-    }
-
     formatCurrency(amount) {
         return new Intl.NumberFormat('fr-FR', {
             style: 'currency',
@@ -582,7 +382,7 @@ class TransportAdminDashboard extends Component {
 
     async refresh() {
         this.notification.add(_t("Actualisation en cours..."), { type: "info" });
-        await this.loadDashboardData();
+        await this.loadDashboardData(true);
         this.notification.add(_t("Tableau de bord actualisé"), { type: "success" });
     }
 }
@@ -1,10 +1,13 @@
 /** @odoo-module **/
 
 import { registry } from "@web/core/registry";
-import { Component, useState, onWillStart, onMounted } from "@odoo/owl";
+import { Component, useState, onWillStart, onMounted, onWillUnmount } from "@odoo/owl";
 import { useService } from "@web/core/utils/hooks";
 import { _t } from "@web/core/l10n/translation";
 
+// Délai (ms) avant rechargement des indicateurs après une rafale d'évènements temps réel
+const RELOAD_DELAY = 15000;
+
 /**
  * Dashboard Compagnie Intelligent
  * Affiche les KPIs, tendances, alertes et performances de la compagnie
@@ -16,8 +19,8 @@ class TransportCompanyDashboard extends Component {
     setup() {
         this.orm = useService("orm");
         this.action = useService("action");
-        this.user = useService("user");
         this.notification = useService("notification");
+        this.busService = useService("bus_service");
         
         this.state = useState({
             loading: true,
@@ -70,6 +73,8 @@ class TransportCompanyDashboard extends Component {
             // Prédictions
             predictedRevenue: 0,
             predictedBookings: 0,
+            // Tendances mensuelles (statistiques journalières)
+            monthlyTrend: [],
         });
 
         onWillStart(async () => {
@@ -77,195 +82,65 @@ class TransportCompanyDashboard extends Component {
         });
         
         onMounted(() => {
-            // Auto-refresh toutes les 3 minutes
-            this.refreshInterval = setInterval(() => this.loadCompanyData(), 180000);
+            // Mises à jour poussées par le serveur (bus) au lieu d'un rafraîchissement périodique
+            if (this.state.companyId) {
+                this.channel = `transport_company_${this.state.companyId}`;
+                this.busService.addChannel(this.channel);
+                this.busService.subscribe("transport.trip/progress", this.onTripProgress);
+            }
+        });
+
+        onWillUnmount(() => {
+            if (this.channel) {
+                this.busService.unsubscribe("transport.trip/progress", this.onTripProgress);
+                this.busService.deleteChannel(this.channel);
+            }
+            clearTimeout(this.reloadTimeout);
         });
     }
-    
-    willUnmount() {
-        if (this.refreshInterval) {
-            clearInterval(this.refreshInterval);
+
+    /**
+     * Avancement de voyages publié par le serveur : les prochains départs
+     * sont mis à jour immédiatement, les indicateurs agrégés rechargés une
+     * seule fois par rafale d'évènements.
+     */
+    onTripProgress = ({ trips }) => {
+        for (const progress of trips) {
+            const trip = this.state.upcomingTrips.find((t) => t.id === progress.trip_id);
+            if (trip) {
+                Object.assign(trip, {
+                    state: progress.state,
+                    total_seats: progress.total_seats,
+                    available_seats: progress.available_seats,
+                });
+            }
         }
-    }
+        if (!this.reloadTimeout) {
+            this.reloadTimeout = setTimeout(() => {
+                this.reloadTimeout = null;
+                // Sans passer par le cache serveur, qui ignorerait l'évènement reçu
+                this.loadCompanyData(true);
+            }, RELOAD_DELAY);
+        }
+    };
 
-    async loadCompanyData() {
+    async loadCompanyData(force = false) {
         this.state.loading = true;
         
         try {
-            // Trouver la compagnie du manager connecté
-            const partnerId = this.user.partnerId;
-            const companies = await this.orm.searchRead(
-                "transport.company",
-                [["manager_ids.partner_id", "=", partnerId]],
-                ["id", "name", "rating", "rating_count", "state"],
-                { limit: 1 }
-            );
+            // Un seul appel : la compagnie du responsable et ses indicateurs sont calculés côté serveur
+            const data = await this.orm.call("transport.dashboard", "get_company_dashboard_data", [], { force });
             
-            if (companies.length === 0) {
+            if (!data.companyId) {
                 this.state.loading = false;
                 return;
             }
             
-            const company = companies[0];
-            this.state.companyId = company.id;
-            this.state.companyName = company.name;
-            this.state.companyRating = company.rating || 0;
-            this.state.companyRatingCount = company.rating_count || 0;
-            
-            const today = new Date().toISOString().split('T')[0];
-            const weekAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000).toISOString().split('T')[0];
-            const twoWeeksAgo = new Date(Date.now() - 14 * 24 * 60 * 60 * 1000).toISOString().split('T')[0];
-            const monthStart = new Date();
-            monthStart.setDate(1);
-            const lastMonthStart = new Date(monthStart);
-            lastMonthStart.setMonth(lastMonthStart.getMonth() - 1);
-            const lastMonthEnd = new Date(monthStart);
-            lastMonthEnd.setDate(lastMonthEnd.getDate() - 1);
-            
-            // ============ STATISTIQUES VOYAGES ============
-            const [totalTrips, scheduledTrips, boardingTrips, departedTrips, completedTrips, cancelledTrips] = await Promise.all([
-                this.orm.searchCount("transport.trip", [["transport_company_id", "=", company.id]]),
-                this.orm.searchCount("transport.trip", [["transport_company_id", "=", company.id], ["state", "=", "scheduled"]]),
-                this.orm.searchCount("transport.trip", [["transport_company_id", "=", company.id], ["state", "=", "boarding"]]),
-                this.orm.searchCount("transport.trip", [["transport_company_id", "=", company.id], ["state", "=", "departed"]]),
-                this.orm.searchCount("transport.trip", [["transport_company_id", "=", company.id], ["state", "=", "completed"]]),
-                this.orm.searchCount("transport.trip", [["transport_company_id", "=", company.id], ["state", "=", "cancelled"]]),
-            ]);
-            
-            const todayTrips = await this.orm.searchCount("transport.trip", [
-                ["transport_company_id", "=", company.id],
-                ["departure_date", "=", today]
-            ]);
-            
-            Object.assign(this.state, { 
-                totalTrips, scheduledTrips, boardingTrips, departedTrips, 
-                completedTrips, cancelledTrips, todayTrips 
-            });
-            
-            // Taux d'annulation
-            this.state.cancellationRate = totalTrips > 0 ? Math.round((cancelledTrips / totalTrips) * 100) : 0;
-            
-            // ============ STATISTIQUES RÉSERVATIONS ============
-            const companyBookings = await this.orm.searchRead(
-                "transport.booking",
-                [["transport_company_id", "=", company.id]],
-                ["state", "total_amount", "amount_due", "booking_date", "reservation_deadline"]
-            );
-            
-            this.state.totalBookings = companyBookings.length;
-            this.state.confirmedBookings = companyBookings.filter(b => b.state === "confirmed").length;
-            this.state.pendingBookings = companyBookings.filter(b => ["draft", "reserved"].includes(b.state)).length;
-            this.state.todayBookings = companyBookings.filter(b => b.booking_date >= today).length;
-            this.state.unpaidBookings = companyBookings.filter(b => 
-                b.amount_due > 0 && !["cancelled", "expired", "refunded"].includes(b.state)
-            ).length;
-            
-            // Réservations expirant bientôt
-            const twoHoursLater = new Date(Date.now() + 2 * 60 * 60 * 1000).toISOString();
-            this.state.expiringReservations = companyBookings.filter(b => 
-                b.state === "reserved" && 
-                b.reservation_deadline && 
-                b.reservation_deadline <= twoHoursLater &&
-                b.reservation_deadline > new Date().toISOString()
-            ).length;
-            
-            // ============ REVENUS ============
-            const confirmedBookings = companyBookings.filter(b => ["confirmed", "completed", "checked_in"].includes(b.state));
-            this.state.totalRevenue = confirmedBookings.reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            this.state.todayRevenue = confirmedBookings
-                .filter(b => b.booking_date >= today)
-                .reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            
-            this.state.weekRevenue = confirmedBookings
-                .filter(b => b.booking_date >= weekAgo)
-                .reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            
-            this.state.monthRevenue = confirmedBookings
-                .filter(b => b.booking_date >= monthStart.toISOString().split('T')[0])
-                .reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            
-            // Revenus mois précédent
-            this.state.lastMonthRevenue = confirmedBookings
-                .filter(b => 
-                    b.booking_date >= lastMonthStart.toISOString().split('T')[0] &&
-                    b.booking_date <= lastMonthEnd.toISOString().split('T')[0]
-                )
-                .reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            
-            // Croissance
-            if (this.state.lastMonthRevenue > 0) {
-                this.state.revenueGrowth = Math.round(
-                    ((this.state.monthRevenue - this.state.lastMonthRevenue) / this.state.lastMonthRevenue) * 100
-                );
-            }
-            
-            // Tendances semaine
-            const thisWeekBookings = confirmedBookings.filter(b => b.booking_date >= weekAgo);
-            const lastWeekBookings = confirmedBookings.filter(b => 
-                b.booking_date >= twoWeeksAgo && b.booking_date < weekAgo
-            );
-            
-            if (lastWeekBookings.length > 0) {
-                this.state.bookingsTrend = Math.round(
-                    ((thisWeekBookings.length - lastWeekBookings.length) / lastWeekBookings.length) * 100
-                );
-            }
-            
-            const lastWeekRevenue = lastWeekBookings.reduce((sum, b) => sum + (b.total_amount || 0), 0);
-            if (lastWeekRevenue > 0) {
-                this.state.revenueTrend = Math.round(
-                    ((this.state.weekRevenue - lastWeekRevenue) / lastWeekRevenue) * 100
-                );
-            }
-            
-            // Données hebdomadaires pour graphique
-            this._calculateWeeklyData(confirmedBookings);
-            
-            // ============ BUS ============
-            const [totalBuses, activeBuses, inMaintenanceBuses] = await Promise.all([
-                this.orm.searchCount("transport.bus", [["transport_company_id", "=", company.id]]),
-                this.orm.searchCount("transport.bus", [["transport_company_id", "=", company.id], ["state", "=", "available"]]),
-                this.orm.searchCount("transport.bus", [["transport_company_id", "=", company.id], ["state", "=", "maintenance"]]),
-            ]);
-            
-            Object.assign(this.state, { totalBuses, activeBuses, inMaintenanceBuses });
-            
-            // ============ TAUX D'OCCUPATION ============
-            const upcomingTrips = await this.orm.searchRead(
-                "transport.trip",
-                [
-                    ["transport_company_id", "=", company.id],
-                    ["state", "in", ["scheduled", "boarding"]],
-                    ["departure_date", ">=", today]
-                ],
-                ["name", "route_id", "departure_datetime", "available_seats", "total_seats", "state", "bus_id"],
-                { order: "departure_datetime asc", limit: 10 }
-            );
-            this.state.upcomingTrips = upcomingTrips;
-            
-            if (upcomingTrips.length > 0) {
-                const totalSeats = upcomingTrips.reduce((sum, t) => sum + (t.total_seats || 0), 0);
-                const bookedSeats = upcomingTrips.reduce((sum, t) => sum + ((t.total_seats || 0) - (t.available_seats || 0)), 0);
-                this.state.avgOccupancyRate = totalSeats > 0 ? Math.round((bookedSeats / totalSeats) * 100) : 0;
-            }
-            
-            // ============ RÉSERVATIONS RÉCENTES ============
-            const recentBookings = await this.orm.searchRead(
-                "transport.booking",
-                [["transport_company_id", "=", company.id]],
-                ["name", "passenger_name", "passenger_phone", "trip_id", "total_amount", "amount_due", "state", "booking_date", "seat_number"],
-                { order: "create_date desc", limit: 10 }
-            );
-            this.state.recentBookings = recentBookings;
+            Object.assign(this.state, data);
             
             // ============ ALERTES ============
             this._generateAlerts();
             
-            // ============ PRÉDICTIONS ============
-            this._generatePredictions(confirmedBookings);
-            
-            this.state.lastUpdate = new Date().toLocaleTimeString('fr-FR');
-            
         } catch (error) {
             console.error("Erreur chargement dashboard compagnie:", error);
             this.notification.add(_t("Erreur lors du chargement du tableau de bord"), { type: "danger" });
@@ -274,31 +149,6 @@ class TransportCompanyDashboard extends Component {
         this.state.loading = false;
     }
     
-    _calculateWeeklyData(bookingsData) {
-        const revenues = [];
-        const counts = [];
-        const days = ['Dim', 'Lun', 'Mar', 'Mer', 'Jeu', 'Ven', 'Sam'];
-        
-        for (let i = 6; i >= 0; i--) {
-            const date = new Date();
-            date.setDate(date.getDate() - i);
-            const dateStr = date.toISOString().split('T')[0];
-            
-            const dayBookings = bookingsData.filter(b => b.booking_date === dateStr);
-            revenues.push({
-                day: days[date.getDay()],
-                value: dayBookings.reduce((sum, b) => sum + (b.total_amount || 0), 0)
-            });
-            counts.push({
-                day: days[date.getDay()],
-                value: dayBookings.length
-            });
-        }
-        
-        this.state.weeklyRevenue = revenues;
-        this.state.weeklyBookings = counts;
-    }
-    
     _generateAlerts() {
         const alerts = [];
         
@@ -403,20 +253,6 @@ class TransportCompanyDashboard extends Component {
         this.state.alerts = alerts;
     }
     
-    _generatePredictions(bookingsData) {
-        const last7Days = bookingsData.filter(b => {
-            const bookingDate = new Date(b.booking_date);
-            const weekAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000);
-            return bookingDate >= weekAgo;
-        });
-        
-        const avgDailyRevenue = last7Days.reduce((sum, b) => sum + (b.total_amount || 0), 0) / 7;
-        const avgDailyBookings = last7Days.length / 7;
-        
-        this.state.predictedRevenue = Math.round(avgDailyRevenue * 7);
-        this.state.predictedBookings = Math.round(avgDailyBookings * 7);
-    }
-
     formatCurrency(amount) {
         return new Intl.NumberFormat('fr-FR', {
             style: 'currency',
@@ -653,7 +489,7 @@ class TransportCompanyDashboard extends Component {
 
     async refresh() {
         this.notification.add(_t("Actualisation en cours..."), { type: "info" });
-        await this.loadCompanyData();
+        await this.loadCompanyData(true);
         this.notification.add(_t("Tableau de bord actualisé"), { type: "success" });
     }
 }
@@ -3,3 +3,6 @@
 from . import test_transport
 from . import test_api
 from . import test_advanced
+from . import test_performance
+from . import test_query_counts
+from . import test_notifications
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Outils communs aux tests du module transport_interurbain
+"""
+
+from types import SimpleNamespace
+
+from odoo.addons.website.tools import MockRequest
+
+# Tailles de données utilisées pour vérifier que le coût SQL reste constant
+QUERY_COUNT_SIZES = (2, 8)
+
+
+class TransportQueryCountMixin:
+    """Assertions de coût SQL indépendant du volume de données (détection des N+1)"""
+
+    def count_queries(self, call):
+        """Nombre de requêtes SQL émises par `call` (caches vidés au préalable)"""
+        self.env.flush_all()
+        self.env.invalidate_all()
+        start = self.cr.sql_log_count
+        call()
+        self.env.flush_all()
+        return self.cr.sql_log_count - start
+
+    def assertQueryCountFlat(self, build, call, max_queries, sizes=QUERY_COUNT_SIZES):
+        """Vérifier que `call(build(size))` émet autant de requêtes quelle que soit la taille,
+        sans dépasser `max_queries`
+
+        :param build: fonction créant les données pour une taille et retournant la cible de `call`
+        :param call: fonction mesurée, appelée avec la cible
+        :param max_queries: borne supérieure absolue du nombre de requêtes
+        """
+        counts = {}
+        for size in sizes:
+            target = build(size)
+            call(target)  # échauffement (caches ormcache, prefetch des vues...)
+            counts[size] = self.count_queries(lambda: call(target))
+        smallest = counts[sizes[0]]
+        for size, count in counts.items():
+            self.assertLessEqual(
+                count, smallest,
+                "Le nombre de requêtes augmente avec le volume de données : %s" % counts,
+            )
+            self.assertLessEqual(
+                count, max_queries,
+                "Trop de requêtes (%d > %d) pour %d enregistrement(s)" % (count, max_queries, size),
+            )
+        return counts
+
+    def call_json_endpoint(self, endpoint, payload=None, token=None, **kwargs):
+        """Appeler un endpoint JSON de l'API mobile avec une requête simulée"""
+        with MockRequest(self.env) as mock_request:
+            mock_request.params = payload or {}
+            mock_request.httprequest.method = 'POST'
+            mock_request.httprequest.headers = {'Authorization': 'Bearer %s' % token} if token else {}
+            mock_request.future_response = SimpleNamespace(headers={})
+            result = endpoint(**kwargs)
+        self.assertTrue(result.get('success'), "Appel en échec : %s" % result.get('message'))
+        return result
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la file de notifications SMS / email
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+from odoo.tools import config
+
+from odoo.addons.transport_interurbain.tools.notifications import LogProvider
+
+
+@tagged('post_install', '-at_install', 'transport')
+class TestTransportNotifications(TransactionCase):
+    """Tests de la file transactionnelle de notifications"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.company = cls.env['transport.company'].create({
+            'name': 'Compagnie Notif',
+            'state': 'active',
+        })
+        cls.city_dep = cls.env['transport.city'].create({'name': 'Départ Notif', 'code': 'DNO'})
+        cls.city_arr = cls.env['transport.city'].create({'name': 'Arrivée Notif', 'code': 'ANO'})
+        cls.route = cls.env['transport.route'].create({
+            'name': 'DNO - ANO',
+            'departure_city_id': cls.city_dep.id,
+            'arrival_city_id': cls.city_arr.id,
+            'base_price': 5000,
+            'state': 'active',
+        })
+        cls.bus = cls.env['transport.bus'].create({
+            'name': 'BUS-NOTIF',
+            'transport_company_id': cls.company.id,
+            'seat_capacity': 50,
+            'state': 'available',
+        })
+        cls.trip = cls.env['transport.trip'].create({
+            'transport_company_id': cls.company.id,
+            'route_id': cls.route.id,
+            'bus_id': cls.bus.id,
+            'departure_datetime': datetime.now() + timedelta(days=2),
+            'meeting_point': 'Gare',
+            'price': 5000,
+        })
+        cls.trip.action_schedule()
+        cls.partner = cls.env['res.partner'].create({'name': 'Client Notif'})
+
+    def _create_booking(self, **vals):
+        return self.env['transport.booking'].create(dict({
+            'trip_id': self.trip.id,
+            'partner_id': self.partner.id,
+            'passenger_name': 'Passager Notif',
+            'passenger_phone': '+2250700000042',
+            'passenger_email': 'notif@example.com',
+            'ticket_price': 5000,
+            'boarding_stop_id': self.city_dep.id,
+            'alighting_stop_id': self.city_arr.id,
+        }, **vals))
+
+    def _outbox(self, booking):
+        return self.env['transport.notification'].search([('booking_id', '=', booking.id)], order='id')
+
+    def test_enqueue_in_booking_transaction_and_dedup(self):
+        """Test que les notifications sont mises en file une seule fois par évènement"""
+        booking = self._create_booking()
+        booking.action_reserve()
+        booking._send_reservation_notification()
+
+        outbox = self._outbox(booking)
+        self.assertEqual(outbox.mapped('dedup_key'), ['reservation:%d:sms' % booking.id])
+        self.assertEqual(outbox.state, 'pending')
+        self.assertEqual(outbox.recipient, '+2250700000042')
+
+        booking.amount_paid = booking.total_amount
+        booking.action_confirm()
+        self.assertEqual(
+            self._outbox(booking).mapped('dedup_key'),
+            ['reservation:%d:sms' % booking.id, 'ticket:%d:sms' % booking.id, 'ticket:%d:email' % booking.id],
+        )
+
+    def test_file_provider_batches(self):
+        """Test de l'envoi par lots vers le prestataire fichier"""
+        self.env['ir.config_parameter'].sudo().set_param('transport_interurbain.sms_provider', 'file')
+        booking = self._create_booking(passenger_email=False)
+        booking.action_reserve()
+
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.dict(config.options, {'transport_outbox_dir': directory}):
+            self.env['transport.notification'].cron_send_notifications()
+            with open(os.path.join(directory, 'sms.jsonl'), encoding='utf-8') as f:
+                lines = [json.loads(line) for line in f]
+
+        outbox = self._outbox(booking)
+        self.assertEqual(outbox.state, 'sent')
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['recipient'], '+2250700000042')
+        self.assertIn(booking.name, lines[0]['body'])
+
+    def test_retry_with_backoff(self):
+        """Test qu'un échec du prestataire est retenté plus tard, puis abandonné"""
+        booking = self._create_booking(passenger_email=False)
+        booking.action_reserve()
+        message = self._outbox(booking)
+
+        with patch.object(LogProvider, 'send_batch', side_effect=ConnectionError("passerelle indisponible")):
+            self.env['transport.notification'].cron_send_notifications()
+            self.assertEqual(message.state, 'pending')
+            self.assertEqual(message.attempts, 1)
+            self.assertGreater(message.next_attempt_at, datetime.now() + timedelta(seconds=30))
+
+            # Pas encore dû : non repris
+            self.env['transport.notification'].cron_send_notifications()
+            self.assertEqual(message.attempts, 1)
+
+            message.write({'attempts': 4, 'next_attempt_at': datetime.now() - timedelta(hours=1)})
+            self.env['transport.notification'].cron_send_notifications()
+            self.assertEqual(message.state, 'failed')
+            self.assertIn('passerelle indisponible', message.last_error)
+
+    def test_missing_result_not_sent(self):
+        """Test qu'un message absent de la réponse du prestataire reste à envoyer"""
+        booking = self._create_booking(passenger_email=False)
+        booking.action_reserve()
+        message = self._outbox(booking)
+
+        with patch.object(LogProvider, 'send_batch', return_value={}):
+            self.env['transport.notification'].cron_send_notifications()
+        self.assertEqual((message.state, message.attempts), ('pending', 1))
+        self.assertTrue(message.last_error)
+
+    def test_rate_limit_across_batches(self):
+        """Test que le débit du prestataire est respecté d'un lot de la file au suivant"""
+        booking = self._create_booking(passenger_email=False)
+        booking.action_reserve()
+        message = self._outbox(booking)
+        next_send = {}
+
+        with patch.object(LogProvider, 'rate_limit', 1), \
+                patch('odoo.addons.transport_interurbain.models.transport_notification.time.sleep') as sleep:
+            message._send_with_provider('log', next_send)
+            sleep.assert_not_called()
+            message.write({'state': 'pending'})
+            message._send_with_provider('log', next_send)
+        sleep.assert_called_once()
+        self.assertGreater(sleep.call_args.args[0], 0.5)
+
+    def _confirmed_booking(self):
+        booking = self._create_booking(passenger_email=False)
+        booking.action_reserve()
+        booking.amount_paid = booking.total_amount
+        booking.action_confirm()
+        return booking
+
+    def _reminders(self, booking):
+        return self.env['transport.reminder'].search([('booking_id', '=', booking.id)])
+
+    def test_reminders_scheduled_and_rescheduled(self):
+        """Test de la planification des rappels à la confirmation et au changement d'horaire"""
+        booking = self._confirmed_booking()
+        reminders = self._reminders(booking)
+        self.assertEqual(
+            {r.kind: r.due_at for r in reminders},
+            {
+                'day_before': self.trip.departure_datetime - timedelta(hours=24),
+                'two_hours': self.trip.departure_datetime - timedelta(hours=2),
+                'boarding': self.trip.departure_datetime - timedelta(minutes=self.trip.meeting_time_before),
+            },
+        )
+
+        self.trip.departure_datetime += timedelta(hours=5)
+        self.env.invalidate_all()
+        self.assertEqual(
+            self._reminders(booking).filtered(lambda r: r.kind == 'two_hours').due_at,
+            self.trip.departure_datetime - timedelta(hours=2),
+        )
+
+    def test_due_reminders_pushed_to_outbox(self):
+        """Test que seuls les rappels échus passent dans la file de notifications"""
+        booking = self._confirmed_booking()
+        cancelled = self._confirmed_booking()
+        self.env.cr.execute(
+            "UPDATE transport_reminder SET due_at = %s WHERE kind = 'day_before' AND booking_id IN %s",
+            (datetime.now() - timedelta(minutes=1), (booking.id, cancelled.id)))
+        cancelled.action_cancel()
+        self.env.invalidate_all()
+
+        self.env['transport.reminder'].cron_send_due_reminders()
+
+        self.assertEqual(sorted(self._reminders(booking).mapped('kind')), ['boarding', 'two_hours'])
+        self.assertFalse(self._reminders(cancelled).filtered(lambda r: r.kind == 'day_before'))
+        keys = self._outbox(booking).mapped('dedup_key')
+        self.assertEqual(len([k for k in keys if k.startswith('reminder:day_before:%d:' % booking.id)]), 1)
+        self.assertFalse([k for k in self._outbox(cancelled).mapped('dedup_key') if k.startswith('reminder:')])
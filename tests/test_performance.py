@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de performance pour le module transport_interurbain
+Opérations en masse, traitements par lots et coût en requêtes SQL
+"""
+
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.exceptions import AccessError
+from odoo.tests import BaseCase, TransactionCase, new_test_user, tagged
+
+from odoo.addons.transport_interurbain.controllers.api_utils import APIMetrics
+from odoo.addons.transport_interurbain.models import transport_dashboard
+from odoo.addons.transport_interurbain.tools.metrics import MetricsStore
+from odoo.addons.transport_interurbain.tools import wave
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged('post_install', '-at_install', 'transport')
+class TestTransportBulkMode(TransactionCase):
+    """Tests du mode opération en masse (sans suivi par enregistrement)"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.company = cls.env['transport.company'].create({
+            'name': 'Bulk Company',
+            'state': 'active',
+        })
+
+        cls.city_dep = cls.env['transport.city'].create({'name': 'Bulk Départ', 'code': 'BKD'})
+        cls.city_arr = cls.env['transport.city'].create({'name': 'Bulk Arrivée', 'code': 'BKA'})
+
+        cls.route = cls.env['transport.route'].create({
+            'name': 'BKD - BKA',
+            'departure_city_id': cls.city_dep.id,
+            'arrival_city_id': cls.city_arr.id,
+            'base_price': 4000,
+            'state': 'active',
+        })
+
+        cls.bus = cls.env['transport.bus'].create({
+            'name': 'BUS-BULK',
+            'transport_company_id': cls.company.id,
+            'seat_capacity': 30,
+            'state': 'available',
+        })
+
+        cls.partner = cls.env['res.partner'].create({
+            'name': 'Bulk Passenger',
+            'phone': '+225 07 55 00 00 00',
+        })
+
+    def _create_trip(self):
+        trip = self.env['transport.trip'].create({
+            'transport_company_id': self.company.id,
+            'route_id': self.route.id,
+            'bus_id': self.bus.id,
+            'departure_datetime': datetime.now() + timedelta(days=1),
+            'meeting_point': 'Gare Bulk',
+            'price': 4000,
+        })
+        trip.action_schedule()
+        return trip
+
+    def _create_bookings(self, trip, count, confirm=True):
+        bookings = self.env['transport.booking']
+        for i in range(count):
+            booking = self.env['transport.booking'].create({
+                'trip_id': trip.id,
+                'partner_id': self.partner.id,
+                'passenger_name': 'Bulk %s' % i,
+                'passenger_phone': '+225 07 55 00 01 %02d' % i,
+                'ticket_price': 4000,
+                'boarding_stop_id': self.city_dep.id,
+                'alighting_stop_id': self.city_arr.id,
+            })
+            booking.action_reserve()
+            if confirm:
+                booking.amount_paid = 4000
+                booking.action_confirm()
+            bookings |= booking
+        return bookings
+
+    def _count_messages(self, model, ids):
+        return self.env['mail.message'].search_count([
+            ('model', '=', model),
+            ('res_id', 'in', ids),
+        ])
+
+    def test_depart_posts_one_summary_per_trip(self):
+        """Test que le départ ne crée qu'un message de synthèse sur le voyage"""
+        trip = self._create_trip()
+        bookings = self._create_bookings(trip, 5)
+        trip.action_start_boarding()
+
+        booking_messages = self._count_messages('transport.booking', bookings.ids)
+        trip_messages = self._count_messages('transport.trip', trip.ids)
+
+        trip.action_depart()
+
+        self.assertTrue(all(b.state == 'checked_in' for b in bookings))
+        self.assertEqual(self._count_messages('transport.booking', bookings.ids), booking_messages)
+        # Un message de suivi (état du voyage) + un message de synthèse
+        self.assertEqual(self._count_messages('transport.trip', trip.ids), trip_messages + 2)
+
+    def test_cron_expire_bulk_summary(self):
+        """Test que l'expiration par cron ne suit pas chaque réservation"""
+        trip = self._create_trip()
+        bookings = self._create_bookings(trip, 3, confirm=False)
+        bookings.write({'reservation_deadline': datetime.now() - timedelta(hours=1)})
+
+        booking_messages = self._count_messages('transport.booking', bookings.ids)
+
+        self.env['transport.booking'].cron_expire_reservations()
+
+        bookings.invalidate_recordset()
+        self.assertTrue(all(b.state == 'expired' for b in bookings))
+        self.assertEqual(self._count_messages('transport.booking', bookings.ids), booking_messages)
+        summary = self.env['mail.message'].search([
+            ('model', '=', 'transport.trip'),
+            ('res_id', '=', trip.id),
+        ], limit=1)
+        self.assertIn('(3)', summary.body)
+
+    def test_cron_expire_in_batches(self):
+        """Test de l'expiration par lots et du recalcul des places du voyage"""
+        trip = self._create_trip()
+        bookings = self._create_bookings(trip, 5, confirm=False)
+        bookings[:4].write({'reservation_deadline': datetime.now() - timedelta(hours=1)})
+        self.assertEqual(trip.booked_seats, 5)
+
+        self.env['transport.booking'].cron_expire_reservations(batch_size=2)
+
+        bookings.invalidate_recordset()
+        self.assertEqual(bookings.mapped('state').count('expired'), 4)
+        self.assertEqual(bookings[4].state, 'reserved')
+        trip.invalidate_recordset()
+        self.assertEqual(trip.booked_seats, 1)
+        self.assertEqual(trip.available_seats, trip.effective_quota - 1)
+
+    def test_daily_stats_refresh(self):
+        """Test du calcul des statistiques journalières pré-agrégées"""
+        trip = self._create_trip()
+        bookings = self._create_bookings(trip, 3)
+        bookings[0].action_cancel()
+
+        Stats = self.env['transport.stats.daily']
+        Stats.action_rebuild_all()
+        line = Stats.search([
+            ('date', '=', trip.departure_date),
+            ('route_id', '=', self.route.id),
+            ('transport_company_id', '=', self.company.id),
+        ])
+        self.assertEqual(len(line), 1)
+        self.assertEqual(line.trip_count, 1)
+        self.assertEqual(line.seats_offered, 30)
+        self.assertEqual(line.seats_sold, 2)
+        self.assertEqual(line.revenue, 8000)
+        self.assertEqual(line.cancellation_count, 1)
+
+        # Seuls les jours modifiés sont retraités
+        changed = Stats._get_changed_dates(datetime.now() - timedelta(days=1))
+        self.assertIn(trip.departure_date, changed)
+        bookings[1].action_cancel()
+        self.env.flush_all()
+        Stats._refresh_days([trip.departure_date])
+        line = Stats.search([
+            ('date', '=', trip.departure_date),
+            ('route_id', '=', self.route.id),
+        ])
+        self.assertEqual(line.seats_sold, 1)
+        self.assertEqual(line.cancellation_count, 2)
+
+        # Voyage reprogrammé : l'ancien jour est marqué à recalculer
+        old_date = trip.departure_date
+        trip.write({'departure_datetime': trip.departure_datetime + timedelta(days=1)})
+        self.env['ir.config_parameter'].sudo().set_param(
+            'transport_interurbain.stats_daily_last_run', fields.Datetime.to_string(datetime.now()))
+        Stats.cron_refresh_daily_stats()
+        self.assertFalse(Stats.search([('date', '=', old_date), ('route_id', '=', self.route.id)]))
+        self.assertEqual(Stats.search([
+            ('date', '=', trip.departure_date), ('route_id', '=', self.route.id),
+        ]).seats_sold, 1)
+
+
+@tagged('post_install', '-at_install', 'transport')
+class TestTransportBatchCounters(TransactionCase):
+    """Tests des compteurs calculés par requêtes groupées"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.companies = cls.env['transport.company'].create([
+            {'name': 'Counter Company %s' % i, 'state': 'active'} for i in range(6)
+        ])
+        cls.cities = cls.env['transport.city'].create([
+            {'name': 'Counter Ville %s' % i, 'code': 'CV%s' % i} for i in range(6)
+        ])
+        cls.routes = cls.env['transport.route'].create([{
+            'name': 'Counter Route %s' % i,
+            'departure_city_id': cls.cities[i].id,
+            'arrival_city_id': cls.cities[(i + 1) % 6].id,
+            'base_price': 3000,
+            'state': 'active',
+        } for i in range(6)])
+        cls.buses = cls.env['transport.bus'].create([{
+            'name': 'BUS-CNT-%s' % i,
+            'transport_company_id': cls.companies[i].id,
+            'seat_capacity': 20,
+            'state': 'available',
+        } for i in range(6)])
+        cls.trips = cls.env['transport.trip'].create([{
+            'transport_company_id': cls.companies[i].id,
+            'route_id': cls.routes[i].id,
+            'bus_id': cls.buses[i].id,
+            'departure_datetime': datetime.now() + timedelta(days=2),
+            'meeting_point': 'Gare Compteurs',
+            'price': 3000,
+        } for i in range(6)])
+        cls.partners = cls.env['res.partner'].create([
+            {'name': 'Counter Partner %s' % i} for i in range(6)
+        ])
+        cls.passengers = cls.env['transport.passenger'].create([{
+            'name': 'Counter Passager %s' % i,
+            'phone': '+225 07 66 00 00 %02d' % i,
+            'partner_id': cls.partners[i].id,
+        } for i in range(6)])
+        cls.bookings = cls.env['transport.booking'].create([{
+            'trip_id': cls.trips[i].id,
+            'partner_id': cls.partners[i].id,
+            'passenger_id': cls.passengers[i].id,
+            'passenger_name': 'Counter Passager %s' % i,
+            'passenger_phone': '+225 07 66 00 00 %02d' % i,
+            'ticket_price': 3000,
+            'boarding_stop_id': cls.cities[i].id,
+            'alighting_stop_id': cls.cities[(i + 1) % 6].id,
+            'state': 'confirmed',
+            'rating': 4,
+        } for i in range(6)])
+
+    def _count_queries(self, records, fnames):
+        """Nombre de requêtes SQL pour lire les champs calculés de `records`"""
+        self.env.flush_all()
+        self.env.invalidate_all()
+        start = self.cr.sql_log_count
+        for record in records:
+            for fname in fnames:
+                record[fname]
+        return self.cr.sql_log_count - start
+
+    def test_counters_query_count_is_constant(self):
+        """Test que le coût des compteurs ne dépend pas du nombre d'enregistrements"""
+        cases = [
+            (self.companies, ['bus_count', 'trip_count', 'active_trip_count', 'total_bookings']),
+            (self.cities, ['departure_count', 'arrival_count']),
+            (self.routes, ['trip_count']),
+            (self.buses, ['trip_count']),
+            (self.partners, ['transport_booking_count', 'total_transport_spent']),
+        ]
+        for records, fnames in cases:
+            small = self._count_queries(records[:2], fnames)
+            large = self._count_queries(records, fnames)
+            self.assertEqual(small, large, "%s: %s" % (records._name, fnames))
+
+    def test_counters_values(self):
+        """Test des valeurs des compteurs groupés et des champs stockés"""
+        city = self.cities[1]
+        self.assertEqual(city.departure_count, 1)
+        self.assertEqual(city.arrival_count, 1)
+        self.assertEqual(self.companies[0].bus_count, 1)
+        self.assertEqual(self.companies[0].total_bookings, 1)
+        self.assertEqual(self.companies[0].rating, 4)
+        self.assertEqual(self.companies[0].rating_count, 1)
+        self.assertEqual(self.passengers[0].booking_count, 1)
+        self.assertEqual(self.passengers[0].total_spent, self.bookings[0].total_amount)
+        self.assertEqual(self.partners[0].transport_booking_count, 1)
+
+        self.bookings[0].write({'rating': 2})
+        self.bookings[0].action_cancel()
+        self.assertEqual(self.companies[0].rating, 2)
+        self.assertEqual(self.passengers[0].booking_count, 0)
+
+
+@tagged('post_install', '-at_install', 'transport')
+class TestTransportDashboard(TransactionCase):
+    """Tests des indicateurs SQL des tableaux de bord, comparés aux définitions ORM"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.companies = cls.env['transport.company'].create([
+            {'name': 'Dashboard Company %s' % i, 'state': 'active'} for i in range(2)
+        ])
+        cls.cities = cls.env['transport.city'].create([
+            {'name': 'Dashboard Ville %s' % i, 'code': 'DV%s' % i} for i in range(2)
+        ])
+        cls.route = cls.env['transport.route'].create({
+            'name': 'Dashboard Route',
+            'departure_city_id': cls.cities[0].id,
+            'arrival_city_id': cls.cities[1].id,
+            'base_price': 4000,
+            'state': 'active',
+        })
+        cls.buses = cls.env['transport.bus'].create([{
+            'name': 'BUS-DSH-%s' % i,
+            'transport_company_id': company.id,
+            'seat_capacity': 30,
+            'state': 'available',
+        } for i, company in enumerate(cls.companies)])
+        cls.trips = cls.env['transport.trip'].create([{
+            'transport_company_id': bus.transport_company_id.id,
+            'route_id': cls.route.id,
+            'bus_id': bus.id,
+            'departure_datetime': datetime.now() + timedelta(days=day),
+            'meeting_point': 'Gare Tableau de bord',
+            'price': 4000,
+        } for bus in cls.buses for day in (1, 2)])
+        cls.trips[1].write({'state': 'cancelled'})
+        cls.trips[2].write({'state': 'scheduled'})
+
+        cls.partner = cls.env['res.partner'].create({'name': 'Dashboard Client'})
+        today = fields.Date.context_today(cls.env['transport.dashboard'])
+        bookings = []
+        for index, trip in enumerate(cls.trips.filtered(lambda t: t.state != 'cancelled')):
+            for state, age in (('confirmed', 0), ('completed', 3), ('confirmed', 10),
+                               ('reserved', 0), ('cancelled', 1)):
+                bookings.append({
+                    'trip_id': trip.id,
+                    'partner_id': cls.partner.id,
+                    'passenger_name': 'Dashboard Passager %s' % index,
+                    'passenger_phone': '+225 07 55 00 00 %02d' % index,
+                    'ticket_price': 4000 + 500 * index,
+                    'boarding_stop_id': cls.cities[0].id,
+                    'alighting_stop_id': cls.cities[1].id,
+                    'state': state,
+                    'booking_date': today - timedelta(days=age),
+                })
+        cls.bookings = cls.env['transport.booking'].create(bookings)
+
+        cls.admin = new_test_user(
+            cls.env, login='dashboard_admin',
+            groups='base.group_user,transport_interurbain.group_transport_admin',
+        )
+        cls.manager = new_test_user(
+            cls.env, login='dashboard_manager',
+            groups='base.group_user,transport_interurbain.group_transport_company_manager',
+        )
+        cls.companies[0].manager_ids = [(4, cls.manager.id)]
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(transport_dashboard._dashboard_cache.clear)
+
+    def _assert_matches_orm(self, data, company=None):
+        """Comparer les indicateurs aux recherches ORM équivalentes"""
+        Trip = self.env['transport.trip'].sudo()
+        Booking = self.env['transport.booking'].sudo()
+        scope = [('transport_company_id', '=', company.id)] if company else []
+        today = fields.Date.context_today(Trip)
+        paid = scope + [('state', 'in', transport_dashboard.PAID_STATES)]
+
+        trips = dict(Trip._read_group(scope, ['state'], ['__count']))
+        total_trips = sum(trips.values())
+        self.assertEqual(data['totalTrips'], total_trips)
+        self.assertEqual(data['scheduledTrips'], trips.get('scheduled', 0))
+        self.assertEqual(data['cancelledTrips'], trips.get('cancelled', 0))
+        self.assertEqual(data['cancellationRate'], round(trips.get('cancelled', 0) * 100 / total_trips))
+
+        bookings = dict(Booking._read_group(scope, ['state'], ['__count']))
+        self.assertEqual(data['totalBookings'], sum(bookings.values()))
+        self.assertEqual(data['confirmedBookings'], bookings.get('confirmed', 0))
+        self.assertEqual(data['reservedBookings'], bookings.get('reserved', 0))
+        self.assertEqual(data['pendingBookings'], bookings.get('draft', 0) + bookings.get('reserved', 0))
+        self.assertEqual(data['todayBookings'], Booking.search_count(scope + [('booking_date', '>=', today)]))
+
+        def revenue(domain):
+            [(amount,)] = Booking._read_group(paid + domain, [], ['total_amount:sum'])
+            return amount or 0
+
+        self.assertAlmostEqual(data['totalRevenue'], revenue([]))
+        self.assertAlmostEqual(data['todayRevenue'], revenue([('booking_date', '>=', today)]))
+        self.assertAlmostEqual(data['weekRevenue'], revenue([('booking_date', '>=', today - timedelta(days=7))]))
+        self.assertAlmostEqual(data['monthRevenue'], revenue([('booking_date', '>=', today.replace(day=1))]))
+
+        for offset, (revenue_point, count_point) in enumerate(zip(data['weeklyRevenue'], data['weeklyBookings'])):
+            day = today - timedelta(days=6 - offset)
+            self.assertEqual(count_point['value'], Booking.search_count(paid + [('booking_date', '=', day)]))
+            self.assertAlmostEqual(revenue_point['value'], revenue([('booking_date', '=', day)]))
+
+    def test_admin_dashboard_matches_orm(self):
+        """Test des indicateurs administrateur (toutes compagnies)"""
+        data = self.env['transport.dashboard'].with_user(self.admin).get_admin_dashboard_data(force=True)
+        self._assert_matches_orm(data)
+        with self.assertRaises(AccessError):
+            self.env['transport.dashboard'].with_user(self.manager).get_admin_dashboard_data()
+
+    def test_company_dashboard_scope_and_cache(self):
+        """Test des indicateurs d'une compagnie : périmètre, cache et rechargement forcé"""
+        Dashboard = self.env['transport.dashboard'].with_user(self.manager)
+        data = Dashboard.get_company_dashboard_data(force=True)
+        self.assertEqual(data['companyId'], self.companies[0].id)
+        self._assert_matches_orm(data, self.companies[0])
+        own = self.bookings.filtered(lambda b: b.transport_company_id == self.companies[0])
+        self.assertEqual(data['totalBookings'], len(own), "Réservations de l'autre compagnie exclues")
+
+        # Nouvelle réservation (écriture ORM non encore envoyée en base)
+        self.env['transport.booking'].create({
+            'trip_id': self.trips[0].id,
+            'partner_id': self.partner.id,
+            'passenger_name': 'Dashboard Nouveau',
+            'passenger_phone': '+225 07 55 00 00 99',
+            'ticket_price': 4000,
+            'boarding_stop_id': self.cities[0].id,
+            'alighting_stop_id': self.cities[1].id,
+            'state': 'confirmed',
+        })
+        self.assertEqual(Dashboard.get_company_dashboard_data()['totalBookings'], data['totalBookings'],
+                         "Servi par le cache")
+        fresh = Dashboard.get_company_dashboard_data(force=True)
+        self.assertEqual(fresh['totalBookings'], data['totalBookings'] + 1)
+        self._assert_matches_orm(fresh, self.companies[0])
+
+
+@tagged('post_install', '-at_install', 'transport')
+class TestAPIMetrics(BaseCase):
+    """Tests des histogrammes de performance de l'API mobile"""
+
+    def test_record_and_snapshot(self):
+        """Test de l'agrégation des mesures par route"""
+        metrics = APIMetrics(buckets=(10, 100))
+        metrics.record('usager.search_trips', 5, 3, 1.5, 200, 'ok')
+        metrics.record('usager.search_trips', 50, 7, 4.0, 300, 'ok')
+        metrics.record('usager.search_trips', 500, 9, 10.0, 100, '5001')
+
+        stats = metrics.snapshot()['usager.search_trips']
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['buckets'], [1, 1, 1])
+        self.assertEqual(stats['query_count_sum'], 19)
+        self.assertEqual(stats['duration_max'], 500)
+        self.assertEqual(stats['status'], {'ok': 2, '5001': 1})
+
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {})
+
+
+@tagged('post_install', '-at_install', 'transport')
+class TestMetricsStore(BaseCase):
+    """Tests des métriques Prometheus partagées entre workers"""
+
+    def test_shared_store_render(self):
+        """Test que deux workers alimentent le même fichier de métriques"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.sqlite')
+            worker_1 = MetricsStore(path=path)
+            worker_2 = MetricsStore(path=path)
+            worker_1.inc('transport_bookings_total', 2, event='created')
+            worker_2.inc('transport_bookings_total', 3, event='created')
+            worker_2.observe('transport_cron_duration_seconds', 2, cron='expire_reservations')
+            worker_2.flush()
+
+            output = worker_1.render()
+            self.assertIn('# TYPE transport_bookings_total counter', output)
+            self.assertIn('transport_bookings_total{event="created"} 5', output)
+            self.assertIn(
+                'transport_cron_duration_seconds_bucket{cron="expire_reservations",le="1.0"} 0', output)
+            self.assertIn(
+                'transport_cron_duration_seconds_bucket{cron="expire_reservations",le="5.0"} 1', output)
+            self.assertIn('transport_cron_duration_seconds_count{cron="expire_reservations"} 1', output)
+
+
+@tagged('post_install', '-at_install', 'transport')
+class TestWaveClient(BaseCase):
+    """Tests des nouvelles tentatives et du disjoncteur du client Wave"""
+
+    def _response(self, status_code, body=None):
+        return type('Response', (), {
+            'status_code': status_code,
+            'text': str(body),
+            'json': lambda self: body or {},
+        })()
+
+    def test_retry_then_circuit_breaker(self):
+        """Test que les 5xx sont rejoués puis ouvrent le disjoncteur"""
+        client = wave.WaveClient('http://wave.test/v1', 'key', max_retries=2)
+        client.breaker = wave.CircuitBreaker(threshold=2, cooldown=60)
+        with patch.object(wave, '_get_session') as get_session, patch.object(wave.time, 'sleep'):
+            session = get_session.return_value
+            session.request.side_effect = [self._response(503), self._response(200, {'id': 'cos-1'})]
+            self.assertEqual(client.create_checkout_session({}, 'PAY-1')['id'], 'cos-1')
+            self.assertEqual(session.request.call_count, 2)
+
+            session.request.side_effect = None
+            session.request.return_value = self._response(503)
+            for _attempt in range(2):
+                with self.assertRaises(wave.WaveError):
+                    client.get_checkout_session('cos-1')
+            self.assertEqual(client.breaker.state, 'open')
+            calls = session.request.call_count
+            with self.assertRaises(wave.WaveUnavailable):
+                client.get_checkout_session('cos-1')
+            self.assertEqual(session.request.call_count, calls, "Aucun appel réseau disjoncteur ouvert")
+
+    def test_client_error_not_retried(self):
+        """Test qu'une erreur 4xx n'est ni rejouée ni comptée par le disjoncteur"""
+        client = wave.WaveClient('http://wave.test/v1', 'key')
+        client.breaker = wave.CircuitBreaker(threshold=1, cooldown=60)
+        with patch.object(wave, '_get_session') as get_session:
+            get_session.return_value.request.return_value = self._response(400, {'code': 'invalid'})
+            with self.assertRaises(wave.WaveError) as error:
+                client.create_checkout_session({}, 'PAY-2')
+            self.assertEqual(error.exception.status_code, 400)
+            self.assertEqual(get_session.return_value.request.call_count, 1)
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_deadline_and_probe_release(self):
+        """Test du délai total et de la libération de l'appel d'essai après une erreur inattendue"""
+        client = wave.WaveClient('http://wave.test/v1', 'key', max_retries=2, deadline=0.1)
+        client.breaker = wave.CircuitBreaker(threshold=1, cooldown=0)
+        with patch.object(wave, '_get_session') as get_session:
+            session = get_session.return_value
+            session.request.return_value = self._response(503)
+            with self.assertRaises(wave.WaveError):
+                client.get_checkout_session('cos-1')
+            self.assertEqual(session.request.call_count, 1, "Pas de nouvelle tentative au-delà du délai")
+            self.assertEqual(client.breaker.state, 'half_open')
+
+            session.request.side_effect = ValueError("boom")
+            with self.assertRaises(ValueError):
+                client.get_checkout_session('cos-1')
+            session.request.side_effect = None
+            session.request.return_value = self._response(200, {'id': 'cos-1'})
+            self.assertEqual(client.get_checkout_session('cos-1')['id'], 'cos-1')
+        self.assertEqual(client.breaker.state, 'closed')
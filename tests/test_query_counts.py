@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Garde-fous sur le nombre de requêtes SQL des endpoints les plus sollicités.
+
+Chaque test mesure un appel sur deux volumes de données et échoue si le
+nombre de requêtes augmente avec le volume (régression N+1) ou dépasse le
+plafond absolu de l'endpoint.
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+from odoo import fields
+from odoo.tests import HttpCase, TransactionCase, new_test_user, tagged
+
+from odoo.addons.transport_interurbain.controllers.mobile_api_agent import TransportAgentMobileAPI
+from odoo.addons.transport_interurbain.controllers.mobile_api_usager import TransportUsagerMobileAPI
+
+from .common import TransportQueryCountMixin
+
+
+class TransportQueryCountData:
+    """Jeu de données minimal pour les mesures de requêtes"""
+
+    @classmethod
+    def _setup_network(cls):
+        cls.company = cls.env['transport.company'].create({
+            'name': 'Query Count Company',
+            'state': 'active',
+        })
+        cls.city_dep = cls.env['transport.city'].create({'name': 'QC Départ', 'code': 'QCD'})
+        cls.city_arr = cls.env['transport.city'].create({'name': 'QC Arrivée', 'code': 'QCA'})
+        cls.route = cls.env['transport.route'].create({
+            'name': 'QCD - QCA',
+            'departure_city_id': cls.city_dep.id,
+            'arrival_city_id': cls.city_arr.id,
+            'base_price': 3000,
+            'state': 'active',
+        })
+        cls.partner = cls.env['res.partner'].create({'name': 'QC Client', 'phone': '+225 07 77 00 00 00'})
+        cls.day_offset = 1
+
+    def _next_day(self):
+        """Une date de départ distincte par lot (un bus n'a qu'un voyage par jour)"""
+        self.__class__.day_offset += 1
+        return datetime.now().replace(hour=8, minute=0, second=0, microsecond=0) \
+            + timedelta(days=self.day_offset)
+
+    def _create_trips(self, count, departure=None, seats=10):
+        departure = departure or self._next_day()
+        buses = self.env['transport.bus'].create([{
+            'name': 'QC-%s' % uuid.uuid4().hex[:8],
+            'transport_company_id': self.company.id,
+            'seat_capacity': seats,
+            'state': 'available',
+        } for __ in range(count)])
+        return self.env['transport.trip'].create([{
+            'transport_company_id': self.company.id,
+            'route_id': self.route.id,
+            'bus_id': bus.id,
+            'departure_datetime': departure + timedelta(minutes=10 * i),
+            'meeting_point': 'Gare QC',
+            'price': 3000,
+            'vip_price': 4500,
+            'state': 'scheduled',
+            'is_published': True,
+        } for i, bus in enumerate(buses)])
+
+    def _create_bookings(self, trip, count, passenger=None, state='confirmed', with_seat=False):
+        seats = trip.bus_id.seat_ids.sorted('id')
+        return self.env['transport.booking'].create([{
+            'trip_id': trip.id,
+            'partner_id': passenger.partner_id.id if passenger else self.partner.id,
+            'passenger_id': passenger.id if passenger else False,
+            'passenger_name': 'QC Passager %s' % i,
+            'passenger_phone': '+225 07 77 00 01 %02d' % i,
+            'ticket_price': 3000,
+            'amount_paid': 3000 if state == 'confirmed' else 0,
+            'boarding_stop_id': self.city_dep.id,
+            'alighting_stop_id': self.city_arr.id,
+            'seat_id': seats[i].id if with_seat else False,
+            'state': state,
+        } for i in range(count)])
+
+
+@tagged('post_install', '-at_install', 'transport', 'query_count')
+class TestMobileAPIQueryCounts(TransportQueryCountMixin, TransportQueryCountData, TransactionCase):
+    """Coût SQL constant des endpoints de l'API mobile"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._setup_network()
+        expiry = fields.Datetime.now() + timedelta(days=1)
+        cls.agent = new_test_user(
+            cls.env, login='qc_agent', groups='transport_interurbain.group_transport_agent',
+        )
+        cls.agent.write({
+            'transport_company_ids': [(4, cls.company.id)],
+            'transport_agent_token': 'qc-agent-token',
+            'transport_agent_token_expiry': expiry,
+        })
+        cls.passenger_expiry = expiry
+        cls.usager_api = TransportUsagerMobileAPI()
+        cls.agent_api = TransportAgentMobileAPI()
+
+    def _create_passenger(self):
+        partner = self.env['res.partner'].create({'name': 'QC Usager %s' % uuid.uuid4().hex[:6]})
+        return self.env['transport.passenger'].create({
+            'name': partner.name,
+            'partner_id': partner.id,
+            'mobile_token': uuid.uuid4().hex,
+            'mobile_token_expiry': self.passenger_expiry,
+        })
+
+    def test_search_trips(self):
+        """Recherche de voyages : coût indépendant du nombre de voyages trouvés"""
+        def build(size):
+            trips = self._create_trips(size)
+            return fields.Date.to_string(trips[0].departure_date)
+
+        self.assertQueryCountFlat(build, lambda date: self.call_json_endpoint(
+            self.usager_api.search_trips, {
+                'departure_city_id': self.city_dep.id,
+                'arrival_city_id': self.city_arr.id,
+                'departure_date': date,
+            }), max_queries=30)
+
+    def test_booking_list(self):
+        """Liste des réservations de l'usager"""
+        def build(size):
+            passenger = self._create_passenger()
+            self._create_bookings(self._create_trips(1), size, passenger=passenger)
+            return passenger.mobile_token
+
+        self.assertQueryCountFlat(build, lambda token: self.call_json_endpoint(
+            self.usager_api.get_bookings, token=token), max_queries=25)
+
+    def test_seat_map(self):
+        """Détail d'un voyage avec plan des sièges"""
+        def build(size):
+            trip = self._create_trips(1, seats=size * 4)
+            self._create_bookings(trip, size, with_seat=True)
+            return trip
+
+        self.assertQueryCountFlat(build, lambda trip: self.call_json_endpoint(
+            self.usager_api.get_trip_detail, trip_id=trip.id), max_queries=25)
+
+    def test_agent_trips(self):
+        """Voyages du jour de l'agent"""
+        def build(size):
+            trips = self._create_trips(size)
+            for trip in trips:
+                self._create_bookings(trip, 2)
+            return fields.Date.to_string(trips[0].departure_date)
+
+        self.assertQueryCountFlat(build, lambda date: self.call_json_endpoint(
+            self.agent_api.get_assigned_trips, {'date': date}, token='qc-agent-token'), max_queries=30)
+
+    def test_trip_passengers(self):
+        """Liste des passagers d'un voyage"""
+        def build(size):
+            trip = self._create_trips(1, seats=size)
+            self._create_bookings(trip, size)
+            return trip
+
+        self.assertQueryCountFlat(build, lambda trip: self.call_json_endpoint(
+            self.agent_api.get_trip_passengers, token='qc-agent-token', trip_id=trip.id), max_queries=25)
+
+    def test_ticket_scan(self):
+        """Scan d'un ticket : coût indépendant du remplissage du voyage"""
+        def build(size):
+            trip = self._create_trips(1, seats=size)
+            return self._create_bookings(trip, size)[-1]
+
+        self.assertQueryCountFlat(build, lambda booking: self.call_json_endpoint(
+            self.agent_api.scan_ticket_qr, {
+                'qr_data': 'TICKET:%s|TOKEN:%s|TRIP:%s' % (
+                    booking.name, booking.ticket_token, booking.trip_id.name),
+            }, token='qc-agent-token'), max_queries=20)
+
+
+@tagged('post_install', '-at_install', 'transport', 'query_count')
+class TestPortalQueryCounts(TransportQueryCountMixin, TransportQueryCountData, HttpCase):
+    """Coût SQL constant des pages du portail"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._setup_network()
+        cls.portal_user = new_test_user(
+            cls.env, login='qc_portal', password='qc_portal_pwd',
+            groups='base.group_portal,transport_interurbain.group_transport_portal',
+        )
+
+    def test_portal_my_bookings(self):
+        """Page /my/bookings : coût indépendant de l'historique du client"""
+        self.authenticate('qc_portal', 'qc_portal_pwd')
+        passenger = self.env['transport.passenger'].create({
+            'name': 'QC Portail',
+            'partner_id': self.portal_user.partner_id.id,
+        })
+
+        def build(size):
+            trip = self._create_trips(1, seats=size)
+            self._create_bookings(trip, size, passenger=passenger)
+            return '/my/bookings'
+
+        def call(url):
+            response = self.url_open(url)
+            self.assertEqual(response.status_code, 200)
+
+        self.assertQueryCountFlat(build, call, max_queries=80)
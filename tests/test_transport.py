@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 
-from odoo.tests import TransactionCase, tagged
+from odoo.tests import TransactionCase, new_test_user, tagged
 from odoo.exceptions import ValidationError, UserError
 from datetime import datetime, timedelta
+import json
+import threading
 from freezegun import freeze_time
+from unittest.mock import patch
+
+from odoo.addons.transport_interurbain.benchmarks.wave_simulator import WaveSimulator, make_server
+from odoo.addons.transport_interurbain.models.transport_payment import WAVE_CHECKOUT_MAX_ATTEMPTS
+from odoo.addons.transport_interurbain.tools import manifest, phone, ticket_qr
+from odoo.addons.transport_interurbain.tools.wave import WaveError
 
 
 @tagged('post_install', '-at_install', 'transport')
@@ -418,9 +426,374 @@ class TestTransportBooking(TransactionCase):
         })
         booking.action_reserve()
         booking.action_cancel()
-        
+
         self.assertEqual(booking.state, 'cancelled')
 
+    def test_ticket_pdf_cache(self):
+        """Test du pré-rendu et de l'invalidation du billet PDF en cache"""
+        booking = self.env['transport.booking'].create({
+            'trip_id': self.trip.id,
+            'partner_id': self.partner.id,
+            'passenger_name': 'Test PDF',
+            'passenger_phone': '+225 05 00 00 00 00',
+            'ticket_price': 6000,
+            'boarding_stop_id': self.city_departure.id,
+            'alighting_stop_id': self.city_arrival.id,
+        })
+        booking.action_reserve()
+        booking.amount_paid = booking.total_amount
+        booking.action_confirm()
+
+        self.env['transport.booking'].cron_prerender_ticket_pdfs()
+        attachments = self.env['ir.attachment'].search([
+            ('res_model', '=', 'transport.booking'), ('res_id', '=', booking.id),
+        ])
+        self.assertEqual(len(attachments), 1)
+        self.assertIn(booking._ticket_pdf_cache_key(), attachments.name)
+
+        Report = self.env.registry['ir.actions.report']
+        with patch.object(Report, '_render_qweb_pdf', side_effect=AssertionError("rendu inattendu")):
+            pdf, key = booking._get_ticket_pdf()
+        self.assertEqual(pdf, attachments.raw)
+
+        # Un changement d'état invalide le billet : nouveau rendu, ancienne version supprimée
+        booking.action_check_in()
+        new_key = booking._get_ticket_pdf()[1]
+        self.assertNotEqual(new_key, key)
+        self.assertFalse(attachments.exists())
+
+    def test_native_ticket_formats(self):
+        """Test du rendu natif du billet (PDF compact, ESC/POS, PNG)"""
+        booking = self.env['transport.booking'].create({
+            'trip_id': self.trip.id,
+            'partner_id': self.partner.id,
+            'passenger_name': 'Aïcha Koné',
+            'passenger_phone': '+225 05 00 00 00 00',
+            'ticket_price': 6000,
+            'boarding_stop_id': self.city_departure.id,
+            'alighting_stop_id': self.city_arrival.id,
+        })
+        booking.action_reserve()
+        booking.amount_paid = booking.total_amount
+        booking.action_confirm()
+
+        pdf, mimetype, filename = booking._render_native_ticket('compact')
+        self.assertEqual(mimetype, 'application/pdf')
+        self.assertTrue(pdf.startswith(b'%PDF-1.4') and pdf.rstrip().endswith(b'%%EOF'))
+        self.assertTrue(filename.endswith('.pdf'))
+
+        escpos = booking._render_native_ticket('escpos')[0]
+        self.assertTrue(escpos.startswith(b'\x1b@'))
+        self.assertIn('Aïcha Koné'.encode('cp1252'), escpos)
+        self.assertIn(booking._get_ticket_qr_payload().encode(), escpos)
+
+        png = booking._render_native_ticket('png')[0]
+        self.assertTrue(png.startswith(b'\x89PNG'))
+
+    def test_signed_ticket_qr(self):
+        """Test des QR codes signés : vérification hors ligne, falsification, rotation, révocation"""
+        booking = self.env['transport.booking'].create({
+            'trip_id': self.trip.id,
+            'partner_id': self.partner.id,
+            'passenger_name': 'Test QR',
+            'passenger_phone': '+225 05 00 00 00 00',
+            'ticket_price': 6000,
+            'seat_number': '12',
+            'boarding_stop_id': self.city_departure.id,
+            'alighting_stop_id': self.city_arrival.id,
+        })
+        booking.action_reserve()
+        booking.amount_paid = booking.total_amount
+        booking.action_confirm()
+
+        QrKey = self.env['transport.qr.key']
+        code = booking._get_ticket_qr_payload()
+        self.assertTrue(code.startswith('T2.'))
+        departure = self.trip.departure_datetime
+
+        claims = ticket_qr.verify_ticket(code, QrKey._get_verification_keys(), now=departure, trip_id=self.trip.id)
+        self.assertEqual(claims['booking_id'], booking.id)
+        self.assertEqual(claims['seat'], '12')
+        self.assertEqual(claims['company_id'], self.company.id)
+
+        parts = code.split('.')
+        parts[4] = '13'
+        rejections = (
+            ('.'.join(parts), {'now': departure}, 'signature'),
+            (code, {'now': departure, 'trip_id': self.trip.id + 1}, 'wrong_trip'),
+            (code, {'now': departure + timedelta(days=1)}, 'expired'),
+            (code, {'now': departure - timedelta(days=2)}, 'not_yet_valid'),
+        )
+        for tampered, kwargs, reason in rejections:
+            with self.assertRaises(ticket_qr.QRError) as error:
+                ticket_qr.verify_ticket(tampered, QrKey._get_verification_keys(), **kwargs)
+            self.assertEqual(error.exception.reason, reason)
+
+        # Après rotation, les nouveaux billets changent de clé et les anciens restent valables
+        self.company.action_rotate_qr_key()
+        self.assertNotEqual(booking._get_ticket_qr_payload().split('.')[1], code.split('.')[1])
+        ticket_qr.verify_ticket(code, QrKey._get_verification_keys(), now=departure)
+
+        # Les anciens QR HMAC sont refusés
+        obsolete = 'T1.' + '.'.join(code.split('.')[1:7]) + '.ABCDEFGHIJKLMNOP'
+        with self.assertRaises(ticket_qr.QRError) as error:
+            ticket_qr.verify_ticket(obsolete, QrKey._get_verification_keys(), now=departure)
+        self.assertEqual(error.exception.reason, 'obsolete')
+
+        # QR passager : expiration et révocation par changement de token
+        passenger = self.env['transport.passenger'].create({'name': 'Test QR', 'phone': '+225 07 00 00 00 01'})
+        payload = passenger._get_qr_payload()
+        passenger_id, tag = ticket_qr.verify_passenger(payload, QrKey._get_verification_keys())
+        self.assertEqual(passenger_id, passenger.id)
+        ticket_qr.check_token_tag(tag, passenger.unique_token)
+        with self.assertRaises(ticket_qr.QRError) as error:
+            ticket_qr.verify_passenger(payload, QrKey._get_verification_keys(), now=datetime.utcnow() + timedelta(
+                days=ticket_qr.PASSENGER_QR_VALIDITY_DAYS + 1))
+        self.assertEqual(error.exception.reason, 'expired')
+        passenger.action_revoke_qr_code()
+        with self.assertRaises(ticket_qr.QRError) as error:
+            ticket_qr.check_token_tag(tag, passenger.unique_token)
+        self.assertEqual(error.exception.reason, 'revoked')
+
+    def test_boarding_session(self):
+        """Test de la session d'embarquement en mémoire et de sa mise à jour par le bus"""
+        passenger = self.env['transport.passenger'].create({
+            'name': 'Test Embarquement', 'phone': '+225 05 00 00 00 00',
+        })
+        booking = self.env['transport.booking'].create({
+            'trip_id': self.trip.id,
+            'partner_id': self.partner.id,
+            'passenger_id': passenger.id,
+            'passenger_name': 'Test Embarquement',
+            'passenger_phone': '+225 05 00 00 00 00',
+            'ticket_price': 6000,
+            'boarding_stop_id': self.city_departure.id,
+            'alighting_stop_id': self.city_arrival.id,
+        })
+        booking.action_reserve()
+        booking.amount_paid = booking.total_amount
+        booking.action_confirm()
+
+        Boarding = self.env['transport.boarding']
+        self.assertIsNone(Boarding._get_session(self.trip.id))
+        self.trip.action_start_boarding()
+        session = Boarding._get_session(self.trip.id)
+        row = session.find_ticket(booking.name, booking.ticket_token)
+        self.assertEqual(row['state'], 'confirmed')
+        self.assertIsNone(session.find_ticket(booking.name, 'mauvais-jeton'))
+
+        # Une écriture (ici ou dans un autre worker) est annoncée sur le bus puis rejouée
+        booking.action_check_in()
+        self.assertEqual(Boarding._get_session(self.trip.id).get(booking.id)['state'], 'checked_in')
+        self.assertEqual(session.stats()['checked_in'], 1)
+        # Sans changement, un scan ne coûte que la lecture du bus
+        self.env.flush_all()
+        with self.assertQueryCount(1):
+            Boarding._get_session(self.trip.id)
+        self.assertIs(Boarding._find_session(booking.id), session)
+        # Les points crédités en SQL sont aussi annoncés aux sessions
+        points = passenger.loyalty_points
+        self.env['transport.passenger']._add_loyalty_points({passenger.id: 5}, reason='Test')
+        row = Boarding._get_session(self.trip.id).get(booking.id)
+        self.assertEqual(row['passenger']['loyalty_points'], points + 5)
+
+        # Fin de l'embarquement : la session est fermée dans tous les workers
+        self.trip.action_depart()
+        self.assertIsNone(Boarding._get_session(self.trip.id))
+
+    def test_realtime_trip_progress(self):
+        """Test de la diffusion temps réel : un delta par voyage et par transaction"""
+        booking = self.env['transport.booking'].create({
+            'trip_id': self.trip.id,
+            'partner_id': self.partner.id,
+            'passenger_name': 'Test Temps Réel',
+            'passenger_phone': '+225 05 00 00 00 00',
+            'ticket_price': 6000,
+            'seat_number': '7',
+            'boarding_stop_id': self.city_departure.id,
+            'alighting_stop_id': self.city_arrival.id,
+        })
+        booking.action_reserve()
+        booking.amount_paid = booking.total_amount
+        booking.action_confirm()
+        # Publication au commit
+        self.env.cr.precommit.run()
+
+        Realtime = self.env['transport.realtime']
+        events, cursor = Realtime._fetch_trip_events(self.trip.id, 0)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['confirmed'], 1)
+        self.assertIn('confirmation', events[0]['events'])
+        self.assertEqual(events[0]['bookings'], [{'id': booking.id, 'seat': '7', 'state': 'confirmed'}])
+
+        self.trip.action_start_boarding()
+        booking.action_check_in()
+        self.env.cr.precommit.run()
+        events, _cursor = Realtime._fetch_trip_events(self.trip.id, cursor)
+        self.assertEqual(len(events), 1)
+        self.assertEqual((events[0]['state'], events[0]['checked_in']), ('boarding', 1))
+        self.assertEqual(events[0]['events'], {'trip_boarding': 1, 'check_in': 1})
+
+        # Abonnements : seuls les canaux autorisés sont conservés
+        channels = [
+            'transport_admin', 'transport_company_%d' % self.company.id,
+            'transport_trip_%d' % self.trip.id, 'transport_boarding_%d' % self.trip.id, 'autre',
+        ]
+        admin = new_test_user(self.env, login='rt_admin', groups='base.group_user,transport_interurbain.group_transport_admin')
+        user = new_test_user(self.env, login='rt_user', groups='base.group_user')
+        self.assertEqual(Realtime.with_user(admin)._filter_channels(channels), channels[:3] + ['autre'])
+        self.assertEqual(Realtime.with_user(user)._filter_channels(channels), ['autre'])
+
+    def test_keyset_pagination(self):
+        """Test de la pagination par curseur : ni doublon ni trou entre les pages"""
+        Booking = self.env['transport.booking']
+        partner = self.env['res.partner'].create({'name': 'Client Pagination'})
+        # Créées dans la même transaction : même create_date
+        bookings = Booking.create([{
+            'trip_id': self.trip.id,
+            'partner_id': partner.id,
+            'passenger_name': 'Passager %d' % i,
+            'passenger_phone': '+225 05 00 00 00 00',
+            'ticket_price': 6000,
+            'boarding_stop_id': self.city_departure.id,
+            'alighting_stop_id': self.city_arrival.id,
+        } for i in range(7)])
+        domain = [('partner_id', '=', partner.id)]
+        for order in ('recent', 'departure', 'name'):
+            seen, cursor = [], None
+            while True:
+                page, cursor = Booking._keyset_search(domain, order, cursor=cursor, limit=3)
+                seen += page.ids
+                if not cursor:
+                    break
+            self.assertEqual(sorted(seen), sorted(bookings.ids), order)
+            self.assertEqual(len(seen), len(set(seen)), order)
+        self.assertEqual(Booking._keyset_count(domain), 7)
+        with self.assertRaises(ValueError):
+            Booking._keyset_search(domain, 'name', cursor='invalide')
+
+    def test_partner_stats(self):
+        """Test des statistiques voyageur calculées par requêtes groupées"""
+        partner = self.env['res.partner'].create({'name': 'Client Fréquent'})
+        bookings = self.env['transport.booking'].create([{
+            'trip_id': self.trip.id,
+            'partner_id': partner.id,
+            'passenger_name': 'Passager %d' % i,
+            'passenger_phone': '+225 05 00 00 00 00',
+            'ticket_price': 6000,
+            'boarding_stop_id': self.city_departure.id,
+            'alighting_stop_id': self.city_arrival.id,
+        } for i in range(3)])
+        bookings[:2].write({'state': 'completed'})
+        bookings[2].write({'state': 'reserved'})
+
+        stats = self.env['transport.partner.stats']._get_partner_stats(partner.id)
+        self.assertEqual(stats['total'], 3)
+        self.assertEqual(stats['pending'], 1)
+        self.assertEqual(stats['total_trips'], 2)
+        self.assertEqual(stats['total_km'], 2 * self.route.distance_km)
+        self.assertEqual(stats['total_spent'], sum(bookings[:2].mapped('total_amount')))
+        self.assertEqual(stats['favorite_company'], self.company.name)
+        self.assertEqual(stats['frequent_routes'], [{'name': self.route.name, 'count': 2}])
+
+    def test_loyalty_ledger(self):
+        """Test du journal des points de fidélité : incrément atomique et niveau matérialisé"""
+        Passenger = self.env['transport.passenger']
+        ama = Passenger.create({'name': 'Ama', 'phone': '+225 07 00 00 00 01'})
+        kofi = Passenger.create({'name': 'Kofi', 'phone': '+225 07 00 00 00 02', 'loyalty_points': 150})
+        self.assertEqual(kofi.loyalty_entry_ids.mapped('points'), [150], "Solde initial reporté au journal")
+
+        Passenger._add_loyalty_points({ama.id: 2500, kofi.id: 60}, reason='Embarquement groupé')
+        self.assertEqual((ama.loyalty_points, ama.loyalty_level), (2500, 'silver'))
+        self.assertEqual((kofi.loyalty_points, kofi.loyalty_level), (210, 'bronze'))
+        self.assertEqual(len(ama.loyalty_entry_ids), 1)
+
+        ama.add_loyalty_points(2600)
+        self.assertEqual((ama.loyalty_points, ama.loyalty_level), (5100, 'gold'))
+        self.assertEqual(sum(ama.loyalty_entry_ids.mapped('points')), ama.loyalty_points)
+        with self.assertRaises(UserError):
+            ama.loyalty_entry_ids[:1].write({'points': 0})
+        with self.assertRaises(UserError):
+            ama.loyalty_entry_ids[:1].unlink()
+
+    def test_phone_key(self):
+        """Test de la clé téléphone E.164 commune aux passagers, réservations et contacts"""
+        for raw in ('+225 07 12 34 56 78', '0712345678', '00225-07.12.34.56.78', '2250712345678'):
+            self.assertEqual(phone.normalize_phone(raw), '+2250712345678', raw)
+        self.assertIsNone(phone.normalize_phone('12-34'))
+        self.assertIsNone(phone.normalize_phone(False))
+
+        passenger = self.env['transport.passenger'].create({'name': 'Awa', 'phone': '07 12 34 56 78'})
+        partner = self.env['res.partner'].create({'name': 'Awa', 'phone': '+225 0712345678'})
+        booking = self.env['transport.booking'].create({
+            'trip_id': self.trip.id,
+            'partner_id': partner.id,
+            'passenger_name': 'Awa',
+            'passenger_phone': '+225 07-12-34-56-78',
+            'ticket_price': 6000,
+            'boarding_stop_id': self.city_departure.id,
+            'alighting_stop_id': self.city_arrival.id,
+        })
+        key = '+2250712345678'
+        self.assertEqual(self.env['transport.passenger'].search([('phone_key', '=', key)]), passenger)
+        self.assertEqual(self.env['res.partner'].search([('transport_phone_key', '=', key)]), partner)
+        self.assertEqual(self.env['transport.booking'].search([('passenger_phone_key', '=', key)]), booking)
+
+    def test_manifest_engine(self):
+        """Test des manifestes de plusieurs voyages construits en une requête"""
+        empty_trip = self.env['transport.trip'].create({
+            'transport_company_id': self.company.id,
+            'route_id': self.route.id,
+            'bus_id': self.bus.id,
+            'departure_datetime': self.trip.departure_datetime + timedelta(hours=2),
+            'meeting_point': 'Gare routière',
+            'price': 6000,
+        })
+        empty_trip.action_schedule()
+        for name in ('Passager B', 'Passager A'):
+            booking = self.env['transport.booking'].create({
+                'trip_id': self.trip.id,
+                'partner_id': self.partner.id,
+                'passenger_name': name,
+                'passenger_phone': '+225 05 00 00 00 00',
+                'ticket_price': 6000,
+                'boarding_stop_id': self.city_departure.id,
+                'alighting_stop_id': self.city_arrival.id,
+            })
+            booking.action_reserve()
+
+        trips = self.env['transport.trip']._get_manifest_trips(
+            self.trip.departure_date, city_id=self.city_departure.id, company_id=self.company.id)
+        self.assertIn(self.trip, trips)
+        self.env.flush_all()
+        with self.assertQueryCount(1):
+            manifests = list(manifest.iter_manifests(self.env.cr, [empty_trip.id, self.trip.id]))
+
+        self.assertEqual([trip['id'] for trip, _passengers in manifests], [self.trip.id, empty_trip.id])
+        passengers = manifests[0][1]
+        self.assertEqual([p['name'] for p in passengers], ['Passager A', 'Passager B'])
+        self.assertEqual({p['boarding'] for p in passengers}, {'Abidjan'})
+        self.assertEqual(manifests[1][1], [])
+
+        lines = b''.join(manifest.iter_csv(manifests)).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('Passager A', lines[1])
+
+        pdf = b''.join(manifest.iter_pdf(manifests))
+        self.assertTrue(pdf.startswith(b'%PDF') and pdf.rstrip().endswith(b'%%EOF'))
+        self.assertIn(b'/Count 2', pdf)
+
+        # Réservations filtrées par les règles d'accès de l'appelant
+        allowed = self.env['transport.booking'].search([('passenger_name', '=', 'Passager B')])
+        filtered = list(manifest.iter_manifests(self.env.cr, [self.trip.id], allowed.ids))
+        self.assertEqual([p['name'] for p in filtered[0][1]], ['Passager B'])
+        # Sélection vide : une page d'information plutôt qu'un PDF sans page
+        self.assertIn(b'/Count 1', b''.join(manifest.iter_pdf([])))
+
+        action = (self.trip | empty_trip).action_print_manifests()
+        self.assertEqual(action['type'], 'ir.actions.act_url')
+        self.assertIn('format=pdf', action['url'])
+
 
 @tagged('post_install', '-at_install', 'transport')
 class TestTransportSeatAvailability(TransactionCase):
@@ -624,3 +997,205 @@ class TestTransportPayment(TransactionCase):
         self.assertEqual(payment.state, 'completed')
         self.assertEqual(self.booking.amount_paid, 5000)
         self.assertEqual(self.booking.state, 'confirmed')
+
+    def test_wave_checkout_uses_configured_api_url(self):
+        """L'URL de l'API Wave est lue dans les paramètres (simulateur local)"""
+        self.env['ir.config_parameter'].sudo().set_param(
+            'transport_interurbain.wave_api_url', 'http://127.0.0.1:8765/v1/')
+        payment = self.env['transport.payment'].create({
+            'booking_id': self.booking.id,
+            'amount': 5000,
+            'payment_method': 'wave',
+        })
+        response = type('Response', (), {
+            'status_code': 200,
+            'json': lambda self: {'id': 'cos-test', 'wave_launch_url': 'http://127.0.0.1:8765/c/cos-test'},
+        })()
+        with patch('odoo.addons.transport_interurbain.tools.wave._get_session') as get_session:
+            get_session.return_value.request.return_value = response
+            payment.action_process_wave_payment()
+
+        call = get_session.return_value.request.call_args
+        self.assertEqual(call.args[:2], ('POST', 'http://127.0.0.1:8765/v1/checkout/sessions'))
+        self.assertEqual(call.kwargs['headers']['Idempotency-Key'], payment.name)
+        self.assertTrue(call.kwargs['json']['webhook_url'].endswith(
+            '/transport/payment/webhook/%d' % payment.id))
+        self.assertEqual(payment.state, 'processing')
+        self.assertEqual(payment.wave_checkout_id, 'cos-test')
+
+    def test_wave_async_checkout(self):
+        """Test de la création différée de la session Wave par la tâche planifiée"""
+        payment = self.env['transport.payment'].create({
+            'booking_id': self.booking.id,
+            'amount': 5000,
+            'payment_method': 'wave',
+        })
+        payment.action_request_wave_checkout()
+        self.assertTrue(payment.wave_checkout_queued)
+        self.assertEqual(payment.state, 'pending')
+
+        response = type('Response', (), {
+            'status_code': 200,
+            'json': lambda self: {'id': 'cos-async', 'wave_launch_url': 'https://pay.wave.com/c/cos-async'},
+        })()
+        with patch('odoo.addons.transport_interurbain.tools.wave._get_session') as get_session:
+            get_session.return_value.request.return_value = response
+            self.env['transport.payment'].cron_process_wave_checkouts()
+
+        self.assertFalse(payment.wave_checkout_queued)
+        self.assertEqual(payment.state, 'processing')
+        self.assertEqual(payment.wave_payment_url, 'https://pay.wave.com/c/cos-async')
+
+    def test_wave_async_checkout_retry(self):
+        """Test qu'un paiement en erreur chez Wave est reporté seul, sans bloquer la file"""
+        Payment = self.env['transport.payment']
+        stuck, refused, ok = payments = Payment.create([{
+            'booking_id': self.booking.id,
+            'amount': 5000,
+            'payment_method': 'wave',
+        } for _i in range(3)])
+        payments.action_request_wave_checkout()
+        errors = {
+            stuck.id: WaveError("Délai d'appel Wave dépassé", reason='deadline'),
+            refused.id: WaveError("Réponse Wave illisible", reason='invalid_json'),
+        }
+
+        def create_checkout(payment, interactive=False):
+            if payment.id in errors:
+                raise errors[payment.id]
+            payment.write({'state': 'processing', 'wave_checkout_queued': False})
+
+        with patch.object(type(Payment), '_create_wave_checkout', autospec=True, side_effect=create_checkout):
+            Payment.cron_process_wave_checkouts()
+            self.assertEqual(ok.state, 'processing', "La file continue après une erreur")
+            self.assertEqual(refused.state, 'failed', "Réponse illisible : échec immédiat")
+            self.assertEqual((stuck.state, stuck.wave_checkout_attempts), ('pending', 1))
+            self.assertTrue(stuck.wave_checkout_retry_at)
+
+            # Reporté : ignoré jusqu'à l'heure du prochain essai, puis en échec après le dernier
+            Payment.cron_process_wave_checkouts()
+            self.assertEqual(stuck.wave_checkout_attempts, 1)
+            for _attempt in range(WAVE_CHECKOUT_MAX_ATTEMPTS - 1):
+                stuck.wave_checkout_retry_at = datetime(2000, 1, 1)
+                Payment.cron_process_wave_checkouts()
+        self.assertEqual((stuck.state, stuck.wave_checkout_attempts), ('failed', WAVE_CHECKOUT_MAX_ATTEMPTS))
+        self.assertFalse(stuck.wave_checkout_queued)
+
+    def test_wave_webhook_inbox_idempotent(self):
+        """Test que les webhooks Wave rejoués ne sont appliqués qu'une fois"""
+        payment = self.env['transport.payment'].create({
+            'booking_id': self.booking.id,
+            'amount': 5000,
+            'payment_method': 'wave',
+            'state': 'processing',
+        })
+        Event = self.env['transport.payment.event']
+
+        def body(event_id):
+            return json.dumps({
+                'id': event_id,
+                'type': 'checkout.session.completed',
+                'data': {'id': 'cos-inbox', 'transaction_id': 'T_INBOX'},
+            }).encode()
+
+        self.assertTrue(Event._receive('wave', payment, body('EV_1')))
+        for invalid in (b'[1, 2]', b'"texte"'):
+            with self.assertRaises(ValueError):
+                Event._receive('wave', payment, invalid)
+        self.assertFalse(Event._receive('wave', payment, body('EV_1')), "Doublon ignoré à la réception")
+        Event.cron_process_payment_events()
+
+        first = Event.search([('event_id', '=', 'EV_1')])
+        self.assertEqual(len(first), 1)
+        self.assertEqual(first.state, 'done')
+        self.assertEqual(payment.state, 'completed')
+        self.assertEqual(payment.transaction_id, 'T_INBOX')
+        self.assertEqual(self.booking.amount_paid, 5000)
+        self.assertEqual(self.booking.state, 'confirmed')
+
+        # Même paiement notifié sous un autre identifiant : sans effet
+        Event._receive('wave', payment, body('EV_2'))
+        Event.cron_process_payment_events()
+        self.assertEqual(Event.search([('event_id', '=', 'EV_2')]).state, 'ignored')
+        self.assertEqual(self.booking.amount_paid, 5000)
+
+    def test_payment_events_booking_order(self):
+        """Test qu'un évènement en échec retient les évènements suivants de sa réservation"""
+        payment = self.env['transport.payment'].create({
+            'booking_id': self.booking.id,
+            'amount': 5000,
+            'payment_method': 'wave',
+            'state': 'processing',
+        })
+        Event = self.env['transport.payment.event']
+        for event_id in ('EV_A', 'EV_B'):
+            Event._receive('wave', payment, json.dumps({
+                'id': event_id,
+                'type': 'checkout.session.completed',
+                'data': {'id': 'cos-order', 'transaction_id': 'T_ORDER'},
+            }).encode())
+        first = Event.search([('event_id', '=', 'EV_A')])
+        second = Event.search([('event_id', '=', 'EV_B')])
+
+        with patch.object(type(payment), '_apply_wave_event', side_effect=ValueError("panne")):
+            Event.cron_process_payment_events()
+        self.assertEqual((first.state, first.attempts), ('pending', 1))
+        self.assertEqual((second.state, second.attempts), ('pending', 0), "Évènement suivant retenu")
+
+        Event.cron_process_payment_events()
+        self.assertEqual(first.state, 'done')
+        self.assertEqual(second.state, 'ignored')
+
+    def test_wave_reconciliation_with_local_stub(self):
+        """Test du rapprochement des paiements en cours contre un simulateur Wave local"""
+        simulator = WaveSimulator(latency_ms=0, jitter_ms=0)
+        server = make_server(simulator, '127.0.0.1', 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.env['ir.config_parameter'].sudo().set_param(
+            'transport_interurbain.wave_api_url', 'http://127.0.0.1:%d/v1' % server.server_address[1])
+        simulator.sessions.update({
+            'cos-paid': {'id': 'cos-paid', 'checkout_status': 'complete',
+                         'payment_status': 'succeeded', 'transaction_id': 'T_PAID'},
+            'cos-lost': {'id': 'cos-lost', 'checkout_status': 'expired', 'payment_status': 'cancelled'},
+            'cos-open': {'id': 'cos-open', 'checkout_status': 'open', 'payment_status': 'processing'},
+        })
+
+        bookings = self.booking
+        for name in ('Client perdu', 'Client indécis'):
+            booking = self.env['transport.booking'].create({
+                'trip_id': self.trip.id,
+                'partner_id': self.partner.id,
+                'passenger_name': name,
+                'passenger_phone': '+225 07 00 00 00 01',
+                'ticket_price': 5000,
+                'boarding_stop_id': self.city_dep.id,
+                'alighting_stop_id': self.city_arr.id,
+            })
+            booking.action_reserve()
+            bookings |= booking
+        payments = self.env['transport.payment'].create([{
+            'booking_id': booking.id,
+            'amount': 5000,
+            'payment_method': 'wave',
+            'state': 'processing',
+            'wave_checkout_id': checkout_id,
+        } for booking, checkout_id in zip(bookings, ('cos-paid', 'cos-lost', 'cos-open'))])
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE transport_payment SET write_date = write_date - interval '1 hour' WHERE id IN %s",
+            (tuple(payments.ids),))
+        self.env.cr.execute(
+            "UPDATE transport_booking SET reservation_deadline = %s WHERE id = %s",
+            (datetime.now() - timedelta(minutes=5), bookings[1].id))
+        self.env.invalidate_all()
+
+        summary = self.env['transport.payment'].cron_reconcile_wave_payments(concurrency=2)
+
+        self.assertEqual(summary, {'completed': 1, 'failed': 1, 'released': 1, 'pending': 1})
+        self.assertEqual(payments.mapped('state'), ['completed', 'failed', 'processing'])
+        self.assertEqual(payments[0].transaction_id, 'T_PAID')
+        self.assertEqual(bookings[0].state, 'confirmed')
+        self.assertEqual(bookings[1].state, 'expired', "Places libérées après l'échec du paiement")
+        self.assertEqual(bookings[2].state, 'reserved')
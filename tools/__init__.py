@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+from . import metrics
+from . import wave
+from . import notifications
+from . import ticket_render
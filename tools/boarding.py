@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Sessions d'embarquement en mémoire - Transport Interurbain
+
+Pendant l'embarquement d'un voyage, chaque worker garde une image compacte
+du manifeste : une ligne (dict) par réservation, indexée par identifiant,
+référence et jeton du billet, identifiant et jeton du passager. Les scans et
+les contrôles d'embarquement sont servis depuis cette image, sans relire les
+réservations.
+
+Les écritures passent toujours par l'ORM (la base reste la référence) ; les
+réservations modifiées sont annoncées sur le canal ``bus.bus`` du voyage et
+chaque worker rejoue ces annonces avant de répondre (voir
+models/transport_boarding.py). Une session trop ancienne est rechargée
+entièrement, ce qui borne l'effet d'une annonce manquée.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Nombre de voyages gardés en mémoire par worker
+MAX_SESSIONS = 200
+# Âge maximum d'une session avant rechargement complet (secondes)
+RESYNC_SECONDS = 60
+
+
+class BoardingSession:
+    """Image en mémoire des réservations d'un voyage en cours d'embarquement"""
+
+    __slots__ = (
+        'trip', 'rows', 'by_ticket', 'by_token', 'by_passenger', 'by_passenger_token',
+        'agents', 'last_bus_id', 'loaded_at', 'lock',
+    )
+
+    def __init__(self, trip, rows, last_bus_id):
+        self.trip = trip
+        self.rows = {}
+        self.by_ticket = {}
+        self.by_token = {}
+        self.by_passenger = {}
+        self.by_passenger_token = {}
+        # Compagnie résolue de chaque agent ayant scanné ce voyage
+        self.agents = {}
+        self.last_bus_id = last_bus_id
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+        for row in rows:
+            self.apply(row)
+
+    @property
+    def trip_id(self):
+        return self.trip['id']
+
+    @property
+    def company_id(self):
+        return self.trip['company_id']
+
+    def is_stale(self):
+        return time.monotonic() - self.loaded_at > RESYNC_SECONDS
+
+    def apply(self, row):
+        """Ajouter ou remplacer la ligne d'une réservation"""
+        self.remove(row['id'])
+        self.rows[row['id']] = row
+        self.by_ticket[row['reference']] = row['id']
+        if row['ticket_token']:
+            self.by_token[row['ticket_token']] = row['id']
+        passenger = row['passenger']
+        if passenger:
+            self.by_passenger.setdefault(passenger['id'], set()).add(row['id'])
+            if passenger['token']:
+                self.by_passenger_token[passenger['token']] = passenger['id']
+
+    def remove(self, booking_id):
+        row = self.rows.pop(booking_id, None)
+        if not row:
+            return
+        self.by_ticket.pop(row['reference'], None)
+        self.by_token.pop(row['ticket_token'], None)
+        if row['passenger']:
+            self.by_passenger.get(row['passenger']['id'], set()).discard(booking_id)
+
+    def get(self, booking_id):
+        return self.rows.get(booking_id)
+
+    def find_ticket(self, reference, token=None):
+        """Ligne du billet ``reference`` (par jeton s'il est fourni)"""
+        if token:
+            row = self.rows.get(self.by_token.get(token))
+            return row if row and row['reference'] == reference else None
+        return self.rows.get(self.by_ticket.get(reference))
+
+    def find_passenger(self, passenger_id=None, token=None):
+        """Lignes des réservations d'un passager, par identifiant ou par jeton"""
+        if passenger_id is None:
+            passenger_id = self.by_passenger_token.get(token)
+        return [self.rows[booking_id] for booking_id in sorted(self.by_passenger.get(passenger_id, ()))]
+
+    def stats(self):
+        """Compteurs d'embarquement (mêmes clés que l'API agent)"""
+        checked_in = sum(1 for row in self.rows.values() if row['state'] == 'checked_in')
+        confirmed = sum(1 for row in self.rows.values() if row['state'] == 'confirmed')
+        return {
+            'total_confirmed': checked_in + confirmed,
+            'checked_in': checked_in,
+            'pending': confirmed,
+        }
+
+
+class SessionStore:
+    """Sessions d'embarquement d'un worker, par base et par voyage (LRU)"""
+
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def get(self, dbname, trip_id):
+        with self._lock:
+            session = self._sessions.get((dbname, trip_id))
+            if session:
+                self._sessions.move_to_end((dbname, trip_id))
+            return session
+
+    def put(self, dbname, session):
+        with self._lock:
+            self._sessions[(dbname, session.trip_id)] = session
+            self._sessions.move_to_end((dbname, session.trip_id))
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def drop(self, dbname, trip_id):
+        with self._lock:
+            self._sessions.pop((dbname, trip_id), None)
+
+    def find_booking(self, dbname, booking_id):
+        """Session contenant la réservation ``booking_id``, s'il y en a une"""
+        with self._lock:
+            for (session_db, _trip_id), session in self._sessions.items():
+                if session_db == dbname and booking_id in session.rows:
+                    return session
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+sessions = SessionStore()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Pagination par curseur (keyset) - Transport Interurbain
+
+Une page est décrite par la clé de tri de sa dernière ligne, par exemple
+``(departure_datetime, id)``, et non par un décalage : la page suivante est
+lue avec la comparaison de lignes ``(departure_datetime, id) < (:date, :id)``,
+qui parcourt directement l'index composite, pour le même coût quelle que soit
+sa profondeur. Le curseur transmis au client est cette clé, sérialisée en
+JSON puis encodée en base64 (URL).
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+# Ordres de pagination : nom -> ((champ, sens), ..., (id, sens)). Tous les champs
+# d'un ordre ont le même sens (condition de la comparaison de lignes), sont des
+# colonnes toujours renseignées (pas de NULL dans la clé) et stockés à la
+# seconde. L'ordre chronologique de création suit donc l'identifiant, croissant
+# avec create_date.
+ORDERS = {
+    'recent': (('id', 'desc'),),
+    'departure': (('departure_datetime', 'desc'), ('id', 'desc')),
+    'name': (('name', 'asc'), ('id', 'asc')),
+    'state': (('state', 'asc'), ('id', 'asc')),
+}
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def order_clause(order):
+    """Clause ORDER BY de l'ordre ``order``"""
+    return ', '.join('%s %s' % (field, direction) for field, direction in ORDERS[order])
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _deserialize(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        raise ValueError(value)
+    return value
+
+
+def encode_cursor(order, values):
+    """Curseur opaque à partir des valeurs de la clé de tri de la dernière ligne"""
+    payload = json.dumps([order] + [_serialize(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, order):
+    """Valeurs de la clé de tri ; ValueError si le curseur est invalide ou d'un autre ordre"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as e:
+        raise ValueError("Curseur invalide") from e
+    if not isinstance(payload, list) or len(payload) != len(ORDERS[order]) + 1 or payload[0] != order:
+        raise ValueError("Curseur invalide")
+    return [_deserialize(value) for value in payload[1:]]
+
+
+def after_clause(order, values, alias):
+    """Condition SQL (clause, paramètres) des lignes situées après la clé ``values`` dans l'ordre ``order``"""
+    fields = ORDERS[order]
+    operator = '<' if fields[0][1] == 'desc' else '>'
+    columns = ', '.join('"%s"."%s"' % (alias, field) for field, _direction in fields)
+    return '(%s) %s (%s)' % (columns, operator, ', '.join(['%s'] * len(fields))), list(values)
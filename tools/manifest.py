@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur de manifestes des passagers - Transport Interurbain
+
+Construit les manifestes d'un ensemble de voyages (typiquement tous les
+départs d'une gare pour une journée) à partir d'une seule requête SQL
+(voyages, réservations, arrêts et places), puis les écrit en CSV ou en PDF
+paginé (voir ``tools/pdf.py``). Les deux sorties sont des générateurs
+d'octets : le contrôleur les diffuse au fil de l'eau, voyage par voyage,
+sans construire le document complet en mémoire.
+"""
+
+import csv
+import io
+from datetime import datetime
+
+import pytz
+
+from .pdf import A4_HEIGHT, A4_WIDTH, PdfWriter, fit_text, text_op
+
+MANIFEST_STATES = ('reserved', 'confirmed', 'checked_in')
+MANIFEST_STATE_LABELS = {
+    'reserved': 'Réservé',
+    'confirmed': 'Confirmé',
+    'checked_in': 'Embarqué',
+}
+MANIFEST_FETCH_SIZE = 2000
+
+# Tri naturel des places (2 avant 10), passagers sans place en fin de liste
+MANIFEST_QUERY = """
+    SELECT t.id, t.name, t.departure_datetime, t.driver_name, t.meeting_point,
+           r.name, c.name, bus.name, bus.license_plate,
+           b.name, b.seat_number, b.passenger_name, b.passenger_phone,
+           COALESCE(bs.name, dep.name), COALESCE(als.name, arr.name), b.state
+      FROM transport_trip t
+      JOIN transport_route r ON r.id = t.route_id
+      JOIN transport_city dep ON dep.id = r.departure_city_id
+      JOIN transport_city arr ON arr.id = r.arrival_city_id
+      JOIN transport_company c ON c.id = t.transport_company_id
+ LEFT JOIN transport_bus bus ON bus.id = t.bus_id
+ LEFT JOIN transport_booking b ON b.trip_id = t.id AND b.state IN %s
+                                AND (%s::int[] IS NULL OR b.id = ANY(%s::int[]))
+ LEFT JOIN transport_city bs ON bs.id = b.boarding_stop_id
+ LEFT JOIN transport_city als ON als.id = b.alighting_stop_id
+     WHERE t.id IN %s
+  ORDER BY t.departure_datetime, t.id,
+           NULLIF(regexp_replace(b.seat_number, '\\D', '', 'g'), '')::int NULLS LAST,
+           b.seat_number, b.passenger_name
+"""
+
+
+def iter_manifests(cr, trip_ids, booking_ids=None, fetch_size=MANIFEST_FETCH_SIZE):
+    """Générer (voyage, passagers) par voyage, dans l'ordre des départs, à partir d'une seule requête
+
+    ``booking_ids`` : réservations que l'utilisateur peut lire (règles d'accès
+    appliquées par l'appelant) ; None pour toutes les réservations des voyages.
+    """
+    if not trip_ids:
+        return
+    booking_ids = list(booking_ids) if booking_ids is not None else None
+    cr.execute(MANIFEST_QUERY, (MANIFEST_STATES, booking_ids, booking_ids, tuple(trip_ids)))
+    trip, passengers = None, []
+    while True:
+        rows = cr.fetchmany(fetch_size)
+        if not rows:
+            break
+        for row in rows:
+            if trip is None or trip['id'] != row[0]:
+                if trip is not None:
+                    yield trip, passengers
+                trip = {
+                    'id': row[0],
+                    'name': row[1],
+                    'departure': row[2],
+                    'driver': row[3],
+                    'meeting_point': row[4],
+                    'route': row[5],
+                    'company': row[6],
+                    'bus': row[7],
+                    'license_plate': row[8],
+                }
+                passengers = []
+            if row[9]:
+                passengers.append({
+                    'ticket': row[9],
+                    'seat': row[10],
+                    'name': row[11],
+                    'phone': row[12],
+                    'boarding': row[13],
+                    'alighting': row[14],
+                    'state': row[15],
+                })
+    if trip is not None:
+        yield trip, passengers
+
+
+def format_departure(value, tz):
+    """Date de départ (UTC en base) dans le fuseau ``tz``"""
+    if not value:
+        return ''
+    return pytz.utc.localize(value).astimezone(pytz.timezone(tz or 'UTC')).strftime('%d/%m/%Y %H:%M')
+
+
+# ---------- CSV ----------
+
+CSV_HEADER = [
+    'Voyage', 'Départ', 'Itinéraire', 'Compagnie', 'Bus', 'Immatriculation', 'Chauffeur',
+    'N°', 'Place', 'Passager', 'Téléphone', 'Embarquement', 'Descente', 'Billet', 'Statut',
+]
+
+
+def iter_csv(manifests, tz='UTC'):
+    """CSV (UTF-8 avec BOM pour les tableurs, séparateur point-virgule), un bloc d'octets par voyage"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    writer.writerow(CSV_HEADER)
+    for trip, passengers in manifests:
+        departure = format_departure(trip['departure'], tz)
+        for index, passenger in enumerate(passengers, 1):
+            writer.writerow([
+                trip['name'], departure, trip['route'], trip['company'], trip['bus'] or '',
+                trip['license_plate'] or '', trip['driver'] or '',
+                index, passenger['seat'] or '', passenger['name'] or '', passenger['phone'] or '',
+                passenger['boarding'] or '', passenger['alighting'] or '', passenger['ticket'],
+                MANIFEST_STATE_LABELS.get(passenger['state'], passenger['state']),
+            ])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+# ---------- PDF ----------
+
+PDF_MARGIN = 36
+PDF_ROW_HEIGHT = 14
+PDF_ROWS_PER_PAGE = 40
+# Colonnes du tableau : (titre, abscisse, largeur)
+PDF_COLUMNS = (
+    ('#', 36, 22),
+    ('Place', 58, 36),
+    ('Passager', 94, 150),
+    ('Téléphone', 244, 85),
+    ('Embarquement', 329, 80),
+    ('Descente', 409, 80),
+    ('Statut', 489, 55),
+    ('Présent', 544, 20),
+)
+
+
+def _pdf_page(trip, rows, first_index, page, page_count, tz, generated_at):
+    """Opérateurs d'une page de manifeste"""
+    ops = []
+    y = A4_HEIGHT - PDF_MARGIN - 14
+    ops.append(text_op('F2', 14, PDF_MARGIN, y, "MANIFESTE DES PASSAGERS"))
+    y -= 22
+    info = (
+        ("Voyage : %s" % trip['name'], "Départ : %s" % format_departure(trip['departure'], tz)),
+        ("Itinéraire : %s" % trip['route'], "Compagnie : %s" % trip['company']),
+        ("Bus : %s %s" % (trip['bus'] or '-', '(%s)' % trip['license_plate'] if trip['license_plate'] else ''),
+         "Chauffeur : %s" % (trip['driver'] or '-')),
+        ("Rassemblement : %s" % (trip['meeting_point'] or '-'), trip['counters']),
+    )
+    for left, right in info:
+        ops.append(text_op('F1', 9, PDF_MARGIN, y, fit_text(left, 9, 250)))
+        ops.append(text_op('F1', 9, 310, y, fit_text(right, 9, 250)))
+        y -= 12
+
+    y -= 12
+    for title, x, _width in PDF_COLUMNS:
+        ops.append(text_op('F2', 8, x, y, title))
+    ops.append(b'0.5 w %d %d m %d %d l S' % (PDF_MARGIN, y - 4, A4_WIDTH - PDF_MARGIN, y - 4))
+    y -= PDF_ROW_HEIGHT + 2
+
+    if not rows and page == 1:
+        ops.append(text_op('F1', 9, PDF_MARGIN, y, "Aucune réservation pour ce voyage"))
+    for index, passenger in enumerate(rows, first_index):
+        values = (
+            str(index), passenger['seat'] or '-', passenger['name'], passenger['phone'],
+            passenger['boarding'], passenger['alighting'],
+            MANIFEST_STATE_LABELS.get(passenger['state'], passenger['state']),
+        )
+        for (_title, x, width), value in zip(PDF_COLUMNS, values):
+            ops.append(text_op('F1', 8, x, y, fit_text(value, 8, width - 4)))
+        x = PDF_COLUMNS[-1][1] + 6
+        ops.append(b'%d %d 7 7 re S' % (x, y - 1))
+        y -= PDF_ROW_HEIGHT
+
+    if page == page_count:
+        for x, label in ((PDF_MARGIN, "Signature du chauffeur"), (330, "Signature du contrôleur")):
+            ops.append(b'%d 90 m %d 90 l S' % (x, x + 200))
+            ops.append(text_op('F1', 9, x + 40, 78, label))
+    ops.append(text_op('F1', 7, PDF_MARGIN, 30, "%s - page %d/%d - document généré le %s" % (
+        trip['name'], page, page_count, generated_at)))
+    return ops
+
+
+def iter_pdf(manifests, tz='UTC'):
+    """PDF A4 paginé : au moins une page par voyage, PDF_ROWS_PER_PAGE passagers par page"""
+    generated_at = format_departure(datetime.utcnow().replace(microsecond=0), tz)
+    writer = PdfWriter()
+    yield writer.header()
+    empty = True
+    for trip, passengers in manifests:
+        empty = False
+        counts = {state: 0 for state in MANIFEST_STATES}
+        for passenger in passengers:
+            counts[passenger['state']] += 1
+        trip = dict(trip, counters="Passagers : %d (embarqués %d, confirmés %d, réservés %d)" % (
+            len(passengers), counts['checked_in'], counts['confirmed'], counts['reserved']))
+        page_count = max((len(passengers) + PDF_ROWS_PER_PAGE - 1) // PDF_ROWS_PER_PAGE, 1)
+        chunks = []
+        for page in range(1, page_count + 1):
+            start = (page - 1) * PDF_ROWS_PER_PAGE
+            ops = _pdf_page(trip, passengers[start:start + PDF_ROWS_PER_PAGE], start + 1,
+                            page, page_count, tz, generated_at)
+            chunks.append(writer.page(A4_WIDTH, A4_HEIGHT, ops))
+        yield b''.join(chunks)
+    if empty:
+        # Un PDF sans page est refusé par de nombreux lecteurs
+        yield writer.page(A4_WIDTH, A4_HEIGHT, [
+            text_op('F2', 14, PDF_MARGIN, A4_HEIGHT - PDF_MARGIN - 14, "MANIFESTE DES PASSAGERS"),
+            text_op('F1', 9, PDF_MARGIN, A4_HEIGHT - PDF_MARGIN - 36, "Aucun voyage sélectionné"),
+        ])
+    yield writer.close()
+
+
+FORMATS = {
+    # format : (type MIME, extension, générateur)
+    'csv': ('text/csv; charset=utf-8', 'csv', iter_csv),
+    'pdf': ('application/pdf', 'pdf', iter_pdf),
+}
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Métriques d'exploitation au format Prometheus - Transport Interurbain
+
+Les compteurs et histogrammes sont accumulés en mémoire dans chaque worker
+puis reportés (au plus toutes les FLUSH_INTERVAL secondes, et à chaque
+collecte) dans une base SQLite partagée. Tous les workers d'un même serveur
+écrivent dans le même fichier, ce qui permet à l'endpoint
+/api/v1/transport/metrics de renvoyer des valeurs agrégées quel que soit le
+worker qui répond.
+
+Emplacement du fichier : option ``transport_metrics_dir`` du fichier de
+configuration Odoo, à défaut ``<data_dir>/transport_metrics``.
+"""
+
+import contextlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 5  # secondes
+METRICS_FILENAME = 'metrics.sqlite'
+
+API_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+WAVE_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+CRON_BUCKETS = (0.1, 1, 5, 15, 30, 60, 120, 300, 600)
+
+# Familles exposées : nom -> (type, aide, bornes des histogrammes)
+METRICS = {
+    'transport_api_request_duration_seconds': (
+        'histogram', "Durée des appels de l'API mobile par route", API_BUCKETS),
+    'transport_api_requests_total': (
+        'counter', "Appels de l'API mobile par route et statut", None),
+    'transport_api_sql_queries_total': (
+        'counter', "Requêtes SQL émises par les appels de l'API mobile", None),
+    'transport_bookings_total': (
+        'counter', "Réservations par évènement (created, confirmed, expired)", None),
+    'transport_scans_total': (
+        'counter', "Scans de QR code par type et résultat", None),
+    'transport_wave_checkout_duration_seconds': (
+        'histogram', "Durée de création des sessions de paiement Wave", WAVE_BUCKETS),
+    'transport_wave_checkout_failures_total': (
+        'counter', "Échecs de création des sessions de paiement Wave", None),
+    'transport_wave_status_duration_seconds': (
+        'histogram', "Durée des lectures d'état de session Wave (rapprochement)", WAVE_BUCKETS),
+    'transport_wave_reconciliations_total': (
+        'counter', "Paiements Wave rapprochés par résultat", None),
+    'transport_notifications_total': (
+        'counter', "Notifications SMS / email par canal, prestataire et résultat", None),
+    'transport_reminders_total': (
+        'counter', "Rappels avant départ échus par type et résultat", None),
+    'transport_ticket_pdf_total': (
+        'counter', "Billets PDF servis depuis le cache (hit) ou rendus (miss)", None),
+    'transport_ticket_render_duration_seconds': (
+        'histogram', "Durée du rendu natif des billets par format", API_BUCKETS),
+    'transport_boarding_sessions_total': (
+        'counter', "Sessions d'embarquement en mémoire par évènement (load, sync, hit, miss)", None),
+    'transport_payment_events_total': (
+        'counter', "Webhooks de paiement reçus et traités par résultat", None),
+    'transport_cron_duration_seconds': (
+        'histogram', "Durée des tâches planifiées", CRON_BUCKETS),
+    'transport_rate_limit_rejections_total': (
+        'counter', "Appels rejetés par la limitation de débit", None),
+}
+
+_LE_RE = re.compile(r'le="([^"]+)"')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return ','.join('%s="%s"' % (key, _escape(labels[key])) for key in sorted(labels))
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class MetricsStore:
+    """Compteurs et histogrammes partagés entre workers via SQLite"""
+
+    def __init__(self, path=None, flush_interval=FLUSH_INTERVAL):
+        self._path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    @property
+    def path(self):
+        if not self._path:
+            directory = config.get('transport_metrics_dir') or os.path.join(
+                config['data_dir'], 'transport_metrics')
+            self._path = os.path.join(directory, METRICS_FILENAME)
+        return self._path
+
+    # ---------- Enregistrement ----------
+
+    def inc(self, name, value=1, **labels):
+        """Incrémenter un compteur"""
+        if not value:
+            return
+        self._add([(name, name, _format_labels(labels), value)])
+
+    def observe(self, name, value, **labels):
+        """Enregistrer une observation dans un histogramme"""
+        buckets = METRICS[name][2]
+        label_str = _format_labels(labels)
+        samples = [
+            (name, name + '_bucket', _format_labels(dict(labels, le=_format_bound(bound))),
+             1 if value <= bound else 0)
+            for bound in buckets
+        ]
+        samples += [
+            (name, name + '_bucket', _format_labels(dict(labels, le='+Inf')), 1),
+            (name, name + '_sum', label_str, value),
+            (name, name + '_count', label_str, 1),
+        ]
+        self._add(samples)
+
+    @contextlib.contextmanager
+    def track_duration(self, name, **labels):
+        """Mesurer la durée d'un bloc (utilisable aussi comme décorateur)"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def _add(self, samples):
+        with self._lock:
+            for family, sample, label_str, value in samples:
+                key = (family, sample, label_str)
+                self._pending[key] = self._pending.get(key, 0) + value
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    # ---------- Stockage partagé ----------
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS samples (
+                family TEXT NOT NULL,
+                sample TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (sample, labels)
+            )
+        """)
+        return conn
+
+    def flush(self):
+        """Reporter les valeurs accumulées par ce worker dans le fichier partagé"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO samples (family, sample, labels, value)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (sample, labels) DO UPDATE SET value = value + excluded.value
+                    """, [key + (value,) for key, value in pending.items()])
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            _logger.warning("Métriques non enregistrées (%s): %s", self.path, e)
+            # Conserver les valeurs pour le prochain report
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+
+    def collect(self):
+        """Lignes (famille, échantillon, labels, valeur) de tous les workers"""
+        self.flush()
+        try:
+            conn = self._connect()
+            try:
+                return conn.execute("SELECT family, sample, labels, value FROM samples").fetchall()
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            _logger.warning("Lecture des métriques impossible (%s): %s", self.path, e)
+            return []
+
+    def render(self):
+        """Exposition au format texte Prometheus (version 0.0.4)"""
+        rows_by_family = {}
+        for family, sample, labels, value in self.collect():
+            rows_by_family.setdefault(family, []).append((sample, labels, value))
+
+        def sort_key(row):
+            sample, labels, __ = row
+            match = _LE_RE.search(labels)
+            bound = float(match.group(1)) if match else 0
+            return (sample, _LE_RE.sub('', labels), bound)
+
+        lines = []
+        for family, (metric_type, help_text, __) in METRICS.items():
+            lines.append('# HELP %s %s' % (family, help_text))
+            lines.append('# TYPE %s %s' % (family, metric_type))
+            for sample, labels, value in sorted(rows_by_family.get(family, []), key=sort_key):
+                value = int(value) if float(value).is_integer() else value
+                lines.append('%s{%s} %s' % (sample, labels, value) if labels else '%s %s' % (sample, value))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Effacer toutes les valeurs (locales et partagées)"""
+        with self._lock:
+            self._pending.clear()
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM samples")
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            _logger.warning("Réinitialisation des métriques impossible (%s): %s", self.path, e)
+
+
+metrics = MetricsStore()
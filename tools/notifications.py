@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Prestataires d'envoi des notifications (SMS, email) - Transport Interurbain
+
+Un prestataire reçoit des lots de messages de la file
+``transport.notification`` et renvoie, pour chaque message, ``None`` en
+cas de succès ou le texte de l'erreur. Un module tiers branche son
+prestataire (passerelle SMS, API email...) avec ``register_provider`` puis
+le sélectionne dans les paramètres système
+``transport_interurbain.sms_provider`` / ``transport_interurbain.email_provider``.
+
+Prestataires fournis :
+
+- ``log`` : écrit les messages dans le journal du serveur ;
+- ``file`` : ajoute les messages (une ligne JSON chacun) dans
+  ``<data_dir>/transport_outbox/<canal>.jsonl``, pour les tests locaux ;
+- ``mail`` : emails uniquement, via la file d'envoi standard d'Odoo (mail.mail).
+"""
+
+import json
+import logging
+import os
+import threading
+
+from odoo.tools import config, plaintext2html
+
+_logger = logging.getLogger(__name__)
+
+PROVIDERS = {}
+
+
+def register_provider(cls):
+    """Décorateur de classe : rendre un prestataire disponible sous son code"""
+    PROVIDERS[cls.code] = cls
+    return cls
+
+
+def get_provider(env, code):
+    """Instance du prestataire ``code`` (KeyError s'il n'est pas enregistré)"""
+    return PROVIDERS[code](env)
+
+
+class NotificationProvider:
+    """Interface d'un prestataire d'envoi"""
+
+    code = None
+    channels = ('sms', 'email')
+    # Taille maximale d'un lot et débit maximal (messages par seconde)
+    batch_size = 50
+    rate_limit = 20
+
+    def __init__(self, env):
+        self.env = env
+
+    def send_batch(self, messages):
+        """Envoyer un lot de transport.notification ; renvoie {id: None ou message d'erreur}"""
+        raise NotImplementedError()
+
+
+@register_provider
+class LogProvider(NotificationProvider):
+    """Écrit les messages dans le journal (aucun envoi réel)"""
+
+    code = 'log'
+    batch_size = 200
+    rate_limit = 1000
+
+    def send_batch(self, messages):
+        for message in messages:
+            _logger.info("[%s → %s] %s", message.channel, message.recipient, message.body)
+        return dict.fromkeys(messages.ids)
+
+
+@register_provider
+class FileProvider(NotificationProvider):
+    """Ajoute les messages dans un fichier JSON Lines par canal"""
+
+    code = 'file'
+    batch_size = 200
+    rate_limit = 1000
+    _lock = threading.Lock()
+
+    @staticmethod
+    def directory():
+        return config.get('transport_outbox_dir') or os.path.join(config['data_dir'], 'transport_outbox')
+
+    def send_batch(self, messages):
+        directory = self.directory()
+        os.makedirs(directory, exist_ok=True)
+        lines = {}
+        for message in messages:
+            lines.setdefault(message.channel, []).append(json.dumps({
+                'id': message.id,
+                'dedup_key': message.dedup_key,
+                'recipient': message.recipient,
+                'subject': message.subject,
+                'body': message.body,
+            }, ensure_ascii=False))
+        with self._lock:
+            for channel, channel_lines in lines.items():
+                with open(os.path.join(directory, '%s.jsonl' % channel), 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(channel_lines) + '\n')
+        return dict.fromkeys(messages.ids)
+
+
+@register_provider
+class MailProvider(NotificationProvider):
+    """Emails confiés à la file d'envoi d'Odoo (mail.mail)"""
+
+    code = 'mail'
+    channels = ('email',)
+    batch_size = 100
+    rate_limit = 100
+
+    def send_batch(self, messages):
+        self.env['mail.mail'].sudo().create([{
+            'subject': message.subject,
+            'body_html': plaintext2html(message.body or ''),
+            'email_to': message.recipient,
+            'auto_delete': True,
+        } for message in messages])
+        return dict.fromkeys(messages.ids)
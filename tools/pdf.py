@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Écriture directe de PDF simples (texte et rectangles) - Transport Interurbain
+
+Utilisé par le rendu natif des billets et par les manifestes : pas de
+QWeb ni de wkhtmltopdf, uniquement les polices standard Helvetica
+(WinAnsiEncoding, accents français compris). Le document est produit de
+façon incrémentale : chaque page est renvoyée en octets dès qu'elle est
+écrite, ce qui permet de diffuser un PDF de plusieurs centaines de pages
+sans le garder en mémoire.
+"""
+
+import zlib
+
+A4_WIDTH = 595
+A4_HEIGHT = 842
+
+# Numéros d'objets réservés ; pages et contenus sont numérotés à partir de FIRST_FREE_OBJECT
+CATALOG_OBJECT = 1
+PAGES_OBJECT = 2
+FONTS = (
+    ('F1', 3, 'Helvetica'),
+    ('F2', 4, 'Helvetica-Bold'),
+)
+FIRST_FREE_OBJECT = 5
+
+
+def pdf_string(text):
+    """Chaîne PDF littérale en WinAnsiEncoding (caractères non représentables remplacés)"""
+    raw = (text or '').encode('cp1252', 'replace')
+    return b'(' + raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def text_op(font, size, x, y, text):
+    """Opérateur d'affichage d'une ligne de texte en (x, y)"""
+    return b'BT /%s %d Tf %.2f %.2f Td %s Tj ET' % (font.encode(), size, x, y, pdf_string(text))
+
+
+def fit_text(text, size, width):
+    """Tronquer un texte à la largeur disponible (largeur moyenne Helvetica ≈ demi-corps)"""
+    text = text or ''
+    max_chars = max(int(width / (size * 0.5)), 1)
+    return text if len(text) <= max_chars else text[:max_chars - 1] + '…'
+
+
+class PdfWriter:
+    """PDF écrit page par page : header(), page() autant que nécessaire, puis close()"""
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.page_objects = []
+        self.next_object = FIRST_FREE_OBJECT
+
+    def _object(self, number, body):
+        self.offsets[number] = self.offset
+        data = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        self.offset += len(data)
+        return data
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def header(self):
+        return self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def page(self, width, height, ops):
+        """Écrire une page à partir de ses opérateurs de contenu (liste d'octets)"""
+        stream = zlib.compress(b'\n'.join(ops))
+        content, page = self.next_object, self.next_object + 1
+        self.next_object += 2
+        self.page_objects.append(page)
+        return (
+            self._object(content, b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (
+                len(stream), stream))
+            + self._object(page, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+                                 b'/Resources << /Font << %s >> >> /Contents %d 0 R >>' % (
+                PAGES_OBJECT, width, height,
+                b' '.join(b'/%s %d 0 R' % (name.encode(), number) for name, number, _base in FONTS),
+                content))
+        )
+
+    def close(self):
+        """Polices, arbre des pages, catalogue, table de références et fin de fichier"""
+        out = b''
+        for _name, number, base in FONTS:
+            out += self._object(number, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s '
+                                        b'/Encoding /WinAnsiEncoding >>' % base.encode())
+        out += self._object(PAGES_OBJECT, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % number for number in self.page_objects), len(self.page_objects)))
+        out += self._object(CATALOG_OBJECT, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES_OBJECT)
+        xref = self.offset
+        size = self.next_object
+        tail = b'xref\n0 %d\n0000000000 65535 f \n' % size
+        for number in range(1, size):
+            tail += b'%010d 00000 n \n' % self.offsets[number]
+        tail += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, CATALOG_OBJECT, xref)
+        return out + self._emit(tail)
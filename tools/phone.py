@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Numéros de téléphone normalisés (E.164) - Transport Interurbain
+
+Les numéros sont saisis dans des formats variés (``+225 07 12 34 56 78``,
+``0712345678``, ``00225-07.12.34.56.78``). La clé d'identité stockée sur les
+passagers, réservations et contacts (``phone_key``) est leur forme E.164,
+``+2250712345678`` : la même pour toutes ces écritures, et indexée.
+
+Un numéro sans indicatif est considéré comme national (Côte d'Ivoire).
+"""
+
+import re
+
+DEFAULT_COUNTRY_CODE = '225'
+# Longueur d'un numéro national ivoirien (10 chiffres depuis 2021, 8 auparavant)
+NATIONAL_LENGTHS = (8, 10)
+
+_SEPARATORS = re.compile(r'[\s\-\.\(\)/]')
+_E164 = re.compile(r'^\+[1-9]\d{7,14}$')
+
+
+def normalize_phone(phone, country_code=DEFAULT_COUNTRY_CODE):
+    """Forme E.164 du numéro ``phone``, ou None s'il n'est pas valide"""
+    if not phone:
+        return None
+    number = _SEPARATORS.sub('', str(phone))
+    if number.startswith('00'):
+        number = '+' + number[2:]
+    elif not number.startswith('+'):
+        if len(number) in NATIONAL_LENGTHS:
+            number = '+' + country_code + number
+        else:
+            number = '+' + number
+    return number if _E164.match(number) else None
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+QR codes signés des billets et des passagers - Transport Interurbain
+
+Format compact, versionné et vérifiable sans base de données (mode
+alphanumérique des QR codes : majuscules, chiffres, ``.`` et ``-``) ::
+
+    T2.<clé>.<réservation>.<voyage>.<siège>.<valide du>.<valide jusqu'au>.<signature>
+    P2.<clé>.<passager>.<jeton>.<expire le>.<signature>
+
+- ``clé`` : identifiant de la clé Ed25519 (``transport.qr.key``) ; les
+  billets sont signés avec la clé de leur compagnie, les QR passagers avec
+  la clé de la plateforme. Après rotation, les anciennes clés restent
+  acceptées tant qu'elles ne sont pas supprimées ;
+- identifiants et minutes (jours pour l'expiration des QR passagers) depuis
+  l'époque Unix (UTC) en base 36 ;
+- ``jeton`` : empreinte courte du jeton unique du passager ; régénérer ce
+  jeton révoque tous ses anciens QR codes ;
+- ``signature`` : signature Ed25519 du reste du code, en base 32 sans
+  remplissage.
+
+Seul le serveur détient les clés privées : les applications de contrôle ne
+reçoivent que les clés publiques et ne peuvent donc pas fabriquer de QR
+codes. Le serveur comme les applications hors ligne rejettent un QR
+falsifié, expiré ou destiné à un autre voyage sans aucune requête SQL. Les
+formats HMAC ``T1`` et ``P1``, dont les secrets étaient diffusés aux
+agents, sont refusés ; les anciens formats ``TICKET:...`` et
+``PASSENGER:...`` restent gérés par les contrôleurs.
+"""
+
+import base64
+import hashlib
+import re
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+
+ALGORITHM = 'Ed25519'
+TICKET_VERSION = 'T2'
+PASSENGER_VERSION = 'P2'
+# Formats HMAC retirés : leurs secrets ont été communiqués aux applications
+OBSOLETE_VERSIONS = ('T1', 'P1')
+KEY_ID_LENGTH = 4
+# Durée de validité d'un QR passager, arrondie au jour
+PASSENGER_QR_VALIDITY_DAYS = 30
+# Octets de l'empreinte du jeton passager (40 bits)
+TOKEN_TAG_BYTES = 5
+
+_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_SEAT_RE = re.compile(r'[^A-Z0-9]')
+
+# Motif de refus -> message affiché à l'agent
+REJECTION_MESSAGES = {
+    'format': "QR code illisible",
+    'obsolete': "QR code d'un ancien format : le passager doit l'afficher à nouveau depuis son application",
+    'unknown_key': "QR code non reconnu (clé de signature inconnue)",
+    'signature': "QR code falsifié",
+    'not_yet_valid': "Ce ticket n'est pas encore valable",
+    'expired': "Ce QR code n'est plus valable",
+    'revoked': "Ce QR code passager a été révoqué",
+    'wrong_trip': "Ce ticket est pour un autre voyage",
+}
+
+
+class QRError(ValueError):
+    """QR code refusé ; ``reason`` est une clé de REJECTION_MESSAGES"""
+
+    def __init__(self, reason):
+        super().__init__(REJECTION_MESSAGES[reason])
+        self.reason = reason
+
+
+def new_key():
+    """Nouvelle clé : (identifiant court, clé privée, clé publique), clés brutes en base 64"""
+    kid = ''.join(secrets.choice(_DIGITS) for _i in range(KEY_ID_LENGTH))
+    private_key = Ed25519PrivateKey.generate()
+    private_bytes = private_key.private_bytes(
+        serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption(),
+    )
+    public_bytes = private_key.public_key().public_bytes(
+        serialization.Encoding.Raw, serialization.PublicFormat.Raw,
+    )
+    return (
+        kid,
+        base64.b64encode(private_bytes).decode('ascii'),
+        base64.b64encode(public_bytes).decode('ascii'),
+    )
+
+
+def to_base36(number):
+    number = int(number)
+    if number < 0:
+        raise ValueError(number)
+    digits = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        digits = _DIGITS[remainder] + digits
+        if not number:
+            return digits
+
+
+def from_base36(value):
+    return int(value, 36)
+
+
+def _minutes(value):
+    """Minutes UTC depuis l'époque (datetime naïf en UTC, comme en base)"""
+    return int(value.replace(tzinfo=timezone.utc).timestamp()) // 60
+
+
+def _days(value):
+    return _minutes(value) // (24 * 60)
+
+
+def token_tag(token):
+    """Empreinte courte (base 36) du jeton unique d'un passager"""
+    digest = hashlib.sha256((token or '').encode('utf-8')).digest()
+    return to_base36(int.from_bytes(digest[:TOKEN_TAG_BYTES], 'big'))
+
+
+def _sign(private_key, body):
+    key = Ed25519PrivateKey.from_private_bytes(base64.b64decode(private_key))
+    signature = key.sign(body.encode('ascii'))
+    return base64.b32encode(signature).decode('ascii').rstrip('=')
+
+
+def encode_ticket(kid, private_key, booking_id, trip_id, seat, valid_from, valid_until):
+    """QR signé d'un billet"""
+    seat = _SEAT_RE.sub('', (seat or '').upper()) or '-'
+    body = '.'.join([
+        TICKET_VERSION, kid, to_base36(booking_id), to_base36(trip_id), seat,
+        to_base36(_minutes(valid_from)), to_base36(_minutes(valid_until)),
+    ])
+    return '%s.%s' % (body, _sign(private_key, body))
+
+
+def encode_passenger(kid, private_key, passenger_id, token, now=None):
+    """QR signé d'un passager, valable PASSENGER_QR_VALIDITY_DAYS jours"""
+    expires = (now or datetime.utcnow()) + timedelta(days=PASSENGER_QR_VALIDITY_DAYS)
+    body = '.'.join([
+        PASSENGER_VERSION, kid, to_base36(passenger_id), token_tag(token), to_base36(_days(expires)),
+    ])
+    return '%s.%s' % (body, _sign(private_key, body))
+
+
+def is_signed(code, version):
+    return (code or '').startswith(version + '.')
+
+
+def is_obsolete(code):
+    return any(is_signed(code, version) for version in OBSOLETE_VERSIONS)
+
+
+def _check_signature(code, expected_parts, keys):
+    parts = code.split('.')
+    if len(parts) != expected_parts:
+        raise QRError('format')
+    key = keys.get(parts[1])
+    if not key:
+        raise QRError('unknown_key')
+    public_key, company_id = key
+    body, signature = code.rsplit('.', 1)
+    try:
+        signature = base64.b32decode(signature + '=' * (-len(signature) % 8))
+        Ed25519PublicKey.from_public_bytes(base64.b64decode(public_key)).verify(
+            signature, body.encode('ascii'))
+    except (ValueError, InvalidSignature):
+        raise QRError('signature')
+    return parts, company_id
+
+
+def verify_ticket(code, keys, now=None, trip_id=None):
+    """
+    Vérifier un QR de billet ``T2`` sans accès à la base.
+
+    ``keys`` : {identifiant: (clé publique, compagnie)}. Renvoie les données
+    du billet (booking_id, trip_id, seat, company_id, valid_from,
+    valid_until, en minutes) ou lève QRError.
+    """
+    if is_obsolete(code):
+        raise QRError('obsolete')
+    parts, company_id = _check_signature(code, 8, keys)
+    try:
+        claims = {
+            'booking_id': from_base36(parts[2]),
+            'trip_id': from_base36(parts[3]),
+            'seat': None if parts[4] == '-' else parts[4],
+            'valid_from': from_base36(parts[5]),
+            'valid_until': from_base36(parts[6]),
+            'company_id': company_id,
+        }
+    except ValueError:
+        raise QRError('format')
+    minute = _minutes(now or datetime.utcnow())
+    if minute < claims['valid_from']:
+        raise QRError('not_yet_valid')
+    if minute > claims['valid_until']:
+        raise QRError('expired')
+    if trip_id and int(trip_id) != claims['trip_id']:
+        raise QRError('wrong_trip')
+    return claims
+
+
+def verify_passenger(code, keys, now=None):
+    """
+    Vérifier un QR passager ``P2`` sans accès à la base.
+
+    Renvoie (identifiant du passager, empreinte du jeton) ; l'appelant
+    compare l'empreinte au jeton courant du passager (voir check_token_tag).
+    """
+    if is_obsolete(code):
+        raise QRError('obsolete')
+    parts, _company_id = _check_signature(code, 6, keys)
+    try:
+        passenger_id = from_base36(parts[2])
+        expires = from_base36(parts[4])
+    except ValueError:
+        raise QRError('format')
+    if _days(now or datetime.utcnow()) > expires:
+        raise QRError('expired')
+    return passenger_id, parts[3]
+
+
+def check_token_tag(tag, token):
+    """Lever QRError('revoked') si ``tag`` ne correspond pas au jeton courant du passager"""
+    if not token or not secrets.compare_digest(tag, token_tag(token)):
+        raise QRError('revoked')
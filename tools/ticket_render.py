@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Rendu natif des billets (sans QWeb ni wkhtmltopdf) - Transport Interurbain
+
+Produit, à partir d'un simple dictionnaire de billet (voir
+``transport.booking._get_ticket_render_data``), trois sorties rendues en
+quelques millisecondes :
+
+- ``compact`` : PDF d'une page au format ticket (80 mm), écrit directement
+  (polices standard Helvetica, QR code dessiné en vectoriel) ;
+- ``escpos`` : flux d'octets ESC/POS pour les imprimantes thermiques des
+  gares, le QR code étant imprimé par l'imprimante elle-même ;
+- ``png`` : image monochrome légère (largeur 384 px, imprimante 58 mm ou
+  affichage mobile).
+
+Le PDF (voir ``tools/pdf.py``) et le flux ESC/POS ne dépendent que de la
+bibliothèque standard ; le QR code est calculé avec ``qrcode`` et l'image
+avec Pillow, déjà requis par le module.
+"""
+
+import io
+import textwrap
+
+from .pdf import PdfWriter, text_op
+
+# Page PDF : 80 mm de large, marges et interligne en points
+PDF_PAGE_WIDTH = 227
+PDF_MARGIN = 12
+PDF_QR_SIZE = 130
+PDF_STYLES = {
+    # style : (police, taille, interligne)
+    'title': ('F2', 13, 18),
+    'heading': ('F2', 10, 14),
+    'normal': ('F1', 9, 12),
+    'small': ('F1', 7, 10),
+}
+
+ESCPOS_COLUMNS = 48
+ESCPOS_QR_MODULE_SIZE = 6
+
+PNG_WIDTH = 384
+PNG_MARGIN = 8
+
+
+def ticket_lines(data):
+    """Lignes du billet communes à tous les formats : liste de (texte, style)"""
+    meeting = data.get('meeting_point') or '-'
+    if data.get('meeting_minutes'):
+        meeting = "%s (%s min avant)" % (meeting, data['meeting_minutes'])
+    lines = [
+        (data.get('company') or '', 'heading'),
+        ("BILLET %s" % data['reference'], 'title'),
+        (data.get('route') or '', 'heading'),
+        ("Départ : %s" % data.get('departure', '-'), 'normal'),
+        ("De : %s" % (data.get('boarding') or '-'), 'normal'),
+        ("À : %s" % (data.get('alighting') or '-'), 'normal'),
+        ("Passager : %s" % (data.get('passenger') or '-'), 'normal'),
+        ("Téléphone : %s" % (data.get('phone') or '-'), 'normal'),
+        ("Siège : %s   Bus : %s" % (data.get('seat') or '-', data.get('bus') or '-'), 'normal'),
+        ("Rendez-vous : %s" % meeting, 'normal'),
+        ("Prix : %s" % (data.get('price') or '-'), 'normal'),
+    ]
+    if data.get('status'):
+        lines.append(("Statut : %s" % data['status'], 'small'))
+    return lines
+
+
+FOOTER = "Présentez ce QR code à l'embarquement"
+
+
+def qr_matrix(payload):
+    """Matrice du QR code (liste de lignes de booléens, marge de 2 modules incluse)"""
+    import qrcode
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=2)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+# ---------- PDF ----------
+
+def _pdf_wrap(text, size):
+    # Largeur moyenne d'un caractère Helvetica : environ la moitié du corps
+    width = max(int((PDF_PAGE_WIDTH - 2 * PDF_MARGIN) / (size * 0.5)), 10)
+    return textwrap.wrap(text, width) or ['']
+
+
+def render_pdf(data, matrix=None):
+    """PDF d'une page au format ticket"""
+    if matrix is None:
+        matrix = qr_matrix(data['qr_payload'])
+    body = [(part, style) for text, style in ticket_lines(data) for part in _pdf_wrap(text, PDF_STYLES[style][1])]
+    footer = [(part, 'small') for part in _pdf_wrap(FOOTER, PDF_STYLES['small'][1])]
+    height = PDF_MARGIN * 2 + sum(PDF_STYLES[style][2] for _text, style in body + footer) + PDF_QR_SIZE + 10
+
+    ops = []
+    y = height - PDF_MARGIN
+    for text, style in body:
+        font, size, leading = PDF_STYLES[style]
+        y -= leading
+        ops.append(text_op(font, size, PDF_MARGIN, y, text))
+
+    # QR code centré : un rectangle par suite de modules noirs sur une ligne
+    y -= 6
+    module = PDF_QR_SIZE / float(len(matrix))
+    left = (PDF_PAGE_WIDTH - PDF_QR_SIZE) / 2.0
+    ops.append(b'0 g')
+    for r, row in enumerate(matrix):
+        top = y - r * module
+        c = 0
+        while c < len(row):
+            if not row[c]:
+                c += 1
+                continue
+            start = c
+            while c < len(row) and row[c]:
+                c += 1
+            ops.append(b'%.2f %.2f %.2f %.2f re' % (left + start * module, top - module, (c - start) * module, module))
+    ops.append(b'f')
+    y -= PDF_QR_SIZE + 4
+
+    for text, style in footer:
+        font, size, leading = PDF_STYLES[style]
+        y -= leading
+        ops.append(text_op(font, size, PDF_MARGIN, y, text))
+
+    writer = PdfWriter()
+    return writer.header() + writer.page(PDF_PAGE_WIDTH, height, ops) + writer.close()
+
+
+# ---------- ESC/POS ----------
+
+ESC = b'\x1b'
+GS = b'\x1d'
+
+
+def _escpos_qr(payload):
+    """Commandes GS ( k : QR code modèle 2 calculé et imprimé par l'imprimante"""
+    data = payload.encode('utf-8')
+    length = len(data) + 3
+
+    def command(fn, params):
+        size = len(params) + 2
+        return GS + b'(k' + bytes((size % 256, size // 256, 49, fn)) + params
+
+    return b''.join([
+        command(65, b'\x32\x00'),                               # modèle 2
+        command(67, bytes((ESCPOS_QR_MODULE_SIZE,))),           # taille d'un module
+        command(69, b'\x31'),                                   # correction d'erreur M
+        GS + b'(k' + bytes((length % 256, length // 256, 49, 80, 48)) + data,  # stockage
+        command(81, b'\x30'),                                   # impression
+    ])
+
+
+def render_escpos(data, columns=ESCPOS_COLUMNS):
+    """Flux ESC/POS (page de code WPC1252) pour imprimante thermique"""
+    out = [
+        ESC + b'@',           # initialisation
+        ESC + b't\x10',       # page de code WPC1252
+        ESC + b'a\x01',       # centré
+    ]
+    for text, style in ticket_lines(data):
+        if style == 'title':
+            out.append(GS + b'!\x11' + ESC + b'E\x01')  # double taille, gras
+            width = columns // 2
+        elif style == 'heading':
+            out.append(GS + b'!\x00' + ESC + b'E\x01')
+            width = columns
+        else:
+            out.append(GS + b'!\x00' + ESC + b'E\x00')
+            width = columns
+        for part in textwrap.wrap(text, width) or ['']:
+            out.append(part.encode('cp1252', 'replace') + b'\n')
+        if style == 'title':
+            out.append(ESC + b'a\x00')  # le détail est aligné à gauche
+    out += [
+        GS + b'!\x00' + ESC + b'E\x00' + ESC + b'a\x01' + b'\n',
+        _escpos_qr(data['qr_payload']),
+        b'\n' + FOOTER.encode('cp1252', 'replace') + b'\n',
+        ESC + b'd\x03',      # avance de 3 lignes
+        GS + b'VB\x00',      # coupe partielle
+    ]
+    return b''.join(out)
+
+
+# ---------- PNG ----------
+
+def render_png(data, matrix=None):
+    """Image PNG monochrome du billet (texte et QR code)"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    if matrix is None:
+        matrix = qr_matrix(data['qr_payload'])
+    font = ImageFont.load_default()
+    line_height = 14
+    rows = [part for text, _style in ticket_lines(data) for part in textwrap.wrap(text, 56) or ['']]
+    footer = textwrap.wrap(FOOTER, 56)
+    scale = max((PNG_WIDTH - 2 * PNG_MARGIN) // (2 * len(matrix)), 2)
+    qr_size = len(matrix) * scale
+    height = PNG_MARGIN * 3 + line_height * (len(rows) + len(footer)) + qr_size
+
+    image = Image.new('1', (PNG_WIDTH, height), 1)
+    draw = ImageDraw.Draw(image)
+    y = PNG_MARGIN
+    for text in rows:
+        draw.text((PNG_MARGIN, y), text, fill=0, font=font)
+        y += line_height
+    y += PNG_MARGIN // 2
+    left = (PNG_WIDTH - qr_size) // 2
+    for r, row in enumerate(matrix):
+        for c, dark in enumerate(row):
+            if dark:
+                draw.rectangle(
+                    [left + c * scale, y + r * scale, left + (c + 1) * scale - 1, y + (r + 1) * scale - 1], fill=0)
+    y += qr_size + PNG_MARGIN // 2
+    for text in footer:
+        draw.text((PNG_MARGIN, y), text, fill=0, font=font)
+        y += line_height
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+# format : (type MIME, extension, fonction de rendu)
+FORMATS = {
+    'compact': ('application/pdf', 'pdf', render_pdf),
+    'escpos': ('application/vnd.escpos', 'bin', render_escpos),
+    'png': ('image/png', 'png', render_png),
+}
+
+
+def render(fmt, data):
+    """Rendre un billet au format ``fmt`` ; renvoie (contenu, type MIME, extension)"""
+    mimetype, extension, renderer = FORMATS[fmt]
+    return renderer(data), mimetype, extension
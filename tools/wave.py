@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Client HTTP de l'API Wave - Transport Interurbain
+
+- une session ``requests`` par processus, avec pool de connexions
+  persistantes (keep-alive) partagé par tous les appels ;
+- délais courts de connexion et de lecture, pour ne pas bloquer un worker
+  HTTP Odoo pendant une panne de Wave ;
+- nouvelles tentatives bornées, avec attente exponentielle, uniquement pour
+  les appels idempotents (lecture, ou création avec ``Idempotency-Key``) ;
+- délai total optionnel (``deadline``) couvrant tentatives et attentes, pour
+  les appels faits pendant une requête HTTP ;
+- disjoncteur par URL d'API : après WAVE_BREAKER_THRESHOLD échecs
+  consécutifs, les appels sont refusés immédiatement pendant
+  WAVE_BREAKER_COOLDOWN secondes, puis un appel d'essai est autorisé.
+"""
+
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+WAVE_CONNECT_TIMEOUT = 3.05  # secondes
+WAVE_READ_TIMEOUT = 10  # secondes
+WAVE_MAX_RETRIES = 2
+WAVE_BACKOFF = 0.25  # secondes, doublé à chaque tentative
+WAVE_POOL_SIZE = 16
+WAVE_BREAKER_THRESHOLD = 5
+WAVE_BREAKER_COOLDOWN = 30  # secondes
+# Délai total d'un appel fait pendant une requête utilisateur (tentatives comprises)
+WAVE_INTERACTIVE_DEADLINE = 8  # secondes
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+class WaveError(Exception):
+    """Erreur d'appel à l'API Wave"""
+
+    def __init__(self, message, status_code=None, reason=None):
+        super().__init__(message)
+        self.status_code = status_code
+        # Motif court pour les métriques (http_503, ReadTimeout, circuit_open...)
+        self.reason = reason or ('http_%s' % status_code if status_code else 'error')
+
+
+class WaveUnavailable(WaveError):
+    """Disjoncteur ouvert : Wave est considéré indisponible"""
+
+    def __init__(self, retry_in):
+        super().__init__("Service Wave indisponible (nouvel essai dans %ds)" % retry_in, reason='circuit_open')
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / semi-ouvert, partagé par les threads du processus"""
+
+    def __init__(self, threshold=WAVE_BREAKER_THRESHOLD, cooldown=WAVE_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self):
+        """Lever WaveUnavailable si l'appel doit être refusé"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return
+            if state == 'half_open' and not self._probing:
+                # Un seul appel d'essai à la fois
+                self._probing = True
+                return
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            raise WaveUnavailable(max(1, int(remaining)))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release_probe(self):
+        """Libérer l'appel d'essai s'il s'est terminé sans succès ni échec enregistré"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                if self._opened_at is None or self._probing:
+                    _logger.warning("Disjoncteur Wave ouvert après %d échec(s)", self._failures)
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+_session = None
+_session_lock = threading.Lock()
+_breakers = {}
+
+
+def _get_session():
+    """Session HTTP du processus (pool de connexions keep-alive)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=WAVE_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def get_breaker(base_url):
+    """Disjoncteur associé à une URL d'API"""
+    with _session_lock:
+        if base_url not in _breakers:
+            _breakers[base_url] = CircuitBreaker()
+        return _breakers[base_url]
+
+
+class WaveClient:
+    """Appels à l'API Wave pour une clé marchand"""
+
+    def __init__(self, base_url, api_key, max_retries=WAVE_MAX_RETRIES,
+                 timeout=(WAVE_CONNECT_TIMEOUT, WAVE_READ_TIMEOUT), deadline=None):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.timeout = timeout
+        # Durée maximale de l'appel, nouvelles tentatives et attentes comprises (None : sans limite)
+        self.deadline = deadline
+        self.breaker = get_breaker(self.base_url)
+
+    def create_checkout_session(self, data, idempotency_key):
+        """Créer une session de paiement (rejouable grâce à la clé d'idempotence)"""
+        return self._request(
+            'POST', '/checkout/sessions', json=data,
+            headers={'Idempotency-Key': idempotency_key}, idempotent=True,
+        )
+
+    def get_checkout_session(self, checkout_id):
+        """Lire une session de paiement"""
+        return self._request('GET', '/checkout/sessions/%s' % checkout_id, idempotent=True)
+
+    def _request(self, method, path, idempotent=False, headers=None, **kwargs):
+        self.breaker.before_call()
+        try:
+            return self._send(method, path, idempotent=idempotent, headers=headers, **kwargs)
+        finally:
+            # Une exception inattendue ne doit pas bloquer le disjoncteur en semi-ouvert
+            self.breaker.release_probe()
+
+    def _send(self, method, path, idempotent=False, headers=None, **kwargs):
+        started = time.monotonic()
+        all_headers = {
+            'Authorization': 'Bearer %s' % self.api_key,
+            'Content-Type': 'application/json',
+        }
+        all_headers.update(headers or {})
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        error = WaveError("Délai d'appel Wave dépassé", reason='deadline')
+        for attempt in range(attempts):
+            timeout = self.timeout
+            if attempt:
+                backoff = WAVE_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random() / 2)
+                if self.deadline is not None and time.monotonic() - started + backoff >= self.deadline:
+                    break
+                time.sleep(backoff)
+            if self.deadline is not None:
+                remaining = self.deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                timeout = (min(timeout[0], remaining), min(timeout[1], remaining))
+            try:
+                response = _get_session().request(
+                    method, self.base_url + path, headers=all_headers, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                error = WaveError(str(e), reason=type(e).__name__)
+                continue
+            if response.status_code in RETRYABLE_STATUS:
+                error = WaveError(response.text, status_code=response.status_code)
+                continue
+            # Une erreur 4xx est une réponse valide de Wave : le disjoncteur n'est pas concerné
+            self.breaker.record_success()
+            if response.status_code >= 400:
+                raise WaveError(response.text, status_code=response.status_code)
+            try:
+                return response.json()
+            except ValueError:
+                raise WaveError("Réponse Wave illisible: %s" % response.text[:200], reason='invalid_json')
+        self.breaker.record_failure()
+        raise error